@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'traffic_monitor.metrics.RequestMetricsMiddleware',   # Métricas de cada pedido (GET /metrics), primeiro para medir tudo
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -133,8 +134,90 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
         #'rest_framework.authentication.SessionAuthentication',
     ],
+    'PAGE_SIZE': 100,   # Tamanho por defeito de cada página (paginação por cursor)
 }
 
+# Tamanho máximo de página que pode ser pedido com ?page_size=
+MAX_PAGE_SIZE = 1000
+
+# A paginação é definida em cada ViewSet (pagination_class), apenas o PAGE_SIZE é global
+SILENCED_SYSTEM_CHECKS = ['rest_framework.W001']
+
+# Cache (por defeito em memória; em produção pode ser usado Redis ou Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Cache das respostas GET /api/segments/ e /api/segments/{id}/: cache a usar e duração em segundos (0 desativa)
+SEGMENT_CACHE_ALIAS = 'default'
+SEGMENT_CACHE_TIMEOUT = 300
+
+# Índice espacial dos segmentos (?bbox= e /api/segments/nearest/):
+# tamanho de cada célula da grelha, em graus (0.01 ≈ 1 km), e idade máxima (segundos) antes de ser reconstruído
+SPATIAL_INDEX_CELL_SIZE = 0.01
+SPATIAL_INDEX_MAX_AGE = 300
+
+# Intensidade do trânsito: velocidade máxima (km/h) com intensidade elevada e com intensidade média
+# (acima → baixa). Cada segmento pode ter os seus próprios limites (campos com o mesmo nome no RoadSegment).
+HIGH_INTENSITY_MAX_SPEED = 20
+MEDIUM_INTENSITY_MAX_SPEED = 50
+
+# Eventos em tempo real (GET /api/stream/): intervalo (segundos) entre keepalives quando não há eventos
+# e número máximo de eventos em espera por cliente (um cliente lento perde os mais antigos)
+REALTIME_KEEPALIVE = 15
+REALTIME_QUEUE_SIZE = 1000
+
+# Escrita diferida (write-behind) de POST /api/readings/: as leituras são respondidas com 202 e gravadas em lotes
+# de WRITE_BEHIND_BATCH_SIZE, ou ao fim de WRITE_BEHIND_MAX_DELAY segundos. Com WRITE_BEHIND_MAX_PENDING leituras
+# em espera os pedidos recebem 503. O journal (pasta, None → apenas em memória) permite recuperar as leituras
+# depois de um reinício; WRITE_BEHIND_FSYNC também as protege de uma falha do sistema (mais lento).
+READINGS_WRITE_BEHIND = False
+WRITE_BEHIND_JOURNAL_DIR = BASE_DIR / 'var' / 'readings_queue'
+WRITE_BEHIND_BATCH_SIZE = 500
+WRITE_BEHIND_MAX_DELAY = 1.0
+WRITE_BEHIND_MAX_PENDING = 50000
+WRITE_BEHIND_FSYNC = False
+
+# Métricas dos pedidos no formato do Prometheus (GET /metrics): latência, queries, tempo na db, serialização
+# e tamanho das respostas por vista. Pedidos mais lentos do que SLOW_REQUEST_THRESHOLD segundos são registados
+# no logger traffic_monitor.slow_requests com as queries que fizeram (None → desativado).
+METRICS_ENABLED = True
+SLOW_REQUEST_THRESHOLD = None
+
+# Deteção de incidentes (incidents.py): uma leitura é anómala quando fica INCIDENT_Z_THRESHOLD desvios-padrão abaixo
+# da média móvel exponencial (peso INCIDENT_EWMA_ALPHA) do segmento; o desvio-padrão usado é pelo menos INCIDENT_MIN_STD km/h.
+# Cada segmento só é avaliado depois de INCIDENT_MIN_READINGS leituras e um incidente termina depois de
+# INCIDENT_CLEAR_READINGS leituras normais. Depois de reiniciar, a média é calculada com as últimas INCIDENT_WARMUP_READINGS.
+INCIDENT_DETECTION = True
+INCIDENT_EWMA_ALPHA = 0.1
+INCIDENT_Z_THRESHOLD = 3.0
+INCIDENT_MIN_STD = 2.0
+INCIDENT_MIN_READINGS = 10
+INCIDENT_CLEAR_READINGS = 3
+INCIDENT_WARMUP_READINGS = 50
+
+# Previsão da velocidade (forecasting.py, GET /api/segments/{id}/forecast/): velocidade média por intervalos de
+# FORECAST_STEP_MINUTES, suavização exponencial do nível (FORECAST_ALPHA) e da sazonalidade diária (FORECAST_GAMMA).
+# O ajuste completo usa os últimos FORECAST_HISTORY_DAYS dias; as previsões vão até FORECAST_MAX_HORIZON minutos.
+FORECAST_STEP_MINUTES = 15
+FORECAST_ALPHA = 0.3
+FORECAST_GAMMA = 0.1
+FORECAST_HISTORY_DAYS = 28
+FORECAST_MAX_HORIZON = 120
+
+# Percursos (routing.py, GET /api/segments/route/): tempo de cada segmento com a velocidade da última leitura (km/h),
+# ROUTING_DEFAULT_SPEED sem leituras e pelo menos ROUTING_MIN_SPEED (trânsito parado). As velocidades escritas por outros
+# processos são lidas a cada ROUTING_SYNC_INTERVAL segundos; o grafo é reconstruído ao fim de ROUTING_GRAPH_MAX_AGE segundos.
+ROUTING_DEFAULT_SPEED = 30
+ROUTING_MIN_SPEED = 5
+ROUTING_SYNC_INTERVAL = 10
+ROUTING_GRAPH_MAX_AGE = 300
+
+# Número máximo de leituras num único POST /api/readings/bulk/
+BULK_READINGS_MAX_ITEMS = 10000
+
 # Swagger / Spectacular (Documentação da API)
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Traffic Monitor API',
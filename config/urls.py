@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
+from traffic_monitor.metrics import metrics_view
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularSwaggerView,
@@ -11,6 +12,7 @@ URLs principais do projeto.
 - /admin/          → Django Admin
 - /api/            → API REST (aplicação traffic_monitor)
 - /api/docs/       → Documentação Swagger
+- /metrics         → Métricas dos pedidos (Prometheus)
 """
 
 urlpatterns = [
@@ -27,4 +29,7 @@ urlpatterns = [
 
     # GET /api/schema/ → Baixa o schema em JSON
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+
+    # GET /metrics → Métricas de desempenho dos pedidos (formato do Prometheus)
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import RoadSegment, SpeedReading
+from .models import DailySpeedRollup, HourlySpeedRollup, ImportedFile, Incident, RoadSegment, SegmentForecast, SegmentState, SpeedReading
 
 
 @admin.register(RoadSegment)
@@ -19,4 +19,41 @@ class SpeedReadingAdmin(admin.ModelAdmin):
     
     def get_intensity(self, obj):
         return obj.intensity
-    get_intensity.short_description = 'Intensidade'
\ No newline at end of file
+    get_intensity.short_description = 'Intensidade'
+
+
+@admin.register(SegmentState)
+class SegmentStateAdmin(admin.ModelAdmin):
+    list_display = ['road_segment', 'reading_count', 'latest_speed', 'intensity', 'latest_timestamp']
+    list_filter = ['intensity']
+    readonly_fields = ['updated_at']                                                        # O estado é mantido automaticamente
+
+
+@admin.register(HourlySpeedRollup, DailySpeedRollup)
+class SpeedRollupAdmin(admin.ModelAdmin):
+    list_display = ['road_segment', 'bucket', 'count', 'average_speed', 'speed_min', 'speed_max']
+    list_filter = ['bucket']
+    search_fields = ['road_segment__id']
+
+
+@admin.register(ImportedFile)
+class ImportedFileAdmin(admin.ModelAdmin):
+    list_display = ['path', 'rows_processed', 'readings_created', 'readings_updated', 'errors', 'completed_at']
+    list_filter = ['completed_at']
+    search_fields = ['path']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(Incident)
+class IncidentAdmin(admin.ModelAdmin):
+    list_display = ['id', 'road_segment', 'started_at', 'ended_at', 'expected_speed', 'min_speed', 'max_score', 'reading_count']
+    list_filter = ['started_at', 'ended_at']
+    search_fields = ['road_segment__id']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(SegmentForecast)
+class SegmentForecastAdmin(admin.ModelAdmin):
+    list_display = ['road_segment', 'level', 'residual_variance', 'observations', 'fitted_until']
+    search_fields = ['road_segment__id']
+    readonly_fields = ['updated_at']                                                        # Os parâmetros são ajustados pelo fit_forecasts
@@ -0,0 +1,204 @@
+from datetime import timezone as dt_timezone
+
+from django.db import connection
+from django.db.models import Aggregate, Avg, Count, DateTimeField, FloatField, Func, Max, Min, Q, StdDev
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import INTENSITY_LEVELS
+from .rollups import ROLLUPS, aggregate_rollups, is_aligned
+
+"""
+Agregação das leituras de velocidade por intervalos de tempo (buckets), calculada na db.
+
+Exemplo: GET /api/readings/aggregate/?bucket=1h&road_segment=1&from=2024-12-01T00:00:00Z
+
+Para cada (bucket, segmento) é devolvido o número de leituras e a velocidade média, mínima, máxima e o desvio padrão.
+Opcionalmente: percentis (?percentiles=50,90, apenas em PostgreSQL) e histograma de intensidade (?histogram=true).
+
+Para os buckets de 1h e 1d, sempre que possível, os valores são lidos das tabelas de rollups
+(algumas centenas de linhas) em vez de agregar milhões de leituras.
+"""
+
+
+class TruncSeconds(Func):
+    """
+    Arredonda uma data para baixo, para um múltiplo de N segundos (ex.: 300 → intervalos de 5 minutos).
+
+    O Django só tem TruncMinute/TruncHour/..., por isso o cálculo é feito sobre o epoch (UTC).
+    """
+
+    output_field = DateTimeField()
+
+    def __init__(self, expression, seconds, **extra):
+        self.seconds = int(seconds)
+        super().__init__(expression, **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template=f'to_timestamp(floor(extract(epoch from %(expressions)s) / {self.seconds}) * {self.seconds})',
+            **extra_context
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template=f"datetime((CAST(strftime('%%%%s', %(expressions)s) AS INTEGER) / {self.seconds}) * {self.seconds}, 'unixepoch')",
+            **extra_context
+        )
+
+
+class PercentileCont(Aggregate):
+    """
+    Percentil contínuo (PostgreSQL): percentile_cont(0.9) WITHIN GROUP (ORDER BY campo)
+    """
+
+    function = 'percentile_cont'
+    template = '%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+# Buckets disponíveis → função que arredonda o timestamp para o início do bucket
+BUCKETS = {
+    '5m': lambda field: TruncSeconds(field, 5 * 60),
+    '15m': lambda field: TruncSeconds(field, 15 * 60),
+    '1h': lambda field: TruncHour(field, tzinfo=dt_timezone.utc),
+    '1d': lambda field: TruncDay(field, tzinfo=dt_timezone.utc),
+}
+
+def parse_time_range(params):
+    """
+    Lê os parâmetros ?from= e ?to= (datas ISO 8601) e devolve (início, fim).
+
+    Qualquer um dos dois pode ser None. Lança ValidationError se a data for inválida.
+    """
+    bounds = []
+    for name in ('from', 'to'):
+        value = params.get(name)
+        parsed = None
+        if value:
+            try:
+                parsed = parse_datetime(value)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                raise ValidationError({name: f'Data inválida: {value}. Use o formato ISO 8601 (ex.: 2024-12-17T14:00:00Z).'})
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=dt_timezone.utc)
+        bounds.append(parsed)
+    return tuple(bounds)
+
+
+def parse_segment_id(params):
+    """
+    Lê o parâmetro ?road_segment= (id de um segmento). Retorna None se não existir.
+    Lança ValidationError se não for um número inteiro.
+    """
+    value = params.get('road_segment')
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({'road_segment': f'Id de segmento inválido: {value}. Deve ser um número inteiro.'})
+
+
+def filter_time_range(queryset, start, end):
+    """
+    Filtra as leituras com start <= timestamp < end.
+    """
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    return queryset
+
+
+def parse_percentiles(value):
+    """
+    Converte "50,90,99" em [50.0, 90.0, 99.0] (valores entre 0 e 100).
+    """
+    if not value:
+        return []
+    try:
+        percentiles = [float(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ValidationError({'percentiles': 'Use uma lista de números separados por vírgulas (ex.: 50,90).'})
+    if any(not 0 <= percentile <= 100 for percentile in percentiles):
+        raise ValidationError({'percentiles': 'Os percentis devem estar entre 0 e 100.'})
+    if percentiles and connection.vendor != 'postgresql':
+        raise ValidationError({'percentiles': 'Os percentis só estão disponíveis com PostgreSQL.'})
+    return percentiles
+
+
+def aggregate_readings(queryset, bucket, percentiles=(), histogram=False, segment_id=None, start=None, end=None, use_rollups=True):
+    """
+    Agrupa as leituras por (bucket, segmento) e devolve um formato compacto:
+
+        {
+            "bucket": "1h",
+            "source": "rollup",
+            "columns": ["bucket", "road_segment", "count", "avg", "min", "max", "stddev", ...],
+            "rows": [["2024-12-17T14:00:00Z", 1, 12, 35.2, 10.0, 61.5, 12.1, ...], ...]
+        }
+
+    queryset já deve vir filtrado (segmento e intervalo de tempo); segment_id, start e end são usados
+    para decidir se a resposta pode ser lida dos rollups: só quando o intervalo pedido coincide com o
+    início dos buckets e não são pedidos percentis nem histograma (que os rollups não guardam).
+    Os rollups só conhecem o segmento e o intervalo de tempo: com outros filtros no queryset
+    (ex.: ?intensity=), quem chama deve passar use_rollups=False.
+    """
+    if bucket not in BUCKETS:
+        raise ValidationError({'bucket': f'Bucket inválido: {bucket}. Opções: {", ".join(BUCKETS)}.'})
+
+    columns = ['bucket', 'road_segment', 'count', 'avg', 'min', 'max', 'stddev']
+
+    if use_rollups and bucket in ROLLUPS and not percentiles and not histogram and is_aligned(start, bucket) and is_aligned(end, bucket):
+        rows = aggregate_rollups(bucket, segment_id=segment_id, start=start, end=end)
+        source = 'rollup'
+    else:
+        aggregates = {
+            'count': Count('id'),
+            'avg': Avg('average_speed'),
+            'min': Min('average_speed'),
+            'max': Max('average_speed'),
+            'stddev': StdDev('average_speed'),
+        }
+        for percentile in percentiles:
+            aggregates[f'p{percentile:g}'.replace('.', '_')] = PercentileCont('average_speed', percentile / 100)
+        if histogram:
+            # Uma coluna por intensidade, calculada na db com os limites de cada segmento
+            queryset = queryset.with_intensity()
+            for name in INTENSITY_LEVELS:
+                aggregates[name] = Count('id', filter=Q(speed_intensity=name))
+
+        rows = (
+            queryset.order_by()
+            .annotate(bucket=BUCKETS[bucket]('timestamp'))
+            .values('bucket', 'road_segment_id')
+            .annotate(**aggregates)
+            .order_by('road_segment_id', 'bucket')
+            .values_list('bucket', 'road_segment_id', *aggregates)
+        )
+        columns = ['bucket', 'road_segment', *aggregates]
+        source = 'raw'
+
+    return {
+        'bucket': bucket,
+        'source': source,
+        'columns': columns,
+        'rows': [[format_bucket(row[0]), *row[1:]] for row in rows],
+    }
+
+
+def format_bucket(value):
+    """
+    Data do início do bucket em ISO 8601 (UTC, com Z), como no resto da API.
+    """
+    value = value.astimezone(dt_timezone.utc).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class TrafficMonitorConfig(AppConfig):
     name = 'traffic_monitor'
+    default_auto_field = 'django.db.models.BigAutoField'  # Igual ao usado na migração inicial
+
+    def ready(self):
+        # Regista os signals que mantêm o SegmentState atualizado
+        from . import signals  # noqa: F401
+        # Instala o contador de queries das métricas em cada ligação à db
+        from . import metrics  # noqa: F401
@@ -0,0 +1,169 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from .models import RoadSegment
+from .caching import LIST_VERSION_KEY, aget_version, compute_etag, get_cache, get_timeout, is_not_modified, segment_version_key, url_key
+from .serializers import RoadSegmentListSerializer, RoadSegmentSerializer, SpeedReadingSerializer, segment_state
+from .views import RoadSegmentViewSet, SpeedReadingViewSet
+
+"""
+Versões assíncronas (ORM assíncrono do Django) dos endpoints de leitura mais usados, para servir com ASGI:
+
+    GET /api/async/segments/                 → como GET /api/segments/ (filtros intensity e bbox, paginação por cursor)
+    GET /api/async/segments/{id}/            → como GET /api/segments/{id}/
+    GET /api/async/segments/{id}/state/      → estado atual do segmento (total de leituras, intensidade e última leitura)
+    GET /api/async/readings/?road_segment=1  → como GET /api/readings/ (filtros road_segment, intensity, from e to)
+
+Os ViewSets do DRF são síncronos: com ASGI, cada pedido ocupa uma thread enquanto espera pela db
+e pelo cliente. Estas vistas são corrotinas (o Django serve-as sem threadpool) e as respostas são iguais
+às dos ViewSets: os querysets, filtros, paginação e serializers são os mesmos, apenas a leitura da db é
+feita com o ORM assíncrono (async for / aget).
+
+Apenas leitura (GET); as escritas continuam nos ViewSets. As respostas dos segmentos usam a mesma cache
+(versões e ETag, ver caching.py), através da API assíncrona da cache do Django.
+"""
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def async_api_view(view):
+    """
+    Decorador das vistas assíncronas: aceita apenas GET, passa um Request do DRF (query_params, build_absolute_uri)
+    e converte as exceções do DRF (ValidationError, NotFound, ...) na mesma resposta JSON dos ViewSets.
+    """
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(Request(request), *args, **kwargs)
+        except (APIException, Http404) as exc:
+            response = exception_handler(exc, {})
+            return json_response(response.data, response.status_code)
+    return wrapper
+
+
+async def cached_response(request, key, build):
+    """
+    Versão assíncrona do CachedResponseMixin.cached_response: `key` deve incluir a versão e `build` é a
+    corrotina que gera os dados da resposta (as exceções não ficam em cache).
+    """
+    timeout = get_timeout()
+    if not timeout:
+        return json_response(await build())
+
+    cache = get_cache()
+    cached = await cache.aget(key)
+    if cached is None:
+        data = await build()
+        cached = (data, compute_etag(data))
+        await cache.aset(key, cached, timeout)
+
+    data, etag = cached
+    response = HttpResponse(status=304) if is_not_modified(request, etag) else json_response(data)
+    response['ETag'] = etag
+    return response
+
+
+def get_viewset(viewset_class, request, action, **kwargs):
+    """
+    Instância do ViewSet para reutilizar o get_queryset, filtros e paginação (não é executado nenhum pedido).
+    """
+    return viewset_class(request=request, args=(), kwargs=kwargs, action=action, format_kwarg=None)
+
+
+async def get_queryset(view):
+    """
+    O filtro ?bbox= usa o índice espacial (que pode ter de ser construído a partir da db), por isso corre numa thread.
+    """
+    if view.request.query_params.get('bbox'):
+        return await sync_to_async(view.get_queryset)()
+    return view.get_queryset()
+
+
+async def paginated_data(view, queryset, serialize):
+    """
+    Lê a página com o ORM assíncrono e devolve os mesmos dados da paginação do ViewSet.
+    """
+    paginator = view.paginator
+    page_queryset = paginator.page_queryset(queryset, view.request)
+    if page_queryset is None:
+        return serialize([item async for item in queryset])
+    page = paginator.set_page([item async for item in page_queryset])
+    return paginator.get_paginated_response(serialize(page)).data
+
+
+async def get_segment(pk):
+    return await aget_object_or_404(RoadSegment.objects.select_related('state'), pk=pk)
+
+
+@async_api_view
+async def segment_list(request):
+    """
+    GET /api/async/segments/?intensity=elevada&bbox=...&cursor=...
+    """
+    async def build():
+        view = get_viewset(RoadSegmentViewSet, request, 'list')
+        return await paginated_data(
+            view, await get_queryset(view), lambda page: RoadSegmentListSerializer(page, many=True).data
+        )
+
+    key = f'segments:list:{await aget_version(LIST_VERSION_KEY)}:{url_key(request)}'
+    return await cached_response(request, key, build)
+
+
+@async_api_view
+async def segment_detail(request, pk):
+    """
+    GET /api/async/segments/{id}/
+    """
+    async def build():
+        return RoadSegmentSerializer(await get_segment(pk)).data
+
+    key = f'segments:retrieve:{pk}:{await aget_version(segment_version_key(pk))}:{url_key(request)}'
+    return await cached_response(request, key, build)
+
+
+@async_api_view
+async def segment_state_detail(request, pk):
+    """
+    GET /api/async/segments/{id}/state/
+
+    Exemplo de resposta:
+        {"road_segment": 1, "total_readings": 12, "intensity": "média", "latest_reading": {...}}
+    """
+    async def build():
+        segment = await get_segment(pk)
+        state = segment_state(segment)
+        latest = state.latest_reading() if state else None
+        return {
+            'road_segment': segment.pk,
+            'total_readings': state.reading_count if state else 0,
+            'intensity': state.intensity if state else None,
+            'latest_reading': SpeedReadingSerializer(latest).data if latest else None,
+        }
+
+    key = f'segments:state:{pk}:{await aget_version(segment_version_key(pk))}:{url_key(request)}'
+    return await cached_response(request, key, build)
+
+
+@async_api_view
+async def reading_list(request):
+    """
+    GET /api/async/readings/?road_segment=1&intensity=elevada&from=...&to=...&cursor=...
+
+    Usa a serialização rápida (SpeedReadingFastSerializer), como a listagem do ViewSet.
+    """
+    view = get_viewset(SpeedReadingViewSet, request, 'list')
+    serializer = view.fast_serializer_class()
+    queryset = serializer.prepare(view.filter_queryset(view.get_queryset()))
+    return json_response(await paginated_data(view, queryset, serializer.to_representation))
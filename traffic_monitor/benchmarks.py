@@ -0,0 +1,196 @@
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+
+import django
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .models import RoadSegment
+from .synthetic import generate_rows, write_csv
+
+"""
+Suite de benchmarks (comando run_benchmarks): gera um dataset sintético determinístico (synthetic.py),
+mede a importação e a latência e o número de queries dos principais endpoints, e devolve os resultados
+num dicionário (guardado em JSON) que pode ser comparado com os de outra execução:
+
+    {
+        "meta": {"git_commit": "93cab9b", "database": "postgresql", "segments": 1000, "readings": 20, ...},
+        "import": {"insert": {"rows": 20000, "seconds": 4.1, "rows_per_second": 4878.0}, "upsert": {...}},
+        "endpoints": {"segments_list": {"url": "/api/segments/", "p50_ms": 3.2, "p95_ms": 4.0, "p99_ms": 5.1, "queries": 2, ...}}
+    }
+
+Os pedidos são feitos com o Client de testes do Django (no mesmo processo, sem rede), por isso medem
+o custo da aplicação e da db, não do servidor HTTP (para isso existe o load_test).
+"""
+
+# Métricas comparadas: caminho nos resultados → True se um valor maior é melhor
+HIGHER_IS_BETTER = {'rows_per_second': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'queries': False}
+
+# Endpoints medidos (ver endpoint_urls)
+ENDPOINTS = (
+    'segments_list', 'segments_list_cached', 'segments_detail', 'segments_intensity', 'segments_bbox',
+    'segments_nearest', 'readings_list', 'readings_by_segment', 'readings_intensity', 'readings_aggregate',
+)
+
+
+def percentile(values, q):
+    """
+    Percentil q (0 a 1) de uma lista já ordenada.
+    """
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def benchmark_import(segments, readings, seed, batch_size):
+    """
+    Importa o dataset sintético (import_data) e volta a importá-lo com --upsert (nada muda).
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.csv')
+        rows = write_csv(path, generate_rows(segments, readings, seed))
+        for name, options in (('insert', {}), ('upsert', {'upsert': True, 'force': True})):
+            started = time.perf_counter()
+            call_command('import_data', file=path, batch_size=batch_size, stdout=StringIO(), **options)
+            elapsed = time.perf_counter() - started
+            results[name] = {'rows': rows, 'seconds': round(elapsed, 3), 'rows_per_second': round(rows / elapsed, 1)}
+    return results
+
+
+def endpoint_urls(seed, count=20):
+    """
+    URLs de cada endpoint medido: {nome: (urls, com cache)}. Os pedidos de cada endpoint percorrem
+    as urls (ex.: segmentos diferentes), escolhidas com a mesma semente em todas as execuções.
+    """
+    rng = random.Random(seed)
+    ids = list(RoadSegment.objects.order_by('id').values_list('id', 'longitude_start', 'latitude_start'))
+    sample = [rng.choice(ids) for _ in range(count)]
+    bboxes = [f'{lon - 0.02:.5f},{lat - 0.02:.5f},{lon + 0.02:.5f},{lat + 0.02:.5f}' for _id, lon, lat in sample]
+    return {
+        'segments_list': (['/api/segments/'], False),
+        'segments_list_cached': (['/api/segments/'], True),
+        'segments_detail': ([f'/api/segments/{segment_id}/' for segment_id, _lon, _lat in sample], False),
+        'segments_intensity': (['/api/segments/?intensity=elevada'], False),
+        'segments_bbox': ([f'/api/segments/?bbox={bbox}' for bbox in bboxes], False),
+        'segments_nearest': ([f'/api/segments/nearest/?lon={lon}&lat={lat}&limit=10' for _id, lon, lat in sample], False),
+        'readings_list': (['/api/readings/'], False),
+        'readings_by_segment': ([f'/api/readings/?road_segment={segment_id}' for segment_id, _lon, _lat in sample], False),
+        'readings_intensity': (['/api/readings/?intensity=elevada'], False),
+        'readings_aggregate': (
+            [f'/api/readings/aggregate/?bucket=1h&road_segment={segment_id}' for segment_id, _lon, _lat in sample], False
+        ),
+    }
+
+
+def benchmark_endpoint(client, urls, requests, cached):
+    """
+    Faz um pedido de aquecimento e `requests` pedidos medidos. Retorna a latência (p50/p95/p99/média)
+    e o número máximo de queries por pedido.
+    """
+    with override_settings(SEGMENT_CACHE_TIMEOUT=300 if cached else 0):
+        client.get(urls[0])
+        latencies, queries, statuses = [], 0, set()
+        for index in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(urls[index % len(urls)])
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured))
+            statuses.add(response.status_code)
+
+    latencies.sort()
+    return {
+        'url': urls[0],
+        'requests': requests,
+        'p50_ms': round(percentile(latencies, 0.5), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'queries': queries,
+        'status': sorted(statuses),
+    }
+
+
+def run_suite(segments=1000, readings=20, seed=42, requests=50, batch_size=1000, only=None):
+    """
+    Corre a suite na db atual (o comando run_benchmarks usa uma db de testes criada para o efeito).
+    `only`: lista de nomes de endpoints a medir (por defeito todos).
+    """
+    # Cache própria (em memória) e sem DEBUG, para não depender da configuração do ambiente
+    benchmark_settings = override_settings(
+        DEBUG=False,
+        ALLOWED_HOSTS=['testserver'],
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmarks'}},
+        SEGMENT_CACHE_ALIAS='default',
+    )
+    with benchmark_settings:
+        results = {
+            'meta': {
+                'created_at': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+                'git_commit': git_commit(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'segments': segments,
+                'readings': readings,
+                'seed': seed,
+                'requests': requests,
+                'batch_size': batch_size,
+            },
+            'import': benchmark_import(segments, readings, seed, batch_size),
+            'endpoints': {},
+        }
+
+        client = Client()
+        for name, (urls, cached) in endpoint_urls(seed).items():
+            if only and name not in only:
+                continue
+            results['endpoints'][name] = benchmark_endpoint(client, urls, max(1, requests), cached)
+    return results
+
+
+def compare_results(current, baseline, threshold=10.0):
+    """
+    Compara duas execuções. Retorna [(métrica, anterior, atual, variação em %, regressão), ...].
+
+    Uma métrica é uma regressão se piorar mais do que `threshold` % (latência e débito) ou,
+    no caso do número de queries, se aumentar.
+    """
+    pairs = [
+        (f'import.{name}.rows_per_second', values.get('rows_per_second'), baseline.get('import', {}).get(name, {}).get('rows_per_second'))
+        for name, values in current.get('import', {}).items()
+    ]
+    for name, values in current.get('endpoints', {}).items():
+        previous = baseline.get('endpoints', {}).get(name, {})
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries'):
+            pairs.append((f'endpoints.{name}.{metric}', values.get(metric), previous.get(metric)))
+
+    comparison = []
+    for path, value, previous in pairs:
+        if value is None or previous is None:
+            continue
+        metric = path.rsplit('.', 1)[1]
+        change = (value - previous) / previous * 100 if previous else 0.0
+        worse = -change if HIGHER_IS_BETTER[metric] else change
+        if metric == 'queries':
+            regression = value > previous
+        else:
+            regression = worse > threshold
+        comparison.append((path, previous, value, round(change, 1), regression))
+    return comparison
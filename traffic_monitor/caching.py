@@ -0,0 +1,141 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import quote_etag
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+"""
+Cache das respostas GET dos segmentos (listagem e detalhe).
+
+As chaves incluem um número de versão, guardado também na cache:
+- segments:version:list → muda sempre que um segmento ou uma leitura é criado, alterado ou apagado
+- segments:version:<id> → muda quando o segmento <id> ou uma das suas leituras muda
+
+Invalidar é apenas mudar a versão para um número maior (as respostas antigas deixam de ser usadas e expiram
+sozinhas). As versões de um conjunto de segmentos mudam de uma só vez (get_many + set_many), não uma a uma.
+
+Cada resposta tem um ETag; um pedido com If-None-Match igual recebe 304 sem corpo.
+
+Configuração (config/settings.py):
+    SEGMENT_CACHE_ALIAS = 'default'   # Cache do Django a usar (CACHES)
+    SEGMENT_CACHE_TIMEOUT = 300       # Duração em segundos (0 desativa a cache)
+"""
+
+LIST_VERSION_KEY = 'segments:version:list'
+
+
+def get_cache():
+    return caches[getattr(settings, 'SEGMENT_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'SEGMENT_CACHE_TIMEOUT', 300)
+
+
+def segment_version_key(segment_id):
+    return f'segments:version:{segment_id}'
+
+
+def get_version(key):
+    """
+    Versão atual de uma chave. Se ainda não existir (ou tiver sido removida da cache),
+    começa no instante atual, para nunca voltar a um número de versão já usado.
+    """
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+async def aget_version(key):
+    """
+    Versão assíncrona do get_version (vistas de async_views.py).
+    """
+    cache = get_cache()
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key, 0)
+    return version
+
+
+def bump_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def invalidate_segments(segment_ids):
+    """
+    Invalida as respostas dos segmentos indicados e todas as listagens
+    (uma alteração pode mudar o resultado de qualquer página ou filtro).
+
+    Todas as versões passam para o mesmo número, maior do que o instante atual e do que qualquer
+    das versões atuais: 2 pedidos à cache (get_many + set_many), qualquer que seja o número de segmentos.
+    """
+    keys = [segment_version_key(segment_id) for segment_id in set(segment_ids)] + [LIST_VERSION_KEY]
+    cache = get_cache()
+    version = max([time.time_ns(), *(value + 1 for value in cache.get_many(keys).values())])
+    cache.set_many(dict.fromkeys(keys, version), None)
+
+
+def compute_etag(data):
+    return quote_etag(hashlib.md5(JSONRenderer().render(data)).hexdigest())
+
+
+def url_key(request):
+    return hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+
+
+def is_not_modified(request, etag):
+    return etag in parse_etags(request.headers.get('If-None-Match', ''))
+
+
+class CachedResponseMixin:
+    """
+    Mixin para ViewSets: guarda na cache as respostas de list e retrieve,
+    por URL completo (inclui os parâmetros, ex.: ?intensity=elevada&cursor=...).
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def response_cache_key(self, request):
+        url = url_key(request)
+        if self.action == 'retrieve':
+            segment_id = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            version = get_version(segment_version_key(segment_id))
+            return f'segments:retrieve:{segment_id}:{version}:{url}'
+        return f'segments:list:{get_version(LIST_VERSION_KEY)}:{url}'
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        timeout = get_timeout()
+        if not timeout:
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.response_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cached = (response.data, compute_etag(response.data))
+            cache.set(key, cached, timeout)
+
+        data, etag = cached
+        if is_not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+
+from .geojson import format_timestamp
+
+"""
+Exportação das leituras em CSV ou NDJSON, em streaming.
+
+Usado pelo endpoint GET /api/readings/export/ e pelo comando export_data.
+
+As leituras são lidas com .values_list().iterator(chunk_size=...) (cursor do lado do servidor em PostgreSQL)
+e cada linha é escrita diretamente, sem criar instâncias dos modelos nem passar pelo ModelSerializer.
+A memória usada é a mesma para mil ou para dezenas de milhões de leituras.
+"""
+
+# Colunas exportadas (a intensidade é calculada na db, com os limites de cada segmento)
+EXPORT_COLUMNS = ['id', 'road_segment', 'average_speed', 'intensity', 'timestamp', 'created_at']
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def iter_readings(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Percorre as leituras por ordem (timestamp, id) e devolve tuplos com as colunas de EXPORT_COLUMNS.
+    """
+    rows = (
+        queryset.with_intensity()
+        .order_by('timestamp', 'id')
+        .values_list('id', 'road_segment_id', 'average_speed', 'speed_intensity', 'timestamp', 'created_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    for reading_id, segment_id, speed, intensity, timestamp, created_at in rows:
+        yield reading_id, segment_id, speed, intensity, format_timestamp(timestamp), format_timestamp(created_at)
+
+
+def _batches(rows, chunk_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode_csv(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Gera o CSV (com cabeçalho) em blocos de texto de chunk_size linhas.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in _batches(rows, chunk_size):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_ndjson(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Gera o NDJSON (um objeto JSON por linha) em blocos de texto de chunk_size linhas.
+    """
+    for batch in _batches(rows, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, separators=(',', ':')) + '\n'
+            for row in batch
+        )
+
+
+# Formato → (função que gera o texto, content type, extensão do ficheiro)
+EXPORT_FORMATS = {
+    'csv': (encode_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (encode_ndjson, 'application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+
+def export_readings(queryset, output='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Gera a exportação das leituras no formato pedido ('csv' ou 'ndjson'), aos bocados.
+    """
+    encode = EXPORT_FORMATS[output][0]
+    return encode(iter_readings(queryset, chunk_size), chunk_size)
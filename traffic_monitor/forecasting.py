@@ -0,0 +1,248 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg
+from django.utils import timezone
+
+from .aggregation import TruncSeconds
+from .models import RoadSegment, SegmentForecast, SpeedReading, intensity_for_speed
+
+"""
+Previsão da velocidade de cada segmento a curto prazo (15 a 60 minutos).
+
+Modelo: suavização exponencial com sazonalidade diária (Holt-Winters aditivo, sem tendência), sobre
+a velocidade média de cada intervalo de FORECAST_STEP_MINUTES (ex.: 96 intervalos de 15 minutos por dia):
+
+    nível      L = α·(y - S[k]) + (1 - α)·L
+    sazonal    S[k] = γ·(y - L) + (1 - γ)·S[k]          (k = intervalo do dia de y)
+    previsão   ŷ(t + h) = L + S[intervalo do dia de t + h]
+
+Sem leituras no intervalo do dia, a componente sazonal é 0 (previsão = nível), o que torna o modelo num
+"seasonal naive" suavizado: a velocidade habitual àquela hora, corrigida pelo estado atual do trânsito.
+
+O ajuste é vetorizado com NumPy: as velocidades de um bloco de segmentos formam uma matriz
+(segmentos × intervalos, NaN onde não há leituras) e o modelo avança um intervalo de cada vez
+para todos os segmentos em simultâneo, em vez de um ciclo Python por segmento e leitura.
+
+Os parâmetros ajustados ficam na tabela segment_forecasts (SegmentForecast). O comando fit_forecasts
+continua o ajuste de cada segmento a partir desses parâmetros, só com as leituras posteriores a
+fitted_until (ajuste incremental); com --full, recomeça com os últimos FORECAST_HISTORY_DAYS dias.
+Os pedidos só leem os parâmetros guardados e as previsões começam sempre no intervalo atual,
+mesmo que o último ajuste já tenha algum tempo.
+
+Configuração (config/settings.py):
+    FORECAST_STEP_MINUTES = 15
+    FORECAST_ALPHA = 0.3              # Peso de cada intervalo no nível
+    FORECAST_GAMMA = 0.1              # Peso de cada intervalo na componente sazonal
+    FORECAST_HISTORY_DAYS = 28
+    FORECAST_MAX_HORIZON = 120        # Minutos
+"""
+
+# Peso de cada erro na variância dos erros de previsão (intervalos de confiança)
+RESIDUAL_WEIGHT = 0.05
+
+# Quantil da normal para o intervalo de 95%
+Z_95 = 1.96
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def step_seconds():
+    return int(get_setting('FORECAST_STEP_MINUTES', 15)) * 60
+
+
+def floor_time(value, seconds):
+    """
+    Arredonda uma data para baixo, para um múltiplo de `seconds` (UTC).
+    """
+    epoch = int(value.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=dt_timezone.utc)
+
+
+class ForecastState:
+    """
+    Estado do modelo de um bloco de segmentos (arrays NumPy, uma linha por segmento).
+    """
+
+    def __init__(self, count, periods):
+        self.level = np.full(count, np.nan)
+        self.seasonal = np.full((count, periods), np.nan)
+        self.residual_variance = np.zeros(count)
+        self.observations = np.zeros(count, dtype=np.int64)
+
+    def load(self, index, forecast):
+        self.level[index] = forecast.level
+        self.seasonal[index] = [np.nan if value is None else value for value in forecast.seasonal]
+        self.residual_variance[index] = forecast.residual_variance
+        self.observations[index] = forecast.observations
+
+    def fit(self, speeds, first_slot, alpha, gamma):
+        """
+        Avança o modelo sobre a matriz de velocidades (segmentos × intervalos, NaN → sem leituras).
+        first_slot é o número (epoch / passo) do primeiro intervalo da matriz.
+        """
+        periods = self.seasonal.shape[1]
+        for column in range(speeds.shape[1]):
+            y = speeds[:, column]
+            observed = ~np.isnan(y)
+            if not observed.any():
+                continue
+            k = (first_slot + column) % periods
+            season = self.seasonal[:, k]
+            known_level = ~np.isnan(self.level)
+            new_season = np.isnan(season)
+
+            # Erro da previsão a um passo (para a variância dos erros), quando já havia previsão
+            error = y - (self.level + season)
+            update = observed & known_level & ~new_season
+            self.residual_variance[update] += RESIDUAL_WEIGHT * (error[update] ** 2 - self.residual_variance[update])
+
+            # 1ª leitura do segmento → nível; 1ª leitura neste intervalo do dia → só a componente sazonal
+            # (o primeiro dia define a sazonalidade em relação ao nível, em vez de o nível a absorver)
+            level = np.where(
+                known_level, np.where(new_season, self.level, alpha * (y - season) + (1 - alpha) * self.level), y
+            )
+            self.level = np.where(observed, level, self.level)
+            deviation = y - self.level
+            season = np.where(new_season, deviation, gamma * deviation + (1 - gamma) * season)
+            self.seasonal[:, k] = np.where(observed, season, self.seasonal[:, k])
+            self.observations += observed
+
+
+def load_speeds(segment_ids, starts, until, seconds):
+    """
+    Velocidade média de cada segmento por intervalo, calculada na db (GROUP BY segmento, intervalo).
+    Retorna (matriz segmentos × intervalos, número do primeiro intervalo). Os intervalos anteriores
+    ao início de cada segmento (starts) ficam a NaN.
+    """
+    start = min(starts)
+    first_slot = int(start.timestamp()) // seconds
+    columns = int(until.timestamp()) // seconds - first_slot
+    speeds = np.full((len(segment_ids), max(columns, 0)), np.nan)
+    if columns <= 0:
+        return speeds, first_slot
+
+    rows = {segment_id: index for index, segment_id in enumerate(segment_ids)}
+    buckets = (
+        SpeedReading.objects
+        .filter(road_segment_id__in=segment_ids, timestamp__gte=start, timestamp__lt=until)
+        .order_by()
+        .annotate(slot=TruncSeconds('timestamp', seconds))
+        .values('road_segment_id', 'slot')
+        .annotate(speed=Avg('average_speed'))
+        .values_list('road_segment_id', 'slot', 'speed')
+    )
+    for segment_id, slot, speed in buckets.iterator(chunk_size=10000):
+        speeds[rows[segment_id], int(slot.timestamp()) // seconds - first_slot] = speed
+
+    # Descarta o que já foi usado no ajuste anterior de cada segmento
+    for index, segment_start in enumerate(starts):
+        speeds[index, :int(segment_start.timestamp()) // seconds - first_slot] = np.nan
+    return speeds, first_slot
+
+
+def fit_forecasts(segment_ids=None, full=False, until=None, batch_size=1000):
+    """
+    Ajusta (ou continua a ajustar) os modelos dos segmentos, em blocos de batch_size segmentos.
+    until: fim dos dados usados (por defeito o início do intervalo atual, que ainda não terminou).
+    Retorna o número de segmentos com modelo.
+    """
+    seconds = step_seconds()
+    periods = 86400 // seconds
+    alpha = get_setting('FORECAST_ALPHA', 0.3)
+    gamma = get_setting('FORECAST_GAMMA', 0.1)
+    until = floor_time(until or timezone.now(), seconds)
+    history_start = floor_time(until - timedelta(days=get_setting('FORECAST_HISTORY_DAYS', 28)), seconds)
+
+    queryset = RoadSegment.objects.order_by('id')
+    if segment_ids is not None:
+        queryset = queryset.filter(id__in=segment_ids)
+    all_ids = list(queryset.values_list('id', flat=True))
+
+    fitted = 0
+    for offset in range(0, len(all_ids), batch_size):
+        ids = all_ids[offset:offset + batch_size]
+        state = ForecastState(len(ids), periods)
+        starts = [history_start] * len(ids)
+        if not full:
+            cached = SegmentForecast.objects.in_bulk(ids)
+            for index, segment_id in enumerate(ids):
+                forecast = cached.get(segment_id)
+                if forecast is not None and forecast.step_minutes * 60 == seconds and len(forecast.seasonal) == periods:
+                    state.load(index, forecast)
+                    starts[index] = max(forecast.fitted_until, history_start)
+
+        speeds, first_slot = load_speeds(ids, starts, until, seconds)
+        state.fit(speeds, first_slot, alpha, gamma)
+
+        forecasts = [
+            SegmentForecast(
+                road_segment_id=segment_id,
+                step_minutes=seconds // 60,
+                level=float(state.level[index]),
+                seasonal=[None if math.isnan(value) else float(value) for value in state.seasonal[index]],
+                residual_variance=float(state.residual_variance[index]),
+                observations=int(state.observations[index]),
+                fitted_until=until,
+            )
+            for index, segment_id in enumerate(ids)
+            if not math.isnan(state.level[index])
+        ]
+        with transaction.atomic():
+            SegmentForecast.objects.bulk_create(
+                forecasts,
+                update_conflicts=True,
+                unique_fields=['road_segment'],
+                update_fields=['step_minutes', 'level', 'seasonal', 'residual_variance', 'observations', 'fitted_until', 'updated_at'],
+            )
+        fitted += len(forecasts)
+    return fitted
+
+
+def predict(forecast, horizon, segment=None, now=None):
+    """
+    Previsões do intervalo atual (now arredondado ao passo) até + horizon minutos, com o intervalo de 95%:
+    [{"timestamp": datetime, "minutes_ahead": 15, "speed": 42.1, "lower": 30.2, "upper": 54.0, "intensity": "média"}, ...]
+
+    Se o último ajuste (fitted_until) já tem algum tempo, o modelo avança até ao intervalo atual: a componente
+    sazonal é a do intervalo do dia de cada previsão e o intervalo de confiança alarga com os passos
+    decorridos desde fitted_until (sem leituras novas, o nível mantém-se).
+    """
+    seconds = forecast.step_minutes * 60
+    periods = len(forecast.seasonal)
+    alpha = get_setting('FORECAST_ALPHA', 0.3)
+    start = max(floor_time(now or timezone.now(), seconds), forecast.fitted_until)
+    first_slot = int(start.timestamp()) // seconds
+    elapsed = first_slot - int(forecast.fitted_until.timestamp()) // seconds
+    std = math.sqrt(forecast.residual_variance)
+
+    predictions = []
+    for step in range(1, horizon * 60 // seconds + 1):
+        season = forecast.seasonal[(first_slot + step - 1) % periods]
+        speed = max(0.0, forecast.level + (season or 0.0))
+        # O erro cresce com a distância ao último ajuste (suavização exponencial simples: 1 + (h - 1)·α²)
+        margin = Z_95 * std * math.sqrt(1 + (elapsed + step - 1) * alpha ** 2)
+        predictions.append({
+            'timestamp': start + timedelta(seconds=seconds * (step - 1)),
+            'minutes_ahead': step * seconds // 60,
+            'speed': round(speed, 2),
+            'lower': round(max(0.0, speed - margin), 2),
+            'upper': round(speed + margin, 2),
+            'intensity': intensity_for_speed(speed, segment),
+        })
+    return predictions
+
+
+def get_forecast(segment):
+    """
+    Parâmetros guardados do segmento (None se ainda não tiver modelo).
+
+    Não ajusta o modelo: isso é feito pelo comando fit_forecasts, para que um pedido GET nunca escreva na db
+    (nem repita o ajuste em cada pedido de um segmento que ainda não tem dados suficientes).
+    """
+    return SegmentForecast.objects.filter(road_segment=segment).first()
@@ -0,0 +1,86 @@
+import json
+import math
+from datetime import timezone as dt_timezone
+
+"""
+Exportação dos segmentos em GeoJSON (FeatureCollection), gerada em streaming.
+
+Cada segmento é uma Feature com uma geometria LineString (início → fim) e o estado atual:
+
+    {"type": "Feature", "id": 1,
+     "geometry": {"type": "LineString", "coordinates": [[-8.61, 41.15], [-8.60, 41.15]]},
+     "properties": {"length": 400.0, "intensity": "média", "latest_speed": 35.2,
+                    "latest_timestamp": "2024-12-17T14:00:00Z", "total_readings": 12}}
+
+As linhas são lidas da db em blocos (iterator, com um cursor do lado do servidor em PostgreSQL)
+e escritas à medida, por isso a memória usada não depende do número de segmentos.
+"""
+
+# Colunas lidas de cada segmento (inclui o estado atual, guardado no SegmentState)
+FEATURE_COLUMNS = (
+    'id', 'longitude_start', 'latitude_start', 'longitude_end', 'latitude_end', 'length',
+    'state__intensity', 'state__latest_speed', 'state__latest_timestamp', 'state__reading_count',
+)
+
+# Número de segmentos lidos da db (e escritos na resposta) de cada vez
+STREAM_CHUNK_SIZE = 2000
+
+
+def format_timestamp(value):
+    if value is None:
+        return None
+    value = value.astimezone(dt_timezone.utc).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def segment_feature(row):
+    """
+    Converte uma linha (FEATURE_COLUMNS) numa Feature GeoJSON.
+    """
+    segment_id, lon_start, lat_start, lon_end, lat_end, length, intensity, speed, timestamp, count = row
+    return {
+        'type': 'Feature',
+        'id': segment_id,
+        'geometry': {'type': 'LineString', 'coordinates': [[lon_start, lat_start], [lon_end, lat_end]]},
+        'properties': {
+            'length': length,
+            'intensity': intensity,
+            'latest_speed': speed,
+            'latest_timestamp': format_timestamp(timestamp),
+            'total_readings': count or 0,
+        },
+    }
+
+
+def stream_feature_collection(queryset):
+    """
+    Gera a FeatureCollection aos bocados (um bloco de texto por cada STREAM_CHUNK_SIZE segmentos).
+    """
+    rows = queryset.order_by('id').values_list(*FEATURE_COLUMNS).iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+    yield '{"type": "FeatureCollection", "features": ['
+    separator, buffer = '', []
+    for row in rows:
+        buffer.append(separator + json.dumps(segment_feature(row), ensure_ascii=False, separators=(',', ':')))
+        separator = ','
+        if len(buffer) >= STREAM_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+    yield ']}'
+
+
+def tile_bbox(z, x, y):
+    """
+    Área (minLon, minLat, maxLon, maxLat) de um tile z/x/y (esquema XYZ / Web Mercator, como nos mapas web).
+    """
+    tiles = 2 ** z
+
+    def lon(value):
+        return value / tiles * 360.0 - 180.0
+
+    def lat(value):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * value / tiles))))
+
+    return lon(x), lat(y + 1), lon(x + 1), lat(y)
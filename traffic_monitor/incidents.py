@@ -0,0 +1,292 @@
+import logging
+import math
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Incident, SpeedReading
+from . import pubsub
+
+logger = logging.getLogger(__name__)
+
+"""
+Deteção de incidentes (congestionamentos anómalos) nas novas leituras.
+
+A intensidade de uma leitura é uma classificação fixa (ex.: abaixo de 20 km/h → elevada), que não distingue
+uma via rápida parada de uma rua que anda sempre devagar. Aqui, cada segmento tem em memória a média
+e a variância móveis exponenciais (EWMA) das suas velocidades, e uma leitura é anómala quando fica
+mais de INCIDENT_Z_THRESHOLD desvios-padrão abaixo da média:
+
+    score = (média - velocidade) / max(desvio-padrão, INCIDENT_MIN_STD)
+
+Cada nova leitura custa O(1) (atualizar a média e a variância do segmento), sem queries; só são escritos
+na db os incidentes que começam, mudam ou terminam, uma vez por bloco de leituras.
+
+- A primeira leitura anómala abre um incidente (modelo Incident); as seguintes atualizam-no
+- O incidente termina depois de INCIDENT_CLEAR_READINGS leituras normais seguidas
+- As leituras anómalas não entram na média, para que o congestionamento não passe a ser "o normal"
+- Um segmento só é avaliado depois de INCIDENT_MIN_READINGS leituras (a média ainda não é fiável)
+- Leituras mais antigas do que a última do segmento (ex.: importação de dados antigos) são ignoradas
+
+As estatísticas de um segmento que ainda não está em memória (ex.: depois de reiniciar) são calculadas
+a partir das suas últimas INCIDENT_WARMUP_READINGS leituras na db, com uma query por bloco de leituras.
+
+O detetor é local ao processo (como o pub/sub do tempo real): as leituras devem ser escritas por um processo
+(ex.: import_data ou a escrita diferida) para que todas passem pelo mesmo detetor. O lock do detetor só protege
+as estatísticas em memória: as queries (arranque dos segmentos e gravação dos incidentes) são feitas fora dele.
+Uma falha na deteção é registada no log e não afeta a escrita das leituras (que já foram gravadas).
+
+Configuração (config/settings.py):
+    INCIDENT_DETECTION = True
+    INCIDENT_EWMA_ALPHA = 0.1         # Peso de cada nova leitura na média
+    INCIDENT_Z_THRESHOLD = 3.0
+    INCIDENT_MIN_STD = 2.0            # km/h
+    INCIDENT_MIN_READINGS = 10
+    INCIDENT_CLEAR_READINGS = 3
+    INCIDENT_WARMUP_READINGS = 50
+"""
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+class SegmentStats:
+    """
+    Estatísticas móveis de um segmento e o seu incidente ativo (se houver).
+    """
+
+    __slots__ = ('mean', 'variance', 'count', 'last_timestamp', 'incident', 'normal_streak')
+
+    def __init__(self):
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+        self.last_timestamp = None
+        self.incident = None
+        self.normal_streak = 0
+
+    def update(self, speed, alpha):
+        """
+        Acrescenta uma velocidade à média e à variância móveis exponenciais.
+        """
+        if self.count == 0:
+            self.mean = speed
+        else:
+            diff = speed - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.variance = (1 - alpha) * (self.variance + diff * increment)
+        self.count += 1
+
+    def score(self, speed, min_std):
+        """
+        Número de desvios-padrão abaixo da média (negativo → acima da média).
+        """
+        return (self.mean - speed) / max(math.sqrt(self.variance), min_std)
+
+    def is_anomalous(self, speed, threshold, min_std, min_readings):
+        return self.count >= min_readings and self.score(speed, min_std) >= threshold
+
+
+class IncidentDetector:
+    """
+    Detetor de incidentes: {segmento: SegmentStats} em memória.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.segments = {}
+
+    def reset(self):
+        with self.lock:
+            self.segments.clear()
+
+    def forget(self, segment_id):
+        with self.lock:
+            self.segments.pop(segment_id, None)
+
+    def process(self, readings):
+        """
+        Avalia as leituras (por ordem de timestamp) e grava os incidentes abertos, alterados e terminados.
+        Retorna a lista dos incidentes que mudaram.
+        """
+        readings = sorted(
+            (reading for reading in readings if reading.average_speed is not None),
+            key=lambda reading: (reading.timestamp, reading.pk or 0),
+        )
+        if not readings:
+            return []
+
+        params = alpha, threshold, min_std, min_readings = (
+            get_setting('INCIDENT_EWMA_ALPHA', 0.1),
+            get_setting('INCIDENT_Z_THRESHOLD', 3.0),
+            get_setting('INCIDENT_MIN_STD', 2.0),
+            get_setting('INCIDENT_MIN_READINGS', 10),
+        )
+        clear_readings = get_setting('INCIDENT_CLEAR_READINGS', 3)
+
+        # Estatísticas dos segmentos que ainda não estão em memória, lidas da db fora do lock
+        with self.lock:
+            missing = {reading.road_segment_id for reading in readings} - self.segments.keys()
+        loaded = self.warm_up(missing, readings[0].timestamp, params) if missing else {}
+
+        with self.lock:
+            for segment_id, stats in loaded.items():
+                self.segments.setdefault(segment_id, stats)     # Outra thread pode ter carregado o segmento entretanto
+            changed = {}
+            for reading in readings:
+                stats = self.segments.get(reading.road_segment_id)
+                if stats is None:
+                    continue    # Segmento esquecido entretanto (ex.: apagado)
+                if stats.last_timestamp is not None and reading.timestamp <= stats.last_timestamp:
+                    continue
+                stats.last_timestamp = reading.timestamp
+
+                if stats.is_anomalous(reading.average_speed, threshold, min_std, min_readings):
+                    score = stats.score(reading.average_speed, min_std)
+                    stats.normal_streak = 0
+                    incident = stats.incident
+                    if incident is None:
+                        incident = stats.incident = Incident(
+                            road_segment_id=reading.road_segment_id,
+                            started_at=reading.timestamp,
+                            expected_speed=round(stats.mean, 2),
+                            min_speed=reading.average_speed,
+                            max_score=round(score, 2),
+                            reading_count=0,
+                        )
+                    incident.last_reading_at = reading.timestamp
+                    incident.min_speed = min(incident.min_speed, reading.average_speed)
+                    incident.max_score = round(max(incident.max_score, score), 2)
+                    incident.reading_count += 1
+                    changed[id(incident)] = incident
+                    continue
+
+                stats.update(reading.average_speed, alpha)
+                if stats.incident is not None:
+                    stats.normal_streak += 1
+                    if stats.normal_streak >= clear_readings:
+                        stats.incident.ended_at = reading.timestamp
+                        changed[id(stats.incident)] = stats.incident
+                        stats.incident = None
+                        stats.normal_streak = 0
+
+        return self.save(list(changed.values()))
+
+    def warm_up(self, segment_ids, before, params):
+        """
+        Calcula as estatísticas dos segmentos indicados a partir das suas últimas leituras anteriores a `before`
+        (sem as anómalas, como em process) e carrega os seus incidentes ativos. Retorna {segmento: SegmentStats}
+        (não altera o detetor, por isso pode ser chamado fora do lock).
+        """
+        alpha, threshold, min_std, min_readings = params
+        warmup = get_setting('INCIDENT_WARMUP_READINGS', 50)
+
+        segments = {segment_id: SegmentStats() for segment_id in segment_ids}
+        if warmup > 0:
+            history = (
+                SpeedReading.objects
+                .filter(road_segment_id__in=segments, timestamp__lt=before)
+                .annotate(position=Window(RowNumber(), partition_by=F('road_segment_id'), order_by=F('timestamp').desc()))
+                .filter(position__lte=warmup)
+                .order_by('road_segment_id', 'timestamp')
+                .values_list('road_segment_id', 'average_speed', 'timestamp')
+            )
+            for segment_id, speed, timestamp in history:
+                stats = segments[segment_id]
+                stats.last_timestamp = timestamp
+                if not stats.is_anomalous(speed, threshold, min_std, min_readings):
+                    stats.update(speed, alpha)
+
+        for incident in Incident.objects.filter(road_segment_id__in=segments, ended_at__isnull=True):
+            segments[incident.road_segment_id].incident = incident
+        return segments
+
+    def save(self, incidents):
+        """
+        Cria os novos incidentes e atualiza os restantes (um UPDATE em bloco).
+
+        Se o UPDATE em bloco falhar na restrição de um só incidente ativo por segmento (um incidente em memória
+        desatualizado: outro processo terminou-o e abriu outro), os incidentes são atualizados um a um e os segmentos
+        desatualizados são esquecidos, para serem lidos de novo da db na próxima leitura.
+        """
+        if not incidents:
+            return []
+        now = timezone.now()
+        fields = ['ended_at', 'last_reading_at', 'min_speed', 'max_score', 'reading_count', 'updated_at']
+        with transaction.atomic():
+            existing = []
+            for incident in incidents:
+                incident.updated_at = now
+                if incident.pk is not None:
+                    existing.append(incident)
+                    continue
+                try:
+                    with transaction.atomic():
+                        incident.save()
+                except IntegrityError:
+                    # Outro processo já abriu um incidente neste segmento: junta-se a esse
+                    self.merge(incident)
+            try:
+                with transaction.atomic():
+                    Incident.objects.bulk_update(existing, fields)
+            except IntegrityError:
+                for incident in existing:
+                    try:
+                        with transaction.atomic():
+                            incident.save(update_fields=fields)
+                    except IntegrityError:
+                        self.forget(incident.road_segment_id)
+        return incidents
+
+    def merge(self, incident):
+        """
+        Junta um incidente novo ao incidente ativo do mesmo segmento já gravado na db.
+        Se esse incidente já tiver terminado entretanto, o novo é gravado na mesma.
+        """
+        active = Incident.objects.filter(road_segment_id=incident.road_segment_id, ended_at__isnull=True).first()
+        if active is None:
+            try:
+                with transaction.atomic():
+                    incident.save()
+            except IntegrityError:
+                self.forget(incident.road_segment_id)
+            return
+        active.last_reading_at = max(active.last_reading_at, incident.last_reading_at)
+        active.min_speed = min(active.min_speed, incident.min_speed)
+        active.max_score = max(active.max_score, incident.max_score)
+        active.reading_count += incident.reading_count
+        active.ended_at = incident.ended_at
+        active.save()
+        with self.lock:
+            stats = self.segments.get(incident.road_segment_id)
+            if stats is not None and stats.incident is incident:
+                stats.incident = active
+        incident.pk, incident.started_at = active.pk, active.started_at
+
+
+detector = IncidentDetector()
+
+
+def process_readings(readings):
+    """
+    Passa novas leituras pelo detetor (chamado pelos signals depois do commit).
+    """
+    if not get_setting('INCIDENT_DETECTION', True):
+        return []
+    try:
+        incidents = detector.process(readings)
+        pubsub.publish_incidents(incidents)
+    except Exception:
+        # As leituras já foram gravadas: a deteção não pode fazer falhar o pedido nem a importação.
+        # Os segmentos são esquecidos, para que o estado em memória seja lido de novo da db.
+        logger.exception('Falha na deteção de incidentes (%d leituras)', len(readings))
+        for segment_id in {reading.road_segment_id for reading in readings}:
+            detector.forget(segment_id)
+        return []
+    return incidents
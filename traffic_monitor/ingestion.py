@@ -0,0 +1,347 @@
+import csv
+import glob
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ImportedFile, RoadSegment, SpeedReading
+from .signals import readings_bulk_created, readings_bulk_updated
+from .spatial import invalidate_segment_index
+
+"""
+Motor de ingestão de dados em bloco (bulk).
+
+Em vez de fazer 2 ou 3 queries por cada linha do CSV, as linhas são lidas em blocos
+de tamanho fixo e cada bloco é escrito com bulk_create dentro de uma transação.
+Os segmentos já existentes são resolvidos através de um mapa em memória
+(coordenadas → id), carregado uma única vez no início da importação.
+
+Os segmentos são únicos pelas coordenadas e as leituras por (segmento, timestamp). Em modo upsert,
+as leituras já existentes são atualizadas em vez de duplicadas (INSERT ... ON CONFLICT DO UPDATE),
+o que permite voltar a importar o mesmo ficheiro.
+"""
+
+COORDINATE_FIELDS = ['longitude_start', 'latitude_start', 'longitude_end', 'latitude_end']
+
+# Tamanho por defeito de cada bloco de linhas
+DEFAULT_BATCH_SIZE = 1000
+
+# Número de blocos lidos por cada tarefa dos processos de leitura (import_data --workers)
+PARSE_TASK_CHUNKS = 10
+
+
+def parse_timestamp(value):
+    """
+    Converte a coluna Timestamp (ISO 8601). Sem fuso horário, é usado o fuso das settings (TIME_ZONE).
+    Retorna None se a coluna estiver vazia.
+    """
+    if not value:
+        return None
+    timestamp = parse_datetime(value.strip())
+    if timestamp is None:
+        raise ValueError(f'Data inválida: {value!r}')
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def parse_row(row):
+    """
+    Converte uma linha do CSV (dicionário) num tuplo com os valores já convertidos.
+
+    Retorna: ((longitude_start, latitude_start, longitude_end, latitude_end), length, speed, timestamp)
+    O timestamp é None se o ficheiro não tiver a coluna Timestamp (opcional).
+
+    Lança KeyError se faltar uma coluna e ValueError se um valor não for numérico ou a data for inválida.
+    """
+    coordinates = (
+        float(row['Long_start']),
+        float(row['Lat_start']),
+        float(row['Long_end']),
+        float(row['Lat_end']),
+    )
+    return coordinates, float(row['Length']), float(row['Speed']), parse_timestamp(row.get('Timestamp'))
+
+
+def iter_chunks(iterable, size):
+    """
+    Divide um iterável em listas com no máximo `size` elementos, sem o carregar todo para memória.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_records(records, batch_size):
+    """
+    Converte os registos de um csv.DictReader (parse_row) em blocos de `batch_size` linhas.
+
+    Gera (número de linhas do bloco, linhas convertidas, mensagens de erro das linhas inválidas).
+    """
+    for chunk in iter_chunks(records, batch_size):
+        rows, errors = [], []
+        for row in chunk:
+            try:
+                rows.append(parse_row(row))
+            # Se a coluna não existe no CSV
+            except KeyError as e:
+                errors.append(f'Erro: Coluna {e} não encontrada na linha')
+            # Se não conseguiu converter a string para número (int ou float) ou a data
+            except (TypeError, ValueError) as e:
+                errors.append(f'Erro ao converter dados: {e}')
+        yield len(chunk), rows, errors
+
+
+def read_csv_chunks(path, batch_size=DEFAULT_BATCH_SIZE, skip=0):
+    """
+    Lê um ficheiro CSV em blocos de `batch_size` linhas já convertidas (parse_row), ignorando as primeiras `skip`.
+
+    Gera (número de linhas do bloco, linhas convertidas, mensagens de erro das linhas inválidas).
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        # DictReader transforma cada linha do CSV num dicionário
+        # Exemplo de um dado: {'ID': '1', 'Long_start': '103.946', 'Lat_start': '30.750', ...}
+        reader = csv.DictReader(file, delimiter=',')
+        yield from parse_records(islice(reader, skip, None), batch_size)
+
+
+def read_csv_range(path, batch_size=DEFAULT_BATCH_SIZE, skip=0, position=None, fieldnames=None, max_chunks=PARSE_TASK_CHUNKS):
+    """
+    Lê e converte até `max_chunks` blocos de um ficheiro (num processo do ProcessPoolExecutor do import_data).
+
+    Sem position, começa no início do ficheiro (ignorando as primeiras `skip` linhas); com position, continua
+    na posição devolvida pela parte anterior, com os nomes das colunas (fieldnames) lidos do cabeçalho.
+    Retorna (blocos, posição da parte seguinte ou None no fim do ficheiro, fieldnames).
+
+    Cada tarefa devolve no máximo max_chunks × batch_size linhas, por isso a memória usada não depende
+    do tamanho do ficheiro. Não usa a db.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if position is not None:
+            file.seek(position)
+        # readline (e não "for line in file") para que file.tell() dê a posição exata no fim da parte
+        reader = csv.DictReader(iter(file.readline, ''), fieldnames=fieldnames, delimiter=',')
+        records = reader if position is not None else islice(reader, skip, None)
+        chunks = list(islice(parse_records(records, batch_size), max_chunks))
+        position = file.tell()
+        at_end = file.readline() == ''
+        return chunks, None if at_end else position, reader.fieldnames
+
+
+def has_timestamp_column(path):
+    """
+    Indica se o cabeçalho do ficheiro CSV tem a coluna Timestamp.
+
+    Sem ela, as leituras recebem a data da importação: voltar a importar o ficheiro cria leituras novas
+    (não há como saber que são as mesmas), por isso o --upsert exige esta coluna.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        return 'Timestamp' in (next(csv.reader(file, delimiter=','), None) or [])
+
+def find_csv_files(pattern):
+    """
+    Ficheiros a importar, por ordem: um ficheiro, todos os *.csv de uma pasta ou um padrão glob
+    (ex.: "data/2024-12/*.csv" ou "data/**/*.csv").
+
+    Lança FileNotFoundError se nenhum ficheiro for encontrado.
+    """
+    if os.path.isdir(pattern):
+        paths = glob.glob(os.path.join(pattern, '*.csv'))
+    elif any(char in pattern for char in '*?['):
+        paths = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+    else:
+        paths = [pattern] if os.path.isfile(pattern) else []
+    if not paths:
+        raise FileNotFoundError(pattern)
+    return sorted(paths)
+
+
+def file_progress(path, force=False):
+    """
+    Registo (ImportedFile) do progresso da importação de um ficheiro.
+
+    Se o ficheiro mudou desde a última importação (tamanho ou data de modificação), ou com force,
+    o progresso volta ao início.
+    """
+    stat = os.stat(path)
+    modified_at = datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=stat.st_mtime_ns // 1000)
+    progress, created = ImportedFile.objects.get_or_create(
+        path=os.path.abspath(path), defaults={'size': stat.st_size, 'modified_at': modified_at}
+    )
+    if not created and (force or progress.size != stat.st_size or progress.modified_at != modified_at):
+        progress.size, progress.modified_at = stat.st_size, modified_at
+        progress.rows_processed = progress.readings_created = progress.readings_updated = progress.errors = 0
+        progress.completed_at = None
+        progress.save()
+    return progress
+
+
+class SegmentResolver:
+    """
+    Mapa em memória que associa as coordenadas de um segmento ao respetivo id.
+
+    Substitui a query RoadSegment.objects.filter(...).first() que era feita por cada linha.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        queryset = RoadSegment.objects.values_list(*COORDINATE_FIELDS, 'id')
+        for *coordinates, segment_id in queryset.iterator(chunk_size=DEFAULT_BATCH_SIZE):
+            self._ids[tuple(coordinates)] = segment_id
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, coordinates):
+        return self._ids.get(coordinates)
+
+    def create_missing(self, rows):
+        """
+        Cria (com um único bulk_create) os segmentos das linhas que ainda não existem.
+
+        Se outro processo tiver criado entretanto o mesmo segmento, o ON CONFLICT (coordenadas)
+        reutiliza-o em vez de falhar (apenas o comprimento é atualizado).
+
+        Retorna um dicionário {coordenadas: id} apenas com os segmentos novos.
+        O mapa interno só é atualizado com remember(), depois de a transação ser confirmada.
+        """
+        missing = {}
+        for coordinates, length, _speed, _timestamp in rows:
+            if coordinates not in self._ids and coordinates not in missing:
+                missing[coordinates] = RoadSegment(
+                    longitude_start=coordinates[0],
+                    latitude_start=coordinates[1],
+                    longitude_end=coordinates[2],
+                    latitude_end=coordinates[3],
+                    length=length,
+                )
+        if not missing:
+            return {}
+
+        segments = RoadSegment.objects.bulk_create(
+            missing.values(), update_conflicts=True, unique_fields=COORDINATE_FIELDS, update_fields=['length']
+        )
+        created = {coordinates: segment.pk for coordinates, segment in zip(missing, segments)}
+
+        # Nem todas as bases de dados devolvem os ids no bulk_create (o PostgreSQL devolve)
+        if None in created.values():
+            for coordinates in created:
+                created[coordinates] = RoadSegment.objects.filter(
+                    **dict(zip(COORDINATE_FIELDS, coordinates))
+                ).values_list('id', flat=True).first()
+        return created
+
+    def remember(self, created):
+        self._ids.update(created)
+
+
+def insert_readings(readings):
+    """
+    Insere uma lista de SpeedReading com bulk_create e envia o signal readings_bulk_created.
+
+    Deve ser chamada dentro de uma transação, para que os dados derivados (ex.: SegmentState)
+    sejam atualizados na mesma transação que as leituras.
+    """
+    readings = SpeedReading.objects.bulk_create(readings, batch_size=DEFAULT_BATCH_SIZE)
+
+    # O bulk_create não envia post_save, por isso avisamos quem mantém dados derivados (ex.: SegmentState)
+    readings_bulk_created.send(sender=SpeedReading, readings=readings)
+    return readings
+
+
+def upsert_readings(readings):
+    """
+    Insere as leituras novas e atualiza a velocidade das que já existem (mesmo segmento e timestamp):
+
+        INSERT ... ON CONFLICT (road_segment_id, timestamp) DO UPDATE SET average_speed = excluded.average_speed
+
+    As leituras sem alterações não são escritas. Dentro da lista, a última leitura de cada
+    (segmento, timestamp) prevalece. Envia readings_bulk_created com as leituras novas e
+    readings_bulk_updated com as alteradas (os rollups destas têm de ser recalculados).
+
+    Deve ser chamada dentro de uma transação. Retorna (criadas, atualizadas).
+    """
+    readings = list({(reading.road_segment_id, reading.timestamp): reading for reading in readings}.values())
+
+    # Uma query por bloco para saber que leituras já existem (e com que velocidade)
+    existing = {}
+    for chunk in iter_chunks(readings, DEFAULT_BATCH_SIZE):
+        existing.update(
+            ((segment_id, timestamp), speed)
+            for segment_id, timestamp, speed in SpeedReading.objects.filter(
+                road_segment_id__in={reading.road_segment_id for reading in chunk},
+                timestamp__in={reading.timestamp for reading in chunk},
+            ).values_list('road_segment_id', 'timestamp', 'average_speed')
+        )
+
+    created, updated = [], []
+    for reading in readings:
+        key = (reading.road_segment_id, reading.timestamp)
+        if key not in existing:
+            created.append(reading)
+        elif existing[key] != reading.average_speed:
+            updated.append(reading)
+    if not created and not updated:
+        return [], []
+
+    SpeedReading.objects.bulk_create(
+        created + updated,
+        batch_size=DEFAULT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['road_segment', 'timestamp'],
+        update_fields=['average_speed'],
+    )
+    if created:
+        readings_bulk_created.send(sender=SpeedReading, readings=created)
+    if updated:
+        readings_bulk_updated.send(sender=SpeedReading, readings=updated)
+    return created, updated
+
+
+def write_chunk(rows, resolver, upsert=False, before_commit=None):
+    """
+    Escreve um bloco de linhas já convertidas numa única transação.
+
+    1. Cria os segmentos em falta (bulk_create)
+    2. Cria todas as leituras do bloco (bulk_create) ou, com upsert, cria/atualiza (upsert_readings)
+    3. Envia os signals readings_bulk_created/updated (atualizam o SegmentState na mesma transação)
+    4. Chama before_commit(criadas, atualizadas), se indicado, ainda dentro da transação (ex.: guardar o progresso)
+    5. Se foram criados segmentos, invalida o índice espacial (o bulk_create não envia signals)
+
+    As linhas sem timestamp recebem a data atual (com 1 µs de diferença entre linhas, para que
+    as leituras do mesmo segmento não colidam na restrição única): escrever de novo as mesmas linhas
+    cria leituras novas, mesmo com upsert.
+
+    Retorna (segmentos_criados, leituras_criadas, leituras_atualizadas).
+    Se algo falhar, a transação é revertida e o mapa do resolver não é alterado.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        created = resolver.create_missing(rows)
+        readings = [
+            SpeedReading(
+                road_segment_id=resolver.get(coordinates) or created[coordinates],
+                average_speed=speed,
+                timestamp=timestamp or now + timedelta(microseconds=index),
+            )
+            for index, (coordinates, _length, speed, timestamp) in enumerate(rows)
+        ]
+        if upsert:
+            readings, updated = upsert_readings(readings)
+        else:
+            readings, updated = insert_readings(readings), []
+        if before_commit is not None:
+            before_commit(len(readings), len(updated))
+
+    resolver.remember(created)
+    if created:
+        invalidate_segment_index()
+    return len(created), len(readings), len(updated)
+
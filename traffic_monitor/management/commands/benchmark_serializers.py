@@ -0,0 +1,87 @@
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from traffic_monitor.models import RoadSegment, SpeedReading
+from traffic_monitor.serializers import SpeedReadingFastSerializer, SpeedReadingSerializer
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para comparar o SpeedReadingSerializer com a serialização rápida (SpeedReadingFastSerializer).
+
+    Como Utilizar:
+        python manage.py benchmark_serializers --rows 100000
+
+    São criadas N leituras temporárias (numa transação que é revertida no fim, a db não é alterada).
+    Cada método lê as leituras da db, serializa e gera o JSON; no fim é verificado que o JSON é igual byte a byte.
+    """
+
+    help = 'Compara a velocidade (leituras/s) do SpeedReadingSerializer com a serialização rápida'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Número de leituras (por defeito: 100000)')
+        parser.add_argument('--repeat', type=int, default=3, help='Número de repetições; conta a mais rápida (por defeito: 3)')
+
+    def handle(self, *args, **options):
+        rows = max(1, options['rows'])
+
+        with transaction.atomic():
+            self.create_readings(rows)
+            queryset = SpeedReading.objects.select_related('road_segment').order_by('-timestamp', '-id')[:rows]
+
+            methods = {
+                'SpeedReadingSerializer': lambda: JSONRenderer().render(SpeedReadingSerializer(queryset, many=True).data),
+                'SpeedReadingFastSerializer': lambda: JSONRenderer().render(
+                    SpeedReadingFastSerializer().to_representation(SpeedReadingFastSerializer().prepare(queryset))
+                ),
+            }
+
+            results, timings = {}, {}
+            for name, method in methods.items():
+                best = None
+                for _ in range(max(1, options['repeat'])):
+                    started = time.perf_counter()
+                    results[name] = method()
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[name] = best
+
+            transaction.set_rollback(True)
+
+        # ===== RESULTADOS =====
+        self.stdout.write(self.style.WARNING(f'{rows} leituras (melhor de {options["repeat"]} repetições)'))
+        baseline = timings['SpeedReadingSerializer']
+        for name, elapsed in timings.items():
+            self.stdout.write(f'  {name:<28} {elapsed * 1000:9.1f} ms  {rows / elapsed:12,.0f} leituras/s  ({baseline / elapsed:.1f}x)')
+
+        if results['SpeedReadingSerializer'] != results['SpeedReadingFastSerializer']:
+            raise CommandError('O JSON gerado pela serialização rápida é diferente do SpeedReadingSerializer!')
+        self.stdout.write(self.style.SUCCESS(f'  JSON igual byte a byte ({len(results["SpeedReadingSerializer"])} bytes)'))
+
+    def create_readings(self, rows):
+        """
+        Cria as leituras temporárias (distribuídas por 100 segmentos), sem signals.
+        """
+        rng = random.Random(42)
+        segments = RoadSegment.objects.bulk_create([
+            RoadSegment(longitude_start=i, latitude_start=0, longitude_end=i + 0.01, latitude_end=0, length=100)
+            for i in range(100)
+        ])
+        if segments[0].pk is None:
+            segments = list(RoadSegment.objects.order_by('-id')[:100])
+
+        now = timezone.now()
+        SpeedReading.objects.bulk_create(
+            (
+                SpeedReading(
+                    road_segment=segments[i % len(segments)],
+                    average_speed=round(rng.uniform(0, 120), 2),
+                    timestamp=now - timezone.timedelta(seconds=i, microseconds=rng.randint(0, 999999)),
+                )
+                for i in range(rows)
+            ),
+            batch_size=5000,
+        )
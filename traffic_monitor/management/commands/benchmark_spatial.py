@@ -0,0 +1,115 @@
+import random
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from traffic_monitor.models import RoadSegment
+from traffic_monitor.spatial import SegmentGrid, distance_to_segment, segment_intersects_box
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para comparar o índice espacial (grelha) com uma leitura completa dos segmentos.
+
+    Como Utilizar:
+        python manage.py benchmark_spatial                       # segmentos da db
+        python manage.py benchmark_spatial --synthetic 100000    # segmentos gerados em memória
+
+    Para cada tipo de pesquisa (área ?bbox= e segmentos mais próximos) são medidas:
+        - db_scan: ler todos os segmentos da db e filtrar em Python (o que era necessário sem índice)
+        - scan:    percorrer todos os segmentos já em memória (sem o custo da db)
+        - grid:    pesquisa no índice espacial
+    Os resultados do scan e da grelha são comparados, para garantir que são iguais.
+    """
+
+    help = 'Compara o índice espacial dos segmentos com uma leitura completa da tabela'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Número de pesquisas de cada tipo (por defeito: 200)')
+        parser.add_argument('--synthetic', type=int, help='Gera N segmentos aleatórios em memória em vez de usar a db')
+        parser.add_argument('--bbox-size', type=float, default=0.02, help='Tamanho (graus) das áreas pesquisadas (por defeito: 0.02)')
+        parser.add_argument('--nearest', type=int, default=10, help='Número de segmentos mais próximos (por defeito: 10)')
+        parser.add_argument('--seed', type=int, default=42, help='Semente dos números aleatórios')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        # ===== DADOS =====
+        if options['synthetic']:
+            segments = self.synthetic_segments(rng, options['synthetic'])
+        else:
+            segments = list(RoadSegment.objects.values_list('id', 'longitude_start', 'latitude_start', 'longitude_end', 'latitude_end'))
+        if not segments:
+            raise CommandError('Não existem segmentos. Importe dados ou use --synthetic N.')
+
+        started = time.perf_counter()
+        grid = SegmentGrid(getattr(settings, 'SPATIAL_INDEX_CELL_SIZE', 0.01))
+        for segment_id, *coords in segments:
+            grid.add(segment_id, coords)
+        build_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f'Segmentos: {len(segments)} | Células: {len(grid.cells)} | Construção do índice: {build_ms:.1f} ms\n')
+
+        lons = [value for segment in segments for value in (segment[1], segment[3])]
+        lats = [value for segment in segments for value in (segment[2], segment[4])]
+        size = options['bbox_size']
+        points = [(rng.uniform(min(lons), max(lons)), rng.uniform(min(lats), max(lats))) for _ in range(max(1, options['queries']))]
+        boxes = [(lon, lat, lon + size, lat + size) for lon, lat in points]
+        limit = max(1, options['nearest'])
+
+        # ===== ÁREA (bbox) =====
+        def scan_bbox(rows, box):
+            return sorted(segment_id for segment_id, *coords in rows if segment_intersects_box(*coords, *box))
+
+        methods = {
+            'scan': lambda box: scan_bbox(segments, box),
+            'grid': lambda box: sorted(grid.query_bbox(*box)),
+        }
+        if not options['synthetic']:
+            methods['db_scan'] = lambda box: scan_bbox(
+                RoadSegment.objects.values_list('id', 'longitude_start', 'latitude_start', 'longitude_end', 'latitude_end'), box
+            )
+        self.report('Área (?bbox=)', methods, boxes)
+
+        # ===== MAIS PRÓXIMOS =====
+        def scan_nearest(rows, point):
+            distances = [(distance_to_segment(*point, coords), segment_id) for segment_id, *coords in rows]
+            return [segment_id for _distance, segment_id in sorted(distances)[:limit]]
+
+        methods = {
+            'scan': lambda point: scan_nearest(segments, point),
+            'grid': lambda point: [segment_id for segment_id, _distance in grid.nearest(*point, limit)],
+        }
+        if not options['synthetic']:
+            methods['db_scan'] = lambda point: scan_nearest(
+                RoadSegment.objects.values_list('id', 'longitude_start', 'latitude_start', 'longitude_end', 'latitude_end'), point
+            )
+        self.report(f'{limit} mais próximos (/nearest/)', methods, points)
+
+    def synthetic_segments(self, rng, count):
+        """
+        Segmentos curtos (até ~500 m) espalhados por uma área de ~1 grau (ex.: uma região metropolitana).
+        """
+        segments = []
+        for segment_id in range(1, count + 1):
+            lon, lat = rng.uniform(-9.0, -8.0), rng.uniform(41.0, 42.0)
+            segments.append((segment_id, lon, lat, lon + rng.uniform(-0.005, 0.005), lat + rng.uniform(-0.005, 0.005)))
+        return segments
+
+    def report(self, title, methods, queries):
+        """
+        Corre cada método sobre todas as pesquisas e mostra o tempo médio e a diferença para a grelha.
+        """
+        self.stdout.write(self.style.WARNING(title))
+        timings, results = {}, {}
+        for name, method in methods.items():
+            started = time.perf_counter()
+            results[name] = [method(query) for query in queries]
+            timings[name] = (time.perf_counter() - started) * 1000 / len(queries)
+
+        for name, average in timings.items():
+            speedup = average / timings['grid'] if timings['grid'] else float('inf')
+            self.stdout.write(f'  {name:<8} {average:10.3f} ms/pesquisa  ({speedup:.1f}x o tempo da grelha)')
+
+        if results['scan'] != results['grid']:
+            self.stdout.write(self.style.ERROR('  Os resultados da grelha são diferentes dos do scan!'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'  Resultados iguais em {len(queries)} pesquisas'))
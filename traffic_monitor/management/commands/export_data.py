@@ -0,0 +1,60 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from traffic_monitor.aggregation import filter_time_range, parse_time_range
+from traffic_monitor.export import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, export_readings
+from traffic_monitor.models import SpeedReading
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para exportar as leituras de velocidade em CSV ou NDJSON.
+
+    Como Utilizar:
+        python manage.py export_data --file readings.csv
+        python manage.py export_data --output-format ndjson --segment 1 --from 2024-12-01T00:00:00Z --to 2025-01-01T00:00:00Z
+        python manage.py export_data --file - | gzip > readings.csv.gz
+
+    As leituras são lidas em blocos e escritas à medida (a memória usada não depende do número de leituras).
+    """
+
+    help = 'Exporta as leituras de velocidade em CSV ou NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', type=str, default='-', help='Ficheiro de destino (por defeito: - para o stdout)')
+        parser.add_argument('--output-format', choices=list(EXPORT_FORMATS), default='csv', help='Formato: csv ou ndjson (por defeito: csv)')
+        parser.add_argument('--segment', type=int, action='append', dest='segments', help='ID de um segmento (pode ser repetido)')
+        parser.add_argument('--from', dest='start', help='Início do intervalo, inclusive (ISO 8601)')
+        parser.add_argument('--to', dest='end', help='Fim do intervalo, exclusive (ISO 8601)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help=f'Leituras lidas da db de cada vez (por defeito: {DEFAULT_CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        try:
+            start, end = parse_time_range({'from': options['start'], 'to': options['end']})
+        except ValidationError as error:
+            raise CommandError(error.detail)
+
+        queryset = filter_time_range(SpeedReading.objects.all(), start, end)
+        if options['segments']:
+            queryset = queryset.filter(road_segment_id__in=options['segments'])
+
+        to_stdout = options['file'] == '-'
+        output = self.stdout if to_stdout else open(options['file'], 'w', encoding='utf-8', newline='')
+
+        started = time.monotonic()
+        size = 0
+        try:
+            for chunk in export_readings(queryset, options['output_format'], max(1, options['chunk_size'])):
+                if to_stdout:
+                    output.write(chunk, ending='')
+                else:
+                    output.write(chunk)
+                size += len(chunk)
+        finally:
+            if not to_stdout:
+                output.close()
+
+        # O resumo vai para o stderr, para não misturar com os dados quando o destino é o stdout
+        self.stderr.write(self.style.SUCCESS(
+            f'Exportação concluída: {size / 1024 / 1024:.1f} MB em {time.monotonic() - started:.1f}s'
+        ))
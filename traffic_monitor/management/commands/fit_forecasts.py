@@ -0,0 +1,49 @@
+import time
+from datetime import timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from traffic_monitor.forecasting import fit_forecasts
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para ajustar os modelos de previsão da velocidade dos segmentos.
+
+    Como Utilizar:
+        python manage.py fit_forecasts
+        python manage.py fit_forecasts --full
+        python manage.py fit_forecasts --segment 1 --segment 2 --until 2024-12-17T14:00:00Z
+
+    Por defeito o ajuste é incremental: cada segmento continua a partir dos parâmetros guardados,
+    apenas com as leituras posteriores ao último ajuste (pode ser corrido, ex.: a cada 15 minutos, num cron).
+    Com --full, os modelos são ajustados de novo com os últimos FORECAST_HISTORY_DAYS dias
+    (ex.: depois de importar leituras antigas ou de mudar as settings FORECAST_*).
+
+    Os segmentos são processados em blocos de --batch-size, cada bloco de uma só vez com NumPy.
+    """
+
+    help = 'Ajusta (de forma incremental) os modelos de previsão da velocidade dos segmentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Ajusta os modelos de novo com todo o histórico')
+        parser.add_argument('--segment', type=int, action='append', dest='segments', help='ID de um segmento (pode ser repetido)')
+        parser.add_argument('--until', help='Fim dos dados usados (ISO 8601, por defeito: agora)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Número de segmentos ajustados de cada vez (por defeito: 1000)')
+
+    def handle(self, *args, **options):
+        until = None
+        if options['until']:
+            until = parse_datetime(options['until'])
+            if until is None:
+                raise CommandError(f'Data inválida em --until: {options["until"]}')
+            if until.tzinfo is None:
+                until = until.replace(tzinfo=timezone.utc)
+
+        mode = 'completo' if options['full'] else 'incremental'
+        self.stdout.write(self.style.WARNING(f'A ajustar os modelos de previsão (ajuste {mode})..'))
+        started = time.perf_counter()
+        fitted = fit_forecasts(
+            segment_ids=options['segments'], full=options['full'], until=until, batch_size=max(1, options['batch_size'])
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Segmentos com previsão: {fitted} ({elapsed:.2f}s)'))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from traffic_monitor.writebehind import ReadingQueue
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para gravar as leituras que ficaram nos journals da escrita diferida (write-behind).
+
+    Como Utilizar:
+        python manage.py flush_readings_queue
+        python manage.py flush_readings_queue --journal-dir /var/lib/traffic-monitor/queue
+
+    Recupera os journals de processos que já terminaram (ex.: depois de um deploy ou crash, sem esperar
+    pelo próximo POST) e grava as leituras em lotes. Os journals de processos ativos não são tocados.
+    """
+
+    help = 'Grava as leituras pendentes dos journals da escrita diferida de processos que já terminaram'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journal-dir', help='Pasta dos journals (por defeito: WRITE_BEHIND_JOURNAL_DIR)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'WRITE_BEHIND_BATCH_SIZE', 500),
+            help='Número de leituras gravadas por transação'
+        )
+
+    def handle(self, *args, **options):
+        journal_dir = options['journal_dir'] or getattr(settings, 'WRITE_BEHIND_JOURNAL_DIR', None)
+        if not journal_dir:
+            raise CommandError('Indique a pasta dos journals (--journal-dir ou WRITE_BEHIND_JOURNAL_DIR).')
+
+        queue = ReadingQueue(journal_dir=str(journal_dir), batch_size=options['batch_size'], background=False)
+        pending = len(queue)
+        self.stdout.write(f'Leituras recuperadas: {pending}')
+
+        queue.stop()
+        self.stdout.write(self.style.SUCCESS(f'Gravadas {queue.written} leituras'))
@@ -0,0 +1,64 @@
+import os
+from datetime import timedelta
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from traffic_monitor.synthetic import DEFAULT_START, generate_rows, write_csv
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para gerar um dataset sintético (determinístico) com o formato de data/traffic_speed.csv.
+
+    Como Utilizar:
+        python manage.py generate_data --segments 10000 --readings 288 --output data/synthetic.csv
+        python manage.py generate_data --segments 5000 --readings 288 --files 24 --output data/dezembro/
+
+    São gerados N segmentos × M leituras (uma leitura de cada segmento a cada --interval minutos, a partir
+    de --start), com a coluna Timestamp. A mesma --seed gera sempre os mesmos ficheiros.
+    Com --files K, as leituras são divididas por K ficheiros (intervalos de tempo seguidos) na pasta --output,
+    como os ficheiros horários de cada região que o import_data recebe.
+    """
+
+    help = 'Gera um dataset sintético de segmentos e leituras (CSV) para benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--segments', type=int, default=1000, help='Número de segmentos (por defeito: 1000)')
+        parser.add_argument('--readings', type=int, default=100, help='Número de leituras por segmento (por defeito: 100)')
+        parser.add_argument('--seed', type=int, default=42, help='Semente dos números aleatórios (por defeito: 42)')
+        parser.add_argument('--interval', type=float, default=5, help='Minutos entre leituras (por defeito: 5)')
+        parser.add_argument('--start', help='Data da primeira leitura (ISO 8601, por defeito: 2024-12-01T00:00:00Z)')
+        parser.add_argument('--files', type=int, default=1, help='Número de ficheiros (por defeito: 1)')
+        parser.add_argument('--output', default='data/synthetic.csv', help='Ficheiro CSV, ou pasta com --files > 1')
+
+    def handle(self, *args, **options):
+        segments, readings, files = options['segments'], options['readings'], options['files']
+        if segments < 1 or readings < 1 or files < 1:
+            raise CommandError('--segments, --readings e --files têm de ser maiores que 0.')
+        start = DEFAULT_START
+        if options['start']:
+            start = parse_datetime(options['start'])
+            if start is None or start.tzinfo is None:
+                raise CommandError('--start tem de ser uma data ISO 8601 com fuso horário (ex.: 2024-12-01T00:00:00Z).')
+
+        rows = generate_rows(segments, readings, options['seed'], start, timedelta(minutes=options['interval']))
+        output = options['output']
+
+        if files == 1:
+            paths = [output]
+            total = write_csv(output, rows)
+        else:
+            os.makedirs(output, exist_ok=True)
+            paths, total = [], 0
+            for index in range(files):
+                # Leituras (instantes) de cada ficheiro: divisão tão igual quanto possível
+                count = readings // files + (1 if index < readings % files else 0)
+                if not count:
+                    break
+                path = os.path.join(output, f'traffic-{index + 1:03d}.csv')
+                total += write_csv(path, islice(rows, count * segments))
+                paths.append(path)
+
+        for path in paths:
+            self.stdout.write(f' {path}')
+        self.stdout.write(self.style.SUCCESS(f'Geradas {total} linhas ({segments} segmentos × {readings} leituras)'))
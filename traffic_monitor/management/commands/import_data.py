@@ -1,130 +1,299 @@
 import csv
-from django.core.management.base import BaseCommand
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
 from django.utils import timezone
-from traffic_monitor.models import RoadSegment, SpeedReading
+from traffic_monitor.ingestion import (
+    DEFAULT_BATCH_SIZE, PARSE_TASK_CHUNKS, SegmentResolver, file_progress, find_csv_files, has_timestamp_column,
+    read_csv_chunks, read_csv_range, write_chunk,
+)
+from traffic_monitor.models import ImportedFile
 
 
 class Command(BaseCommand):
     """
-    Comando Django para importar dados de um ficheiro CSV para a db.
-    
+    Comando Django para importar dados de um ou mais ficheiros CSV para a db.
+
     Como Utilizar:
         python manage.py import_data
-    
+        python manage.py import_data --file data/outro.csv --batch-size 5000
+        python manage.py import_data --file data/feed.csv --upsert
+        python manage.py import_data --file "data/2024-12/*.csv" --workers 8
+        python manage.py import_data --file data/2024-12/
+
     Passos:
-        1. Lê o ficheiro data/traffic_speed.csv
-        2. Para cada linha:
-           - Cria ou obtêm um RoadSegment (segmento de estrada)
-           - Cria uma SpeedReading associado a esse segmento
-        3. Mostra logs no final
+        1. Procura os ficheiros (um ficheiro, uma pasta ou um padrão glob) e ignora os que já foram importados
+        2. Carrega para memória um mapa coordenadas → id com os segmentos já existentes
+        3. Lê cada ficheiro CSV em blocos de --batch-size linhas (sem carregar o ficheiro todo)
+           - com --workers > 1, os ficheiros são lidos e convertidos em paralelo por vários processos
+        4. Para cada bloco, numa única transação (escrita apenas por este processo):
+           - Cria os RoadSegments em falta com bulk_create (ON CONFLICT nas coordenadas)
+           - Cria as SpeedReadings do bloco com bulk_create ou, com --upsert, cria as novas e
+             atualiza as existentes (INSERT ... ON CONFLICT (road_segment_id, timestamp) DO UPDATE)
+           - Guarda o progresso do ficheiro (ImportedFile)
+        5. Mostra logs no final (incluindo linhas/segundo)
 
-    Nota: 
+    Nota:
         - IDs são gerados automaticamente pelo PostgreSQL
         - Evitamos problemas de sequência desatualizada ao fazer o import
+        - Se um bloco falhar na db, esse bloco é revertido e o resto do ficheiro fica por importar:
+          a próxima importação continua nesse bloco (os outros ficheiros são importados na mesma)
+        - A coluna Timestamp (ISO 8601) é opcional; sem ela, as leituras recebem a data da importação
+          e voltar a importar o ficheiro (ex.: com --force) duplica todas as leituras
+        - Com --upsert e a coluna Timestamp, voltar a importar o mesmo ficheiro não duplica leituras
+          (sem o --upsert, uma leitura repetida faz falhar o respetivo bloco); o --upsert recusa
+          ficheiros sem a coluna Timestamp
+        - Uma importação interrompida continua, no mesmo ficheiro, a partir do último bloco escrito;
+          os ficheiros já importados (mesmo tamanho e data de modificação) são ignorados, exceto com --force
     """
 
-    help = 'Importa dados do ficheiro traffic_speed.csv para a base de dados'
-    
+    help = 'Importa dados de ficheiros CSV (por defeito: data/traffic_speed.csv) para a base de dados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default='data/traffic_speed.csv',
+            help='Ficheiro CSV, pasta (todos os *.csv) ou padrão glob, ex.: "data/*.csv" (por defeito: data/traffic_speed.csv)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Número de linhas escritas por transação (por defeito: {DEFAULT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--upsert',
+            action='store_true',
+            help='Atualiza as leituras que já existem (mesmo segmento e Timestamp) em vez de as duplicar (exige a coluna Timestamp)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Número de processos que leem os ficheiros (por defeito: número de CPUs se houver mais de um ficheiro)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Volta a importar os ficheiros já importados'
+        )
+
     def handle(self, *args, **options):
         """
         Método principal executado pelo Django quando o comando é chamado.
         """
-        
-        csv_file = 'data/traffic_speed.csv' # Caminho para o ficheiro CSV
-    
+
+        pattern = options['file']               # Ficheiro, pasta ou padrão glob
+        batch_size = max(1, options['batch_size'])
+        upsert = options['upsert']
+
         # Contadores para estatística
-        segments_created = 0  # Número de segmentos criados
-        readings_created = 0  # Número de leituras criadas
-        errors = 0            # Número de erros ocorridos
+        self.segments_created = 0  # Número de segmentos criados
+        self.readings_created = 0  # Número de leituras criadas
+        self.readings_updated = 0  # Número de leituras atualizadas (--upsert)
+        self.rows_processed = 0    # Número de linhas lidas dos CSV
+        self.errors = 0            # Número de erros ocorridos
+        self.write_time = 0        # Tempo a escrever na db
+        self.wait_time = 0         # Tempo à espera dos processos de leitura
+        files_imported = 0         # Número de ficheiros importados
+        files_skipped = 0          # Número de ficheiros ignorados (já importados)
+
+        self.stdout.write(self.style.WARNING(f'A iniciar importação de {pattern}..\n'))
+        started = time.perf_counter()
 
-        self.stdout.write(self.style.WARNING(f'A iniciar importação de {csv_file}..\n'))
-        
         try:
-            # Abre o ficheiro CSV em modo leitura com codificação UTF-8
-            with open(csv_file, 'r', encoding='utf-8') as file:  
-                # DictReader transforma cada linha do CSV num dicionário
-                # Exemplo de um dado: {'ID': '1', 'Long_start': '103.946', 'Lat_start': '30.750', ...}
-                reader = csv.DictReader(file, delimiter=',')
-            
-                for row in reader:
-                    try:
-                        # ===== EXTRAIR DADOS DA LINHA =====
-                        segment_id = int(row['ID'])
-                        longitude_start = float(row['Long_start'])
-                        latitude_start = float(row['Lat_start'])
-                        longitude_end = float(row['Long_end'])
-                        latitude_end = float(row['Lat_end'])
-                        length = float(row['Length'])
-                        speed = float(row['Speed'])
-                        
-                        # ===== CRIAR OU OBTER SEGMENTO DE ESTRADA =====
-                        # Procurar segmento existente com as mesmas coordenadas
-                        existing = RoadSegment.objects.filter(
-                            longitude_start=longitude_start,
-                            latitude_start=latitude_start,
-                            longitude_end=longitude_end,
-                            latitude_end=latitude_end
-                        ).first()
-
-                        if existing:
-                            segment = existing  # Segmento já existe, usa o existente
-                        else:
-                            segment = RoadSegment.objects.create(
-                                longitude_start=longitude_start,
-                                latitude_start=latitude_start,
-                                longitude_end=longitude_end,
-                                latitude_end=latitude_end,
-                                length=length,
-                            )
-                            segments_created += 1
-                        
-                        # ===== CRIAR LEITURA DE VELOCIDADE =====
-                        reading = SpeedReading.objects.create(
-                            road_segment=segment,      # FK para o segmento
-                            average_speed=speed,       # Velocidade do CSV
-                            timestamp=timezone.now()   # Data/hora atual
-                        )
-                        
-                        readings_created += 1
-                        
-                        # ===== MOSTRAR PROGRESSO =====
-                        
-                        #  Mostrar progresso a cada 50 segmentos criados
-                        if segments_created % 50 == 0 and segments_created > 0:
-                            self.stdout.write(f' Já foram processados {segments_created} segmentos!')
-                    
-                    # Se a coluna não existe no CSV
-                    except KeyError as e:
-                        errors += 1
-                        self.stdout.write(self.style.ERROR(f'Erro: Coluna {e} não encontrada na linha'))
-                        continue
-                    # Se não conseguiu converter a string para número (int ou float)
-                    except ValueError as e:
-                        errors += 1
-                        self.stdout.write(self.style.ERROR(f'Erro ao converter dados: {e}'))
-                        continue
-                    # Em caso qualquer outro erro
-                    except Exception as e:
-                        errors += 1
-                        self.stdout.write(self.style.ERROR(f'Erro inesperado na linha {row.get("ID", "?")}: {e}'))
-                        continue
-            
+            files = []
+            for path in find_csv_files(pattern):
+                progress = file_progress(path, force=options['force'])
+                if progress.completed_at is not None:
+                    files_skipped += 1
+                    self.stdout.write(f' {path}: já importado, ignorado (use --force para importar de novo)')
+                    continue
+                files.append(progress)
+
+            # Sem a coluna Timestamp, cada importação cria leituras novas (com a data da importação)
+            without_timestamp = [progress.path for progress in files if not self.has_timestamp(progress.path)]
+            if upsert and without_timestamp:
+                raise CommandError(
+                    f'O --upsert exige a coluna Timestamp (sem ela as leituras não podem ser deduplicadas): '
+                    f'{", ".join(without_timestamp)}'
+                )
+            for path in without_timestamp:
+                self.stdout.write(self.style.WARNING(
+                    f' Aviso: {path} não tem a coluna Timestamp, as leituras recebem a data atual '
+                    f'e voltar a importá-lo duplica-as'
+                ))
+
+            workers = options['workers'] or ((os.cpu_count() or 1) if len(files) > 1 else 1)
+            workers = max(1, min(workers, len(files) or 1))
+
+            # Mapa em memória com os segmentos que já existem na db
+            resolver = SegmentResolver()
+
+            for progress, chunks in self.read_files(files, batch_size, workers):
+                if self.import_file(progress, chunks, resolver, upsert):
+                    files_imported += 1
+
+            elapsed = time.perf_counter() - started
+            rows_per_second = self.rows_processed / elapsed if elapsed > 0 else 0
+
             # ===== DADOS FINAIS =====
             self.stdout.write('\n' + '='*60)
             self.stdout.write(self.style.SUCCESS('Importação concluída!'))
             self.stdout.write('='*60)
-            self.stdout.write(self.style.SUCCESS(f'Segmentos criados: {segments_created}'))
-            self.stdout.write(self.style.SUCCESS(f'Leituras criadas: {readings_created}'))
-            
-            if errors > 0:
-                self.stdout.write(self.style.ERROR(f'Ocorreram {errors} erros'))
+            self.stdout.write(self.style.SUCCESS(f'Ficheiros importados: {files_imported} ({files_skipped} já importados)'))
+            self.stdout.write(self.style.SUCCESS(f'Segmentos criados: {self.segments_created}'))
+            self.stdout.write(self.style.SUCCESS(f'Leituras criadas: {self.readings_created}'))
+            if upsert:
+                self.stdout.write(self.style.SUCCESS(f'Leituras atualizadas: {self.readings_updated}'))
+            self.stdout.write(self.style.SUCCESS(f'Linhas processadas: {self.rows_processed} em {elapsed:.2f}s ({rows_per_second:.0f} linhas/s)'))
+            self.stdout.write(
+                f'Processos de leitura: {workers} | escrita na db: {self.write_time:.2f}s | '
+                f'à espera da leitura: {self.wait_time:.2f}s'
+            )
+
+            if self.errors > 0:
+                self.stdout.write(self.style.ERROR(f'Ocorreram {self.errors} erros'))
             else:
                 self.stdout.write(self.style.SUCCESS('Não houve erros!!!'))
             self.stdout.write('='*60 + '\n')
+        except CommandError:
+            raise
         # Se o ficheiro não existir
         except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f'\n Erro: Ficheiro não encontrado: {csv_file}'))
+            self.stdout.write(self.style.ERROR(f'\n Erro: Ficheiro não encontrado: {pattern}'))
             self.stdout.write(self.style.WARNING('Certifica-te que o ficheiro está na pasta data/ \n '))
         # Qualquer outro erro
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'\n Erro durante importação: {e}\n'))
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f'\n Erro durante importação: {e}\n'))
+
+    def has_timestamp(self, path):
+        """
+        Indica se o ficheiro tem a coluna Timestamp (um ficheiro que não se consegue ler conta como tendo:
+        o erro é mostrado ao importá-lo).
+        """
+        try:
+            return has_timestamp_column(path)
+        except (OSError, UnicodeDecodeError, csv.Error):
+            return True
+
+    def read_files(self, files, batch_size, workers):
+        """
+        Gera (progresso, blocos) de cada ficheiro, pela ordem dos ficheiros.
+
+        Com um processo, os blocos são lidos à medida que são escritos. Com vários, os ficheiros são lidos
+        e convertidos pelos processos do pool, por partes de PARSE_TASK_CHUNKS blocos (read_csv_range),
+        e só este processo escreve na db. Estão a ser lidos no máximo 2 ficheiros por processo e, de cada um,
+        só uma parte à frente da que está a ser escrita, por isso a memória usada não depende do tamanho dos ficheiros.
+        """
+        if workers == 1:
+            for progress in files:
+                yield progress, read_csv_chunks(progress.path, batch_size, progress.rows_processed)
+            return
+
+        # spawn: os processos não herdam as ligações à db deste processo
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=django.setup) as pool:
+            def submit(progress, position=None, fieldnames=None):
+                skip = progress.rows_processed if position is None else 0
+                return pool.submit(read_csv_range, progress.path, batch_size, skip, position, fieldnames, PARSE_TASK_CHUNKS)
+
+            files = iter(files)
+            queue = deque((progress, submit(progress)) for progress in islice(files, workers * 2))
+            while queue:
+                progress, future = queue.popleft()
+                queue.extend((progress, submit(progress)) for progress in islice(files, 1))
+                yield progress, self.file_chunks(progress, future, submit)
+
+    def file_chunks(self, progress, future, submit):
+        """
+        Blocos de um ficheiro lido pelo pool: enquanto uma parte é escrita, a parte seguinte já está a ser lida.
+        """
+        while future is not None:
+            waited = time.perf_counter()
+            chunks, position, fieldnames = future.result()
+            self.wait_time += time.perf_counter() - waited
+            future = submit(progress, position, fieldnames) if position is not None else None
+            yield from chunks
+
+    def import_file(self, progress, chunks, resolver, upsert):
+        """
+        Escreve os blocos de um ficheiro e marca-o como importado.
+        Retorna False se não foi possível lê-lo ou escrever algum bloco (o ficheiro fica por terminar).
+        """
+        resumed = f' (a continuar na linha {progress.rows_processed + 1})' if progress.rows_processed else ''
+        self.stdout.write(self.style.WARNING(f' {progress.path}{resumed}'))
+        missing_timestamp = False
+        try:
+            for lines, rows, errors in chunks:
+                for message in errors:
+                    self.stdout.write(self.style.ERROR(message))
+                missing_timestamp = missing_timestamp or any(timestamp is None for *_values, timestamp in rows)
+                if not self.write_rows(progress, lines, rows, len(errors), resolver, upsert):
+                    # O progresso fica no bloco que falhou: a próxima importação volta a tentá-lo
+                    self.stdout.write(self.style.WARNING(
+                        f' {progress.path}: ficheiro por terminar, a próxima importação continua na linha {progress.rows_processed + 1}'
+                    ))
+                    return False
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            self.errors += 1
+            self.stdout.write(self.style.ERROR(f'Erro ao ler {progress.path}: {e}'))
+            return False
+
+        if upsert and missing_timestamp:
+            self.stdout.write(self.style.WARNING(
+                'Aviso: há linhas com o Timestamp vazio, essas leituras recebem a data atual e não são deduplicadas'
+            ))
+        progress.completed_at = timezone.now()
+        progress.save(update_fields=['completed_at', 'updated_at'])
+        return True
+
+    def write_rows(self, progress, lines, rows, invalid, resolver, upsert):
+        """
+        Escreve um bloco e avança o progresso do ficheiro na mesma transação.
+        Retorna False se o bloco falhou (nesse caso o progresso não avança).
+        """
+        def advance(created=0, updated=0):
+            ImportedFile.objects.filter(pk=progress.pk).update(
+                rows_processed=F('rows_processed') + lines,
+                readings_created=F('readings_created') + created,
+                readings_updated=F('readings_updated') + updated,
+                errors=F('errors') + invalid,
+                updated_at=timezone.now(),
+            )
+
+        self.rows_processed += lines
+        self.errors += invalid
+        if not rows:
+            advance()
+            progress.rows_processed += lines
+            return True
+
+        started = time.perf_counter()
+        # ===== ESCREVER O BLOCO (SEGMENTOS + LEITURAS) =====
+        try:
+            segments, readings, updated = write_chunk(rows, resolver, upsert=upsert, before_commit=advance)
+        # Em caso de erro na db, o bloco inteiro é revertido (incluindo o progresso)
+        except Exception as e:
+            self.errors += len(rows)
+            self.stdout.write(self.style.ERROR(
+                f'Erro inesperado no bloco que termina na linha {progress.rows_processed + lines}: {e}'
+            ))
+            return False
+        finally:
+            self.write_time += time.perf_counter() - started
+
+        progress.rows_processed += lines
+        self.segments_created += segments
+        self.readings_created += readings
+        self.readings_updated += updated
+
+        # ===== MOSTRAR PROGRESSO =====
+        self.stdout.write(f' Já foram processadas {self.rows_processed} linhas ({self.segments_created} segmentos criados)')
+        return True
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para medir o débito (pedidos/s) e a latência de um ou mais URLs com muitos clientes em simultâneo.
+
+    Como Utilizar (ex.: WSGI vs ASGI):
+        gunicorn config.wsgi --workers 4 --threads 8 --bind 127.0.0.1:8000
+        uvicorn config.asgi:application --port 8001
+
+        python manage.py load_test --concurrency 500 --requests 20000 \\
+            --url http://127.0.0.1:8000/api/segments/ \\
+            --url http://127.0.0.1:8001/api/async/segments/
+
+    Cada cliente abre uma ligação por pedido (Connection: close) e faz pedidos GET seguidos até
+    se atingir o total. Não usa bibliotecas externas (apenas asyncio).
+    """
+
+    help = 'Teste de carga (GET) a um ou mais URLs: pedidos/s e latência (p50/p95/p99)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', required=True, help='URL a testar (pode ser repetido para comparar)')
+        parser.add_argument('--concurrency', type=int, default=100, help='Número de clientes em simultâneo (por defeito: 100)')
+        parser.add_argument('--requests', type=int, default=2000, help='Número total de pedidos por URL (por defeito: 2000)')
+        parser.add_argument('--timeout', type=float, default=30, help='Tempo máximo de cada pedido em segundos (por defeito: 30)')
+
+    def handle(self, *args, **options):
+        results = []
+        for url in options['url']:
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https') or not parts.hostname:
+                raise CommandError(f'URL inválido: {url}')
+            self.stdout.write(self.style.WARNING(url))
+            result = asyncio.run(self.run(parts, max(1, options['concurrency']), max(1, options['requests']), options['timeout']))
+            results.append(result)
+            self.report(result, results[0])
+
+    async def run(self, parts, concurrency, total, timeout):
+        """
+        Corre `total` pedidos com `concurrency` clientes e devolve as estatísticas.
+        """
+        remaining = iter(range(total))
+        latencies, errors = [], {}
+
+        async def client():
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    status_code = await asyncio.wait_for(self.request(parts), timeout)
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError) as error:
+                    status_code = type(error).__name__
+                if status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors[status_code] = errors.get(status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(min(concurrency, total))))
+        return {'elapsed': time.perf_counter() - started, 'latencies': sorted(latencies), 'errors': errors}
+
+    async def request(self, parts):
+        """
+        Faz um pedido GET e devolve o código de estado (a resposta é lida até ao fim).
+        """
+        https = parts.scheme == 'https'
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or (443 if https else 80), ssl=https or None)
+        try:
+            path = parts.path or '/'
+            if parts.query:
+                path += f'?{parts.query}'
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: close\r\nAccept: application/json\r\n\r\n'.encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            while await reader.read(65536):
+                pass
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+
+    def report(self, result, baseline):
+        latencies = result['latencies']
+        throughput = len(latencies) / result['elapsed']
+        self.stdout.write(f'  {len(latencies)} pedidos OK em {result["elapsed"]:.2f} s → {throughput:,.0f} pedidos/s')
+        if latencies:
+            p50, p95, p99 = (latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 for q in (0.5, 0.95, 0.99))
+            self.stdout.write(f'  latência: p50 {p50:.1f} ms | p95 {p95:.1f} ms | p99 {p99:.1f} ms')
+        if result['errors']:
+            self.stdout.write(self.style.ERROR(f'  erros: {result["errors"]}'))
+        if result is not baseline and baseline['latencies']:
+            speedup = throughput / (len(baseline['latencies']) / baseline['elapsed'])
+            self.stdout.write(self.style.SUCCESS(f'  {speedup:.1f}x o débito do primeiro URL'))
@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from traffic_monitor.partitions import (
+    add_months,
+    convert_to_partitioned,
+    create_partitions,
+    drop_expired_partitions,
+    is_partitioned,
+    list_partitions,
+    month_start)
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para gerir o particionamento mensal da tabela speed_readings (apenas PostgreSQL).
+
+    Como Utilizar:
+        # 1ª vez: converter a tabela atual (bloqueia a tabela durante a cópia dos dados)
+        python manage.py partition_readings --convert
+
+        # Periodicamente (ex.: cron diário): criar as partições dos próximos meses e aplicar a retenção
+        python manage.py partition_readings --months-ahead 3 --retention-months 12
+
+    Com --detach-only as partições antigas são desligadas da tabela em vez de apagadas (ficam para arquivo).
+    """
+
+    help = 'Converte speed_readings numa tabela particionada por mês, cria as próximas partições e remove as expiradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='Converte a tabela atual numa tabela particionada')
+        parser.add_argument('--months-ahead', type=int, default=3, help='Número de meses futuros com partição criada (por defeito: 3)')
+        parser.add_argument('--retention-months', type=int, help='Remove as partições com mais de N meses (além do mês atual)')
+        parser.add_argument('--detach-only', action='store_true', help='Desliga as partições expiradas em vez de as apagar')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('O particionamento só está disponível com PostgreSQL.')
+
+        months_ahead = max(0, options['months_ahead'])
+        current = month_start(datetime.now(timezone.utc))
+
+        # ===== CONVERSÃO =====
+        if options['convert']:
+            if is_partitioned():
+                self.stdout.write(self.style.WARNING('A tabela speed_readings já está particionada.'))
+            else:
+                self.stdout.write(self.style.WARNING('A converter a tabela speed_readings..'))
+                convert_to_partitioned(months_ahead=months_ahead)
+                self.stdout.write(self.style.SUCCESS('Tabela convertida'))
+        elif not is_partitioned():
+            raise CommandError('A tabela speed_readings não está particionada. Use --convert.')
+
+        # ===== NOVAS PARTIÇÕES =====
+        created = create_partitions(current, months_ahead + 1)
+        for name in created:
+            self.stdout.write(f' Partição criada: {name}')
+
+        # ===== RETENÇÃO =====
+        removed = []
+        if options['retention_months'] is not None:
+            before = add_months(current, -max(0, options['retention_months']))
+            removed = drop_expired_partitions(before, detach_only=options['detach_only'])
+            action = 'desligada' if options['detach_only'] else 'apagada'
+            for name in removed:
+                self.stdout.write(f' Partição {action}: {name}')
+
+        # ===== RESUMO =====
+        partitions = list_partitions()
+        self.stdout.write(self.style.SUCCESS(f'\nPartições mensais: {len(partitions)}'))
+        if partitions:
+            self.stdout.write(f'De {partitions[0][0]} a {partitions[-1][0]}')
+        self.stdout.write(f'Criadas: {len(created)} | Removidas: {len(removed)}')
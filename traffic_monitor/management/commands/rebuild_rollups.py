@@ -0,0 +1,45 @@
+from datetime import timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from traffic_monitor.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para reconstruir (backfill/reparação) as estatísticas por hora e por dia.
+
+    Como Utilizar:
+        python manage.py rebuild_rollups
+        python manage.py rebuild_rollups --from 2024-12-01 --to 2024-12-31 --segment 1 --segment 2
+
+    O intervalo é alargado para dias completos. As estatísticas desse intervalo são apagadas
+    e recalculadas a partir das leituras, numa única transação.
+    """
+
+    help = 'Reconstrói as estatísticas pré-calculadas (rollups) por hora e por dia a partir das leituras'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='Início do intervalo (ISO 8601, ex.: 2024-12-01)')
+        parser.add_argument('--to', dest='end', help='Fim do intervalo, exclusive (ISO 8601)')
+        parser.add_argument('--segment', type=int, action='append', dest='segments', help='ID de um segmento (pode ser repetido)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Número de registos por INSERT (por defeito: 1000)')
+
+    def parse_date(self, value, name):
+        if value is None:
+            return None
+        parsed = parse_datetime(value if 'T' in value or ' ' in value else f'{value}T00:00:00')
+        if parsed is None:
+            raise CommandError(f'Data inválida em --{name}: {value}')
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
+
+    def handle(self, *args, **options):
+        start = self.parse_date(options['start'], 'from')
+        end = self.parse_date(options['end'], 'to')
+
+        self.stdout.write(self.style.WARNING('A reconstruir as estatísticas por hora e por dia..'))
+        created = rebuild_rollups(start=start, end=end, segment_ids=options['segments'], batch_size=max(1, options['batch_size']))
+
+        self.stdout.write(self.style.SUCCESS(f'Estatísticas horárias criadas: {created["1h"]}'))
+        self.stdout.write(self.style.SUCCESS(f'Estatísticas diárias criadas: {created["1d"]}'))
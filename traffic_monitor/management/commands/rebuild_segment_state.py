@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from traffic_monitor.ingestion import DEFAULT_BATCH_SIZE, iter_chunks
+from traffic_monitor.models import RoadSegment
+from traffic_monitor.segment_state import refresh_segment_states
+
+
+class Command(BaseCommand):
+    """
+    Comando Django para reconstruir o estado atual (SegmentState) de todos os segmentos.
+
+    Como Utilizar:
+        python manage.py rebuild_segment_state
+
+    Útil se as leituras forem alteradas diretamente na db (sem passar pelo Django)
+    ou se houver alguma dúvida sobre a consistência do estado.
+    """
+
+    help = 'Reconstrói o estado atual (última leitura, intensidade e total de leituras) de cada segmento'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Número de segmentos recalculados por transação (por defeito: {DEFAULT_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        segment_ids = RoadSegment.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size)
+
+        total = 0
+        for chunk in iter_chunks(segment_ids, batch_size):
+            refresh_segment_states(chunk)
+            total += len(chunk)
+            self.stdout.write(f' Já foram recalculados {total} segmentos')
+
+        self.stdout.write(self.style.SUCCESS(f'Estado reconstruído para {total} segmentos'))
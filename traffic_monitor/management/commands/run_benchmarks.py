@@ -0,0 +1,112 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+from traffic_monitor.benchmarks import ENDPOINTS, compare_results, run_suite
+
+
+class Command(BaseCommand):
+    """
+    Comando Django que corre a suite de benchmarks (importação e endpoints) com um dataset sintético.
+
+    Como Utilizar:
+        python manage.py run_benchmarks --output resultados/antes.json
+        # ... alterar o código ...
+        python manage.py run_benchmarks --output resultados/depois.json --compare resultados/antes.json
+
+        python manage.py run_benchmarks --segments 5000 --readings 50 --requests 200 --endpoint segments_list
+
+    Os benchmarks correm numa db de testes criada para o efeito e apagada no fim (como o manage.py test),
+    por isso a db configurada não é alterada e todas as execuções partem dos mesmos dados.
+    Para cada endpoint são medidos a latência (p50/p95/p99, em ms) e o número de queries por pedido;
+    para a importação, as linhas/s do import_data (inserção e reimportação com --upsert).
+
+    Com --compare, cada métrica é comparada com a execução anterior e as que pioraram mais do que
+    --threshold % (ou com mais queries) são assinaladas; com --fail-on-regression o comando falha (ex.: CI).
+    """
+
+    help = 'Corre os benchmarks da importação e dos endpoints e guarda os resultados em JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--segments', type=int, default=1000, help='Número de segmentos (por defeito: 1000)')
+        parser.add_argument('--readings', type=int, default=20, help='Número de leituras por segmento (por defeito: 20)')
+        parser.add_argument('--seed', type=int, default=42, help='Semente do dataset e dos pedidos (por defeito: 42)')
+        parser.add_argument('--requests', type=int, default=50, help='Número de pedidos medidos por endpoint (por defeito: 50)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='--batch-size do import_data (por defeito: 1000)')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help='Mede apenas este endpoint (pode ser repetido)')
+        parser.add_argument('--output', help='Ficheiro JSON onde guardar os resultados')
+        parser.add_argument('--compare', help='Ficheiro JSON de uma execução anterior para comparar')
+        parser.add_argument('--threshold', type=float, default=10.0, help='Variação (%%) a partir da qual há regressão (por defeito: 10)')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Falha se alguma métrica tiver uma regressão')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Não foi possível ler {options["compare"]}: {e}')
+
+        unknown = sorted(set(options['endpoints'] or ()) - set(ENDPOINTS))
+        if unknown:
+            raise CommandError(f'Endpoints desconhecidos: {", ".join(unknown)} (disponíveis: {", ".join(ENDPOINTS)})')
+
+        self.stdout.write(self.style.WARNING(
+            f'Dataset: {options["segments"]} segmentos × {options["readings"]} leituras (seed {options["seed"]})'
+        ))
+
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = run_suite(
+                segments=max(1, options['segments']),
+                readings=max(1, options['readings']),
+                seed=options['seed'],
+                requests=max(1, options['requests']),
+                batch_size=max(1, options['batch_size']),
+                only=options['endpoints'],
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Resultados guardados em {options["output"]}'))
+
+        if baseline is not None:
+            comparison = compare_results(results, baseline, options['threshold'])
+            regressions = self.report_comparison(comparison, baseline)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} métricas pioraram mais do que {options["threshold"]}%.')
+
+    def report(self, results):
+        self.stdout.write(self.style.WARNING('\nImportação (import_data)'))
+        for name, values in results['import'].items():
+            self.stdout.write(f'  {name:<8} {values["rows"]:>9} linhas em {values["seconds"]:8.2f} s  {values["rows_per_second"]:>12,.0f} linhas/s')
+
+        self.stdout.write(self.style.WARNING('\nEndpoints (ms por pedido)'))
+        self.stdout.write(f'  {"":<22} {"p50":>8} {"p95":>8} {"p99":>8} {"queries":>8}')
+        for name, values in results['endpoints'].items():
+            line = f'  {name:<22} {values["p50_ms"]:8.2f} {values["p95_ms"]:8.2f} {values["p99_ms"]:8.2f} {values["queries"]:>8}'
+            if values['status'] != [200]:
+                line += f'  (estado {values["status"]})'
+            self.stdout.write(self.style.ERROR(line) if values['status'] != [200] else line)
+
+    def report_comparison(self, comparison, baseline):
+        """
+        Mostra as diferenças para a execução anterior. Retorna o número de regressões.
+        """
+        commit = baseline.get('meta', {}).get('git_commit') or '?'
+        self.stdout.write(self.style.WARNING(f'\nComparação com {commit}'))
+        regressions = 0
+        for path, previous, value, change, regression in comparison:
+            line = f'  {path:<42} {previous:>12} → {value:<12} ({change:+.1f}%)'
+            if regression:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line + '  REGRESSÃO'))
+            else:
+                self.stdout.write(line)
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('  Sem regressões'))
+        return regressions
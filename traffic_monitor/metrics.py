@@ -0,0 +1,340 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+"""
+Métricas de desempenho de cada pedido, no formato de texto do Prometheus (GET /metrics).
+
+O RequestMetricsMiddleware (primeiro em MIDDLEWARE) mede, por vista (nome do URL, ex.: segment-list):
+
+    traffic_monitor_http_requests_total                 pedidos, por vista, método e código de estado
+    traffic_monitor_http_request_duration_seconds       latência (histograma)
+    traffic_monitor_db_queries_per_request              número de queries (histograma)
+    traffic_monitor_db_duration_seconds                 tempo gasto na db por pedido (histograma)
+    traffic_monitor_render_duration_seconds             serialização da resposta pelo renderer do DRF (histograma)
+    traffic_monitor_response_size_bytes                 tamanho da resposta (histograma, exceto streaming)
+    traffic_monitor_slow_requests_total                 pedidos acima de SLOW_REQUEST_THRESHOLD
+
+As queries são contadas por um execute_wrapper instalado em cada ligação à db (connection_created),
+que soma ao pedido atual (ContextVar); por isso também conta as queries das vistas assíncronas,
+feitas noutra thread pelo sync_to_async.
+
+Com SLOW_REQUEST_THRESHOLD (segundos), os pedidos mais lentos são registados no logger
+traffic_monitor.slow_requests, com as queries (SQL, parâmetros e duração) que fizeram.
+
+As métricas ficam em memória e são locais ao processo (como o pub/sub do tempo real): com vários
+processos, o Prometheus deve recolher cada um (ou usar um único processo por porta).
+
+Configuração (config/settings.py):
+    METRICS_ENABLED = True            # Desativa o middleware e o /metrics
+    SLOW_REQUEST_THRESHOLD = None     # Segundos (None → sem log dos pedidos lentos)
+"""
+
+logger = logging.getLogger('traffic_monitor.slow_requests')
+
+# Limites (le) dos histogramas
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Número máximo de queries guardadas por pedido para o log dos pedidos lentos
+MAX_LOGGED_QUERIES = 100
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (
+        str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for value in values
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class Counter:
+    """
+    Contador com etiquetas (labels): {valores das etiquetas: total}.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, self.labelnames, labels, value
+
+
+class Histogram:
+    """
+    Histograma com etiquetas: para cada combinação, o número de observações em cada limite (cumulativo
+    no formato do Prometheus), a soma e o total.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def observe(self, labels, value):
+        counts = self.values.get(labels)
+        if counts is None:
+            # [observações por limite..., acima do último limite, soma]
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        names = self.labelnames + ('le',)
+        for labels, counts in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', names, labels + (format_value(float(bound)),), cumulative
+            yield f'{self.name}_sum', self.labelnames, labels, counts[-1]
+            yield f'{self.name}_count', self.labelnames, labels, cumulative
+
+
+class MetricsRegistry:
+    """
+    Conjunto de métricas do processo. As alterações são feitas com um lock (o servidor pode usar threads).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Texto no formato de exposição do Prometheus.
+        """
+        lines = []
+        with self.lock:
+            for metric in self.metrics:
+                lines.append(f'# HELP {metric.name} {metric.documentation}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                for name, labelnames, labels, value in metric.samples():
+                    lines.append(f'{name}{format_labels(labelnames, labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            for metric in self.metrics:
+                metric.values.clear()
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.register(Counter(
+    'traffic_monitor_http_requests_total', 'Pedidos HTTP por vista, método e código de estado.',
+    ('view', 'method', 'status'),
+))
+REQUEST_DURATION = registry.register(Histogram(
+    'traffic_monitor_http_request_duration_seconds', 'Latência dos pedidos (até a resposta ser devolvida).',
+    DURATION_BUCKETS, ('view', 'method'),
+))
+DB_QUERIES = registry.register(Histogram(
+    'traffic_monitor_db_queries_per_request', 'Número de queries por pedido.', QUERY_BUCKETS, ('view',),
+))
+DB_DURATION = registry.register(Histogram(
+    'traffic_monitor_db_duration_seconds', 'Tempo gasto na db por pedido.', DURATION_BUCKETS, ('view',),
+))
+RENDER_DURATION = registry.register(Histogram(
+    'traffic_monitor_render_duration_seconds', 'Tempo de serialização da resposta (renderer).',
+    DURATION_BUCKETS, ('view',),
+))
+RESPONSE_SIZE = registry.register(Histogram(
+    'traffic_monitor_response_size_bytes', 'Tamanho das respostas (exceto streaming).', SIZE_BUCKETS, ('view',),
+))
+SLOW_REQUESTS = registry.register(Counter(
+    'traffic_monitor_slow_requests_total', 'Pedidos mais lentos do que SLOW_REQUEST_THRESHOLD.', ('view',),
+))
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def slow_request_threshold():
+    return getattr(settings, 'SLOW_REQUEST_THRESHOLD', None)
+
+
+class RequestRecord:
+    """
+    Medições de um pedido (queries, tempo na db e serialização), preenchidas durante o pedido.
+    """
+
+    def __init__(self, capture_sql=False):
+        self.capture_sql = capture_sql
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.sql = []
+
+    def add_query(self, sql, params, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        if self.capture_sql and len(self.sql) < MAX_LOGGED_QUERIES:
+            self.sql.append((sql, params, elapsed))
+
+
+current_request = ContextVar('traffic_monitor_request', default=None)
+
+
+def track_query(execute, sql, params, many, context):
+    """
+    execute_wrapper instalado em todas as ligações: mede a query se houver um pedido a ser medido.
+    """
+    record = current_request.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.add_query(sql, params, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_tracker(sender, connection, **kwargs):
+    # Cada ligação (por thread) só recebe o wrapper uma vez, mesmo que volte a ligar-se
+    if track_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_query)
+
+
+def view_label(request, response):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched' if response.status_code == 404 else 'unknown'
+    return match.view_name or match.route
+
+
+class RequestMetricsMiddleware:
+    """
+    Mede cada pedido e atualiza as métricas do processo. Funciona com WSGI e ASGI (vistas síncronas e assíncronas).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics_enabled():
+            return self.get_response(request)
+        record, token = self.start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.finish(request, response, record, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not metrics_enabled():
+            return await self.get_response(request)
+        record, token = self.start()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.finish(request, response, record, time.perf_counter() - started)
+        return response
+
+    def start(self):
+        record = RequestRecord(capture_sql=slow_request_threshold() is not None)
+        return record, current_request.set(record)
+
+    def process_template_response(self, request, response):
+        """
+        As respostas do DRF são renderizadas depois da vista: mede o tempo até ao fim da renderização.
+        """
+        record = current_request.get()
+        if record is not None:
+            record.render_started = time.perf_counter()
+
+            def rendered(response):
+                record.render_time += time.perf_counter() - record.render_started
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, record, elapsed):
+        view = view_label(request, response)
+        with registry.lock:
+            REQUESTS.inc((view, request.method, str(response.status_code)))
+            REQUEST_DURATION.observe((view, request.method), elapsed)
+            DB_QUERIES.observe((view,), record.queries)
+            DB_DURATION.observe((view,), record.db_time)
+            if record.render_started is not None:
+                RENDER_DURATION.observe((view,), record.render_time)
+            if not response.streaming:
+                RESPONSE_SIZE.observe((view,), len(response.content))
+
+        threshold = slow_request_threshold()
+        if threshold is not None and elapsed >= threshold:
+            with registry.lock:
+                SLOW_REQUESTS.inc((view,))
+            self.log_slow_request(request, response, record, view, elapsed)
+
+    def log_slow_request(self, request, response, record, view, elapsed):
+        queries = '\n'.join(
+            f'  [{duration * 1000:.1f} ms] {sql} {params!r}' for sql, params, duration in record.sql
+        )
+        if record.queries > len(record.sql):
+            queries += f'\n  ... mais {record.queries - len(record.sql)} queries'
+        logger.warning(
+            'Pedido lento: %s %s (%s) → %s em %.1f ms, %d queries (%.1f ms na db)\n%s',
+            request.method, request.get_full_path(), view, response.status_code, elapsed * 1000,
+            record.queries, record.db_time * 1000, queries,
+        )
+
+
+@require_GET
+def metrics_view(request):
+    """
+    GET /metrics → métricas do processo no formato do Prometheus.
+    """
+    if not metrics_enabled():
+        raise Http404
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
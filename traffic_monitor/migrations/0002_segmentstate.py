@@ -0,0 +1,66 @@
+# Generated by Django 6.0 on 2026-10-17 05:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def populate_segment_states(apps, schema_editor):
+    """
+    Cria o estado inicial de todos os segmentos que já têm leituras.
+    """
+    RoadSegment = apps.get_model('traffic_monitor', 'RoadSegment')
+    SpeedReading = apps.get_model('traffic_monitor', 'SpeedReading')
+    SegmentState = apps.get_model('traffic_monitor', 'SegmentState')
+
+    latest = SpeedReading.objects.filter(road_segment=OuterRef('pk')).order_by('-timestamp', '-id')
+    segments = RoadSegment.objects.annotate(
+        total=Count('readings'),
+        latest_id=Subquery(latest.values('id')[:1]),
+        latest_speed=Subquery(latest.values('average_speed')[:1]),
+        latest_timestamp=Subquery(latest.values('timestamp')[:1]),
+        latest_created_at=Subquery(latest.values('created_at')[:1]),
+    ).filter(total__gt=0)
+
+    states = []
+    for segment in segments.iterator(chunk_size=1000):
+        speed = segment.latest_speed
+        states.append(SegmentState(
+            road_segment_id=segment.pk,
+            reading_count=segment.total,
+            latest_reading_id=segment.latest_id,
+            latest_speed=speed,
+            latest_timestamp=segment.latest_timestamp,
+            latest_created_at=segment.latest_created_at,
+            intensity='elevada' if speed <= 20 else 'média' if speed <= 50 else 'baixa',
+        ))
+    SegmentState.objects.bulk_create(states, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentState',
+            fields=[
+                ('road_segment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='state', serialize=False, to='traffic_monitor.roadsegment', verbose_name='Segmento de Estrada')),
+                ('reading_count', models.PositiveIntegerField(default=0, verbose_name='Total de Leituras')),
+                ('latest_reading_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID da Última Leitura')),
+                ('latest_speed', models.FloatField(blank=True, null=True, verbose_name='Velocidade da Última Leitura (km/h)')),
+                ('latest_timestamp', models.DateTimeField(blank=True, null=True, verbose_name='Data/Hora da Última Leitura')),
+                ('latest_created_at', models.DateTimeField(blank=True, null=True)),
+                ('intensity', models.CharField(blank=True, db_index=True, max_length=10, null=True, verbose_name='Intensidade Atual')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Estado do Segmento',
+                'verbose_name_plural': 'Estados dos Segmentos',
+                'db_table': 'segment_states',
+            },
+        ),
+        migrations.RunPython(populate_segment_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 05:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0002_segmentstate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='roadsegment',
+            index=models.Index(fields=['longitude_start', 'latitude_start', 'longitude_end', 'latitude_end'], name='road_seg_coords_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='speedreading',
+            index=models.Index(fields=['road_segment', 'timestamp'], name='speed_read_seg_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='speedreading',
+            index=models.Index(fields=['timestamp'], name='speed_read_ts_idx'),
+        ),
+        # O índice simples da FK só é removido depois de existir o índice composto
+        migrations.AlterField(
+            model_name='speedreading',
+            name='road_segment',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='readings', to='traffic_monitor.roadsegment', verbose_name='Segmento de Estrada'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-17 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0003_reading_and_segment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='speedreading',
+            index=models.Index(fields=['road_segment', 'timestamp', 'id'], name='speed_read_seg_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='speedreading',
+            index=models.Index(fields=['timestamp', 'id'], name='speed_read_ts_id_idx'),
+        ),
+        # Os índices antigos só são removidos depois de existirem os novos
+        migrations.RemoveIndex(
+            model_name='speedreading',
+            name='speed_read_seg_ts_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='speedreading',
+            name='speed_read_ts_idx',
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 6.0 on 2026-10-17 06:01
+
+import django.db.models.deletion
+from datetime import timezone
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def populate_rollups(apps, schema_editor):
+    """
+    Calcula as estatísticas por hora e por dia das leituras que já existem.
+    """
+    SpeedReading = apps.get_model('traffic_monitor', 'SpeedReading')
+    for model_name, truncate in (('HourlySpeedRollup', TruncHour), ('DailySpeedRollup', TruncDay)):
+        model = apps.get_model('traffic_monitor', model_name)
+        rows = (
+            SpeedReading.objects.order_by()
+            .annotate(bucket=truncate('timestamp', tzinfo=timezone.utc))
+            .values('road_segment_id', 'bucket')
+            .annotate(
+                count=Count('id'),
+                speed_sum=Sum('average_speed'),
+                speed_sum_sq=Sum(F('average_speed') * F('average_speed')),
+                speed_min=Min('average_speed'),
+                speed_max=Max('average_speed'),
+            )
+        )
+        model.objects.bulk_create((model(**row) for row in rows.iterator(chunk_size=1000)), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySpeedRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='Início do Intervalo')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Número de Leituras')),
+                ('speed_sum', models.FloatField(default=0)),
+                ('speed_sum_sq', models.FloatField(default=0)),
+                ('speed_min', models.FloatField(verbose_name='Velocidade Mínima (km/h)')),
+                ('speed_max', models.FloatField(verbose_name='Velocidade Máxima (km/h)')),
+                ('road_segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='traffic_monitor.roadsegment', verbose_name='Segmento de Estrada')),
+            ],
+            options={
+                'verbose_name': 'Estatística Diária',
+                'verbose_name_plural': 'Estatísticas Diárias',
+                'db_table': 'speed_rollups_daily',
+                'ordering': ['road_segment', 'bucket'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['bucket'], name='rollup_daily_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('road_segment', 'bucket'), name='rollup_daily_seg_bucket_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySpeedRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='Início do Intervalo')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Número de Leituras')),
+                ('speed_sum', models.FloatField(default=0)),
+                ('speed_sum_sq', models.FloatField(default=0)),
+                ('speed_min', models.FloatField(verbose_name='Velocidade Mínima (km/h)')),
+                ('speed_max', models.FloatField(verbose_name='Velocidade Máxima (km/h)')),
+                ('road_segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='traffic_monitor.roadsegment', verbose_name='Segmento de Estrada')),
+            ],
+            options={
+                'verbose_name': 'Estatística Horária',
+                'verbose_name_plural': 'Estatísticas Horárias',
+                'db_table': 'speed_rollups_hourly',
+                'ordering': ['road_segment', 'bucket'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['bucket'], name='rollup_hourly_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('road_segment', 'bucket'), name='rollup_hourly_seg_bucket_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0005_speed_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roadsegment',
+            name='high_intensity_max_speed',
+            field=models.FloatField(blank=True, null=True, verbose_name='Velocidade Máxima com Intensidade Elevada (km/h)'),
+        ),
+        migrations.AddField(
+            model_name='roadsegment',
+            name='medium_intensity_max_speed',
+            field=models.FloatField(blank=True, null=True, verbose_name='Velocidade Máxima com Intensidade Média (km/h)'),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 6.0 on 2026-10-17 14:20
+
+from datetime import timezone
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def deduplicate(apps, schema_editor):
+    """
+    Remove os duplicados antes de criar as restrições UNIQUE (0008):
+
+    1. Segmentos com as mesmas coordenadas → fica o de menor id, que recebe as leituras dos outros
+    2. Leituras do mesmo segmento com a mesma data → fica a de menor id
+
+    O estado e os rollups dos segmentos afetados são recalculados.
+    """
+    RoadSegment = apps.get_model('traffic_monitor', 'RoadSegment')
+    SpeedReading = apps.get_model('traffic_monitor', 'SpeedReading')
+    coordinates = ['longitude_start', 'latitude_start', 'longitude_end', 'latitude_end']
+    affected = set()
+
+    duplicated_segments = (
+        RoadSegment.objects.order_by().values(*coordinates)
+        .annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    )
+    for group in duplicated_segments.iterator():
+        keep = group.pop('keep')
+        del group['total']
+        duplicates = list(RoadSegment.objects.filter(**group).exclude(pk=keep).values_list('pk', flat=True))
+        SpeedReading.objects.filter(road_segment_id__in=duplicates).update(road_segment_id=keep)
+        RoadSegment.objects.filter(pk__in=duplicates).delete()
+        affected.add(keep)
+
+    duplicated_readings = (
+        SpeedReading.objects.order_by().values('road_segment_id', 'timestamp')
+        .annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    )
+    for group in duplicated_readings.iterator():
+        SpeedReading.objects.filter(
+            road_segment_id=group['road_segment_id'], timestamp=group['timestamp']
+        ).exclude(pk=group['keep']).delete()
+        affected.add(group['road_segment_id'])
+
+    if affected:
+        rebuild_derived_data(apps, affected)
+
+
+def rebuild_derived_data(apps, segment_ids):
+    """
+    Recalcula o SegmentState e os rollups dos segmentos indicados (como em 0002 e 0005).
+    """
+    RoadSegment = apps.get_model('traffic_monitor', 'RoadSegment')
+    SpeedReading = apps.get_model('traffic_monitor', 'SpeedReading')
+    SegmentState = apps.get_model('traffic_monitor', 'SegmentState')
+    high = getattr(settings, 'HIGH_INTENSITY_MAX_SPEED', 20)
+    medium = getattr(settings, 'MEDIUM_INTENSITY_MAX_SPEED', 50)
+
+    SegmentState.objects.filter(road_segment_id__in=segment_ids).delete()
+    states = []
+    for segment in RoadSegment.objects.filter(pk__in=segment_ids):
+        readings = SpeedReading.objects.filter(road_segment_id=segment.pk)
+        latest = readings.order_by('-timestamp', '-id').first()
+        if latest is None:
+            continue
+        speed = latest.average_speed
+        segment_high = segment.high_intensity_max_speed if segment.high_intensity_max_speed is not None else high
+        segment_medium = segment.medium_intensity_max_speed if segment.medium_intensity_max_speed is not None else medium
+        states.append(SegmentState(
+            road_segment_id=segment.pk,
+            reading_count=readings.count(),
+            latest_reading_id=latest.pk,
+            latest_speed=speed,
+            latest_timestamp=latest.timestamp,
+            latest_created_at=latest.created_at,
+            intensity='elevada' if speed <= segment_high else 'média' if speed <= segment_medium else 'baixa',
+        ))
+    SegmentState.objects.bulk_create(states, batch_size=1000)
+
+    for model_name, truncate in (('HourlySpeedRollup', TruncHour), ('DailySpeedRollup', TruncDay)):
+        model = apps.get_model('traffic_monitor', model_name)
+        model.objects.filter(road_segment_id__in=segment_ids).delete()
+        rows = (
+            SpeedReading.objects.filter(road_segment_id__in=segment_ids).order_by()
+            .annotate(bucket=truncate('timestamp', tzinfo=timezone.utc))
+            .values('road_segment_id', 'bucket')
+            .annotate(
+                count=Count('id'),
+                speed_sum=Sum('average_speed'),
+                speed_sum_sq=Sum(F('average_speed') * F('average_speed')),
+                speed_min=Min('average_speed'),
+                speed_max=Max('average_speed'),
+            )
+        )
+        model.objects.bulk_create((model(**row) for row in rows.iterator(chunk_size=1000)), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0006_segment_intensity_thresholds'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-17 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0007_deduplicate_segments_and_readings'),
+    ]
+
+    operations = [
+        # A restrição UNIQUE cria o seu próprio índice, que substitui o das coordenadas
+        migrations.RemoveIndex(
+            model_name='roadsegment',
+            name='road_seg_coords_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='roadsegment',
+            constraint=models.UniqueConstraint(fields=('longitude_start', 'latitude_start', 'longitude_end', 'latitude_end'), name='road_seg_coords_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='speedreading',
+            constraint=models.UniqueConstraint(fields=('road_segment', 'timestamp'), name='speed_read_seg_ts_uniq'),
+        ),
+        # O índice (road_segment, timestamp, id) só é removido depois de existir o índice da restrição
+        migrations.RemoveIndex(
+            model_name='speedreading',
+            name='speed_read_seg_ts_id_idx',
+        ),
+    ]
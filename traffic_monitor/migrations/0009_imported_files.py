@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0008_unique_segments_and_readings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True, verbose_name='Caminho')),
+                ('size', models.BigIntegerField(verbose_name='Tamanho (bytes)')),
+                ('modified_at', models.DateTimeField(verbose_name='Data de Modificação')),
+                ('rows_processed', models.PositiveIntegerField(default=0, verbose_name='Linhas Processadas')),
+                ('readings_created', models.PositiveIntegerField(default=0, verbose_name='Leituras Criadas')),
+                ('readings_updated', models.PositiveIntegerField(default=0, verbose_name='Leituras Atualizadas')),
+                ('errors', models.PositiveIntegerField(default=0, verbose_name='Erros')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='Concluído em')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Ficheiro Importado',
+                'verbose_name_plural': 'Ficheiros Importados',
+                'db_table': 'imported_files',
+                'ordering': ['path'],
+            },
+        ),
+    ]
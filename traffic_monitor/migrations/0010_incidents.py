@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0009_imported_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Incident',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='Início')),
+                ('ended_at', models.DateTimeField(blank=True, null=True, verbose_name='Fim')),
+                ('last_reading_at', models.DateTimeField(verbose_name='Última Leitura Anómala')),
+                ('expected_speed', models.FloatField(verbose_name='Velocidade Habitual (km/h)')),
+                ('min_speed', models.FloatField(verbose_name='Velocidade Mínima (km/h)')),
+                ('max_score', models.FloatField(verbose_name='Desvio Máximo')),
+                ('reading_count', models.PositiveIntegerField(default=1, verbose_name='Leituras Anómalas')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('road_segment', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='incidents', to='traffic_monitor.roadsegment', verbose_name='Segmento de Estrada')),
+            ],
+            options={
+                'verbose_name': 'Incidente',
+                'verbose_name_plural': 'Incidentes',
+                'db_table': 'incidents',
+                'ordering': ['-started_at', '-id'],
+                'indexes': [models.Index(fields=['road_segment', 'started_at'], name='incident_seg_start_idx'), models.Index(fields=['started_at', 'id'], name='incident_start_id_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('ended_at__isnull', True)), fields=('road_segment',), name='incident_one_active_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_monitor', '0010_incidents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentForecast',
+            fields=[
+                ('road_segment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='forecast', serialize=False, to='traffic_monitor.roadsegment', verbose_name='Segmento de Estrada')),
+                ('step_minutes', models.PositiveSmallIntegerField(verbose_name='Intervalo (minutos)')),
+                ('level', models.FloatField(verbose_name='Nível (km/h)')),
+                ('seasonal', models.JSONField(verbose_name='Componente Sazonal')),
+                ('residual_variance', models.FloatField(default=0, verbose_name='Variância dos Erros')),
+                ('observations', models.PositiveIntegerField(default=0, verbose_name='Intervalos Observados')),
+                ('fitted_until', models.DateTimeField(verbose_name='Ajustado Até')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Previsão do Segmento',
+                'verbose_name_plural': 'Previsões dos Segmentos',
+                'db_table': 'segment_forecasts',
+            },
+        ),
+    ]
@@ -1,9 +1,103 @@
+from django.conf import settings
 from django.db import models
+from django.db.models.functions import Coalesce
 
 #
-# Vamos ter 2 modelos:
+# Vamos ter 8 modelos:
 # - RoadSegment
 # - SpeedReading
+# - SegmentState (estado atual de cada segmento, mantido automaticamente)
+# - HourlySpeedRollup / DailySpeedRollup (estatísticas pré-calculadas por hora e por dia)
+# - ImportedFile (progresso da importação de cada ficheiro)
+# - Incident (congestionamentos anómalos detetados nas leituras)
+# - SegmentForecast (parâmetros do modelo de previsão de cada segmento)
+
+
+# Limites de velocidade (km/h) que definem a intensidade do trânsito, por defeito.
+# Podem ser alterados em config/settings.py (mesmos nomes) e, para cada segmento, nos campos
+# high_intensity_max_speed / medium_intensity_max_speed (ex.: autoestradas vs ruas urbanas).
+HIGH_INTENSITY_MAX_SPEED = 20       # Até 20 km/h → intensidade elevada
+MEDIUM_INTENSITY_MAX_SPEED = 50     # Até 50 km/h → intensidade média (acima → baixa)
+
+# Níveis de intensidade, da mais alta para a mais baixa
+INTENSITY_LEVELS = ('elevada', 'média', 'baixa')
+
+
+def intensity_thresholds(segment=None):
+    """
+    Limites (elevada, média) em vigor: os do segmento, se os tiver, ou os das settings.
+    """
+    high = getattr(settings, 'HIGH_INTENSITY_MAX_SPEED', HIGH_INTENSITY_MAX_SPEED)
+    medium = getattr(settings, 'MEDIUM_INTENSITY_MAX_SPEED', MEDIUM_INTENSITY_MAX_SPEED)
+    if segment is not None:
+        if segment.high_intensity_max_speed is not None:
+            high = segment.high_intensity_max_speed
+        if segment.medium_intensity_max_speed is not None:
+            medium = segment.medium_intensity_max_speed
+    return high, medium
+
+
+def intensity_for_speed(speed, segment=None):
+    """
+    Calcula a intensidade do trânsito com base numa velocidade média (km/h)
+    e nos limites do segmento (se indicado).
+    """
+    high, medium = intensity_thresholds(segment)
+    if speed <= high:
+        return "elevada"
+    elif speed <= medium:
+        return "média"
+    else:
+        return "baixa"
+
+
+def normalize_intensity(value):
+    """
+    Converte o valor de um filtro (?intensity=) no nível correspondente: "media" e "Média" → "média".
+    Retorna None se não for um nível válido.
+    """
+    value = value.strip().lower().replace('é', 'e')
+    for level in INTENSITY_LEVELS:
+        if level.replace('é', 'e') == value:
+            return level
+    return None
+
+
+def intensity_expression(field='average_speed', segment='road_segment'):
+    """
+    A mesma regra do intensity_for_speed, como expressão SQL (CASE WHEN), para ser calculada na db:
+    permite filtrar, agrupar e ordenar pela intensidade sem carregar as leituras.
+
+    segment: caminho até ao RoadSegment cujos limites são usados ('' se a query já é sobre os segmentos).
+    """
+    high, medium = intensity_thresholds()
+    prefix = f'{segment}__' if segment else ''
+    high = Coalesce(models.F(f'{prefix}high_intensity_max_speed'), models.Value(float(high)), output_field=models.FloatField())
+    medium = Coalesce(models.F(f'{prefix}medium_intensity_max_speed'), models.Value(float(medium)), output_field=models.FloatField())
+    return models.Case(
+        models.When(**{f'{field}__lte': high}, then=models.Value('elevada')),
+        models.When(**{f'{field}__lte': medium}, then=models.Value('média')),
+        default=models.Value('baixa'),
+        output_field=models.CharField(),
+    )
+
+
+class SpeedReadingQuerySet(models.QuerySet):
+    """
+    Queryset das leituras, com a intensidade calculada na db.
+
+        SpeedReading.objects.with_intensity().values('speed_intensity').annotate(total=Count('id'))
+        SpeedReading.objects.filter_intensity('elevada')
+    """
+
+    def with_intensity(self):
+        if 'speed_intensity' in self.query.annotations:
+            return self
+        return self.annotate(speed_intensity=intensity_expression())
+
+    def filter_intensity(self, intensity):
+        return self.with_intensity().filter(speed_intensity=intensity)
+
 
 # Modelo que representa um segmento de estrada 
 class RoadSegment(models.Model):
@@ -16,6 +110,9 @@ class RoadSegment(models.Model):
     longitude_end = models.FloatField(verbose_name="Longitude de Fim")          # Longitude final
     latitude_end = models.FloatField(verbose_name="Latitude de Fim")            # Latitude final
     length = models.FloatField(verbose_name="Comprimento (metros)")             # Comprimento do segmento
+    # Limites de intensidade deste segmento (vazios → os definidos nas settings)
+    high_intensity_max_speed = models.FloatField(null=True, blank=True, verbose_name="Velocidade Máxima com Intensidade Elevada (km/h)")
+    medium_intensity_max_speed = models.FloatField(null=True, blank=True, verbose_name="Velocidade Máxima com Intensidade Média (km/h)")
     # As datas são geridas automaticamente pelo Django
     created_at = models.DateTimeField(auto_now_add=True)                        # Guarda automaticamente quando o segemento de estrada for criado
     updated_at = models.DateTimeField(auto_now=True)                            # Atualiza automaticamente quando o segmento de estrada for modificado
@@ -25,6 +122,13 @@ class RoadSegment(models.Model):
         ordering = ['id']                               # Ordenar pelo ID
         verbose_name = 'Segmento de Estrada'
         verbose_name_plural = 'Segmentos de Estrada'
+        constraints = [
+            # Um segmento por coordenadas (o índice serve também a deduplicação e o ON CONFLICT do import_data)
+            models.UniqueConstraint(
+                fields=['longitude_start', 'latitude_start', 'longitude_end', 'latitude_end'],
+                name='road_seg_coords_uniq'
+            ),
+        ]
     
     def __str__(self):
         return f"Segmento {self.id}"    # Exemplo: Segmento 1
@@ -39,17 +143,30 @@ class SpeedReading(models.Model):
         RoadSegment,
         on_delete=models.CASCADE,       # Se o segmento for apagado, todas as leituras de velocidade associadas a ele também serão
         related_name='readings',
-        verbose_name='Segmento de Estrada'
+        verbose_name='Segmento de Estrada',
+        db_index=False                  # Já coberto pelo índice da restrição única (road_segment, timestamp)
     )
     average_speed = models.FloatField(verbose_name="Velocidade Média (km/h)")   # Velocidade média dos veículos no segmento associado
     timestamp = models.DateTimeField(verbose_name="Data/Hora da Leitura")       # Para saber o omento real em que a leitura foi feita no trânsito
     created_at = models.DateTimeField(auto_now_add=True)                        # Data de criação desta leitura de velocidade na db
+
+    objects = SpeedReadingQuerySet.as_manager()
     
     class Meta:
         db_table = 'speed_readings'             # Nome da tabela        
         ordering = ['-timestamp']               # Ordenar começando do mais recente para o mais antigo
         verbose_name = 'Leitura de Velocidade'
         verbose_name_plural = 'Leituras de Velocidade'
+        indexes = [
+            # Todas as leituras ordenadas por data (listagem e filtros por intervalo de tempo)
+            models.Index(fields=['timestamp', 'id'], name='speed_read_ts_id_idx'),
+        ]
+        constraints = [
+            # Uma leitura por segmento e data (reimportar o mesmo ficheiro não duplica leituras)
+            # O índice serve também as leituras de um segmento ordenadas por data (filtro ?road_segment=,
+            # última leitura e paginação por cursor: dentro de um segmento não há empates no timestamp)
+            models.UniqueConstraint(fields=['road_segment', 'timestamp'], name='speed_read_seg_ts_uniq'),
+        ]
     
     def __str__(self):
         return f"Leitura {self.id} - {self.average_speed} km/h"     # Por Exemplo: Leitura 3 - 40.5 km/h
@@ -57,12 +174,258 @@ class SpeedReading(models.Model):
     @property
     def intensity(self):
         """
-        Serve para calcular a intensidade do trânsito com base na velocidade média.
-        Este valor não é guardado na base de dados.
+        Serve para calcular a intensidade do trânsito com base na velocidade média
+        e nos limites do segmento. Este valor não é guardado na base de dados.
+
+        Para não fazer uma query por leitura, o segmento deve vir com select_related('road_segment').
         """
-        if self.average_speed <= 20:
-            return "elevada"
-        elif self.average_speed <= 50:
-            return "média"
-        else:
-            return "baixa"
\ No newline at end of file
+        return intensity_for_speed(self.average_speed, self.road_segment)
+
+
+# Modelo que guarda o estado atual de um segmento (desnormalizado)
+class SegmentState(models.Model):
+    """
+    Estado atual de um segmento de estrada: última leitura, intensidade e número de leituras.
+
+    É atualizado automaticamente sempre que uma SpeedReading é criada, alterada ou apagada
+    (ver signals.py), evitando recalcular "a leitura mais recente" em cada pedido.
+    Os dados da última leitura são copiados (e não uma FK) para não ser preciso um JOIN.
+
+    Pode ser reconstruído com: python manage.py rebuild_segment_state
+    """
+
+    road_segment = models.OneToOneField(
+        RoadSegment,
+        on_delete=models.CASCADE,       # Se o segmento for apagado, o estado também é
+        primary_key=True,
+        related_name='state',
+        verbose_name='Segmento de Estrada'
+    )
+    reading_count = models.PositiveIntegerField(default=0, verbose_name="Total de Leituras")
+    latest_reading_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID da Última Leitura")
+    latest_speed = models.FloatField(null=True, blank=True, verbose_name="Velocidade da Última Leitura (km/h)")
+    latest_timestamp = models.DateTimeField(null=True, blank=True, verbose_name="Data/Hora da Última Leitura")
+    latest_created_at = models.DateTimeField(null=True, blank=True)
+    intensity = models.CharField(max_length=10, null=True, blank=True, db_index=True, verbose_name="Intensidade Atual")  # Indexado para o filtro ?intensity=
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'segment_states'
+        verbose_name = 'Estado do Segmento'
+        verbose_name_plural = 'Estados dos Segmentos'
+
+    def __str__(self):
+        return f"Estado do Segmento {self.road_segment_id}"
+
+    def set_latest(self, reading):
+        """
+        Copia os dados de uma leitura para o estado, como sendo a leitura mais recente.
+        """
+        self.latest_reading_id = reading.pk
+        self.latest_speed = reading.average_speed
+        self.latest_timestamp = reading.timestamp
+        self.latest_created_at = reading.created_at
+        self.intensity = intensity_for_speed(reading.average_speed, reading.road_segment)
+
+    def latest_reading(self):
+        """
+        Reconstrói (sem query) a última leitura a partir dos dados copiados.
+        """
+        if self.latest_reading_id is None:
+            return None
+        reading = SpeedReading(
+            id=self.latest_reading_id,
+            road_segment_id=self.road_segment_id,
+            average_speed=self.latest_speed,
+            timestamp=self.latest_timestamp,
+            created_at=self.latest_created_at,
+        )
+        # Reaproveita o segmento já carregado (usado no cálculo da intensidade)
+        if SegmentState.road_segment.is_cached(self):
+            reading.road_segment = self.road_segment
+        return reading
+
+
+# Modelo base das tabelas de estatísticas pré-calculadas (rollups)
+class SpeedRollup(models.Model):
+    """
+    Estatísticas das leituras de um segmento num intervalo de tempo (bucket).
+
+    Guardam-se somas (e não médias) para que o registo possa ser atualizado
+    de forma incremental à medida que chegam novas leituras:
+        média = speed_sum / count
+        variância = speed_sum_sq / count - média²
+    """
+
+    road_segment = models.ForeignKey(
+        RoadSegment,
+        on_delete=models.CASCADE,       # Se o segmento for apagado, as estatísticas também são
+        related_name='+',
+        verbose_name='Segmento de Estrada'
+    )
+    bucket = models.DateTimeField(verbose_name="Início do Intervalo")      # Início do intervalo (UTC)
+    count = models.PositiveIntegerField(default=0, verbose_name="Número de Leituras")
+    speed_sum = models.FloatField(default=0)                                # Soma das velocidades
+    speed_sum_sq = models.FloatField(default=0)                             # Soma dos quadrados das velocidades
+    speed_min = models.FloatField(verbose_name="Velocidade Mínima (km/h)")
+    speed_max = models.FloatField(verbose_name="Velocidade Máxima (km/h)")
+
+    class Meta:
+        abstract = True
+        ordering = ['road_segment', 'bucket']
+
+    def __str__(self):
+        return f"Segmento {self.road_segment_id} - {self.bucket:%Y-%m-%d %H:%M}"
+
+    @property
+    def average_speed(self):
+        return self.speed_sum / self.count if self.count else None
+
+
+class HourlySpeedRollup(SpeedRollup):
+    """
+    Estatísticas das leituras de cada segmento, por hora.
+    """
+
+    class Meta(SpeedRollup.Meta):
+        db_table = 'speed_rollups_hourly'
+        verbose_name = 'Estatística Horária'
+        verbose_name_plural = 'Estatísticas Horárias'
+        constraints = [
+            models.UniqueConstraint(fields=['road_segment', 'bucket'], name='rollup_hourly_seg_bucket_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket'], name='rollup_hourly_bucket_idx'),
+        ]
+
+
+class DailySpeedRollup(SpeedRollup):
+    """
+    Estatísticas das leituras de cada segmento, por dia.
+    """
+
+    class Meta(SpeedRollup.Meta):
+        db_table = 'speed_rollups_daily'
+        verbose_name = 'Estatística Diária'
+        verbose_name_plural = 'Estatísticas Diárias'
+        constraints = [
+            models.UniqueConstraint(fields=['road_segment', 'bucket'], name='rollup_daily_seg_bucket_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket'], name='rollup_daily_bucket_idx'),
+        ]
+
+
+class ImportedFile(models.Model):
+    """
+    Progresso da importação de um ficheiro CSV (import_data).
+
+    O número de linhas processadas é guardado na mesma transação de cada bloco escrito, por isso uma
+    importação interrompida continua na linha seguinte e um ficheiro já importado (com o mesmo tamanho
+    e data de modificação) é ignorado.
+    """
+
+    path = models.CharField(max_length=500, unique=True, verbose_name="Caminho")     # Caminho absoluto do ficheiro
+    size = models.BigIntegerField(verbose_name="Tamanho (bytes)")
+    modified_at = models.DateTimeField(verbose_name="Data de Modificação")
+    rows_processed = models.PositiveIntegerField(default=0, verbose_name="Linhas Processadas")
+    readings_created = models.PositiveIntegerField(default=0, verbose_name="Leituras Criadas")
+    readings_updated = models.PositiveIntegerField(default=0, verbose_name="Leituras Atualizadas")
+    errors = models.PositiveIntegerField(default=0, verbose_name="Erros")
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name="Concluído em")   # Vazio → importação por terminar
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'imported_files'
+        ordering = ['path']
+        verbose_name = 'Ficheiro Importado'
+        verbose_name_plural = 'Ficheiros Importados'
+
+    def __str__(self):
+        return self.path
+
+
+
+class Incident(models.Model):
+    """
+    Incidente (congestionamento anómalo) detetado num segmento pelo incidents.py.
+
+    Começa na primeira leitura muito abaixo da velocidade habitual do segmento (média móvel exponencial)
+    e termina quando as leituras voltam ao normal. Enquanto está ativo (ended_at vazio), cada nova leitura
+    anómala atualiza a velocidade mínima, o desvio máximo e o número de leituras.
+    """
+
+    road_segment = models.ForeignKey(
+        RoadSegment,
+        on_delete=models.CASCADE,       # Se o segmento for apagado, os incidentes também são
+        related_name='incidents',
+        verbose_name='Segmento de Estrada',
+        db_index=False                  # Já coberto pelo índice (road_segment, started_at)
+    )
+    started_at = models.DateTimeField(verbose_name="Início")                                    # Timestamp da primeira leitura anómala
+    ended_at = models.DateTimeField(null=True, blank=True, verbose_name="Fim")                 # Vazio → incidente ativo
+    last_reading_at = models.DateTimeField(verbose_name="Última Leitura Anómala")
+    expected_speed = models.FloatField(verbose_name="Velocidade Habitual (km/h)")              # Média do segmento antes do incidente
+    min_speed = models.FloatField(verbose_name="Velocidade Mínima (km/h)")
+    max_score = models.FloatField(verbose_name="Desvio Máximo")                                # Desvios-padrão abaixo da média
+    reading_count = models.PositiveIntegerField(default=1, verbose_name="Leituras Anómalas")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'incidents'
+        ordering = ['-started_at', '-id']
+        verbose_name = 'Incidente'
+        verbose_name_plural = 'Incidentes'
+        indexes = [
+            # Incidentes de um segmento (filtro ?road_segment=) e listagem por data
+            models.Index(fields=['road_segment', 'started_at'], name='incident_seg_start_idx'),
+            models.Index(fields=['started_at', 'id'], name='incident_start_id_idx'),
+        ]
+        constraints = [
+            # No máximo um incidente ativo por segmento
+            models.UniqueConstraint(
+                fields=['road_segment'], condition=models.Q(ended_at__isnull=True), name='incident_one_active_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Incidente {self.id} - Segmento {self.road_segment_id}"
+
+    @property
+    def active(self):
+        return self.ended_at is None
+
+
+class SegmentForecast(models.Model):
+    """
+    Parâmetros do modelo de previsão da velocidade de um segmento (forecasting.py), já ajustados.
+
+    O modelo (suavização exponencial com sazonalidade diária) guarda o nível atual, a componente sazonal
+    de cada intervalo do dia e a variância dos erros de previsão. É ajustado pelo comando fit_forecasts,
+    que continua a partir destes valores com as leituras posteriores a fitted_until.
+    """
+
+    road_segment = models.OneToOneField(
+        RoadSegment,
+        on_delete=models.CASCADE,       # Se o segmento for apagado, a previsão também é
+        primary_key=True,
+        related_name='forecast',
+        verbose_name='Segmento de Estrada'
+    )
+    step_minutes = models.PositiveSmallIntegerField(verbose_name="Intervalo (minutos)")     # Duração de cada intervalo do modelo
+    level = models.FloatField(verbose_name="Nível (km/h)")
+    seasonal = models.JSONField(verbose_name="Componente Sazonal")                         # Um valor (ou null) por intervalo do dia
+    residual_variance = models.FloatField(default=0, verbose_name="Variância dos Erros")
+    observations = models.PositiveIntegerField(default=0, verbose_name="Intervalos Observados")
+    fitted_until = models.DateTimeField(verbose_name="Ajustado Até")                        # Fim do último intervalo usado
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'segment_forecasts'
+        verbose_name = 'Previsão do Segmento'
+        verbose_name_plural = 'Previsões dos Segmentos'
+
+    def __str__(self):
+        return f"Previsão do Segmento {self.road_segment_id}"
@@ -0,0 +1,165 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+"""
+Paginação por cursor (keyset).
+
+Em vez de OFFSET (que obriga a db a percorrer todas as linhas das páginas anteriores),
+cada cursor guarda os valores da ordenação do último elemento da página, e a página seguinte
+é obtida com um WHERE sobre esses valores. Assim, a página 1000 custa o mesmo que a primeira.
+
+Exemplo (leituras ordenadas por -timestamp, -id):
+    WHERE timestamp <= T AND (timestamp < T OR id < ID) ORDER BY timestamp DESC, id DESC LIMIT N
+"""
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Paginação por cursor sobre todos os campos da ordenação (e não apenas o primeiro, como no DRF).
+
+    O último campo da ordenação deve ser único (ex.: id), para que não existam empates.
+
+    Tamanho da página:
+        - Por defeito: REST_FRAMEWORK['PAGE_SIZE']
+        - Pode ser alterado com ?page_size=, até ao máximo definido em settings.MAX_PAGE_SIZE
+    """
+
+    ordering = ('-id',)
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Cursor inválido'
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'MAX_PAGE_SIZE', 1000)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    def page_queryset(self, queryset, request):
+        """
+        Queryset (ainda não executado) da página pedida, com mais um elemento para saber se existe uma página a seguir.
+        Separado do set_page para que a página também possa ser lida com o ORM assíncrono (async_views.py).
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor.reverse if self.cursor else False
+
+        # Ao recuar (página anterior) percorremos a ordenação ao contrário
+        ordering = self.reversed_ordering() if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+
+        if self.cursor and self.cursor.position is not None:
+            try:
+                queryset = queryset.filter(self.keyset_filter(ordering, self.decode_position(self.cursor.position)))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # Pedimos mais um elemento para saber se existe uma página a seguir
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        """
+        Guarda a página a partir dos resultados do page_queryset.
+        """
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.cursor and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None and self.cursor.position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self.position_of(self.page[-1])
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self.position_of(self.page[0])
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    def keyset_filter(self, ordering, values):
+        """
+        Constrói a condição "vem depois de (v1, v2, ...)" para a ordenação indicada.
+
+        Para (-timestamp, -id): timestamp <= v1 AND (timestamp < v1 OR (timestamp = v1 AND id < v2))
+        A primeira condição (só sobre o 1º campo) permite à db usar o índice como intervalo.
+        """
+        if len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        fields = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+        condition = Q()
+        for index in reversed(range(len(fields))):
+            name, descending = fields[index]
+            after = Q(**{f'{name}__{"lt" if descending else "gt"}': values[index]})
+            condition = after if index == len(fields) - 1 else after | (Q(**{name: values[index]}) & condition)
+
+        first_name, first_descending = fields[0]
+        bound = Q(**{f'{first_name}__{"lte" if first_descending else "gte"}': values[0]})
+        return bound & condition
+
+    def position_of(self, item):
+        """
+        Valores dos campos da ordenação de um elemento, codificados para o cursor.
+        Aceita instâncias de modelos ou dicionários (querysets com .values()).
+        """
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = item[name] if isinstance(item, dict) else getattr(item, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return json.dumps(values, separators=(',', ':'))
+
+    def decode_position(self, position):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+
+class RoadSegmentPagination(KeysetPagination):
+    """
+    Paginação dos segmentos pelo id.
+    """
+    ordering = ('id',)
+
+
+class SpeedReadingPagination(KeysetPagination):
+    """
+    Paginação das leituras da mais recente para a mais antiga (timestamp, id).
+    """
+    ordering = ('-timestamp', '-id')
+
+
+class IncidentPagination(KeysetPagination):
+    """
+    Paginação dos incidentes do mais recente para o mais antigo (started_at, id).
+    """
+    ordering = ('-started_at', '-id')
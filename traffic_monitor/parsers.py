@@ -0,0 +1,38 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+"""
+Parsers adicionais da API.
+"""
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parser para NDJSON (um objeto JSON por linha), usado no envio de leituras em bloco.
+
+    Exemplo:
+        {"road_segment": 1, "average_speed": 35.2, "timestamp": "2024-12-17T14:00:00Z"}
+        {"road_segment": 2, "average_speed": 12.0, "timestamp": "2024-12-17T14:00:00Z"}
+
+    Devolve uma lista com um dicionário por linha (as linhas vazias são ignoradas).
+    """
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        items = []
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line.decode(encoding)))
+            except ValueError as e:
+                raise ParseError(f'NDJSON inválido na linha {number}: {e}')
+        return items
@@ -0,0 +1,223 @@
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from .models import SpeedReading
+from .segment_state import refresh_segment_states
+from .caching import invalidate_segments
+
+"""
+Particionamento (opcional, apenas PostgreSQL) da tabela speed_readings por mês (timestamp).
+
+    speed_readings                  → tabela particionada (PARTITION BY RANGE (timestamp))
+    ├── speed_readings_p2024_11     → leituras de novembro de 2024
+    ├── speed_readings_p2024_12     → leituras de dezembro de 2024
+    └── speed_readings_default      → leituras fora de qualquer partição mensal
+
+- convert_to_partitioned: converte a tabela atual (cópia dos dados, numa única transação)
+- create_partitions: cria as partições dos próximos meses
+- drop_expired_partitions: desliga (DETACH) e apaga as partições antigas (retenção)
+
+Numa tabela particionada a chave primária tem de incluir a coluna de partição, por isso passa a ser (id, timestamp).
+O id continua a ser gerado por uma sequência, pelo que se mantém único.
+
+Com filtros sobre o timestamp (ex.: GET /api/readings/?from=...&to=...) o PostgreSQL só lê as partições desse intervalo.
+"""
+
+TABLE = SpeedReading._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(value):
+    """
+    Primeiro instante (UTC) do mês de uma data.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month.year:04d}_{month.month:02d}'
+
+
+def is_partitioned():
+    """
+    Indica se a tabela speed_readings já está particionada.
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s',
+            [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """
+    Partições mensais existentes → lista de (nome, início do mês), por ordem.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits i '
+            'JOIN pg_class parent ON parent.oid = i.inhparent '
+            'JOIN pg_class child ON child.oid = i.inhrelid '
+            'WHERE parent.relname = %s',
+            [TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _bound(value):
+    return f"'{value.isoformat()}'"
+
+
+def create_partitions(start, months):
+    """
+    Cria as partições mensais de [start, start + months[ que ainda não existem.
+
+    Se a partição default tiver leituras desse mês, estas são movidas para a nova partição
+    (o PostgreSQL não permite criar uma partição cujas linhas já estão na default).
+
+    Retorna os nomes das partições criadas.
+    """
+    quote = connection.ops.quote_name
+    existing = {name for name, _month in list_partitions()}
+    created = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        month = month_start(start)
+        for _ in range(months):
+            name, following = partition_name(month), add_months(month, 1)
+            if name not in existing:
+                cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(TABLE)} INCLUDING DEFAULTS)')
+                cursor.execute(
+                    f'WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+                    f'INSERT INTO {quote(name)} SELECT * FROM moved',
+                    [month, following]
+                )
+                cursor.execute(
+                    f'ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)} '
+                    f'FOR VALUES FROM ({_bound(month)}) TO ({_bound(following)})'
+                )
+                created.append(name)
+            month = following
+    return created
+
+
+def convert_to_partitioned(months_ahead=3):
+    """
+    Converte speed_readings numa tabela particionada por mês, com partições desde a leitura
+    mais antiga até months_ahead meses depois do mês atual.
+
+    Tudo é feito numa transação (com a tabela bloqueada): em caso de erro, nada muda.
+    Os índices definidos no modelo são recriados na tabela particionada (e assim em cada partição).
+    """
+    quote = connection.ops.quote_name
+    legacy = f'{TABLE}_legacy'
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {quote(TABLE)} IN ACCESS EXCLUSIVE MODE')
+        # Verifica já as chaves estrangeiras pendentes (deferred), para a tabela atual poder ser apagada
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'SELECT MIN("timestamp") FROM {quote(TABLE)}')
+        oldest = cursor.fetchone()[0]
+
+        # Restrições UNIQUE e índices da tabela atual (exceto a chave primária), para os recriar na tabela particionada
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = %s',
+            [TABLE, 'u']
+        )
+        constraints = cursor.fetchall()
+        for constraint_name, _definition in constraints:
+            cursor.execute(f'ALTER TABLE {quote(TABLE)} DROP CONSTRAINT {quote(constraint_name)}')
+        cursor.execute(
+            'SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN '
+            '(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)',
+            [TABLE, TABLE]
+        )
+        indexes = cursor.fetchall()
+        for index_name, _definition in indexes:
+            cursor.execute(f'DROP INDEX {quote(index_name)}')
+
+        cursor.execute(f'ALTER TABLE {quote(TABLE)} RENAME TO {quote(legacy)}')
+        cursor.execute(
+            f'CREATE TABLE {quote(TABLE)} (LIKE {quote(legacy)} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute(f'CREATE TABLE {quote(DEFAULT_PARTITION)} PARTITION OF {quote(TABLE)} DEFAULT')
+
+        current = month_start(datetime.now(dt_timezone.utc))
+        first = month_start(oldest) if oldest is not None and oldest < current else current
+        months = (current.year - first.year) * 12 + current.month - first.month + months_ahead + 1
+        create_partitions(first, months)
+
+        cursor.execute(f'INSERT INTO {quote(TABLE)} SELECT * FROM {quote(legacy)}')
+        cursor.execute(f'DROP TABLE {quote(legacy)}')
+
+        # O id deixa de ser uma coluna IDENTITY (não suportado em tabelas particionadas no PostgreSQL 16)
+        sequence = f'{TABLE}_id_seq'
+        cursor.execute(f'CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(TABLE)}."id"')
+        cursor.execute(f'SELECT setval(%s, COALESCE((SELECT MAX("id") FROM {quote(TABLE)}), 0) + 1, false)', [sequence])
+        cursor.execute(f'ALTER TABLE {quote(TABLE)} ALTER COLUMN "id" SET DEFAULT nextval(%s)', [sequence])
+
+        cursor.execute(f'ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(f"{TABLE}_pkey")} PRIMARY KEY ("id", "timestamp")')
+        segment_field = SpeedReading._meta.get_field('road_segment')
+        cursor.execute(
+            f'ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(f"{TABLE}_road_segment_id_fk")} '
+            f'FOREIGN KEY ({quote(segment_field.column)}) '
+            f'REFERENCES {quote(segment_field.related_model._meta.db_table)} ("id") DEFERRABLE INITIALLY DEFERRED'
+        )
+        for constraint_name, definition in constraints:
+            cursor.execute(f'ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(constraint_name)} {definition}')
+        for _index_name, definition in indexes:
+            cursor.execute(definition)
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+def drop_expired_partitions(before, detach_only=False):
+    """
+    Remove as partições mensais que terminam antes de `before`.
+
+    Com detach_only=True as partições são apenas desligadas (ficam como tabelas independentes,
+    ex.: para arquivo) em vez de apagadas.
+
+    O estado dos segmentos afetados é recalculado. Os rollups (horários e diários) não são apagados,
+    para que as estatísticas continuem disponíveis depois da remoção das leituras.
+
+    Retorna os nomes das partições removidas.
+    """
+    quote = connection.ops.quote_name
+    cutoff = month_start(before)
+    removed, segment_ids = [], set()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name, month in list_partitions():
+            if add_months(month, 1) > cutoff:
+                continue
+            cursor.execute(f'SELECT DISTINCT road_segment_id FROM {quote(name)}')
+            segment_ids.update(row[0] for row in cursor.fetchall())
+            cursor.execute(f'ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}')
+            if not detach_only:
+                cursor.execute(f'DROP TABLE {quote(name)}')
+            removed.append(name)
+
+        if segment_ids:
+            refresh_segment_states(segment_ids)
+            invalidate_segments(segment_ids)
+    return removed
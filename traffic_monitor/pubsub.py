@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+import json
+import threading
+
+from django.conf import settings
+
+from .models import RoadSegment, intensity_for_speed
+from .geojson import format_timestamp
+
+"""
+Pub/sub em memória para os eventos em tempo real (GET /api/stream/, Server-Sent Events).
+
+Eventos publicados:
+- reading:   nova leitura    {"id": 10, "road_segment": 1, "average_speed": 35.2, "intensity": "média", "timestamp": "..."}
+- intensity: mudança da intensidade atual de um segmento {"road_segment": 1, "intensity": "elevada", "previous": "média"}
+- incident:  incidente aberto, atualizado ou terminado (incidents.py) {"id": 3, "road_segment": 1, "active": true, ...}
+
+Os eventos são publicados pelos signals (depois do commit) a partir de qualquer thread e entregues
+a cada subscritor na sua event loop (call_soon_threadsafe), numa fila com tamanho limitado:
+um cliente lento perde os eventos mais antigos em vez de fazer crescer a memória.
+
+O broker é local ao processo: funciona com um servidor ASGI de um só processo (ex.: uvicorn config.asgi:application).
+Com vários processos, os eventos teriam de passar por um broker partilhado (ex.: Redis pub/sub)
+com a mesma interface (subscribe / unsubscribe / publish).
+"""
+
+# Número máximo de eventos em espera por subscritor
+DEFAULT_QUEUE_SIZE = 1000
+
+
+class Subscription:
+    """
+    Um cliente ligado ao stream: fila de eventos na event loop do cliente e filtro por segmentos.
+    """
+
+    def __init__(self, segment_ids=None, queue_size=DEFAULT_QUEUE_SIZE):
+        self.segment_ids = set(segment_ids) if segment_ids is not None else None    # None → todos os segmentos
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def matches(self, event):
+        return self.segment_ids is None or event['data']['road_segment'] in self.segment_ids
+
+    def deliver(self, event):
+        """
+        Entrega um evento (pode ser chamado a partir de qualquer thread).
+        """
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # A event loop do cliente já terminou
+            pass
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """
+        Próximo evento, ou None se não chegar nenhum em `timeout` segundos.
+        """
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBroker:
+    """
+    Broker em memória: cada evento publicado é entregue a todos os subscritores cujo filtro aceita o evento.
+    """
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def subscribe(self, segment_ids=None):
+        subscription = Subscription(segment_ids, getattr(settings, 'REALTIME_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event_type, data):
+        event = {'id': next(self._ids), 'event': event_type, 'data': data}
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.matches(event):
+                subscription.deliver(event)
+        return event
+
+
+broker = InProcessBroker()
+
+
+def format_event(event):
+    """
+    Evento no formato Server-Sent Events:
+
+        id: 12
+        event: reading
+        data: {"id": 10, "road_segment": 1, ...}
+    """
+    data = json.dumps(event['data'], ensure_ascii=False, separators=(',', ':'))
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+def publish_readings(readings):
+    """
+    Publica as novas leituras (a intensidade usa os limites de cada segmento, lidos com uma query).
+    Sem subscritores não faz nada.
+    """
+    if not broker or not readings:
+        return
+    segments = RoadSegment.objects.only('high_intensity_max_speed', 'medium_intensity_max_speed').in_bulk(
+        {reading.road_segment_id for reading in readings}
+    )
+    for reading in readings:
+        broker.publish('reading', {
+            'id': reading.pk,
+            'road_segment': reading.road_segment_id,
+            'average_speed': reading.average_speed,
+            'intensity': intensity_for_speed(reading.average_speed, segments.get(reading.road_segment_id)),
+            'timestamp': format_timestamp(reading.timestamp),
+        })
+
+
+def publish_intensity_changes(changes):
+    """
+    Publica as mudanças de intensidade [(segmento, anterior, nova), ...] devolvidas pelo segment_state.
+    """
+    for segment_id, previous, intensity in changes:
+        broker.publish('intensity', {'road_segment': segment_id, 'intensity': intensity, 'previous': previous})
+
+
+def publish_incidents(incidents):
+    """
+    Publica os incidentes que começaram, mudaram ou terminaram (devolvidos pelo incidents.py).
+    """
+    for incident in incidents:
+        broker.publish('incident', {
+            'id': incident.pk,
+            'road_segment': incident.road_segment_id,
+            'active': incident.active,
+            'started_at': format_timestamp(incident.started_at),
+            'ended_at': format_timestamp(incident.ended_at) if incident.ended_at else None,
+            'expected_speed': incident.expected_speed,
+            'min_speed': incident.min_speed,
+            'max_score': incident.max_score,
+            'reading_count': incident.reading_count,
+        })
@@ -0,0 +1,76 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import ValidationError
+
+from .pubsub import broker, format_event
+from .spatial import parse_bbox, segments_in_bbox
+
+"""
+Eventos em tempo real (Server-Sent Events), servidos pela aplicação ASGI (config/asgi.py).
+
+    GET /api/stream/                          → todas as novas leituras e mudanças de intensidade
+    GET /api/stream/?road_segment=1,2         → apenas dos segmentos 1 e 2
+    GET /api/stream/?bbox=-8.7,41.1,-8.5,41.2 → apenas dos segmentos na área (resolvida ao ligar)
+
+Em vez de pedir /api/segments/ de poucos em poucos segundos, o cliente mantém uma ligação aberta
+e recebe os eventos à medida que as leituras são gravadas:
+
+    const source = new EventSource('/api/stream/?road_segment=1');
+    source.addEventListener('intensity', (event) => console.log(JSON.parse(event.data)));
+
+A vista é assíncrona: cada ligação aberta é uma corrotina à espera na fila do subscritor, não ocupa uma thread.
+"""
+
+
+def parse_segment_ids(value):
+    """
+    Converte "1,2,3" em {1, 2, 3}. Lança ValidationError se for inválido.
+    """
+    try:
+        return {int(item) for item in value.split(',') if item.strip()}
+    except ValueError:
+        raise ValidationError({'road_segment': 'Use uma lista de ids separados por vírgulas (ex.: 1,2).'})
+
+
+async def event_stream(subscription, keepalive):
+    """
+    Gera os eventos do subscritor no formato SSE; sem eventos durante `keepalive` segundos envia
+    um comentário, para que proxies e clientes não fechem a ligação.
+    """
+    try:
+        yield ': ligado\n\n'
+        while True:
+            event = await subscription.get(timeout=keepalive)
+            yield format_event(event) if event else ': keepalive\n\n'
+    finally:
+        # Cliente desligado
+        broker.unsubscribe(subscription)
+
+
+@require_GET
+async def stream_events(request):
+    """
+    GET /api/stream/?road_segment=1,2&bbox=minLon,minLat,maxLon,maxLat
+
+    Com os dois filtros, só são enviados os eventos dos segmentos indicados que estão na área.
+    """
+    segment_ids = None
+    try:
+        if request.GET.get('road_segment'):
+            segment_ids = parse_segment_ids(request.GET['road_segment'])
+        if request.GET.get('bbox'):
+            in_bbox = set(await sync_to_async(segments_in_bbox)(*parse_bbox(request.GET['bbox'])))
+            segment_ids = in_bbox if segment_ids is None else segment_ids & in_bbox
+    except ValidationError as error:
+        return JsonResponse(error.detail, status=400)
+
+    subscription = broker.subscribe(segment_ids)
+    response = StreamingHttpResponse(
+        event_stream(subscription, getattr(settings, 'REALTIME_KEEPALIVE', 15)),
+        content_type='text/event-stream; charset=utf-8',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'    # nginx: não acumular a resposta
+    return response
@@ -0,0 +1,205 @@
+from datetime import timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+from .models import DailySpeedRollup, HourlySpeedRollup, SpeedReading
+
+"""
+Manutenção das tabelas de estatísticas pré-calculadas (rollups) por hora e por dia.
+
+- apply_readings: atualização incremental com novas leituras (um único INSERT ... ON CONFLICT por tabela)
+- recompute_buckets: recalcula buckets concretos a partir das leituras (alterações e remoções)
+- rebuild_rollups: reconstrói (backfill/reparação) um intervalo de tempo inteiro
+"""
+
+
+def _truncate_hour(value):
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _truncate_day(value):
+    return _truncate_hour(value).replace(hour=0)
+
+
+# Bucket → (modelo, duração, arredondamento em Python, arredondamento na db)
+ROLLUPS = {
+    '1h': (HourlySpeedRollup, timedelta(hours=1), _truncate_hour, lambda field: TruncHour(field, tzinfo=dt_timezone.utc)),
+    '1d': (DailySpeedRollup, timedelta(days=1), _truncate_day, lambda field: TruncDay(field, tzinfo=dt_timezone.utc)),
+}
+
+# Número de linhas por INSERT (limita o número de parâmetros por query)
+UPSERT_BATCH_SIZE = 100
+
+
+def _summarize(readings, truncate):
+    """
+    Agrupa leituras em memória por (segmento, bucket) → [count, sum, sum_sq, min, max].
+    """
+    summary = {}
+    for reading in readings:
+        key = (reading.road_segment_id, truncate(reading.timestamp))
+        speed = reading.average_speed
+        stats = summary.get(key)
+        if stats is None:
+            summary[key] = [1, speed, speed * speed, speed, speed]
+        else:
+            stats[0] += 1
+            stats[1] += speed
+            stats[2] += speed * speed
+            stats[3] = min(stats[3], speed)
+            stats[4] = max(stats[4], speed)
+    return summary
+
+
+def _upsert(model, summary):
+    """
+    Soma as estatísticas aos registos existentes (ou cria-os), de forma atómica na db:
+
+        INSERT ... ON CONFLICT (road_segment_id, bucket) DO UPDATE SET count = count + excluded.count, ...
+
+    Funciona em PostgreSQL e SQLite (no SQLite o mínimo/máximo de 2 valores é MIN()/MAX()).
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+    columns = ['road_segment_id', 'bucket', 'count', 'speed_sum', 'speed_sum_sq', 'speed_min', 'speed_max']
+    quoted = {column: quote(column) for column in columns}
+
+    sql_prefix = f"INSERT INTO {table} ({', '.join(quoted.values())}) VALUES "
+    sql_suffix = (
+        f" ON CONFLICT ({quoted['road_segment_id']}, {quoted['bucket']}) DO UPDATE SET "
+        f"{quoted['count']} = {table}.{quoted['count']} + excluded.{quoted['count']}, "
+        f"{quoted['speed_sum']} = {table}.{quoted['speed_sum']} + excluded.{quoted['speed_sum']}, "
+        f"{quoted['speed_sum_sq']} = {table}.{quoted['speed_sum_sq']} + excluded.{quoted['speed_sum_sq']}, "
+        f"{quoted['speed_min']} = {least}({table}.{quoted['speed_min']}, excluded.{quoted['speed_min']}), "
+        f"{quoted['speed_max']} = {greatest}({table}.{quoted['speed_max']}, excluded.{quoted['speed_max']})"
+    )
+
+    items = list(summary.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[start:start + UPSERT_BATCH_SIZE]
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(batch))
+            params = []
+            for (segment_id, bucket), stats in batch:
+                params.extend([segment_id, connection.ops.adapt_datetimefield_value(bucket), *stats])
+            cursor.execute(sql_prefix + placeholders + sql_suffix, params)
+
+
+def apply_readings(readings):
+    """
+    Atualiza (incrementalmente) os rollups horários e diários com novas leituras.
+    """
+    if not readings:
+        return
+    with transaction.atomic():
+        for model, _duration, truncate, _db_truncate in ROLLUPS.values():
+            _upsert(model, _summarize(readings, truncate))
+
+
+def _aggregate(queryset, db_truncate):
+    """
+    Agrega leituras na db por (segmento, bucket), com as mesmas colunas dos rollups.
+    """
+    return (
+        queryset.order_by()
+        .annotate(bucket=db_truncate('timestamp'))
+        .values('road_segment_id', 'bucket')
+        .annotate(
+            count=Count('id'),
+            speed_sum=Sum('average_speed'),
+            speed_sum_sq=Sum(F('average_speed') * F('average_speed')),
+            speed_min=Min('average_speed'),
+            speed_max=Max('average_speed'),
+        )
+    )
+
+
+def recompute_buckets(keys):
+    """
+    Recalcula buckets concretos a partir das leituras (usado quando uma leitura é alterada ou apagada,
+    porque o mínimo/máximo não podem ser "descontados").
+
+    keys: conjunto de (road_segment_id, timestamp) afetados.
+    """
+    if not keys:
+        return
+    with transaction.atomic():
+        for model, duration, truncate, db_truncate in ROLLUPS.values():
+            for segment_id, bucket in {(segment_id, truncate(timestamp)) for segment_id, timestamp in keys}:
+                model.objects.filter(road_segment_id=segment_id, bucket=bucket).delete()
+                readings = SpeedReading.objects.filter(
+                    road_segment_id=segment_id, timestamp__gte=bucket, timestamp__lt=bucket + duration
+                )
+                model.objects.bulk_create([model(**row) for row in _aggregate(readings, db_truncate)])
+
+
+def rebuild_rollups(start=None, end=None, segment_ids=None, batch_size=1000):
+    """
+    Reconstrói os rollups de um intervalo de tempo (ou de todo o histórico) a partir das leituras.
+
+    O intervalo é alargado para dias completos, para nunca deixar um bucket parcialmente calculado.
+    Retorna um dicionário {bucket: número de registos criados}.
+    """
+    if start is not None:
+        start = _truncate_day(start)
+    if end is not None and end != _truncate_day(end):
+        end = _truncate_day(end) + timedelta(days=1)
+
+    created = {}
+    with transaction.atomic():
+        for name, (model, _duration, _truncate, db_truncate) in ROLLUPS.items():
+            rollups = model.objects.all()
+            readings = SpeedReading.objects.all()
+            if start is not None:
+                rollups, readings = rollups.filter(bucket__gte=start), readings.filter(timestamp__gte=start)
+            if end is not None:
+                rollups, readings = rollups.filter(bucket__lt=end), readings.filter(timestamp__lt=end)
+            if segment_ids:
+                rollups, readings = rollups.filter(road_segment_id__in=segment_ids), readings.filter(road_segment_id__in=segment_ids)
+
+            rollups.delete()
+            objects = (model(**row) for row in _aggregate(readings, db_truncate).iterator(chunk_size=batch_size))
+            created[name] = 0
+            while True:
+                batch = list(islice(objects, batch_size))
+                if not batch:
+                    break
+                model.objects.bulk_create(batch)
+                created[name] += len(batch)
+    return created
+
+
+def aggregate_rollups(bucket, segment_id=None, start=None, end=None):
+    """
+    Lê as estatísticas já calculadas (em vez das leituras) e devolve linhas no mesmo formato
+    do aggregate_readings: (bucket, segmento, count, avg, min, max, stddev).
+    """
+    model = ROLLUPS[bucket][0]
+    rollups = model.objects.all()
+    if segment_id is not None:
+        rollups = rollups.filter(road_segment_id=segment_id)
+    if start is not None:
+        rollups = rollups.filter(bucket__gte=start)
+    if end is not None:
+        rollups = rollups.filter(bucket__lt=end)
+
+    rows = []
+    for row in rollups.order_by('road_segment_id', 'bucket').values_list(
+        'bucket', 'road_segment_id', 'count', 'speed_sum', 'speed_sum_sq', 'speed_min', 'speed_max'
+    ):
+        bucket_start, segment, count, total, total_sq, speed_min, speed_max = row
+        mean = total / count
+        variance = max(total_sq / count - mean * mean, 0.0)
+        rows.append((bucket_start, segment, count, mean, speed_min, speed_max, variance ** 0.5))
+    return rows
+
+
+def is_aligned(value, bucket):
+    """
+    Indica se uma data coincide com o início de um bucket (ou é None).
+    """
+    return value is None or ROLLUPS[bucket][2](value) == value
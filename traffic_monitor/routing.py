@@ -0,0 +1,316 @@
+import heapq
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import RoadSegment, SegmentState
+from .caching import get_version
+from .spatial import GEOMETRY_VERSION_KEY, METERS_PER_DEGREE, nearest_segments
+
+"""
+Cálculo de percursos (o caminho mais rápido entre dois pontos) com as velocidades atuais dos segmentos.
+
+Os segmentos partilham as coordenadas dos extremos (ex.: vários segmentos começam no mesmo ponto), o que forma
+um grafo dirigido: cada ponto é um nó e cada segmento uma aresta do início para o fim. O grafo é mantido
+em memória como listas de adjacência (nó → arestas que saem dele), e o peso de cada aresta é o tempo
+de percurso do segmento com a velocidade da última leitura:
+
+    tempo (s) = length (m) / (velocidade (km/h) / 3.6)
+
+Sem leituras, é usada ROUTING_DEFAULT_SPEED; abaixo de ROUTING_MIN_SPEED (trânsito parado), esta é usada
+no lugar da velocidade medida (o segmento fica muito lento, mas continua a ser possível passar).
+O caminho mais rápido é calculado com o algoritmo de Dijkstra (heap), que pára ao chegar ao destino.
+
+O grafo é construído a partir das tabelas road_segments e segment_states (uma query) e mantido atualizado:
+- as novas leituras deste processo atualizam só o peso das arestas dos seus segmentos, sem queries
+  (signals, depois do commit); leituras alteradas ou apagadas releem o SegmentState desses segmentos
+- as leituras escritas noutros processos (ex.: import_data) são lidas do SegmentState (updated_at),
+  no máximo a cada ROUTING_SYNC_INTERVAL segundos
+- quando os segmentos mudam, a versão da geometria na cache (a mesma do índice espacial) muda e o grafo
+  é reconstruído; em último caso, ao fim de ROUTING_GRAPH_MAX_AGE segundos
+"""
+
+# Casas decimais das coordenadas que identificam um nó (~0.1 m): os extremos iguais ligam os segmentos
+NODE_PRECISION = 6
+
+# Número de segmentos próximos do ponto pedido a considerar para escolher o nó de partida/chegada
+SNAP_CANDIDATES = 5
+
+# Margem (segundos) da sincronização com o SegmentState, para as transações que terminam depois de updated_at
+SYNC_OVERLAP = 30
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def travel_time(length, speed):
+    """
+    Tempo de percurso (segundos) de um segmento com a velocidade indicada (km/h).
+    """
+    if speed is None:
+        speed = get_setting('ROUTING_DEFAULT_SPEED', 30)
+    speed = max(speed, get_setting('ROUTING_MIN_SPEED', 5))
+    return length / (speed / 3.6)
+
+
+def distance(lon1, lat1, lon2, lat2):
+    """
+    Distância aproximada (em metros) entre dois pontos, numa projeção equiretangular local.
+    """
+    scale = math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot((lon2 - lon1) * scale, lat2 - lat1) * METERS_PER_DEGREE
+
+
+class Edge:
+    """
+    Aresta do grafo (um segmento), com o tempo de percurso atual.
+    """
+
+    __slots__ = ('segment_id', 'source', 'target', 'length', 'speed', 'reading_key', 'travel_time')
+
+    def __init__(self, segment_id, source, target, length):
+        self.segment_id = segment_id
+        self.source = source
+        self.target = target
+        self.length = length
+        self.speed = None
+        self.reading_key = None     # (timestamp, id) da leitura que deu a velocidade
+        self.travel_time = travel_time(length, None)
+
+    def set_speed(self, speed, reading_key):
+        self.speed = speed
+        self.reading_key = reading_key
+        self.travel_time = travel_time(self.length, speed)
+
+
+class RoadGraph:
+    """
+    Grafo dirigido da rede: nós (pontos) e arestas (segmentos), com as listas de adjacência.
+    """
+
+    def __init__(self):
+        self.nodes = {}          # (lon, lat) arredondados → id do nó
+        self.coordinates = []    # id do nó → (lon, lat)
+        self.outgoing = []       # id do nó → arestas que saem do nó
+        self.edges = {}          # id do segmento → Edge
+        self.version = None
+        self.built_at = time.monotonic()
+        self.synced_at = timezone.now()
+        self.last_sync = time.monotonic()
+
+    def __len__(self):
+        return len(self.edges)
+
+    def node(self, lon, lat):
+        key = (round(lon, NODE_PRECISION), round(lat, NODE_PRECISION))
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = len(self.coordinates)
+            self.coordinates.append((lon, lat))
+            self.outgoing.append([])
+        return node
+
+    def add(self, segment_id, coords, length):
+        edge = Edge(segment_id, self.node(coords[0], coords[1]), self.node(coords[2], coords[3]), length)
+        self.edges[segment_id] = edge
+        self.outgoing[edge.source].append(edge)
+        return edge
+
+    def apply_readings(self, readings):
+        """
+        Atualiza o peso das arestas com novas leituras (só as mais recentes do que a leitura atual de cada segmento).
+        """
+        for reading in readings:
+            edge = self.edges.get(reading.road_segment_id)
+            if edge is None:
+                continue
+            key = (reading.timestamp, reading.pk or 0)
+            if edge.reading_key is None or key >= edge.reading_key:
+                edge.set_speed(reading.average_speed, key)
+
+    def apply_states(self, rows):
+        """
+        Atualiza o peso das arestas com o SegmentState: [(segmento, velocidade, timestamp, id da leitura), ...].
+        """
+        for segment_id, speed, timestamp, reading_id in rows:
+            edge = self.edges.get(segment_id)
+            if edge is not None:
+                edge.set_speed(speed, (timestamp, reading_id or 0) if timestamp is not None else None)
+
+    def sync(self):
+        """
+        Lê do SegmentState as velocidades alteradas desde a última sincronização (ex.: por outros processos).
+        """
+        started = timezone.now()
+        since = self.synced_at - timedelta(seconds=SYNC_OVERLAP)
+        self.apply_states(
+            SegmentState.objects.filter(updated_at__gte=since)
+            .values_list('road_segment_id', 'latest_speed', 'latest_timestamp', 'latest_reading_id')
+        )
+        self.synced_at = started
+        self.last_sync = time.monotonic()
+
+    def snap(self, lon, lat):
+        """
+        Nó do grafo mais próximo do ponto: o extremo mais próximo dos segmentos mais próximos (índice espacial).
+        """
+        candidates = set()
+        for segment_id, _distance in nearest_segments(lon, lat, SNAP_CANDIDATES):
+            edge = self.edges.get(segment_id)
+            if edge is not None:
+                candidates.update((edge.source, edge.target))
+        if not candidates:
+            candidates = range(len(self.coordinates))
+        return min(candidates, key=lambda node: distance(lon, lat, *self.coordinates[node]), default=None)
+
+    def shortest_path(self, source, target):
+        """
+        Caminho mais rápido entre dois nós (Dijkstra) → (tempo total em segundos, [arestas]), ou None se não existir.
+        """
+        times = {source: 0.0}
+        previous = {}
+        heap = [(0.0, source)]
+        while heap:
+            elapsed, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if elapsed > times[node]:
+                continue    # Entrada antiga do heap (já foi encontrado um caminho mais rápido para o nó)
+            for edge in self.outgoing[node]:
+                arrival = elapsed + edge.travel_time
+                if arrival < times.get(edge.target, math.inf):
+                    times[edge.target] = arrival
+                    previous[edge.target] = edge
+                    heapq.heappush(heap, (arrival, edge.target))
+        else:
+            return None
+
+        path = []
+        node = target
+        while node != source:
+            edge = previous[node]
+            path.append(edge)
+            node = edge.source
+        path.reverse()
+        return times[target], path
+
+
+def parse_location(params, name):
+    """
+    Lê um parâmetro "lon,lat" (ex.: ?from=-8.61,41.15) e devolve (lon, lat). Lança ValidationError se for inválido.
+    """
+    try:
+        lon, lat = (float(item) for item in params.get(name, '').split(','))
+    except ValueError:
+        raise ValidationError({name: 'Parâmetro obrigatório no formato lon,lat (ex.: -8.61,41.15).'})
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise ValidationError({name: 'A longitude deve estar entre -180 e 180 e a latitude entre -90 e 90.'})
+    return lon, lat
+
+
+_graph = None
+_lock = threading.RLock()
+
+
+def build_road_graph():
+    """
+    Constrói o grafo a partir dos segmentos e das velocidades do seu SegmentState (uma query).
+    """
+    graph = RoadGraph()
+    graph.version = get_version(GEOMETRY_VERSION_KEY)
+    rows = RoadSegment.objects.order_by('id').values_list(
+        'id', 'longitude_start', 'latitude_start', 'longitude_end', 'latitude_end', 'length',
+        'state__latest_speed', 'state__latest_timestamp', 'state__latest_reading_id',
+    )
+    for segment_id, lon1, lat1, lon2, lat2, length, speed, timestamp, reading_id in rows.iterator(chunk_size=2000):
+        edge = graph.add(segment_id, (lon1, lat1, lon2, lat2), length)
+        if timestamp is not None:
+            edge.set_speed(speed, (timestamp, reading_id or 0))
+    return graph
+
+
+def get_road_graph():
+    """
+    Grafo atualizado deste processo (é reconstruído se a geometria mudou ou se for demasiado antigo;
+    as velocidades alteradas por outros processos são lidas a cada ROUTING_SYNC_INTERVAL segundos).
+    """
+    global _graph
+    with _lock:
+        if (
+            _graph is None
+            or _graph.version != get_version(GEOMETRY_VERSION_KEY)
+            or time.monotonic() - _graph.built_at > get_setting('ROUTING_GRAPH_MAX_AGE', 300)
+        ):
+            _graph = build_road_graph()
+        elif time.monotonic() - _graph.last_sync >= get_setting('ROUTING_SYNC_INTERVAL', 10):
+            _graph.sync()
+        return _graph
+
+
+def find_route(origin, destination):
+    """
+    Caminho mais rápido entre dois pontos (lon, lat), partindo e chegando aos nós mais próximos.
+    Retorna None se não houver segmentos ou caminho entre os dois pontos.
+    """
+    with _lock:
+        graph = get_road_graph()
+        source, target = graph.snap(*origin), graph.snap(*destination)
+        if source is None or target is None:
+            return None
+        result = graph.shortest_path(source, target)
+        if result is None:
+            return None
+
+        total, path = result
+        return {
+            'from': list(graph.coordinates[source]),
+            'to': list(graph.coordinates[target]),
+            'travel_time': round(total, 1),
+            'distance': round(sum(edge.length for edge in path), 1),
+            'segments': [
+                {
+                    'id': edge.segment_id,
+                    'length': edge.length,
+                    'speed': edge.speed,
+                    'travel_time': round(edge.travel_time, 1),
+                }
+                for edge in path
+            ],
+            'coordinates': [list(graph.coordinates[source])] + [list(graph.coordinates[edge.target]) for edge in path],
+        }
+
+
+def readings_created(readings):
+    """
+    Novas leituras → atualiza o peso das arestas dos seus segmentos (se o grafo já tiver sido construído).
+    """
+    with _lock:
+        if _graph is not None:
+            _graph.apply_readings(readings)
+
+
+def refresh_speeds(segment_ids):
+    """
+    Leituras alteradas ou apagadas → relê a velocidade atual dos segmentos do SegmentState.
+    """
+    with _lock:
+        if _graph is not None and segment_ids:
+            _graph.apply_states(
+                SegmentState.objects.filter(road_segment_id__in=segment_ids)
+                .values_list('road_segment_id', 'latest_speed', 'latest_timestamp', 'latest_reading_id')
+            )
+
+
+def invalidate_road_graph():
+    """
+    Obriga este processo a reconstruir o grafo no próximo pedido.
+    """
+    global _graph
+    with _lock:
+        _graph = None
@@ -0,0 +1,223 @@
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import RoadSegment, SegmentState, SpeedReading, intensity_for_speed
+
+"""
+Manutenção do SegmentState (estado atual de cada segmento).
+
+- apply_new_reading: atualização incremental quando é criada uma leitura (caso mais frequente)
+- apply_new_readings: atualização incremental com leituras criadas em bloco (um único INSERT ... ON CONFLICT)
+- refresh_segment_states: recalcula o estado de um conjunto de segmentos a partir das leituras
+  (usado em alterações, remoções e no comando rebuild_segment_state)
+
+Ambas devolvem as mudanças de intensidade [(segmento, intensidade anterior, intensidade nova), ...],
+que são publicadas aos clientes em tempo real (ver pubsub.py).
+"""
+
+
+def apply_new_reading(reading):
+    """
+    Atualiza o estado do segmento com uma nova leitura.
+
+    A linha do estado é bloqueada (select_for_update) para que leituras criadas
+    em simultâneo não percam incrementos do contador.
+    """
+    with transaction.atomic():
+        state, _ = SegmentState.objects.select_for_update().get_or_create(road_segment_id=reading.road_segment_id)
+        state.reading_count += 1
+        previous = state.intensity
+
+        # A nova leitura só passa a ser a última se for mais recente (o id desempata)
+        if state.latest_timestamp is None or (reading.timestamp, reading.pk) >= (state.latest_timestamp, state.latest_reading_id):
+            state.set_latest(reading)
+        state.save()
+
+    if state.intensity != previous:
+        return [(state.road_segment_id, previous, state.intensity)]
+    return []
+
+
+# Número de segmentos por INSERT (limita o número de parâmetros por query)
+UPSERT_BATCH_SIZE = 100
+
+
+def _summarize(readings):
+    """
+    Agrupa leituras em memória por segmento → [count, leitura mais recente] (o id desempata).
+    """
+    summary = {}
+    for reading in readings:
+        stats = summary.get(reading.road_segment_id)
+        if stats is None:
+            summary[reading.road_segment_id] = [1, reading]
+        else:
+            stats[0] += 1
+            if (reading.timestamp, reading.pk) >= (stats[1].timestamp, stats[1].pk):
+                stats[1] = reading
+    return summary
+
+
+def _upsert(rows):
+    """
+    Soma as contagens aos estados existentes (ou cria-os) e substitui a última leitura só se a do bloco
+    for mais recente, de forma atómica na db:
+
+        INSERT ... ON CONFLICT (road_segment_id) DO UPDATE SET reading_count = reading_count + excluded.reading_count,
+            latest_* = CASE WHEN (excluded.latest_timestamp, excluded.latest_reading_id) >= (latest_*) THEN ... END
+
+    Funciona em PostgreSQL e SQLite (as expressões do SET usam sempre os valores anteriores da linha).
+    """
+    quote = connection.ops.quote_name
+    table = quote(SegmentState._meta.db_table)
+    columns = [
+        'road_segment_id', 'reading_count', 'latest_reading_id', 'latest_speed',
+        'latest_timestamp', 'latest_created_at', 'intensity', 'updated_at',
+    ]
+    quoted = {column: quote(column) for column in columns}
+
+    def current(column):
+        return f"{table}.{quoted[column]}"
+
+    def new(column):
+        return f"excluded.{quoted[column]}"
+
+    newer = (
+        f"{current('latest_timestamp')} IS NULL"
+        f" OR {new('latest_timestamp')} > {current('latest_timestamp')}"
+        f" OR ({new('latest_timestamp')} = {current('latest_timestamp')}"
+        f" AND {new('latest_reading_id')} >= {current('latest_reading_id')})"
+    )
+    latest = ['latest_reading_id', 'latest_speed', 'latest_timestamp', 'latest_created_at', 'intensity']
+
+    sql_prefix = f"INSERT INTO {table} ({', '.join(quoted.values())}) VALUES "
+    sql_suffix = (
+        f" ON CONFLICT ({quoted['road_segment_id']}) DO UPDATE SET "
+        f"{quoted['reading_count']} = {current('reading_count')} + {new('reading_count')}, "
+        + ''.join(
+            f"{quoted[column]} = CASE WHEN {newer} THEN {new(column)} ELSE {current(column)} END, "
+            for column in latest
+        )
+        + f"{quoted['updated_at']} = {new('updated_at')}"
+    )
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(batch))
+            params = []
+            for row in batch:
+                params.extend(row)
+            cursor.execute(sql_prefix + placeholders + sql_suffix, params)
+
+
+def apply_new_readings(readings):
+    """
+    Atualiza (incrementalmente) o estado dos segmentos com leituras criadas em bloco (ex.: import_data).
+
+    A contagem e a leitura mais recente de cada segmento são calculadas em memória a partir do bloco,
+    sem reler as leituras já existentes: o custo depende do tamanho do bloco e não do histórico.
+    Leituras sem id (a db não os devolveu) → recalcula o estado a partir das leituras (refresh_segment_states).
+    """
+    if not readings:
+        return []
+    if any(reading.pk is None for reading in readings):
+        return refresh_segment_states({reading.road_segment_id for reading in readings})
+
+    summary = _summarize(readings)
+    with transaction.atomic():
+        # Bloqueia os estados existentes para não haver conflito com apply_new_reading
+        previous = {
+            pk: (intensity, (timestamp, reading_id or 0) if timestamp is not None else None)
+            for pk, intensity, timestamp, reading_id in SegmentState.objects.select_for_update()
+            .filter(pk__in=summary)
+            .values_list('pk', 'intensity', 'latest_timestamp', 'latest_reading_id')
+        }
+        # Limites de intensidade de cada segmento (segmentos que já não existem são ignorados)
+        segments = RoadSegment.objects.only('pk', 'high_intensity_max_speed', 'medium_intensity_max_speed').in_bulk(summary)
+
+        now = timezone.now()
+        rows, changes = [], []
+        for segment_id, (count, reading) in summary.items():
+            segment = segments.get(segment_id)
+            if segment is None:
+                continue
+            intensity = intensity_for_speed(reading.average_speed, segment)
+            rows.append([
+                segment_id, count, reading.pk, reading.average_speed,
+                connection.ops.adapt_datetimefield_value(reading.timestamp),
+                connection.ops.adapt_datetimefield_value(reading.created_at),
+                intensity,
+                connection.ops.adapt_datetimefield_value(now),
+            ])
+
+            old_intensity, old_key = previous.get(segment_id, (None, None))
+            if old_key is not None and (reading.timestamp, reading.pk) < old_key:
+                intensity = old_intensity
+            if intensity != old_intensity:
+                changes.append((segment_id, old_intensity, intensity))
+        _upsert(rows)
+
+    return changes
+
+
+def refresh_segment_states(segment_ids):
+    """
+    Recalcula o estado dos segmentos indicados com 2 queries (contagens + últimas leituras)
+    e grava tudo com um único bulk_create (upsert).
+
+    Segmentos que já não existem são ignorados.
+    """
+    segment_ids = set(segment_ids)
+    if not segment_ids:
+        return []
+
+    with transaction.atomic():
+        # Bloqueia os estados existentes para não haver conflito com apply_new_reading
+        previous = dict(SegmentState.objects.select_for_update().filter(pk__in=segment_ids).values_list('pk', 'intensity'))
+
+        counts = dict(
+            SpeedReading.objects.filter(road_segment_id__in=segment_ids)
+            .order_by()
+            .values('road_segment_id')
+            .annotate(total=Count('id'))
+            .values_list('road_segment_id', 'total')
+        )
+
+        latest_readings = SpeedReading.objects.filter(road_segment=OuterRef('pk')).order_by('-timestamp', '-id')
+        segments = RoadSegment.objects.filter(pk__in=segment_ids).annotate(
+            latest_reading_id=Subquery(latest_readings.values('id')[:1]),
+            latest_speed=Subquery(latest_readings.values('average_speed')[:1]),
+            latest_timestamp=Subquery(latest_readings.values('timestamp')[:1]),
+            latest_created_at=Subquery(latest_readings.values('created_at')[:1]),
+        ).only('pk', 'high_intensity_max_speed', 'medium_intensity_max_speed')
+
+        states = [
+            SegmentState(
+                road_segment_id=segment.pk,
+                reading_count=counts.get(segment.pk, 0),
+                latest_reading_id=segment.latest_reading_id,
+                latest_speed=segment.latest_speed,
+                latest_timestamp=segment.latest_timestamp,
+                latest_created_at=segment.latest_created_at,
+                # Com os limites de intensidade do próprio segmento
+                intensity=intensity_for_speed(segment.latest_speed, segment) if segment.latest_speed is not None else None,
+            )
+            for segment in segments
+        ]
+        SegmentState.objects.bulk_create(
+            states,
+            update_conflicts=True,
+            unique_fields=['road_segment'],
+            update_fields=[
+                'reading_count', 'latest_reading_id', 'latest_speed',
+                'latest_timestamp', 'latest_created_at', 'intensity', 'updated_at',
+            ],
+        )
+
+    return [
+        (state.road_segment_id, previous.get(state.road_segment_id), state.intensity)
+        for state in states
+        if state.intensity != previous.get(state.road_segment_id)
+    ]
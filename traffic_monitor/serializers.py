@@ -1,5 +1,18 @@
-from rest_framework import serializers
-from .models import RoadSegment, SpeedReading
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .models import Incident, RoadSegment, SegmentState, SpeedReading, intensity_thresholds
+
+
+def segment_state(segment):
+    """
+    Estado atual (SegmentState) de um segmento, ou None se o segmento ainda não tem leituras.
+
+    Quando o RoadSegmentViewSet faz select_related('state') não é feita nenhuma query.
+    """
+    try:
+        return segment.state
+    except SegmentState.DoesNotExist:
+        return None
 
 
 class SpeedReadingSerializer(serializers.ModelSerializer):
@@ -27,6 +40,58 @@ class SpeedReadingSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class SpeedReadingFastSerializer:
+    """
+    Serialização rápida (apenas leitura) de listas de leituras, com o mesmo resultado do SpeedReadingSerializer.
+
+    Em vez de criar uma instância do modelo e percorrer os campos do ModelSerializer por cada leitura:
+    - prepare(): pede à db apenas as colunas necessárias (.values()), com a intensidade calculada na própria
+      query (CASE WHEN, ver SpeedReadingQuerySet.with_intensity)
+    - to_representation(): converte cada linha num dicionário com as mesmas chaves e formatos
+
+    As datas seguem as mesmas definições do DateTimeField do DRF (formato e timezone); no caso habitual
+    (ISO 8601) a conversão é feita diretamente, sem passar pelo campo do DRF em cada leitura.
+    """
+
+    def __init__(self):
+        self.datetime_field = serializers.DateTimeField()
+
+    def prepare(self, queryset):
+        return queryset.with_intensity().values(
+            'id', 'road_segment_id', 'average_speed', 'speed_intensity', 'timestamp', 'created_at'
+        )
+
+    def datetime_formatter(self):
+        """
+        Função que formata uma data exatamente como o DateTimeField.to_representation do DRF.
+        """
+        output_format = getattr(self.datetime_field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = self.datetime_field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+            return self.datetime_field.to_representation
+
+        def format_datetime(value):
+            if not value:
+                return None
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return format_datetime
+
+    def to_representation(self, rows):
+        format_datetime = self.datetime_formatter()
+        return [
+            {
+                'id': row['id'],
+                'road_segment': row['road_segment_id'],
+                'average_speed': row['average_speed'],
+                'intensity': row['speed_intensity'],
+                'timestamp': format_datetime(row['timestamp']),
+                'created_at': format_datetime(row['created_at']),
+            }
+            for row in rows
+        ]
+
+
 class RoadSegmentSerializer(serializers.ModelSerializer):
     
     """
@@ -49,6 +114,8 @@ class RoadSegmentSerializer(serializers.ModelSerializer):
             'longitude_end',        # Longitude final
             'latitude_end',         # Latitude final
             'length',               # Comprimento do segmento
+            'high_intensity_max_speed',     # Limite da intensidade elevada (vazio → o das settings)
+            'medium_intensity_max_speed',   # Limite da intensidade média (vazio → o das settings)
             'total_readings',       # Número total de leituras deste segmento
             'latest_reading',       # Última leitura deste segmento
             'created_at',           # Timestamp de quando o segemento foi criado
@@ -56,19 +123,39 @@ class RoadSegmentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def validate(self, attrs):
+        """
+        Os limites de intensidade em vigor (do segmento ou das settings) têm de ser crescentes:
+        elevada ≤ média.
+        """
+        segment = RoadSegment(
+            high_intensity_max_speed=attrs.get('high_intensity_max_speed', getattr(self.instance, 'high_intensity_max_speed', None)),
+            medium_intensity_max_speed=attrs.get('medium_intensity_max_speed', getattr(self.instance, 'medium_intensity_max_speed', None)),
+        )
+        high, medium = intensity_thresholds(segment)
+        if high > medium:
+            raise serializers.ValidationError({
+                'high_intensity_max_speed': f'Deve ser inferior ou igual ao limite da intensidade média ({medium} km/h).'
+            })
+        return attrs
+
     def get_total_readings(self, obj):
         """
         Devolve o número total de leituras associadas a este segmento.
         """
-        return obj.readings.count()
+        state = segment_state(obj)
+        return state.reading_count if state else 0
 
 
     def get_latest_reading(self, obj):
         """
         Devolve a leitura mais recente deste segmento.
         Se não existirem leituras, retorna None.
+
+        A leitura é obtida a partir do SegmentState (sem query adicional).
         """
-        latest = obj.readings.first()
+        state = segment_state(obj)
+        latest = state.latest_reading() if state else None
         if latest:
             # Serializa o objeto SpeedReading para JSON
             return SpeedReadingSerializer(latest).data
@@ -100,4 +187,91 @@ class RoadSegmentListSerializer(serializers.ModelSerializer):
         """
         Devolve o número de leituras de velocidade do segmento.
         """
-        return obj.readings.count()
\ No newline at end of file
+        state = segment_state(obj)
+        return state.reading_count if state else 0
+
+
+class SpeedReadingBulkItemSerializer(serializers.Serializer):
+    """
+    Serializer (apenas validação) de cada leitura enviada em bloco para POST /api/readings/bulk/.
+
+    Ao contrário do SpeedReadingSerializer, o road_segment é um simples inteiro:
+    a existência dos segmentos é verificada de uma só vez em validate_bulk_readings
+    (em vez de uma query por leitura).
+    """
+
+    road_segment = serializers.IntegerField(min_value=1)
+    average_speed = serializers.FloatField(min_value=0)
+    timestamp = serializers.DateTimeField()
+
+
+def validate_bulk_readings(items):
+    """
+    Valida uma lista de leituras (dicionários) numa única passagem.
+
+    Retorna (readings, errors):
+        - readings: lista de SpeedReading (ainda não gravadas) das leituras válidas
+        - errors: lista de {'index': posição na lista, 'errors': {...}} das leituras inválidas
+
+    Os segmentos de todas as leituras são verificados com uma única query, e as leituras repetidas
+    (mesmo segmento e timestamp, na lista ou na db) com outra.
+    """
+    child = SpeedReadingBulkItemSerializer()
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, child.run_validation(item)))
+        except serializers.ValidationError as e:
+            errors.append({'index': index, 'errors': e.detail})
+
+    # Uma única query para saber que segmentos existem
+    segment_ids = {data['road_segment'] for _index, data in valid}
+    existing = set(RoadSegment.objects.filter(pk__in=segment_ids).values_list('pk', flat=True))
+
+    # Uma única query para saber que leituras já existem
+    keys = set(SpeedReading.objects.filter(
+        road_segment_id__in=existing, timestamp__in={data['timestamp'] for _index, data in valid}
+    ).values_list('road_segment_id', 'timestamp'))
+
+    readings = []
+    for index, data in valid:
+        if data['road_segment'] not in existing:
+            errors.append({'index': index, 'errors': {'road_segment': [f'O segmento {data["road_segment"]} não existe.']}})
+            continue
+        key = (data['road_segment'], data['timestamp'])
+        if key in keys:
+            errors.append({'index': index, 'errors': {'timestamp': ['Já existe uma leitura deste segmento com este timestamp.']}})
+            continue
+        keys.add(key)
+        readings.append(SpeedReading(
+            road_segment_id=data['road_segment'],
+            average_speed=data['average_speed'],
+            timestamp=data['timestamp'],
+        ))
+
+    errors.sort(key=lambda error: error['index'])
+    return readings, errors
+
+
+class IncidentSerializer(serializers.ModelSerializer):
+    """
+    Serializer para os incidentes detetados (apenas leitura, são criados pelo incidents.py).
+    """
+
+    active = serializers.BooleanField(read_only=True)     # Sem ended_at → ainda a decorrer
+
+    class Meta:
+        model = Incident
+        fields = [
+            'id',
+            'road_segment',
+            'active',
+            'started_at',        # Timestamp da primeira leitura anómala
+            'ended_at',          # Timestamp da leitura que terminou o incidente
+            'last_reading_at',   # Timestamp da última leitura anómala
+            'expected_speed',    # Velocidade habitual do segmento antes do incidente
+            'min_speed',         # Velocidade mais baixa durante o incidente
+            'max_score',         # Maior desvio (em desvios-padrão abaixo da média)
+            'reading_count',     # Número de leituras anómalas
+        ]
+        read_only_fields = fields
@@ -0,0 +1,306 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from .models import RoadSegment, SpeedReading
+from .segment_state import apply_new_reading, apply_new_readings, refresh_segment_states
+from . import incidents, pubsub, rollups, routing, spatial
+from .caching import invalidate_segments
+
+"""
+Signals da aplicação.
+
+Mantêm os dados derivados das leituras: o SegmentState, os rollups (horários e diários),
+a cache das respostas dos segmentos, o índice espacial e o peso das arestas do grafo dos percursos (routing.py).
+Publicam também as novas leituras e as mudanças de intensidade para os clientes em tempo real (pubsub.py)
+e passam as novas leituras pelo detetor de incidentes (incidents.py).
+
+O Django não envia post_save quando as leituras são criadas com bulk_create,
+por isso quem insere em bloco (ex.: import_data) deve enviar o signal readings_bulk_created:
+
+    readings_bulk_created.send(sender=SpeedReading, readings=readings)
+
+Quem atualiza leituras em bloco (ex.: import_data --upsert) envia readings_bulk_updated.
+"""
+
+# Enviado depois de um bulk_create de leituras (argumento: readings)
+readings_bulk_created = Signal()
+
+# Enviado depois de alterar a velocidade de leituras existentes em bloco (argumento: readings)
+readings_bulk_updated = Signal()
+
+
+@receiver(pre_save, sender=SpeedReading)
+def remember_previous_values(sender, instance, **kwargs):
+    """
+    Antes de alterar uma leitura, guarda o segmento e o timestamp que tinha,
+    para que o estado e os rollups antigos também sejam recalculados se estes mudarem.
+    """
+    if instance.pk is not None:
+        instance._previous_values = (
+            SpeedReading.objects.filter(pk=instance.pk).values_list('road_segment_id', 'timestamp').first()
+        )
+
+
+def publish_intensity_changes(changes):
+    """
+    Publica as mudanças de intensidade depois do commit (só se a transação for confirmada).
+    """
+    if changes:
+        transaction.on_commit(lambda: pubsub.publish_intensity_changes(changes))
+
+
+@receiver(post_save, sender=SpeedReading)
+def update_state_on_save(sender, instance, created, **kwargs):
+    """
+    Leitura criada → atualização incremental.
+    Leitura alterada → recalcula o estado do(s) segmento(s) afetado(s).
+    """
+    if created:
+        publish_intensity_changes(apply_new_reading(instance))
+        return
+    segment_ids = {instance.road_segment_id}
+    previous = getattr(instance, '_previous_values', None)
+    if previous is not None:
+        segment_ids.add(previous[0])
+    publish_intensity_changes(refresh_segment_states(segment_ids))
+
+
+@receiver(post_save, sender=SpeedReading)
+def update_rollups_on_save(sender, instance, created, **kwargs):
+    """
+    Leitura criada → soma aos rollups.
+    Leitura alterada → recalcula os buckets antigo e novo.
+    """
+    if created:
+        rollups.apply_readings([instance])
+        return
+    keys = {(instance.road_segment_id, instance.timestamp)}
+    previous = getattr(instance, '_previous_values', None)
+    if previous is not None:
+        keys.add(previous)
+    rollups.recompute_buckets(keys)
+
+
+@receiver(pre_save, sender=RoadSegment)
+def remember_previous_thresholds(sender, instance, **kwargs):
+    """
+    Antes de alterar um segmento, guarda os limites de intensidade que tinha.
+    """
+    if instance.pk is not None:
+        instance._previous_thresholds = (
+            RoadSegment.objects.filter(pk=instance.pk)
+            .values_list('high_intensity_max_speed', 'medium_intensity_max_speed').first()
+        )
+
+
+@receiver(post_save, sender=RoadSegment)
+def update_state_on_segment_save(sender, instance, created, **kwargs):
+    """
+    Limites de intensidade alterados → recalcula a intensidade atual do segmento.
+    """
+    previous = getattr(instance, '_previous_thresholds', None)
+    if not created and previous is not None and previous != (instance.high_intensity_max_speed, instance.medium_intensity_max_speed):
+        publish_intensity_changes(refresh_segment_states([instance.pk]))
+
+
+def deleted_with_segment(origin):
+    """
+    Indica se a remoção foi causada pela remoção do próprio segmento (CASCADE).
+    Nesse caso o estado e os rollups do segmento também são apagados, não há nada a recalcular.
+    """
+    return isinstance(origin, RoadSegment) or getattr(origin, 'model', None) is RoadSegment
+
+
+@receiver(post_delete, sender=SpeedReading)
+def update_state_on_delete(sender, instance, origin=None, **kwargs):
+    """
+    Leitura apagada → recalcula o estado do segmento.
+    """
+    if not deleted_with_segment(origin):
+        publish_intensity_changes(refresh_segment_states([instance.road_segment_id]))
+
+
+@receiver(post_delete, sender=SpeedReading)
+def update_rollups_on_delete(sender, instance, origin=None, **kwargs):
+    """
+    Leitura apagada → recalcula o bucket a que pertencia.
+    """
+    if not deleted_with_segment(origin):
+        rollups.recompute_buckets({(instance.road_segment_id, instance.timestamp)})
+
+
+@receiver(readings_bulk_created, sender=SpeedReading)
+def update_state_on_bulk_create(sender, readings, **kwargs):
+    """
+    Leituras criadas em bloco → soma ao estado dos segmentos envolvidos (um INSERT ... ON CONFLICT).
+    """
+    publish_intensity_changes(apply_new_readings(readings))
+
+
+@receiver(readings_bulk_created, sender=SpeedReading)
+def update_rollups_on_bulk_create(sender, readings, **kwargs):
+    """
+    Leituras criadas em bloco → soma aos rollups (um INSERT ... ON CONFLICT por tabela).
+    """
+    rollups.apply_readings(readings)
+
+
+@receiver(readings_bulk_updated, sender=SpeedReading)
+def update_state_on_bulk_update(sender, readings, **kwargs):
+    """
+    Leituras alteradas em bloco → recalcula o estado dos segmentos envolvidos.
+    """
+    publish_intensity_changes(refresh_segment_states({reading.road_segment_id for reading in readings}))
+
+
+@receiver(readings_bulk_updated, sender=SpeedReading)
+def update_rollups_on_bulk_update(sender, readings, **kwargs):
+    """
+    Leituras alteradas em bloco → recalcula os buckets a que pertencem.
+    """
+    rollups.recompute_buckets({(reading.road_segment_id, reading.timestamp) for reading in readings})
+
+
+# Segmentos alterados na transação atual (de cada thread), cuja cache é invalidada depois do commit
+_pending_invalidation = threading.local()
+
+
+def flush_cache_invalidation():
+    """
+    Invalida de uma só vez a cache de todos os segmentos alterados na transação.
+    """
+    segment_ids = getattr(_pending_invalidation, 'segment_ids', None)
+    _pending_invalidation.segment_ids = None
+    if segment_ids:
+        invalidate_segments(segment_ids)
+
+
+def invalidate_cache(segment_ids):
+    """
+    Invalida a cache dos segmentos depois do commit (até lá, as respostas em cache continuam corretas
+    para os outros pedidos), uma só vez por transação: os segmentos de todas as escritas da transação
+    são juntados e o primeiro callback invalida-os com um único invalidate_segments (os seguintes já
+    não têm nada a fazer). Fora de uma transação, invalida já.
+
+    Os segmentos de uma transação revertida são invalidados no commit seguinte (inofensivo).
+    """
+    if not transaction.get_connection().in_atomic_block:
+        invalidate_segments(segment_ids)
+        return
+
+    pending = getattr(_pending_invalidation, 'segment_ids', None)
+    if pending is None:
+        pending = _pending_invalidation.segment_ids = set()
+    pending.update(segment_ids)
+    transaction.on_commit(flush_cache_invalidation)
+
+
+@receiver(post_save, sender=RoadSegment)
+@receiver(post_delete, sender=RoadSegment)
+def invalidate_cache_on_segment_change(sender, instance, **kwargs):
+    invalidate_cache([instance.pk])
+
+
+@receiver(post_save, sender=SpeedReading)
+def invalidate_cache_on_reading_save(sender, instance, **kwargs):
+    segment_ids = {instance.road_segment_id}
+    previous = getattr(instance, '_previous_values', None)
+    if previous is not None:
+        segment_ids.add(previous[0])
+    invalidate_cache(segment_ids)
+
+
+@receiver(post_delete, sender=SpeedReading)
+def invalidate_cache_on_reading_delete(sender, instance, **kwargs):
+    invalidate_cache([instance.road_segment_id])
+
+
+@receiver(readings_bulk_created, sender=SpeedReading)
+@receiver(readings_bulk_updated, sender=SpeedReading)
+def invalidate_cache_on_bulk_create(sender, readings, **kwargs):
+    invalidate_cache({reading.road_segment_id for reading in readings})
+
+
+@receiver(post_save, sender=RoadSegment)
+def update_spatial_index_on_save(sender, instance, **kwargs):
+    spatial.segment_saved(instance)
+
+
+@receiver(post_delete, sender=RoadSegment)
+def update_spatial_index_on_delete(sender, instance, **kwargs):
+    spatial.segment_deleted(instance.pk)
+
+
+@receiver(post_save, sender=SpeedReading)
+def publish_reading_on_save(sender, instance, created, **kwargs):
+    """
+    Leitura criada → publicada para os clientes em tempo real (depois do commit).
+    """
+    if created:
+        transaction.on_commit(lambda: pubsub.publish_readings([instance]))
+
+
+@receiver(readings_bulk_created, sender=SpeedReading)
+def publish_readings_on_bulk_create(sender, readings, **kwargs):
+    """
+    Leituras criadas em bloco → publicadas para os clientes em tempo real (depois do commit).
+    """
+    transaction.on_commit(lambda: pubsub.publish_readings(readings))
+
+
+@receiver(post_save, sender=SpeedReading)
+def detect_incidents_on_save(sender, instance, created, **kwargs):
+    """
+    Leitura criada → avaliada pelo detetor de incidentes (depois do commit).
+    """
+    if created:
+        transaction.on_commit(lambda: incidents.process_readings([instance]))
+
+
+@receiver(readings_bulk_created, sender=SpeedReading)
+def detect_incidents_on_bulk_create(sender, readings, **kwargs):
+    """
+    Leituras criadas em bloco → avaliadas pelo detetor de incidentes (depois do commit).
+    """
+    transaction.on_commit(lambda: incidents.process_readings(readings))
+
+
+@receiver(post_delete, sender=RoadSegment)
+def forget_incident_stats_on_delete(sender, instance, **kwargs):
+    incidents.detector.forget(instance.pk)
+
+
+@receiver(post_save, sender=SpeedReading)
+def update_route_weights_on_save(sender, instance, created, **kwargs):
+    """
+    Leitura criada → atualiza o tempo de percurso do segmento no grafo (depois do commit, sem queries).
+    Leitura alterada → relê a velocidade atual do(s) segmento(s) afetado(s).
+    """
+    if created:
+        transaction.on_commit(lambda: routing.readings_created([instance]))
+        return
+    segment_ids = {instance.road_segment_id}
+    previous = getattr(instance, '_previous_values', None)
+    if previous is not None:
+        segment_ids.add(previous[0])
+    transaction.on_commit(lambda: routing.refresh_speeds(segment_ids))
+
+
+@receiver(post_delete, sender=SpeedReading)
+def update_route_weights_on_delete(sender, instance, origin=None, **kwargs):
+    if not deleted_with_segment(origin):
+        transaction.on_commit(lambda: routing.refresh_speeds([instance.road_segment_id]))
+
+
+@receiver(readings_bulk_created, sender=SpeedReading)
+def update_route_weights_on_bulk_create(sender, readings, **kwargs):
+    transaction.on_commit(lambda: routing.readings_created(readings))
+
+
+@receiver(readings_bulk_updated, sender=SpeedReading)
+def update_route_weights_on_bulk_update(sender, readings, **kwargs):
+    segment_ids = {reading.road_segment_id for reading in readings}
+    transaction.on_commit(lambda: routing.refresh_speeds(segment_ids))
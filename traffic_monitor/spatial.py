@@ -0,0 +1,296 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+from .models import RoadSegment
+from .caching import bump_version, get_version
+
+"""
+Índice espacial (em memória) dos segmentos de estrada, para:
+- GET /api/segments/?bbox=minLon,minLat,maxLon,maxLat   → segmentos numa área (ex.: o mapa visível)
+- GET /api/segments/nearest/?lon=&lat=&limit=           → segmentos mais próximos de um ponto
+
+É uma grelha regular: cada célula (SPATIAL_INDEX_CELL_SIZE graus) guarda os ids dos segmentos que a atravessam.
+Uma pesquisa só olha para as células da área pedida, em vez de percorrer todos os segmentos.
+
+O índice é construído a partir da tabela road_segments no primeiro pedido e mantido atualizado:
+- neste processo, pelos signals de RoadSegment (criação, alteração e remoção)
+- noutros processos (ex.: import_data, outros workers), por uma versão guardada na cache, que
+  obriga a reconstruir o índice quando muda; e, em último caso, por SPATIAL_INDEX_MAX_AGE segundos.
+"""
+
+GEOMETRY_VERSION_KEY = 'segments:version:geometry'
+
+# Número máximo de segmentos devolvidos por GET /api/segments/nearest/
+NEAREST_MAX_LIMIT = 100
+
+# Metros por grau de latitude (aproximação usada nas distâncias)
+METERS_PER_DEGREE = 111_320
+
+
+def segment_intersects_box(x1, y1, x2, y2, min_x, min_y, max_x, max_y):
+    """
+    Indica se o segmento de reta (x1, y1) → (x2, y2) interseta o retângulo (recorte de Liang-Barsky).
+    """
+    dx, dy = x2 - x1, y2 - y1
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x1 - min_x), (dx, max_x - x1), (-dy, y1 - min_y), (dy, max_y - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return False
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return False
+            t1 = min(t1, t)
+    return True
+
+
+def distance_to_segment(lon, lat, coords):
+    """
+    Distância aproximada (em metros) de um ponto a um segmento, numa projeção equiretangular local.
+    """
+    scale = math.cos(math.radians(lat))
+    x1, y1 = (coords[0] - lon) * scale, coords[1] - lat
+    x2, y2 = (coords[2] - lon) * scale, coords[3] - lat
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else max(0.0, min(1.0, -(x1 * dx + y1 * dy) / length_sq))
+    return math.hypot(x1 + t * dx, y1 + t * dy) * METERS_PER_DEGREE
+
+
+def ring_cells(cx, cy, ring):
+    """
+    Células à distância `ring` (em células) da célula (cx, cy): o contorno de um quadrado.
+    """
+    if ring == 0:
+        return [(cx, cy)]
+    cells = []
+    for offset in range(-ring, ring + 1):
+        cells.extend([(cx + offset, cy - ring), (cx + offset, cy + ring)])
+    for offset in range(-ring + 1, ring):
+        cells.extend([(cx - ring, cy + offset), (cx + ring, cy + offset)])
+    return cells
+
+
+class SegmentGrid:
+    """
+    Grelha regular de segmentos: célula (ix, iy) → ids dos segmentos cujo retângulo envolvente a cobre.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.segments = {}   # id → (longitude_start, latitude_start, longitude_end, latitude_end)
+        self.cells = {}      # (ix, iy) → set de ids
+        self.bounds = None   # (min_ix, min_iy, max_ix, max_iy) das células ocupadas (só aumenta)
+        self.version = None
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.segments)
+
+    def cell(self, lon, lat):
+        return math.floor(lon / self.cell_size), math.floor(lat / self.cell_size)
+
+    def cells_of(self, coords):
+        min_x, min_y = self.cell(min(coords[0], coords[2]), min(coords[1], coords[3]))
+        max_x, max_y = self.cell(max(coords[0], coords[2]), max(coords[1], coords[3]))
+        return [(ix, iy) for ix in range(min_x, max_x + 1) for iy in range(min_y, max_y + 1)]
+
+    def add(self, segment_id, coords):
+        self.remove(segment_id)
+        coords = tuple(float(value) for value in coords)
+        self.segments[segment_id] = coords
+        cells = self.cells_of(coords)
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(segment_id)
+        (first_x, first_y), (last_x, last_y) = cells[0], cells[-1]
+        if self.bounds is None:
+            self.bounds = (first_x, first_y, last_x, last_y)
+        else:
+            min_x, min_y, max_x, max_y = self.bounds
+            self.bounds = (min(min_x, first_x), min(min_y, first_y), max(max_x, last_x), max(max_y, last_y))
+
+    def remove(self, segment_id):
+        coords = self.segments.pop(segment_id, None)
+        if coords is None:
+            return
+        for cell in self.cells_of(coords):
+            members = self.cells.get(cell)
+            if members is not None:
+                members.discard(segment_id)
+                if not members:
+                    del self.cells[cell]
+
+    def query_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """
+        Ids dos segmentos que intersetam o retângulo.
+        """
+        min_x, min_y = self.cell(min_lon, min_lat)
+        max_x, max_y = self.cell(max_lon, max_lat)
+
+        # Uma área com mais células do que segmentos é mais rápida de percorrer segmento a segmento
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self.segments):
+            candidates = self.segments.keys()
+        else:
+            candidates = set()
+            for ix in range(min_x, max_x + 1):
+                for iy in range(min_y, max_y + 1):
+                    candidates.update(self.cells.get((ix, iy), ()))
+
+        return [
+            segment_id for segment_id in candidates
+            if segment_intersects_box(*self.segments[segment_id], min_lon, min_lat, max_lon, max_lat)
+        ]
+
+    def nearest(self, lon, lat, limit):
+        """
+        Os `limit` segmentos mais próximos do ponto → lista de (id, distância em metros), do mais próximo para o mais afastado.
+
+        Percorre a grelha em anéis à volta da célula do ponto e pára quando o anel já não pode conter
+        nenhum segmento mais próximo do que os encontrados.
+        """
+        if not self.segments or limit <= 0:
+            return []
+
+        cx, cy = self.cell(lon, lat)
+        min_x, min_y, max_x, max_y = self.bounds
+        max_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy, 0)
+        # Distância (em metros) garantidamente percorrida por cada anel, no sentido mais curto (longitude)
+        ring_meters = self.cell_size * math.cos(math.radians(lat)) * METERS_PER_DEGREE
+
+        distances = {}
+        for ring in range(max_ring + 1):
+            # Se o anel já tem mais células do que segmentos, é mais rápido calcular a distância a todos
+            if (2 * ring + 1) ** 2 > len(self.segments):
+                for segment_id, coords in self.segments.items():
+                    if segment_id not in distances:
+                        distances[segment_id] = distance_to_segment(lon, lat, coords)
+                break
+            for cell in ring_cells(cx, cy, ring):
+                for segment_id in self.cells.get(cell, ()):
+                    if segment_id not in distances:
+                        distances[segment_id] = distance_to_segment(lon, lat, self.segments[segment_id])
+            if len(distances) >= limit and sorted(distances.values())[limit - 1] <= ring * ring_meters:
+                break
+
+        return sorted(distances.items(), key=lambda item: (item[1], item[0]))[:limit]
+
+
+def parse_bbox(value):
+    """
+    Converte "minLon,minLat,maxLon,maxLat" em 4 floats. Lança ValidationError se for inválido.
+    """
+    try:
+        bbox = [float(item) for item in value.split(',')]
+    except ValueError:
+        bbox = []
+    if len(bbox) != 4 or not all(math.isfinite(item) for item in bbox):
+        raise ValidationError({'bbox': 'Use o formato minLon,minLat,maxLon,maxLat (ex.: -8.7,41.1,-8.5,41.2).'})
+    if bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValidationError({'bbox': 'Os valores mínimos devem ser inferiores aos máximos.'})
+    return bbox
+
+
+def parse_point(params):
+    """
+    Lê os parâmetros ?lon= e ?lat= e devolve (lon, lat). Lança ValidationError se forem inválidos.
+    """
+    point = []
+    for name, limit in (('lon', 180), ('lat', 90)):
+        try:
+            value = float(params.get(name, ''))
+        except ValueError:
+            raise ValidationError({name: 'Parâmetro obrigatório (número).'})
+        if not -limit <= value <= limit:
+            raise ValidationError({name: f'Deve estar entre -{limit} e {limit}.'})
+        point.append(value)
+    return tuple(point)
+
+
+_index = None
+_lock = threading.RLock()
+
+
+def build_segment_index():
+    """
+    Constrói o índice a partir da tabela road_segments.
+    """
+    index = SegmentGrid(getattr(settings, 'SPATIAL_INDEX_CELL_SIZE', 0.01))
+    index.version = get_version(GEOMETRY_VERSION_KEY)
+    rows = RoadSegment.objects.values_list('id', 'longitude_start', 'latitude_start', 'longitude_end', 'latitude_end')
+    for segment_id, *coords in rows.iterator(chunk_size=2000):
+        index.add(segment_id, coords)
+    return index
+
+
+def get_segment_index():
+    """
+    Índice atualizado deste processo (é reconstruído se a versão na cache mudou ou se for demasiado antigo).
+    """
+    global _index
+    with _lock:
+        max_age = getattr(settings, 'SPATIAL_INDEX_MAX_AGE', 300)
+        if (
+            _index is None
+            or _index.version != get_version(GEOMETRY_VERSION_KEY)
+            or time.monotonic() - _index.built_at > max_age
+        ):
+            _index = build_segment_index()
+        return _index
+
+
+def _apply_change(change):
+    """
+    Aplica uma alteração ao índice deste processo e muda a versão na cache (para os outros processos).
+    Se o índice já estava desatualizado, não é alterado: será reconstruído no próximo pedido.
+    """
+    with _lock:
+        expected = get_version(GEOMETRY_VERSION_KEY)
+        bump_version(GEOMETRY_VERSION_KEY)
+        if _index is not None and _index.version == expected:
+            change(_index)
+            _index.version = get_version(GEOMETRY_VERSION_KEY)
+
+
+def segments_in_bbox(min_lon, min_lat, max_lon, max_lat):
+    """
+    Ids dos segmentos que intersetam o retângulo (min_lon, min_lat) → (max_lon, max_lat).
+    """
+    with _lock:
+        return get_segment_index().query_bbox(min_lon, min_lat, max_lon, max_lat)
+
+
+def nearest_segments(lon, lat, limit):
+    """
+    Os `limit` segmentos mais próximos do ponto → lista de (id, distância em metros).
+    """
+    with _lock:
+        return get_segment_index().nearest(lon, lat, limit)
+
+
+def segment_saved(segment):
+    coords = (segment.longitude_start, segment.latitude_start, segment.longitude_end, segment.latitude_end)
+    _apply_change(lambda index: index.add(segment.pk, coords))
+
+
+def segment_deleted(segment_id):
+    _apply_change(lambda index: index.remove(segment_id))
+
+
+def invalidate_segment_index():
+    """
+    Obriga todos os processos a reconstruir o índice (ex.: depois de criar segmentos com bulk_create).
+    """
+    global _index
+    with _lock:
+        bump_version(GEOMETRY_VERSION_KEY)
+        _index = None
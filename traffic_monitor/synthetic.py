@@ -0,0 +1,95 @@
+import csv
+import math
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from .geojson import format_timestamp
+from .spatial import distance_to_segment
+
+"""
+Gerador determinístico de dados de tráfego sintéticos, com o formato de data/traffic_speed.csv
+(mais a coluna Timestamp), para benchmarks e testes de carga.
+
+    ID,Long_start,Lat_start,Long_end,Lat_end,Length,Speed,Timestamp
+    1,103.9460064,30.75066046,103.9564943,30.7450801,1179.21,31.77,2024-12-01T00:00:00Z
+
+N segmentos × M leituras: para cada instante (de `interval` em `interval`) há uma leitura de cada segmento,
+como num feed. Cada segmento tem uma velocidade base (vias rápidas e ruas) que desce nas horas de ponta,
+com ruído; por isso aparecem as três intensidades. A mesma semente gera sempre os mesmos dados.
+"""
+
+COLUMNS = ['ID', 'Long_start', 'Lat_start', 'Long_end', 'Lat_end', 'Length', 'Speed', 'Timestamp']
+
+# Área dos dados reais (Chengdu)
+AREA = (103.90, 30.55, 104.20, 30.80)
+
+DEFAULT_START = datetime(2024, 12, 1, tzinfo=dt_timezone.utc)
+DEFAULT_INTERVAL = timedelta(minutes=5)
+
+
+def generate_segments(count, seed=42):
+    """
+    Lista de N segmentos [(longitude_start, latitude_start, longitude_end, latitude_end, length, base_speed), ...],
+    curtos (até ~1 km) e com coordenadas distintas.
+    """
+    rng = random.Random(seed)
+    min_lon, min_lat, max_lon, max_lat = AREA
+    segments, seen = [], set()
+    while len(segments) < count:
+        lon, lat = round(rng.uniform(min_lon, max_lon), 7), round(rng.uniform(min_lat, max_lat), 7)
+        end_lon, end_lat = round(lon + rng.uniform(-0.007, 0.007), 7), round(lat + rng.uniform(-0.007, 0.007), 7)
+        if (lon, lat, end_lon, end_lat) in seen:
+            continue
+        seen.add((lon, lat, end_lon, end_lat))
+        length = round(distance_to_segment(end_lon, end_lat, (lon, lat, lon, lat)), 2)
+        base_speed = rng.choice((30, 50, 50, 70, 90))
+        segments.append((lon, lat, end_lon, end_lat, length, base_speed))
+    return segments
+
+
+def rush_hour_factor(timestamp):
+    """
+    Fator (0.3 a 1) que reduz a velocidade nas horas de ponta (8h e 18h) e a aumenta de madrugada.
+    """
+    hour = timestamp.hour + timestamp.minute / 60
+    rush = max(math.exp(-((hour - 8) ** 2) / 2), math.exp(-((hour - 18) ** 2) / 2))
+    return 1 - 0.7 * rush
+
+
+def generate_rows(segments=100, readings=10, seed=42, start=DEFAULT_START, interval=DEFAULT_INTERVAL):
+    """
+    Gera N × M linhas (dicionários com as colunas de COLUMNS), ordenadas por Timestamp e segmento.
+    """
+    rng = random.Random(seed + 1)
+    geometry = generate_segments(segments, seed)
+    row_id = 0
+    for index in range(readings):
+        timestamp = start + index * interval
+        factor = rush_hour_factor(timestamp)
+        for lon, lat, end_lon, end_lat, length, base_speed in geometry:
+            row_id += 1
+            speed = max(0.0, base_speed * factor + rng.gauss(0, 6))
+            yield {
+                'ID': row_id,
+                'Long_start': lon,
+                'Lat_start': lat,
+                'Long_end': end_lon,
+                'Lat_end': end_lat,
+                'Length': length,
+                'Speed': round(speed, 2),
+                'Timestamp': format_timestamp(timestamp),
+            }
+
+
+def write_csv(path, rows):
+    """
+    Escreve as linhas num ficheiro CSV. Retorna o número de linhas escritas.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
@@ -1,16 +1,71 @@
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+from io import StringIO
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock, skipIf, skipUnless
+from asgiref.sync import sync_to_async
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils import timezone
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.authtoken.models import Token
-from .models import RoadSegment, SpeedReading
+from .models import DailySpeedRollup, HourlySpeedRollup, ImportedFile, Incident, RoadSegment, SegmentForecast, SegmentState, SpeedReading, intensity_for_speed
+from .views import RoadSegmentViewSet, SpeedReadingViewSet
+from .pagination import SpeedReadingPagination
+from .serializers import SpeedReadingFastSerializer, SpeedReadingSerializer, validate_bulk_readings
+from .ingestion import SegmentResolver, insert_readings, read_csv_chunks, read_csv_range, write_chunk
+from .spatial import SegmentGrid, distance_to_segment, segment_intersects_box
+from .partitions import is_partitioned, list_partitions
+from .pubsub import Subscription, broker
+from .synthetic import COLUMNS, generate_rows, generate_segments
+from .benchmarks import ENDPOINTS, compare_results, run_suite
+from .incidents import detector
+from .forecasting import fit_forecasts, predict
+from .caching import invalidate_segments
+from .signals import invalidate_cache
+from . import metrics, routing, writebehind
 
 """
 Testes unitários realizados: 
 - Modelos (RoadSegment, SpeedReading): criação, campos obrigatórios, cálculo de intensidade, relações FK.
 - Permissões da API: acesso de utilizadores anónimos e administradores.
 - Endpoints da API: listagem, detalhes, contagem de leituras, última leitura e filtros por intensidade.
+- Número de queries constante na listagem e detalhe de segmentos (sem N+1).
+- Estado atual do segmento (SegmentState): atualizado ao criar, alterar e apagar leituras.
+- Paginação por cursor: navegação entre páginas, limites do tamanho de página e cursores inválidos.
+- Criação de leituras em bloco (POST /api/readings/bulk/): JSON, NDJSON e erros por leitura.
+- Agregação das leituras por intervalo de tempo (GET /api/readings/aggregate/).
+- Particionamento mensal de speed_readings (PostgreSQL): conversão, partições futuras, retenção e filtros por data.
+- Índice espacial dos segmentos: filtro ?bbox=, segmentos mais próximos e atualização ao alterar segmentos.
+- Exportação GeoJSON dos segmentos (streaming) e tiles z/x/y.
+- Exportação das leituras em CSV/NDJSON (GET /api/readings/export/ e comando export_data).
+- Serialização rápida das leituras: JSON igual byte a byte ao SpeedReadingSerializer.
+- Intensidade calculada na db: limites configuráveis (settings e por segmento), filtro ?intensity= e histograma.
+- Eventos em tempo real (GET /api/stream/, SSE): novas leituras, mudanças de intensidade e filtros.
+- Endpoints de leitura assíncronos (GET /api/async/...): respostas iguais às dos ViewSets.
+- Escrita diferida das leituras (write-behind): 202, gravação em lotes, contrapressão e recuperação do journal.
+- Deteção de incidentes (EWMA): abertura, atualização e fim, arranque a partir da db e GET /api/incidents/.
+- Previsão da velocidade (NumPy): padrão diário, ajuste em bloco e incremental, GET /api/segments/{id}/forecast/.
+- Percursos (grafo dos segmentos): caminho mais rápido, atualização do peso das arestas e GET /api/segments/route/.
+- Métricas dos pedidos (GET /metrics): latência, queries, tempo na db, serialização, tamanho e pedidos lentos.
+- Dataset sintético (generate_data) e suite de benchmarks: determinismo, resultados e deteção de regressões.
+- Cache das respostas dos segmentos: invalidação ao alterar segmentos/leituras e ETag (304).
+- Estatísticas pré-calculadas (rollups) por hora e por dia: atualização, recálculo e reconstrução.
+- Planos de execução (EXPLAIN): as queries dos ViewSets usam índices e não leituras sequenciais.
+- Comando import_data: importação em blocos, reutilização de segmentos, linhas inválidas e reimportação (--upsert).
 """
 
 class RoadSegmentModelTest(TestCase):
@@ -161,6 +216,7 @@ class PermissionsTest(TestCase):
         
         # Cliente da API (para simular pedidos HTTP à API)
         self.client = APIClient()
+        cache.clear()  # As respostas dos segmentos ficam em cache entre testes
     
     def test_anonymous_can_get(self):
         """
@@ -197,8 +253,8 @@ class PermissionsTest(TestCase):
         data = {
             'longitude_start': 10,
             'latitude_start': 30,
-            'longitude_end': 10,
-            'latitude_end': 30,
+            'longitude_end': 11,
+            'latitude_end': 31,
             'length': 510.5
         }
         response = self.client.post('/api/segments/', data)
@@ -271,6 +327,7 @@ class APIEndpointsTest(TestCase):
         )
         
         self.client = APIClient()
+        cache.clear()  # As respostas dos segmentos ficam em cache entre testes
     
     def test_list_segments(self):
         """
@@ -279,7 +336,7 @@ class APIEndpointsTest(TestCase):
         response = self.client.get('/api/segments/')
         print(response.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data['results']), 3)
     
     def test_retrieve_segment(self):
         """
@@ -300,12 +357,13 @@ class APIEndpointsTest(TestCase):
         print(f"\nSegmento A: {response.data}\n")
         self.assertEqual(response.data['total_readings'], 1)
         
-        # Adiciona mais uma leitura ao segmento A
-        SpeedReading.objects.create(
-            road_segment=self.segment_A,
-            average_speed=55.0,
-            timestamp=timezone.now()
-        )
+        # Adiciona mais uma leitura ao segmento A (a cache é invalidada depois do commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            SpeedReading.objects.create(
+                road_segment=self.segment_A,
+                average_speed=55.0,
+                timestamp=timezone.now()
+            )
         response = self.client.get(f'/api/segments/{self.segment_A.id}/')
         print(f"\n Segmento A com + 1 leitura: {response.data}\n")
         self.assertEqual(response.data['total_readings'], 2)
@@ -333,7 +391,7 @@ class APIEndpointsTest(TestCase):
         """
         response = self.client.get('/api/segments/?intensity=elevada')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)  # Apenas 1 com elevada
+        self.assertEqual(len(response.data['results']), 1)  # Apenas 1 com elevada
     
     def test_filter_by_intensity_media(self):
         """
@@ -341,7 +399,7 @@ class APIEndpointsTest(TestCase):
         """
         response = self.client.get('/api/segments/?intensity=média')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)  # Apenas 1 com média
+        self.assertEqual(len(response.data['results']), 1)  # Apenas 1 com média
     
     def test_filter_by_intensity_baixa(self):
         """
@@ -351,7 +409,7 @@ class APIEndpointsTest(TestCase):
 
         response = self.client.get('/api/segments/?intensity=baixa')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)  # Apenas 1 com baixa
+        self.assertEqual(len(response.data['results']), 1)  # Apenas 1 com baixa
     
     def test_filter_readings_by_segment(self):
         """
@@ -359,4 +417,2596 @@ class APIEndpointsTest(TestCase):
         """
         response = self.client.get(f'/api/readings/?road_segment={self.segment_A.id}')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)  # Apenas 1 leitura deste segmento
+        self.assertEqual(len(response.data['results']), 1)  # Apenas 1 leitura deste segmento
+
+
+class ImportDataCommandTest(TestCase):
+    """
+    Testes para o comando import_data.
+
+    Testa:
+    - Importação em blocos (--batch-size) a partir de um ficheiro (--file)
+    - Reutilização de segmentos com as mesmas coordenadas
+    - Linhas inválidas não interrompem a importação
+    - Número de queries não cresce com o número de linhas
+    - Coluna Timestamp e reimportação com --upsert (sem duplicar leituras nem segmentos)
+    - O --upsert recusa ficheiros sem a coluna Timestamp (não podem ser deduplicados)
+    - Vários ficheiros (pasta ou glob) lidos por vários processos, por partes, ficheiros já importados ignorados
+    - Uma importação interrompida continua a partir do último bloco escrito
+    - Um bloco que falha na db não avança o progresso: a importação seguinte volta a tentá-lo
+    """
+
+    HEADER = 'ID,Long_start,Lat_start,Long_end,Lat_end,Length,Speed\n'
+
+    def write_csv(self, lines, header=HEADER):
+        """
+        Cria um ficheiro CSV temporário com as linhas indicadas.
+        """
+        file = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8')
+        file.write(header + ''.join(line + '\n' for line in lines))
+        file.close()
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def run_import(self, path, batch_size=2, **options):
+        out = StringIO()
+        call_command('import_data', file=path, batch_size=batch_size, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_creates_segments_and_readings(self):
+        """
+        Testa se as linhas com as mesmas coordenadas partilham o mesmo segmento.
+        """
+        path = self.write_csv([
+            '1,103.9,30.7,103.95,30.74,1179.2,31.7',
+            '2,103.9,30.7,103.95,30.74,1179.2,49.4',
+            '3,104.0,30.7,104.06,30.73,730.2,15.1',
+        ])
+        output = self.run_import(path)
+        self.assertIn('Segmentos criados: 2', output)
+        self.assertIn('Leituras criadas: 3', output)
+        self.assertIn('linhas/s', output)
+        self.assertEqual(RoadSegment.objects.count(), 2)
+        self.assertEqual(SpeedReading.objects.count(), 3)
+        self.assertEqual(sorted(SegmentState.objects.values_list('reading_count', flat=True)), [1, 2])
+
+        # Voltar a importar (--force) reutiliza os segmentos existentes
+        self.run_import(path, force=True)
+        self.assertEqual(RoadSegment.objects.count(), 2)
+        self.assertEqual(SpeedReading.objects.count(), 6)
+
+    def test_invalid_rows_are_skipped(self):
+        """
+        Testa se uma linha inválida é contada como erro sem perder as restantes.
+        """
+        path = self.write_csv([
+            '1,103.9,30.7,103.95,30.74,1179.2,31.7',
+            '2,103.9,abc,103.95,30.74,1179.2,49.4',
+            '3,104.0,30.7,104.06,30.73,730.2,15.1',
+        ])
+        output = self.run_import(path)
+        self.assertIn('Ocorreram 1 erros', output)
+        self.assertEqual(SpeedReading.objects.count(), 2)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """
+        Testa se o número de queries depende do número de blocos e não do número de linhas.
+        """
+        counts = []
+        for total in (10, 40):
+            lines = [f'{i},{total + i},30.0,{total + i}.5,30.5,100.0,{i}' for i in range(total)]
+            path = self.write_csv(lines)
+            with CaptureQueriesContext(connection) as queries:
+                self.run_import(path, batch_size=total)  # Um único bloco
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(SpeedReading.objects.count(), 50)
+
+    def test_import_directory_with_workers(self):
+        """
+        Testa a importação de uma pasta com 2 processos e se os ficheiros já importados são ignorados.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for hour in range(3):
+            with open(os.path.join(directory, f'regiao-{hour:02d}.csv'), 'w', encoding='utf-8') as file:
+                file.write(self.HEADER.replace('Speed', 'Speed,Timestamp'))
+                for i in range(5):
+                    file.write(f'{i},{100 + i},30.0,{100 + i}.5,30.5,100.0,{10 * hour + i},2024-12-17T{hour:02d}:00:00Z\n')
+        with open(os.path.join(directory, 'notas.txt'), 'w', encoding='utf-8') as file:
+            file.write('não é um CSV')
+
+        # Uma parte de um bloco por tarefa: cada ficheiro é lido em 3 tarefas
+        with mock.patch('traffic_monitor.management.commands.import_data.PARSE_TASK_CHUNKS', 1):
+            output = self.run_import(directory, batch_size=2, workers=2)
+        self.assertIn('Ficheiros importados: 3 (0 já importados)', output)
+        self.assertIn('Processos de leitura: 2', output)
+        self.assertEqual((RoadSegment.objects.count(), SpeedReading.objects.count()), (5, 15))
+        self.assertEqual(list(ImportedFile.objects.values_list('rows_processed', 'readings_created')), [(5, 5)] * 3)
+        self.assertTrue(all(ImportedFile.objects.values_list('completed_at', flat=True)))
+
+        # Um ficheiro novo na pasta: só esse é importado
+        shutil.copy(os.path.join(directory, 'regiao-00.csv'), os.path.join(directory, 'regiao-03.csv'))
+        output = self.run_import(os.path.join(directory, 'regiao-*.csv'), upsert=True)
+        self.assertIn('Ficheiros importados: 1 (3 já importados)', output)
+        self.assertEqual(SpeedReading.objects.count(), 15)
+
+    def test_read_csv_range_in_parts(self):
+        """
+        Testa se ler um ficheiro por partes (read_csv_range, nos processos de leitura) dá os mesmos blocos que lê-lo todo.
+        """
+        lines = [f'{i},{100 + i},30.0,{100 + i}.5,30.5,100.0,{i}' for i in range(7)]
+        lines[3] = '3,"103,9",30.0,104.5,30.5,100.0,3'     # Vírgula dentro de aspas (e valor inválido)
+        path = self.write_csv(lines)
+
+        for skip in (0, 3):
+            expected = list(read_csv_chunks(path, 2, skip))
+            parts, position, fieldnames = [], None, None
+            while True:
+                chunks, position, fieldnames = read_csv_range(path, 2, skip, position, fieldnames, max_chunks=1)
+                parts.append(chunks)
+                if position is None:
+                    break
+            self.assertEqual([chunk for chunks in parts for chunk in chunks], expected)
+            self.assertTrue(all(len(chunks) <= 1 for chunks in parts))
+            self.assertEqual(sum(lines for chunks in parts for lines, _rows, _errors in chunks), 7 - skip)
+
+    def test_resume_interrupted_import(self):
+        """
+        Testa se uma importação interrompida continua na linha seguinte ao último bloco escrito.
+        """
+        path = self.write_csv([f'{i},{100 + i},30.0,{100 + i}.5,30.5,100.0,{i}' for i in range(6)])
+        original = write_chunk
+        calls = []
+
+        def fail_on_second_chunk(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise KeyboardInterrupt     # O processo é interrompido a meio do 2º bloco
+            return original(*args, **kwargs)
+
+        with mock.patch('traffic_monitor.management.commands.import_data.write_chunk', fail_on_second_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_import(path)
+        progress = ImportedFile.objects.get()
+        self.assertEqual((progress.rows_processed, progress.completed_at), (2, None))
+
+        output = self.run_import(path)
+        self.assertIn('a continuar na linha 3', output)
+        self.assertIn('Linhas processadas: 4', output)
+        self.assertEqual(SpeedReading.objects.count(), 6)
+        self.assertIsNotNone(ImportedFile.objects.get().completed_at)
+
+    def test_failed_chunk_is_retried(self):
+        """
+        Testa se um bloco que falha na db deixa o ficheiro por terminar e é escrito na importação seguinte.
+        """
+        path = self.write_csv([f'{i},{100 + i},30.0,{100 + i}.5,30.5,100.0,{i}' for i in range(6)])
+        original = write_chunk
+        calls = []
+
+        def fail_on_second_chunk(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise Exception('ligação à db perdida')
+            return original(*args, **kwargs)
+
+        with mock.patch('traffic_monitor.management.commands.import_data.write_chunk', fail_on_second_chunk):
+            output = self.run_import(path)
+        self.assertIn('Ocorreram 2 erros', output)
+        self.assertIn('a próxima importação continua na linha 3', output)
+        self.assertIn('Ficheiros importados: 0', output)
+        progress = ImportedFile.objects.get()
+        self.assertEqual((progress.rows_processed, progress.errors, progress.completed_at), (2, 0, None))
+        self.assertEqual(SpeedReading.objects.count(), 2)      # O 3º bloco também fica para a próxima importação
+
+        # Sem --force: o ficheiro não foi dado como importado e continua no bloco que falhou
+        output = self.run_import(path)
+        self.assertIn('a continuar na linha 3', output)
+        self.assertIn('Não houve erros', output)
+        self.assertEqual(sorted(SpeedReading.objects.values_list('average_speed', flat=True)), [0, 1, 2, 3, 4, 5])
+        progress.refresh_from_db()
+        self.assertEqual((progress.rows_processed, progress.readings_created), (6, 6))
+        self.assertIsNotNone(progress.completed_at)
+
+    def test_upsert_reimport_is_idempotent(self):
+        """
+        Testa se voltar a importar (--upsert) um ficheiro com Timestamp só atualiza as leituras alteradas.
+        """
+        header = self.HEADER.replace('Speed', 'Speed,Timestamp')
+        lines = [
+            '1,103.9,30.7,103.95,30.74,1179.2,31.7,2024-12-17T14:00:00Z',
+            '2,103.9,30.7,103.95,30.74,1179.2,49.4,2024-12-17T14:05:00',
+            '3,104.0,30.7,104.06,30.73,730.2,15.1,2024-12-17T14:00:00Z',
+        ]
+        output = self.run_import(self.write_csv(lines, header), upsert=True)
+        self.assertIn('Leituras criadas: 3', output)
+        self.assertEqual(
+            sorted(SpeedReading.objects.values_list('timestamp', flat=True))[-1],
+            datetime(2024, 12, 17, 14, 5, tzinfo=dt_timezone.utc)     # Sem fuso horário → TIME_ZONE (UTC)
+        )
+
+        output = self.run_import(self.write_csv(lines, header), upsert=True)
+        self.assertIn('Leituras criadas: 0', output)
+        self.assertIn('Leituras atualizadas: 0', output)
+        self.assertEqual((RoadSegment.objects.count(), SpeedReading.objects.count()), (2, 3))
+
+        # A última leitura do 1º segmento mudou de velocidade: estado e rollups recalculados
+        lines[1] = '2,103.9,30.7,103.95,30.74,1179.2,12.0,2024-12-17T14:05:00Z'
+        output = self.run_import(self.write_csv(lines, header), upsert=True)
+        self.assertIn('Leituras atualizadas: 1', output)
+        self.assertEqual(SpeedReading.objects.count(), 3)
+        segment = RoadSegment.objects.get(longitude_end=103.95)
+        self.assertEqual(SegmentState.objects.get(road_segment=segment).intensity, 'elevada')
+        rollup = HourlySpeedRollup.objects.get(road_segment=segment)
+        self.assertEqual((rollup.count, rollup.speed_min, rollup.speed_max), (2, 12.0, 31.7))
+
+    def test_file_without_timestamp_column(self):
+        """
+        Testa se o --upsert recusa um ficheiro sem a coluna Timestamp (antes de escrever na db)
+        e se, sem --upsert, a importação avisa que voltar a importá-lo duplica as leituras.
+        """
+        path = self.write_csv(['1,103.9,30.7,103.95,30.74,1179.2,31.7'])
+        with self.assertRaisesMessage(CommandError, 'exige a coluna Timestamp'):
+            self.run_import(path, upsert=True)
+        self.assertFalse(SpeedReading.objects.exists())
+        self.assertFalse(RoadSegment.objects.exists())
+
+        output = self.run_import(path)
+        self.assertIn('não tem a coluna Timestamp', output)
+        self.run_import(path, force=True)
+        self.assertEqual(SpeedReading.objects.count(), 2)
+
+    def test_duplicate_reading_without_upsert_fails_chunk(self):
+        """
+        Testa se, sem --upsert, uma leitura repetida faz falhar o seu bloco (e o ficheiro fica por terminar).
+        """
+        header = self.HEADER.replace('Speed', 'Speed,Timestamp')
+        path = self.write_csv(['1,103.9,30.7,103.95,30.74,1179.2,31.7,2024-12-17T14:00:00Z'], header)
+        self.run_import(path)
+        output = self.run_import(path, force=True)
+        self.assertIn('Ocorreram 1 erros', output)
+        self.assertEqual(SpeedReading.objects.count(), 1)
+        self.assertIsNone(ImportedFile.objects.get().completed_at)
+
+
+class SegmentQueryCountTest(TestCase):
+    """
+    Testes para garantir que não existe o problema N+1 nos segmentos.
+
+    Testa:
+    - GET /api/segments/ faz o mesmo número de queries com 2 ou 10 segmentos
+    - GET /api/segments/{id}/ faz o mesmo número de queries com 1 ou 10 leituras
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()  # As respostas dos segmentos ficam em cache entre testes
+
+    def create_segments(self, total):
+        start = RoadSegment.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):     # A cache é invalidada depois do commit
+            for i in range(start, start + total):
+                segment = RoadSegment.objects.create(
+                    longitude_start=i,
+                    latitude_start=30,
+                    longitude_end=i,
+                    latitude_end=31,
+                    length=100
+                )
+                SpeedReading.objects.create(road_segment=segment, average_speed=30.0, timestamp=timezone.now())
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+
+    def test_list_query_count_is_constant(self):
+        """
+        Testa se o número de queries da listagem não cresce com o número de segmentos.
+        """
+        self.create_segments(2)
+        few, _ = self.count_queries('/api/segments/')
+        self.create_segments(8)
+        many, response = self.count_queries('/api/segments/')
+        self.assertEqual(few, many)
+        self.assertTrue(all(segment['total_readings'] == 1 for segment in response.data['results']))
+
+    def test_detail_query_count_is_constant(self):
+        """
+        Testa se o detalhe de um segmento usa sempre o mesmo número de queries.
+        """
+        self.create_segments(1)
+        segment = RoadSegment.objects.get()
+        few, _ = self.count_queries(f'/api/segments/{segment.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            for speed in range(9):
+                latest = SpeedReading.objects.create(road_segment=segment, average_speed=speed, timestamp=timezone.now())
+        many, response = self.count_queries(f'/api/segments/{segment.id}/')
+        self.assertEqual(few, many)
+        self.assertEqual(few, 1)
+        self.assertEqual(response.data['total_readings'], 10)
+        self.assertEqual(response.data['latest_reading']['id'], latest.id)
+        self.assertEqual(response.data['latest_reading']['intensity'], 'elevada')
+
+
+class SegmentStateTest(TestCase):
+    """
+    Testes para o estado atual dos segmentos (SegmentState).
+
+    Testa:
+    - Criação de leituras atualiza contador, última leitura e intensidade
+    - Alteração e remoção de leituras recalculam o estado
+    - Importação em bloco e comando rebuild_segment_state
+    - Inserção em bloco incremental: soma o bloco ao estado sem reler as leituras existentes
+    """
+
+    def setUp(self):
+        self.segment = RoadSegment.objects.create(
+            longitude_start=10,
+            latitude_start=30,
+            longitude_end=11,
+            latitude_end=31,
+            length=500
+        )
+        self.now = timezone.now()
+
+    def state(self):
+        return SegmentState.objects.get(road_segment=self.segment)
+
+    def test_state_follows_new_readings(self):
+        """
+        Testa se uma leitura mais antiga não substitui a última leitura.
+        """
+        latest = SpeedReading.objects.create(road_segment=self.segment, average_speed=15.0, timestamp=self.now)
+        SpeedReading.objects.create(road_segment=self.segment, average_speed=80.0, timestamp=self.now - timezone.timedelta(hours=1))
+
+        state = self.state()
+        self.assertEqual(state.reading_count, 2)
+        self.assertEqual(state.latest_reading_id, latest.id)
+        self.assertEqual(state.intensity, 'elevada')
+
+    def test_state_after_update_and_delete(self):
+        """
+        Testa se alterar e apagar a última leitura recalcula o estado.
+        """
+        older = SpeedReading.objects.create(road_segment=self.segment, average_speed=35.0, timestamp=self.now - timezone.timedelta(hours=1))
+        latest = SpeedReading.objects.create(road_segment=self.segment, average_speed=15.0, timestamp=self.now)
+
+        latest.average_speed = 70.0
+        latest.save()
+        self.assertEqual(self.state().intensity, 'baixa')
+
+        latest.delete()
+        state = self.state()
+        self.assertEqual(state.reading_count, 1)
+        self.assertEqual(state.latest_reading_id, older.id)
+        self.assertEqual(state.intensity, 'média')
+
+    def test_reading_moved_to_other_segment(self):
+        """
+        Testa se mudar uma leitura de segmento atualiza o estado dos dois segmentos.
+        """
+        other = RoadSegment.objects.create(longitude_start=1, latitude_start=1, longitude_end=2, latitude_end=2, length=10)
+        reading = SpeedReading.objects.create(road_segment=self.segment, average_speed=15.0, timestamp=self.now)
+        reading.road_segment = other
+        reading.save()
+
+        self.assertEqual(self.state().reading_count, 0)
+        self.assertIsNone(self.state().intensity)
+        self.assertEqual(SegmentState.objects.get(road_segment=other).reading_count, 1)
+
+    def test_deleting_segment_removes_state(self):
+        """
+        Testa se apagar um segmento (CASCADE) também apaga o estado.
+        """
+        SpeedReading.objects.create(road_segment=self.segment, average_speed=15.0, timestamp=self.now)
+        self.segment.delete()
+        self.assertFalse(SegmentState.objects.exists())
+
+    def test_rebuild_command(self):
+        """
+        Testa se o comando rebuild_segment_state repõe um estado inconsistente.
+        """
+        SpeedReading.objects.create(road_segment=self.segment, average_speed=15.0, timestamp=self.now)
+        SegmentState.objects.all().delete()
+
+        call_command('rebuild_segment_state', stdout=StringIO())
+        state = self.state()
+        self.assertEqual(state.reading_count, 1)
+        self.assertEqual(state.intensity, 'elevada')
+
+    def test_bulk_insert_is_incremental(self):
+        """
+        Testa se uma inserção em bloco soma as leituras ao estado (só as mais recentes substituem a última leitura),
+        sem recontar as leituras que já existem, e se o resultado é igual ao do rebuild_segment_state.
+        """
+        other = RoadSegment.objects.create(longitude_start=1, latitude_start=1, longitude_end=2, latitude_end=2, length=10)
+        latest = SpeedReading.objects.create(road_segment=self.segment, average_speed=15.0, timestamp=self.now)
+
+        with CaptureQueriesContext(connection) as queries:
+            insert_readings([
+                SpeedReading(road_segment=self.segment, average_speed=80.0, timestamp=self.now - timezone.timedelta(hours=1)),
+                SpeedReading(road_segment=other, average_speed=70.0, timestamp=self.now - timezone.timedelta(hours=1)),
+                SpeedReading(road_segment=other, average_speed=35.0, timestamp=self.now),
+            ])
+        self.assertFalse([query['sql'] for query in queries.captured_queries if 'COUNT(' in query['sql'].upper()])
+
+        state = self.state()
+        self.assertEqual(state.reading_count, 2)
+        self.assertEqual(state.latest_reading_id, latest.id)
+        self.assertEqual(state.intensity, 'elevada')
+        other_state = SegmentState.objects.get(road_segment=other)
+        self.assertEqual(other_state.reading_count, 2)
+        self.assertEqual(other_state.latest_speed, 35.0)
+        self.assertEqual(other_state.intensity, 'média')
+
+        # Uma leitura mais recente no bloco seguinte substitui a última leitura
+        newest, = insert_readings([SpeedReading(road_segment=self.segment, average_speed=90.0, timestamp=self.now + timezone.timedelta(minutes=5))])
+        state = self.state()
+        self.assertEqual((state.reading_count, state.latest_reading_id, state.intensity), (3, newest.id, 'baixa'))
+
+        fields = ('road_segment_id', 'reading_count', 'latest_reading_id', 'latest_speed', 'latest_timestamp', 'latest_created_at', 'intensity')
+        incremental = list(SegmentState.objects.order_by('pk').values_list(*fields))
+        call_command('rebuild_segment_state', stdout=StringIO())
+        self.assertEqual(list(SegmentState.objects.order_by('pk').values_list(*fields)), incremental)
+
+    def test_intensity_filter_uses_state(self):
+        """
+        Testa se o filtro ?intensity= usa a intensidade guardada no estado.
+        """
+        SpeedReading.objects.create(road_segment=self.segment, average_speed=35.0, timestamp=self.now)
+        response = APIClient().get('/api/segments/?intensity=media')
+        self.assertEqual([segment['id'] for segment in response.data['results']], [self.segment.id])
+
+
+class QueryPlanTest(TestCase):
+    """
+    Testes aos planos de execução (EXPLAIN) das queries geradas pelos ViewSets.
+
+    Com uma base de dados populada, verifica que as queries usam os índices
+    e não fazem uma leitura sequencial (Seq Scan) das tabelas.
+
+    No PostgreSQL é desativado o enable_seqscan: o planeador só volta a usar
+    um Seq Scan se não existir nenhum índice que sirva a query.
+    """
+
+    SEGMENTS = 50
+    READINGS_PER_SEGMENT = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        segments = RoadSegment.objects.bulk_create([
+            RoadSegment(longitude_start=i, latitude_start=30, longitude_end=i + 0.5, latitude_end=30.5, length=100)
+            for i in range(cls.SEGMENTS)
+        ])
+        segments = list(RoadSegment.objects.order_by('id'))
+        SpeedReading.objects.bulk_create([
+            SpeedReading(road_segment=segment, average_speed=(i * 7) % 90, timestamp=now - timezone.timedelta(minutes=i))
+            for segment in segments
+            for i in range(cls.READINGS_PER_SEGMENT)
+        ])
+        call_command('rebuild_segment_state', stdout=StringIO())
+        cls.segment = segments[0]
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def viewset_queryset(self, viewset_class, action, params=None):
+        """
+        Devolve o queryset que o ViewSet usaria para um pedido GET com os parâmetros indicados.
+        """
+        view = viewset_class()
+        view.action = action
+        view.request = Request(APIRequestFactory().get('/', params or {}))
+        view.format_kwarg = None
+        view.kwargs = {}
+        return view.get_queryset()
+
+    def assertUsesIndexes(self, queryset, *tables, index=None):
+        """
+        Falha se o plano de execução fizer uma leitura sequencial de alguma das tabelas
+        ou, se indicado, se não usar o índice esperado.
+        """
+        plan = queryset.explain()
+        if index:
+            self.assertIn(index, plan, f'O índice {index} não foi usado:\n{plan}')
+        for table in tables:
+            if connection.vendor == 'postgresql':
+                sequential = f'Seq Scan on {table}' in plan
+            else:
+                # SQLite: "SCAN tabela" sem índice é uma leitura completa da tabela
+                sequential = re.search(rf'SCAN {table}\b(?! USING (COVERING )?INDEX)', plan) is not None
+            self.assertFalse(sequential, f'Leitura sequencial de {table}:\n{plan}')
+
+    def test_readings_by_segment(self):
+        """
+        GET /api/readings/?road_segment=X usa o índice (road_segment, timestamp) da restrição única.
+        """
+        queryset = self.viewset_queryset(SpeedReadingViewSet, 'list', {'road_segment': self.segment.id})
+        index = 'speed_read_seg_ts_uniq' if connection.vendor == 'postgresql' else 'sqlite_autoindex_speed_readings'
+        self.assertUsesIndexes(queryset[:100], 'speed_readings', index=index)
+
+    def test_deep_page_of_readings(self):
+        """
+        Uma página a meio da listagem (cursor) continua a usar o índice (timestamp, id), sem OFFSET.
+        """
+        reading = SpeedReading.objects.order_by('-timestamp', '-id')[500]
+        pagination = SpeedReadingPagination()
+        queryset = self.viewset_queryset(SpeedReadingViewSet, 'list').order_by(*pagination.ordering).filter(
+            pagination.keyset_filter(pagination.ordering, [reading.timestamp, reading.id])
+        )
+        self.assertNotIn('OFFSET', str(queryset[:100].query))
+        self.assertUsesIndexes(queryset[:100], 'speed_readings', index='speed_read_ts_id_idx')
+
+    def test_latest_readings(self):
+        """
+        GET /api/readings/ (primeira página, mais recentes primeiro) usa o índice do timestamp.
+        """
+        queryset = self.viewset_queryset(SpeedReadingViewSet, 'list')
+        self.assertUsesIndexes(queryset[:100], 'speed_readings', index='speed_read_ts_id_idx')
+
+    def test_segments_by_intensity(self):
+        """
+        GET /api/segments/?intensity=elevada usa o índice da intensidade do SegmentState.
+        """
+        queryset = self.viewset_queryset(RoadSegmentViewSet, 'list', {'intensity': 'elevada'})
+        self.assertUsesIndexes(queryset, 'segment_states', 'road_segments')
+
+    def test_segment_detail(self):
+        """
+        GET /api/segments/{id}/ usa as chaves primárias.
+        """
+        queryset = self.viewset_queryset(RoadSegmentViewSet, 'retrieve').filter(pk=self.segment.id)
+        self.assertUsesIndexes(queryset, 'segment_states', 'road_segments')
+
+    def test_import_dedup_lookup(self):
+        """
+        A procura de um segmento pelas coordenadas (import_data) usa o índice da restrição única das coordenadas.
+        """
+        queryset = RoadSegment.objects.filter(
+            longitude_start=self.segment.longitude_start,
+            latitude_start=self.segment.latitude_start,
+            longitude_end=self.segment.longitude_end,
+            latitude_end=self.segment.latitude_end,
+        )
+        # No SQLite o índice de uma restrição UNIQUE tem um nome automático (sqlite_autoindex_...)
+        index = 'road_seg_coords_uniq' if connection.vendor == 'postgresql' else 'sqlite_autoindex_road_segments'
+        self.assertUsesIndexes(queryset, 'road_segments', index=index)
+
+
+class CursorPaginationTest(TestCase):
+    """
+    Testes para a paginação por cursor de /api/readings/ e /api/segments/.
+
+    Testa:
+    - Percorrer todas as páginas sem repetir nem perder elementos (incluindo empates no timestamp)
+    - Voltar à página anterior
+    - Limite máximo de ?page_size=
+    - Cursor inválido
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()  # As respostas dos segmentos ficam em cache entre testes
+        self.segments = [
+            RoadSegment.objects.create(longitude_start=10 + i, latitude_start=30, longitude_end=11 + i, latitude_end=31, length=500)
+            for i in range(3)
+        ]
+        now = timezone.now()
+        # Várias leituras (de segmentos diferentes) com o mesmo timestamp, para testar o desempate pelo id
+        for i in range(25):
+            SpeedReading.objects.create(
+                road_segment=self.segments[i % 3],
+                average_speed=i,
+                timestamp=now - timezone.timedelta(minutes=i // 3)
+            )
+
+    def collect(self, url):
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            ids.extend(reading['id'] for reading in response.data['results'])
+            url = response.data['next']
+        return ids, pages
+
+    def test_walk_all_reading_pages(self):
+        """
+        Testa se todas as leituras aparecem uma única vez, pela ordem (-timestamp, -id).
+        """
+        ids, pages = self.collect('/api/readings/?page_size=4')
+        expected = list(SpeedReading.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), 7)
+        self.assertIsNone(pages[0]['previous'])
+
+    def test_previous_page(self):
+        """
+        Testa se o link previous devolve a página anterior.
+        """
+        _, pages = self.collect('/api/readings/?page_size=4')
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+    def test_segments_are_paginated_by_id(self):
+        """
+        Testa a paginação dos segmentos.
+        """
+        for i in range(4):
+            RoadSegment.objects.create(longitude_start=i, latitude_start=0, longitude_end=i, latitude_end=1, length=1)
+        ids, pages = self.collect('/api/segments/?page_size=2')
+        self.assertEqual(ids, list(RoadSegment.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(len(pages), 4)
+
+    def test_page_size_limit(self):
+        """
+        Testa se o ?page_size= não ultrapassa o MAX_PAGE_SIZE.
+        """
+        with self.settings(MAX_PAGE_SIZE=10):
+            response = self.client.get('/api/readings/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_invalid_cursor(self):
+        """
+        Testa se um cursor inválido devolve 404.
+        """
+        response = self.client.get('/api/readings/?cursor=invalido')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BulkReadingsTest(TestCase):
+    """
+    Testes para POST /api/readings/bulk/.
+
+    Testa:
+    - Criação de várias leituras (lista JSON e NDJSON)
+    - Leituras inválidas devolvidas em errors sem impedir as restantes
+    - Número de queries não cresce com o número de leituras
+    - Apenas administradores podem enviar leituras
+    - Uma leitura gravada por um pedido em simultâneo (depois da validação) é devolvida em errors, sem erro 500
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='admin', is_staff=True)
+        self.token = Token.objects.create(user=self.admin)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.segment = RoadSegment.objects.create(
+            longitude_start=10,
+            latitude_start=30,
+            longitude_end=11,
+            latitude_end=31,
+            length=500
+        )
+        self.minute = 0     # Cada leitura tem um timestamp diferente (um minuto depois da anterior)
+
+    def reading(self, speed, segment=None, minute=None):
+        self.minute += 1
+        return {
+            'road_segment': segment or self.segment.id,
+            'average_speed': speed,
+            'timestamp': (
+                datetime(2024, 12, 17, 14, tzinfo=dt_timezone.utc) + timezone.timedelta(minutes=self.minute if minute is None else minute)
+            ).isoformat(),
+        }
+
+    def test_bulk_create_with_errors(self):
+        """
+        Testa se as leituras válidas são criadas e as inválidas devolvidas com a posição.
+        """
+        data = [self.reading(15.0), self.reading('abc'), self.reading(35.0, segment=9999), self.reading(70.0)]
+        response = self.client.post('/api/readings/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('average_speed', response.data['errors'][0]['errors'])
+        self.assertIn('road_segment', response.data['errors'][1]['errors'])
+        self.assertEqual(SpeedReading.objects.count(), 2)
+        self.assertEqual(SegmentState.objects.get(road_segment=self.segment).reading_count, 2)
+
+    def test_concurrent_duplicate_is_error(self):
+        """
+        Testa se uma leitura gravada por outro pedido entre a validação e o INSERT passa a erro (e não a 500).
+        """
+        data = [self.reading(15.0), self.reading(25.0), self.reading(35.0)]
+        original = validate_bulk_readings
+        calls = []
+
+        def validate_then_race(items):
+            result = original(items)
+            if not calls:
+                # Outro pedido grava a 2ª leitura depois de esta já ter sido validada
+                SpeedReading.objects.create(
+                    road_segment=self.segment, average_speed=99.0, timestamp=datetime.fromisoformat(data[1]['timestamp'])
+                )
+            calls.append(1)
+            return result
+
+        with mock.patch('traffic_monitor.views.validate_bulk_readings', validate_then_race):
+            response = self.client.post('/api/readings/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertIn('timestamp', response.data['errors'][0]['errors'])
+        self.assertEqual(sorted(SpeedReading.objects.values_list('average_speed', flat=True)), [15.0, 35.0, 99.0])
+
+    def test_bulk_create_ndjson(self):
+        """
+        Testa o envio das leituras em NDJSON (uma por linha).
+        """
+        body = '\n'.join(json.dumps(self.reading(speed)) for speed in (10.0, 20.0, 30.0)) + '\n'
+        response = self.client.post('/api/readings/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+
+    def test_all_invalid_returns_400(self):
+        """
+        Testa se uma lista sem leituras válidas devolve 400.
+        """
+        response = self.client.post('/api/readings/bulk/', [{'road_segment': 'x'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['created'], 0)
+
+    def test_duplicate_readings_are_errors(self):
+        """
+        Testa se uma leitura repetida (mesmo segmento e timestamp, na lista ou já na db) é devolvida em errors.
+        """
+        SpeedReading.objects.create(road_segment=self.segment, average_speed=10.0, timestamp=datetime(2024, 12, 17, 14, tzinfo=dt_timezone.utc))
+        data = [self.reading(15.0, minute=0), self.reading(20.0, minute=1), self.reading(25.0, minute=1)]
+        response = self.client.post('/api/readings/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 2])
+        self.assertIn('timestamp', response.data['errors'][0]['errors'])
+
+    def test_query_count_is_constant(self):
+        """
+        Testa se enviar 5 ou 50 leituras usa o mesmo número de queries.
+        """
+        counts = []
+        for total in (5, 50):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post('/api/readings/bulk/', [self.reading(i) for i in range(total)], format='json')
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_anonymous_cannot_bulk_create(self):
+        """
+        Testa se um utilizador anónimo não pode enviar leituras.
+        """
+        response = APIClient().post('/api/readings/bulk/', [self.reading(15.0)], format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class AggregateReadingsTest(TestCase):
+    """
+    Testes para GET /api/readings/aggregate/.
+
+    Testa:
+    - Agrupamento por hora e por 5 minutos
+    - Filtros por segmento e intervalo de tempo
+    - Histograma de intensidade
+    - Percentis (apenas PostgreSQL)
+    - Parâmetros inválidos
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.segment = RoadSegment.objects.create(longitude_start=10, latitude_start=30, longitude_end=11, latitude_end=31, length=500)
+        self.other = RoadSegment.objects.create(longitude_start=12, latitude_start=30, longitude_end=13, latitude_end=31, length=500)
+        base = datetime(2024, 12, 17, 14, 0, tzinfo=dt_timezone.utc)
+        # 14:00, 14:02, 14:07 e 15:01 no segmento principal
+        for minutes, speed in ((0, 10.0), (2, 30.0), (7, 60.0), (61, 40.0)):
+            SpeedReading.objects.create(road_segment=self.segment, average_speed=speed, timestamp=base + timezone.timedelta(minutes=minutes))
+        SpeedReading.objects.create(road_segment=self.other, average_speed=90.0, timestamp=base)
+
+    def get(self, params):
+        return self.client.get('/api/readings/aggregate/', params)
+
+    def rows(self, response):
+        """
+        Converte as linhas compactas em dicionários (coluna → valor).
+        """
+        return [dict(zip(response.data['columns'], row)) for row in response.data['rows']]
+
+    def test_hourly_buckets(self):
+        """
+        Testa o agrupamento por hora de um segmento.
+        """
+        response = self.get({'bucket': '1h', 'road_segment': self.segment.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = self.rows(response)
+        self.assertEqual([row['bucket'] for row in rows], ['2024-12-17T14:00:00Z', '2024-12-17T15:00:00Z'])
+        self.assertEqual(rows[0]['count'], 3)
+        self.assertAlmostEqual(rows[0]['avg'], 100 / 3)
+        self.assertEqual((rows[0]['min'], rows[0]['max']), (10.0, 60.0))
+
+    def test_five_minute_buckets_with_time_range(self):
+        """
+        Testa o agrupamento por 5 minutos, limitado a um intervalo de tempo.
+        """
+        response = self.get({'bucket': '5m', 'from': '2024-12-17T14:00:00Z', 'to': '2024-12-17T15:00:00Z'})
+        rows = self.rows(response)
+        self.assertEqual(
+            [(row['bucket'], row['road_segment'], row['count']) for row in rows],
+            [
+                ('2024-12-17T14:00:00Z', self.segment.id, 2),
+                ('2024-12-17T14:05:00Z', self.segment.id, 1),
+                ('2024-12-17T14:00:00Z', self.other.id, 1),
+            ]
+        )
+
+    def test_intensity_histogram(self):
+        """
+        Testa o histograma de intensidade (elevada / média / baixa) por bucket.
+        """
+        response = self.get({'bucket': '1d', 'road_segment': self.segment.id, 'histogram': 'true'})
+        row = self.rows(response)[0]
+        self.assertEqual((row['elevada'], row['média'], row['baixa']), (1, 2, 1))
+
+    @skipUnless(connection.vendor == 'postgresql', 'Percentis apenas em PostgreSQL')
+    def test_percentiles(self):
+        """
+        Testa o cálculo da mediana por bucket.
+        """
+        response = self.get({'bucket': '1h', 'road_segment': self.segment.id, 'percentiles': '50'})
+        self.assertEqual(self.rows(response)[0]['p50'], 30.0)
+
+    @skipIf(connection.vendor == 'postgresql', 'Percentis disponíveis em PostgreSQL')
+    def test_percentiles_unsupported(self):
+        """
+        Testa se os percentis são recusados fora do PostgreSQL.
+        """
+        response = self.get({'percentiles': '50'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_parameters(self):
+        """
+        Testa se bucket, datas e segmento inválidos devolvem 400.
+        """
+        self.assertEqual(self.get({'bucket': '7m'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get({'from': 'ontem'}).status_code, status.HTTP_400_BAD_REQUEST)
+        for url in ('/api/readings/aggregate/', '/api/readings/', '/api/readings/export/', '/api/incidents/'):
+            response = self.client.get(url, {'road_segment': 'abc'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+            self.assertIn('road_segment', response.data)
+
+
+class SpeedRollupTest(TestCase):
+    """
+    Testes para as estatísticas pré-calculadas (rollups) por hora e por dia.
+
+    Testa:
+    - Atualização ao criar leituras (uma a uma e em bloco)
+    - Recálculo ao alterar e apagar leituras
+    - Comando rebuild_rollups
+    - Leitura dos rollups no GET /api/readings/aggregate/ (mesmo resultado que as leituras)
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.segment = RoadSegment.objects.create(longitude_start=10, latitude_start=30, longitude_end=11, latitude_end=31, length=500)
+        self.base = datetime(2024, 12, 17, 14, 0, tzinfo=dt_timezone.utc)
+
+    def create(self, minutes, speed):
+        return SpeedReading.objects.create(road_segment=self.segment, average_speed=speed, timestamp=self.base + timezone.timedelta(minutes=minutes))
+
+    def hourly(self):
+        return [
+            (rollup.bucket.hour, rollup.count, rollup.speed_min, rollup.speed_max, rollup.average_speed)
+            for rollup in HourlySpeedRollup.objects.filter(road_segment=self.segment)
+        ]
+
+    def test_created_readings_update_rollups(self):
+        """
+        Testa se as leituras criadas (uma a uma e em bloco) são somadas aos rollups.
+        """
+        self.create(0, 10.0)
+        self.create(30, 30.0)
+        insert_readings([
+            SpeedReading(road_segment=self.segment, average_speed=50.0, timestamp=self.base + timezone.timedelta(minutes=45)),
+            SpeedReading(road_segment=self.segment, average_speed=70.0, timestamp=self.base + timezone.timedelta(minutes=75)),
+        ])
+
+        self.assertEqual(self.hourly(), [(14, 3, 10.0, 50.0, 30.0), (15, 1, 70.0, 70.0, 70.0)])
+        daily = DailySpeedRollup.objects.get(road_segment=self.segment)
+        self.assertEqual((daily.count, daily.speed_min, daily.speed_max, daily.average_speed), (4, 10.0, 70.0, 40.0))
+
+    def test_updated_and_deleted_readings_recompute_rollups(self):
+        """
+        Testa se alterar ou apagar uma leitura recalcula os buckets afetados (incluindo mínimo e máximo).
+        """
+        low = self.create(0, 10.0)
+        self.create(30, 30.0)
+
+        low.average_speed = 20.0
+        low.timestamp = self.base + timezone.timedelta(minutes=70)
+        low.save()
+        self.assertEqual(self.hourly(), [(14, 1, 30.0, 30.0, 30.0), (15, 1, 20.0, 20.0, 20.0)])
+
+        low.delete()
+        self.assertEqual(self.hourly(), [(14, 1, 30.0, 30.0, 30.0)])
+        self.assertEqual(DailySpeedRollup.objects.get(road_segment=self.segment).count, 1)
+
+    def test_rebuild_command(self):
+        """
+        Testa se o comando rebuild_rollups repõe os rollups a partir das leituras.
+        """
+        self.create(0, 10.0)
+        self.create(90, 30.0)
+        HourlySpeedRollup.objects.all().delete()
+        DailySpeedRollup.objects.update(count=99)
+
+        call_command('rebuild_rollups', '--from', '2024-12-17', '--segment', str(self.segment.id), stdout=StringIO())
+
+        self.assertEqual(self.hourly(), [(14, 1, 10.0, 10.0, 10.0), (15, 1, 30.0, 30.0, 30.0)])
+        self.assertEqual(DailySpeedRollup.objects.get(road_segment=self.segment).count, 2)
+
+    def test_aggregate_reads_rollups(self):
+        """
+        Testa se o aggregate usa os rollups quando o intervalo coincide com as horas
+        e se o resultado é igual ao calculado a partir das leituras.
+        """
+        for minutes, speed in ((0, 10.0), (2, 30.0), (7, 60.0), (61, 40.0)):
+            self.create(minutes, speed)
+
+        params = {'bucket': '1h', 'road_segment': self.segment.id, 'from': '2024-12-17T14:00:00Z', 'to': '2024-12-17T16:00:00Z'}
+        from_rollups = self.client.get('/api/readings/aggregate/', params).data
+        # O histograma não existe nos rollups, por isso obriga a agregar as leituras
+        from_readings = self.client.get('/api/readings/aggregate/', {**params, 'histogram': 'true'}).data
+        self.assertEqual(from_rollups['source'], 'rollup')
+        self.assertEqual(from_readings['source'], 'raw')
+
+        self.assertEqual(len(from_rollups['rows']), 2)
+        for rollup_row, reading_row in zip(from_rollups['rows'], from_readings['rows']):
+            self.assertEqual(rollup_row[:3], reading_row[:3])
+            for rollup_value, reading_value in zip(rollup_row[3:], reading_row[3:7]):
+                self.assertAlmostEqual(rollup_value, reading_value)
+
+        # Um intervalo que não coincide com as horas é calculado a partir das leituras
+        response = self.client.get('/api/readings/aggregate/', {**params, 'from': '2024-12-17T14:01:00Z'})
+        self.assertEqual(response.data['source'], 'raw')
+
+
+class SegmentResponseCacheTest(TestCase):
+    """
+    Testes para a cache das respostas GET /api/segments/ e /api/segments/{id}/.
+
+    Testa:
+    - Pedidos repetidos não fazem queries
+    - Invalidação ao criar leituras e ao alterar segmentos (depois do commit)
+    - Uma só invalidação (get_many + set_many) por transação, qualquer que seja o número de escritas e segmentos
+    - ETag e If-None-Match (304 sem corpo)
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.segment = RoadSegment.objects.create(longitude_start=10, latitude_start=30, longitude_end=11, latitude_end=31, length=500)
+            self.other = RoadSegment.objects.create(longitude_start=12, latitude_start=30, longitude_end=13, latitude_end=31, length=500)
+            SpeedReading.objects.create(road_segment=self.segment, average_speed=15.0, timestamp=timezone.now())
+
+    def test_repeated_requests_use_cache(self):
+        """
+        Testa se o segundo pedido igual é servido sem queries, e se parâmetros diferentes não partilham a resposta.
+        """
+        url = f'/api/segments/{self.segment.id}/'
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+
+        self.assertEqual(len(self.client.get('/api/segments/?intensity=elevada').data['results']), 1)
+        self.assertEqual(len(self.client.get('/api/segments/?intensity=baixa').data['results']), 0)
+
+    def test_new_reading_invalidates_segment_and_list(self):
+        """
+        Testa se uma nova leitura invalida o detalhe do segmento e a listagem filtrada.
+        """
+        self.client.get(f'/api/segments/{self.segment.id}/')
+        self.client.get('/api/segments/?intensity=baixa')
+        self.client.get(f'/api/segments/{self.other.id}/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SpeedReading.objects.create(road_segment=self.segment, average_speed=80.0, timestamp=timezone.now())
+
+        self.assertEqual(self.client.get(f'/api/segments/{self.segment.id}/').data['total_readings'], 2)
+        self.assertEqual(len(self.client.get('/api/segments/?intensity=baixa').data['results']), 1)
+        # O outro segmento não mudou, continua em cache
+        with self.assertNumQueries(0):
+            self.client.get(f'/api/segments/{self.other.id}/')
+
+    def test_segment_update_invalidates_cache(self):
+        """
+        Testa se alterar e apagar um segmento invalida as respostas em cache.
+        """
+        url = f'/api/segments/{self.segment.id}/'
+        self.client.get(url)
+        self.client.get('/api/segments/')
+
+        self.segment.length = 750
+        with self.captureOnCommitCallbacks(execute=True):
+            self.segment.save()
+        self.assertEqual(self.client.get(url).data['length'], 750)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        self.assertEqual([item['id'] for item in self.client.get('/api/segments/').data['results']], [self.segment.id])
+
+    def test_one_invalidation_per_transaction(self):
+        """
+        Testa se as escritas de uma transação (ex.: um bloco do import_data) invalidam a cache uma só vez, depois
+        do commit, com um pedido get_many e um set_many para todos os segmentos (e não um incr por segmento).
+        """
+        segments = [self.segment, self.other]
+        with mock.patch('traffic_monitor.signals.invalidate_segments', wraps=invalidate_segments) as invalidate, \
+                mock.patch.object(cache, 'incr', side_effect=AssertionError('incr por segmento')):
+            with self.captureOnCommitCallbacks(execute=True):
+                for chunk in range(3):
+                    insert_readings([
+                        SpeedReading(road_segment=segment, average_speed=50.0, timestamp=timezone.now() + timezone.timedelta(seconds=chunk))
+                        for segment in segments
+                    ])
+                self.assertFalse(invalidate.called)      # Nada antes do commit
+        invalidate.assert_called_once_with({self.segment.id, self.other.id})
+        self.assertEqual(self.client.get(f'/api/segments/{self.other.id}/').data['total_readings'], 3)
+
+        # Fora de uma transação, invalida já
+        with mock.patch('traffic_monitor.signals.transaction.get_connection') as get_connection, \
+                mock.patch('traffic_monitor.signals.invalidate_segments') as invalidate:
+            get_connection.return_value.in_atomic_block = False
+            invalidate_cache([self.segment.id])
+        invalidate.assert_called_once_with([self.segment.id])
+
+    def test_etag_not_modified(self):
+        """
+        Testa se um pedido com o ETag atual recebe 304 sem corpo, e 200 depois de uma alteração.
+        """
+        url = f'/api/segments/{self.segment.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertTrue(etag)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SpeedReading.objects.create(road_segment=self.segment, average_speed=80.0, timestamp=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ReadingPartitionTest(TestCase):
+    """
+    Testes para o particionamento mensal da tabela speed_readings (comando partition_readings).
+
+    Testa:
+    - Filtro das leituras por intervalo de tempo (?from= e ?to=)
+    - Conversão da tabela, mantendo as leituras e a geração de ids (PostgreSQL)
+    - Só são lidas as partições do intervalo pedido (PostgreSQL)
+    - Retenção: remoção das partições antigas e recálculo do estado dos segmentos (PostgreSQL)
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.segment = RoadSegment.objects.create(longitude_start=10, latitude_start=30, longitude_end=11, latitude_end=31, length=500)
+        for month, speed in ((11, 10.0), (12, 30.0)):
+            SpeedReading.objects.create(road_segment=self.segment, average_speed=speed, timestamp=datetime(2024, month, 15, tzinfo=dt_timezone.utc))
+        self.recent = SpeedReading.objects.create(road_segment=self.segment, average_speed=60.0, timestamp=timezone.now())
+
+    def convert(self):
+        call_command('partition_readings', '--convert', stdout=StringIO())
+
+    def test_time_range_filter(self):
+        """
+        Testa se GET /api/readings/?from=&to= devolve apenas as leituras desse intervalo.
+        """
+        response = self.client.get('/api/readings/', {'from': '2024-12-01T00:00:00Z', 'to': '2025-01-01T00:00:00Z'})
+        self.assertEqual([reading['average_speed'] for reading in response.data['results']], [30.0])
+        self.assertEqual(self.client.get('/api/readings/', {'to': 'ontem'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipIf(connection.vendor == 'postgresql', 'Particionamento disponível em PostgreSQL')
+    def test_requires_postgresql(self):
+        """
+        Testa se o comando é recusado fora do PostgreSQL.
+        """
+        with self.assertRaises(CommandError):
+            self.convert()
+
+    @skipUnless(connection.vendor == 'postgresql', 'Particionamento apenas em PostgreSQL')
+    def test_convert_keeps_readings(self):
+        """
+        Testa se a conversão cria as partições mensais e mantém as leituras e a geração de ids.
+        """
+        self.convert()
+        self.assertTrue(is_partitioned())
+
+        names = [name for name, _month in list_partitions()]
+        self.assertEqual(names[:2], ['speed_readings_p2024_11', 'speed_readings_p2024_12'])
+        self.assertEqual(SpeedReading.objects.count(), 3)
+
+        reading = SpeedReading.objects.create(road_segment=self.segment, average_speed=45.0, timestamp=timezone.now())
+        self.assertGreater(reading.id, self.recent.id)
+        self.assertEqual(SegmentState.objects.get(road_segment=self.segment).latest_reading_id, reading.id)
+
+        # Converter novamente não faz nada
+        self.convert()
+        self.assertEqual(SpeedReading.objects.count(), 4)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Particionamento apenas em PostgreSQL')
+    def test_time_range_prunes_partitions(self):
+        """
+        Testa se o filtro por intervalo de tempo só lê a partição desse mês.
+        """
+        self.convert()
+        view = SpeedReadingViewSet()
+        view.action = 'list'
+        view.request = Request(APIRequestFactory().get('/', {'from': '2024-12-01T00:00:00Z', 'to': '2024-12-20T00:00:00Z'}))
+        view.format_kwarg = None
+        view.kwargs = {}
+
+        plan = view.get_queryset().order_by('-timestamp', '-id')[:100].explain()
+        self.assertIn('speed_readings_p2024_12', plan)
+        self.assertNotIn('speed_readings_p2024_11', plan)
+        self.assertNotIn('speed_readings_default', plan)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Particionamento apenas em PostgreSQL')
+    def test_retention_drops_old_partitions(self):
+        """
+        Testa se a retenção remove as partições antigas e recalcula o estado do segmento.
+        """
+        self.convert()
+        call_command('partition_readings', '--retention-months', '0', stdout=StringIO())
+
+        self.assertEqual(list(SpeedReading.objects.values_list('id', flat=True)), [self.recent.id])
+        self.assertNotIn('speed_readings_p2024_11', [name for name, _month in list_partitions()])
+        self.assertEqual(SegmentState.objects.get(road_segment=self.segment).reading_count, 1)
+
+
+class SpatialIndexTest(TestCase):
+    """
+    Testes para o índice espacial dos segmentos.
+
+    Testa:
+    - A grelha devolve o mesmo que percorrer todos os segmentos (área e mais próximos)
+    - GET /api/segments/?bbox= e parâmetros inválidos
+    - GET /api/segments/nearest/ (ordem e distância)
+    - Atualização do índice ao criar, alterar e apagar segmentos (incluindo em bloco)
+    """
+
+    def setUp(self):
+        cache.clear()  # Também obriga o índice espacial a ser reconstruído
+        self.client = APIClient()
+        # Três segmentos numa linha, a ~1 km uns dos outros
+        self.segments = [
+            RoadSegment.objects.create(
+                longitude_start=-8.60 + i * 0.012, latitude_start=41.15,
+                longitude_end=-8.595 + i * 0.012, latitude_end=41.15, length=400
+            )
+            for i in range(3)
+        ]
+
+    def bbox_ids(self, bbox):
+        response = self.client.get('/api/segments/', {'bbox': bbox})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [segment['id'] for segment in response.data['results']]
+
+    def test_grid_matches_full_scan(self):
+        """
+        Testa se a grelha devolve os mesmos segmentos que uma pesquisa em todos os segmentos.
+        """
+        rng = random.Random(1)
+        grid, segments = SegmentGrid(0.01), {}
+        for segment_id in range(500):
+            lon, lat = rng.uniform(0, 0.5), rng.uniform(0, 0.5)
+            segments[segment_id] = (lon, lat, lon + rng.uniform(-0.02, 0.02), lat + rng.uniform(-0.02, 0.02))
+            grid.add(segment_id, segments[segment_id])
+
+        for _ in range(50):
+            lon, lat = rng.uniform(0, 0.5), rng.uniform(0, 0.5)
+            box = (lon, lat, lon + 0.05, lat + 0.03)
+            expected = sorted(i for i, coords in segments.items() if segment_intersects_box(*coords, *box))
+            self.assertEqual(sorted(grid.query_bbox(*box)), expected)
+
+            by_distance = sorted((distance_to_segment(lon, lat, coords), i) for i, coords in segments.items())
+            self.assertEqual([i for i, _distance in grid.nearest(lon, lat, 5)], [i for _distance, i in by_distance[:5]])
+
+    def test_bbox_filter(self):
+        """
+        Testa se ?bbox= devolve apenas os segmentos que atravessam a área.
+        """
+        first, second, third = self.segments
+        self.assertEqual(self.bbox_ids('-8.61,41.14,-8.59,41.16'), [first.id])
+        self.assertEqual(self.bbox_ids('-8.597,41.14,-8.58,41.16'), [first.id, second.id])
+        self.assertEqual(self.bbox_ids('0,0,1,1'), [])
+
+        for bbox in ('1,2,3', '-8.5,41,-8.6,42', 'a,b,c,d'):
+            self.assertEqual(self.client.get('/api/segments/', {'bbox': bbox}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_nearest(self):
+        """
+        Testa se /api/segments/nearest/ devolve os segmentos por ordem de distância.
+        """
+        first, second, third = self.segments
+        response = self.client.get('/api/segments/nearest/', {'lon': -8.575, 'lat': 41.151, 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([segment['id'] for segment in response.data], [third.id, second.id])
+        self.assertAlmostEqual(response.data[0]['distance'], 111.3, delta=1)
+
+        self.assertEqual(self.client.get('/api/segments/nearest/', {'lat': 41}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_index_follows_writes(self):
+        """
+        Testa se o índice acompanha a criação, alteração e remoção de segmentos (também em bloco).
+        """
+        first, second, third = self.segments
+        self.assertEqual(self.bbox_ids('-8.61,41.14,-8.59,41.16'), [first.id])
+
+        first.latitude_start = first.latitude_end = 41.5
+        first.save()
+        second.delete()
+        new = RoadSegment.objects.create(longitude_start=-8.605, latitude_start=41.15, longitude_end=-8.604, latitude_end=41.15, length=80)
+        self.assertEqual(self.bbox_ids('-8.61,41.14,-8.58,41.16'), [new.id])
+
+        # A cache das respostas é invalidada depois do commit
+        with self.captureOnCommitCallbacks(execute=True):
+            write_chunk([((-8.609, 41.155, -8.608, 41.155), 90, 40.0, None)], SegmentResolver())
+        self.assertEqual(len(self.bbox_ids('-8.61,41.14,-8.58,41.16')), 2)
+
+
+class SegmentGeoJSONTest(TestCase):
+    """
+    Testes para GET /api/segments/geojson/ e /api/segments/tiles/{z}/{x}/{y}/.
+
+    Testa:
+    - FeatureCollection com uma LineString por segmento e a intensidade atual
+    - Resposta em streaming, sem queries por segmento
+    - Filtros por intensidade
+    - Tiles: apenas os segmentos do tile, e tiles inválidos
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.porto = RoadSegment.objects.create(longitude_start=-8.61, latitude_start=41.15, longitude_end=-8.60, latitude_end=41.151, length=800)
+        self.lisboa = RoadSegment.objects.create(longitude_start=-9.14, latitude_start=38.72, longitude_end=-9.13, latitude_end=38.72, length=870)
+        SpeedReading.objects.create(road_segment=self.porto, average_speed=15.0, timestamp=datetime(2024, 12, 17, 14, 0, tzinfo=dt_timezone.utc))
+
+    def get_geojson(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/geo+json; charset=utf-8')
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_feature_collection(self):
+        """
+        Testa se cada segmento é uma Feature LineString com a intensidade e a última leitura.
+        """
+        data = self.get_geojson('/api/segments/geojson/')
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual([feature['id'] for feature in data['features']], [self.porto.id, self.lisboa.id])
+
+        feature = data['features'][0]
+        self.assertEqual(feature['geometry'], {'type': 'LineString', 'coordinates': [[-8.61, 41.15], [-8.60, 41.151]]})
+        self.assertEqual(feature['properties'], {
+            'length': 800.0, 'intensity': 'elevada', 'latest_speed': 15.0,
+            'latest_timestamp': '2024-12-17T14:00:00Z', 'total_readings': 1,
+        })
+        self.assertIsNone(data['features'][1]['properties']['intensity'])
+
+    def test_query_count_does_not_grow(self):
+        """
+        Testa se a exportação usa o mesmo número de queries com 2 ou 20 segmentos.
+        """
+        def count():
+            with CaptureQueriesContext(connection) as queries:
+                b''.join(self.client.get('/api/segments/geojson/').streaming_content)
+            return len(queries)
+
+        few = count()
+        RoadSegment.objects.bulk_create([
+            RoadSegment(longitude_start=i, latitude_start=0, longitude_end=i + 0.1, latitude_end=0, length=10) for i in range(18)
+        ])
+        self.assertEqual(count(), few)
+
+    def test_intensity_filter(self):
+        """
+        Testa o filtro por intensidade na exportação.
+        """
+        data = self.get_geojson('/api/segments/geojson/', {'intensity': 'elevada'})
+        self.assertEqual([feature['id'] for feature in data['features']], [self.porto.id])
+
+    def test_tiles(self):
+        """
+        Testa se um tile só devolve os segmentos dessa área, e se um tile inválido devolve 404.
+        """
+        # Tile de zoom 10 que contém o Porto
+        data = self.get_geojson('/api/segments/tiles/10/487/383/')
+        self.assertEqual([feature['id'] for feature in data['features']], [self.porto.id])
+
+        data = self.get_geojson('/api/segments/tiles/0/0/0/')
+        self.assertEqual(len(data['features']), 2)
+
+        self.assertEqual(self.client.get('/api/segments/tiles/2/4/0/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ReadingExportTest(TestCase):
+    """
+    Testes para GET /api/readings/export/ e para o comando export_data.
+
+    Testa:
+    - CSV (com cabeçalho) e NDJSON, por ordem de data
+    - Filtros por segmento e intervalo de tempo
+    - Número de queries constante (sem queries por leitura)
+    - Comando export_data para ficheiro
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.segment = RoadSegment.objects.create(longitude_start=10, latitude_start=30, longitude_end=11, latitude_end=31, length=500)
+        self.other = RoadSegment.objects.create(longitude_start=12, latitude_start=30, longitude_end=13, latitude_end=31, length=500)
+        base = datetime(2024, 12, 17, 14, 0, tzinfo=dt_timezone.utc)
+        self.readings = [
+            SpeedReading.objects.create(road_segment=segment, average_speed=speed, timestamp=base + timezone.timedelta(hours=hours))
+            for segment, speed, hours in ((self.segment, 60.0, 2), (self.segment, 15.0, 0), (self.other, 35.0, 1))
+        ]
+
+    def export(self, params):
+        response = self.client.get('/api/readings/export/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        """
+        Testa a exportação em CSV, ordenada por data, com a intensidade calculada.
+        """
+        response, content = self.export({})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="readings.csv"')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'id,road_segment,average_speed,intensity,timestamp,created_at')
+        self.assertEqual(
+            [line.split(',')[:5] for line in lines[1:]],
+            [
+                [str(self.readings[1].id), str(self.segment.id), '15.0', 'elevada', '2024-12-17T14:00:00Z'],
+                [str(self.readings[2].id), str(self.other.id), '35.0', 'média', '2024-12-17T15:00:00Z'],
+                [str(self.readings[0].id), str(self.segment.id), '60.0', 'baixa', '2024-12-17T16:00:00Z'],
+            ]
+        )
+
+    def test_ndjson_with_filters(self):
+        """
+        Testa a exportação em NDJSON, filtrada por segmento e intervalo de tempo.
+        """
+        response, content = self.export({
+            'output': 'ndjson', 'road_segment': self.segment.id,
+            'from': '2024-12-17T15:00:00Z', 'to': '2024-12-18T00:00:00Z',
+        })
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(row['id'], row['average_speed'], row['intensity']) for row in rows], [(self.readings[0].id, 60.0, 'baixa')])
+
+        self.assertEqual(self.client.get('/api/readings/export/', {'output': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_does_not_grow(self):
+        """
+        Testa se exportar 3 ou 53 leituras usa o mesmo número de queries.
+        """
+        def count():
+            with CaptureQueriesContext(connection) as queries:
+                self.export({})
+            return len(queries)
+
+        few = count()
+        insert_readings([SpeedReading(road_segment=self.other, average_speed=50.0, timestamp=timezone.now()) for _ in range(50)])
+        self.assertEqual(count(), few)
+
+    def test_export_command(self):
+        """
+        Testa o comando export_data para um ficheiro, com filtro por segmento.
+        """
+        path = os.path.join(tempfile.mkdtemp(), 'readings.ndjson')
+        call_command('export_data', '--file', path, '--output-format', 'ndjson', '--segment', str(self.other.id), stderr=StringIO())
+        with open(path, encoding='utf-8') as file:
+            rows = [json.loads(line) for line in file]
+        self.assertEqual([row['id'] for row in rows], [self.readings[2].id])
+
+        with self.assertRaises(CommandError):
+            call_command('export_data', '--from', 'ontem', stderr=StringIO())
+
+
+class FastReadingSerializerTest(TestCase):
+    """
+    Testes para a serialização rápida das leituras (SpeedReadingFastSerializer).
+
+    Testa:
+    - O JSON é igual byte a byte ao do SpeedReadingSerializer (incluindo os limites de intensidade e microssegundos)
+    - A listagem (com paginação e filtros) devolve exatamente a mesma resposta com e sem a serialização rápida
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.segment = RoadSegment.objects.create(longitude_start=10, latitude_start=30, longitude_end=11, latitude_end=31, length=500)
+        base = datetime(2024, 12, 17, 14, 0, tzinfo=dt_timezone.utc)
+        for i, speed in enumerate((0.0, 20.0, 20.01, 50.0, 50.5, 120.0)):
+            SpeedReading.objects.create(
+                road_segment=self.segment, average_speed=speed,
+                timestamp=base + timezone.timedelta(minutes=i, microseconds=i * 1234)
+            )
+
+    def test_same_json_as_model_serializer(self):
+        """
+        Testa se o JSON das duas serializações é igual byte a byte.
+        """
+        queryset = SpeedReading.objects.order_by('-timestamp', '-id')
+        fast = SpeedReadingFastSerializer()
+        self.assertEqual(
+            JSONRenderer().render(fast.to_representation(fast.prepare(queryset))),
+            JSONRenderer().render(SpeedReadingSerializer(queryset, many=True).data),
+        )
+
+    def test_list_response_is_identical(self):
+        """
+        Testa se a listagem paginada e filtrada é igual com e sem a serialização rápida.
+        """
+        urls = [
+            '/api/readings/?page_size=4',
+            f'/api/readings/?road_segment={self.segment.id}&from=2024-12-17T14:02:00Z',
+        ]
+        for url in urls:
+            fast = self.client.get(url)
+            with mock.patch.object(SpeedReadingViewSet, 'fast_serializer_class', None):
+                regular = self.client.get(url)
+            self.assertEqual(fast.status_code, status.HTTP_200_OK)
+            self.assertEqual(fast.content, regular.content)
+
+        # A página seguinte (cursor) também é igual
+        next_url = self.client.get(urls[0]).data['next']
+        with mock.patch.object(SpeedReadingViewSet, 'fast_serializer_class', None):
+            regular = self.client.get(next_url)
+        self.assertEqual(self.client.get(next_url).content, regular.content)
+
+
+class IntensityThresholdTest(TestCase):
+    """
+    Testes para a intensidade calculada na db (SpeedReadingQuerySet.with_intensity) e para os limites configuráveis.
+
+    Testa:
+    - A anotação na db dá o mesmo resultado que o intensity_for_speed (incluindo os valores nos limites)
+    - Os limites das settings e os limites próprios de cada segmento
+    - O filtro ?intensity= das leituras (com e sem acento, e valores inválidos)
+    - A alteração dos limites de um segmento atualiza o estado atual e valida a ordem dos limites
+    - O histograma da agregação usa os limites de cada segmento
+    - A agregação com ?intensity= dá o mesmo resultado por hora (sem rollups) e por 5 minutos
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'admin123')
+        self.city = RoadSegment.objects.create(longitude_start=0, latitude_start=0, longitude_end=1, latitude_end=1, length=100)
+        # Autoestrada: 60 km/h já é trânsito elevado
+        self.highway = RoadSegment.objects.create(
+            longitude_start=2, latitude_start=2, longitude_end=3, latitude_end=3, length=1000,
+            high_intensity_max_speed=60, medium_intensity_max_speed=90,
+        )
+        self.timestamp = datetime(2024, 12, 17, 14, 0, tzinfo=dt_timezone.utc)
+        for i, speed in enumerate((0.0, 20.0, 20.01, 50.0, 50.5, 60.0, 90.0, 120.0)):
+            for segment in (self.city, self.highway):
+                SpeedReading.objects.create(road_segment=segment, average_speed=speed, timestamp=self.timestamp + timezone.timedelta(minutes=i))
+
+    def test_annotation_matches_python(self):
+        """
+        Testa se a intensidade calculada na db é igual à calculada em Python.
+        """
+        readings = SpeedReading.objects.select_related('road_segment').with_intensity()
+        for reading in readings:
+            self.assertEqual(reading.speed_intensity, intensity_for_speed(reading.average_speed, reading.road_segment))
+            self.assertEqual(reading.speed_intensity, reading.intensity)
+
+        self.assertEqual(SpeedReading.objects.filter(road_segment=self.city).filter_intensity('elevada').count(), 2)
+        self.assertEqual(SpeedReading.objects.filter(road_segment=self.highway).filter_intensity('elevada').count(), 6)
+
+    def test_thresholds_from_settings(self):
+        """
+        Testa se os limites por defeito vêm das settings (os do segmento têm prioridade).
+        """
+        with self.settings(HIGH_INTENSITY_MAX_SPEED=30, MEDIUM_INTENSITY_MAX_SPEED=70):
+            self.assertEqual(intensity_for_speed(25), 'elevada')
+            self.assertEqual(intensity_for_speed(65, self.highway), 'média')
+            self.assertEqual(SpeedReading.objects.filter(road_segment=self.city).filter_intensity('média').count(), 3)
+            self.assertEqual(SpeedReading.objects.filter(road_segment=self.highway).filter_intensity('média').count(), 1)
+
+    def test_filter_readings_by_intensity(self):
+        """
+        Testa o filtro ?intensity= em /api/readings/ e a intensidade devolvida em cada leitura.
+        """
+        for value in ('média', 'media', 'Média'):
+            response = self.client.get(f'/api/readings/?intensity={value}&road_segment={self.city.id}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([item['average_speed'] for item in response.data['results']], [50.0, 20.01])
+
+        response = self.client.get(f'/api/readings/?intensity=elevada&road_segment={self.highway.id}')
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertTrue(all(item['intensity'] == 'elevada' for item in response.data['results']))
+
+        response = self.client.get('/api/readings/?intensity=invalida')
+        self.assertEqual(response.data['results'], [])
+
+    def test_segment_thresholds_update_state(self):
+        """
+        Testa se alterar os limites de um segmento atualiza a intensidade atual (e o filtro dos segmentos).
+        """
+        self.assertEqual(SegmentState.objects.get(road_segment=self.city).intensity, 'baixa')    # última leitura: 120 km/h
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.patch(
+            f'/api/segments/{self.city.id}/',
+            {'high_intensity_max_speed': 130, 'medium_intensity_max_speed': 150}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['latest_reading']['intensity'], 'elevada')
+        self.assertEqual(SegmentState.objects.get(road_segment=self.city).intensity, 'elevada')
+
+        response = self.client.get('/api/segments/?intensity=elevada')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.city.id])
+
+        # O limite da intensidade elevada não pode ser superior ao da média
+        response = self.client.patch(f'/api/segments/{self.city.id}/', {'high_intensity_max_speed': 200}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('high_intensity_max_speed', response.data)
+
+    def test_histogram_uses_segment_thresholds(self):
+        """
+        Testa se o histograma da agregação conta as intensidades com os limites de cada segmento.
+        """
+        response = self.client.get('/api/readings/aggregate/?bucket=1d&histogram=true')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        columns = response.data['columns']
+        histograms = {
+            row[1]: [row[columns.index(name)] for name in ('elevada', 'média', 'baixa')]
+            for row in response.data['rows']
+        }
+        self.assertEqual(histograms, {self.city.id: [2, 2, 4], self.highway.id: [6, 1, 1]})
+
+    def test_aggregate_with_intensity_filter(self):
+        """
+        Testa se o filtro ?intensity= é aplicado na agregação por hora (que, sem filtro, lê os rollups).
+        """
+        params = {'intensity': 'elevada', 'road_segment': self.highway.id}
+        hourly = self.client.get('/api/readings/aggregate/', {**params, 'bucket': '1h'}).data
+        five_minutes = self.client.get('/api/readings/aggregate/', {**params, 'bucket': '5m'}).data
+        self.assertEqual(hourly['source'], 'raw')
+
+        columns = hourly['columns']
+        (row,) = hourly['rows']
+        self.assertEqual(row[columns.index('count')], 6)
+        self.assertEqual(row[columns.index('count')], sum(item[columns.index('count')] for item in five_minutes['rows']))
+        self.assertAlmostEqual(row[columns.index('avg')], (0.0 + 20.0 + 20.01 + 50.0 + 50.5 + 60.0) / 6)
+        self.assertEqual(row[columns.index('max')], 60.0)
+
+        # Sem o filtro, a mesma hora vem dos rollups, com todas as leituras
+        response = self.client.get('/api/readings/aggregate/', {'bucket': '1h', 'road_segment': self.highway.id})
+        self.assertEqual(response.data['source'], 'rollup')
+        self.assertEqual(response.data['rows'][0][columns.index('count')], 8)
+
+
+class RealtimeStreamTest(TestCase):
+    """
+    Testes para os eventos em tempo real (pubsub.py e GET /api/stream/).
+
+    Testa:
+    - Novas leituras (individuais e em bloco) e mudanças de intensidade são publicadas depois do commit
+    - O filtro por segmentos e por área (bbox) de cada subscritor
+    - O endpoint SSE: formato dos eventos, keepalive e parâmetros inválidos
+    - Um subscritor lento perde os eventos mais antigos (fila limitada)
+    """
+
+    def setUp(self):
+        self.segment = RoadSegment.objects.create(longitude_start=-8.61, latitude_start=41.15, longitude_end=-8.60, latitude_end=41.15, length=800)
+        self.other = RoadSegment.objects.create(longitude_start=-9.20, latitude_start=38.70, longitude_end=-9.19, latitude_end=38.70, length=800)
+        self.timestamp = datetime(2024, 12, 17, 14, 0, tzinfo=dt_timezone.utc)
+
+    def tearDown(self):
+        for subscription in list(broker._subscriptions):
+            broker.unsubscribe(subscription)
+
+    def create_readings(self, *readings):
+        with self.captureOnCommitCallbacks(execute=True):
+            for segment, speed, minutes in readings:
+                SpeedReading.objects.create(road_segment=segment, average_speed=speed, timestamp=self.timestamp + timezone.timedelta(minutes=minutes))
+
+    def insert_bulk(self, speeds):
+        with self.captureOnCommitCallbacks(execute=True):
+            insert_readings([
+                SpeedReading(road_segment_id=self.segment.id, average_speed=speed, timestamp=self.timestamp + timezone.timedelta(hours=i + 1))
+                for i, speed in enumerate(speeds)
+            ])
+
+    async def receive(self, subscription, count):
+        events = [await subscription.get(timeout=1) for _ in range(count)]
+        self.assertIsNone(await subscription.get(timeout=0.05))    # não há mais eventos
+        return events
+
+    async def test_reading_and_intensity_events(self):
+        """
+        Testa os eventos de novas leituras e de mudança de intensidade (apenas do segmento subscrito).
+        """
+        subscription = broker.subscribe([self.segment.id])
+        await sync_to_async(self.create_readings)((self.segment, 15.0, 0), (self.other, 15.0, 0), (self.segment, 18.0, 1))
+
+        events = await self.receive(subscription, 3)
+        self.assertEqual([event['event'] for event in events], ['intensity', 'reading', 'reading'])
+        readings = [event['data'] for event in events if event['event'] == 'reading']
+        changes = [event['data'] for event in events if event['event'] == 'intensity']
+        self.assertEqual([reading['average_speed'] for reading in readings], [15.0, 18.0])
+        self.assertEqual(readings[0]['intensity'], 'elevada')
+        self.assertEqual(readings[0]['timestamp'], '2024-12-17T14:00:00Z')
+        # Só a primeira leitura muda a intensidade (sem estado → elevada)
+        self.assertEqual(changes, [{'road_segment': self.segment.id, 'intensity': 'elevada', 'previous': None}])
+
+        await sync_to_async(self.create_readings)((self.segment, 80.0, 2))
+        events = await self.receive(subscription, 2)
+        self.assertIn({'road_segment': self.segment.id, 'intensity': 'baixa', 'previous': 'elevada'}, [event['data'] for event in events])
+
+    async def test_bulk_readings_are_published(self):
+        """
+        Testa se as leituras criadas em bloco também são publicadas.
+        """
+        subscription = broker.subscribe()
+        await sync_to_async(self.insert_bulk)([30.0, 60.0])
+        events = await self.receive(subscription, 3)
+        self.assertEqual(
+            [event['data']['average_speed'] for event in events if event['event'] == 'reading'], [30.0, 60.0]
+        )
+        self.assertEqual([event['data']['intensity'] for event in events if event['event'] == 'intensity'], ['baixa'])
+
+    async def test_slow_subscriber_drops_oldest(self):
+        """
+        Testa se a fila de um subscritor lento está limitada e guarda os eventos mais recentes.
+        """
+        subscription = Subscription(queue_size=2)
+        for i in range(3):
+            subscription._put({'id': i})
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual([(await subscription.get(0))['id'] for _ in range(2)], [1, 2])
+
+    async def test_stream_endpoint(self):
+        """
+        Testa o endpoint SSE: cabeçalhos, formato dos eventos e keepalive.
+        """
+        with self.settings(REALTIME_KEEPALIVE=0.05):
+            response = await self.async_client.get(f'/api/stream/?road_segment={self.segment.id}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response['Content-Type'].startswith('text/event-stream'))
+
+            stream = aiter(response.streaming_content)
+            self.assertEqual(await anext(stream), b': ligado\n\n')
+
+            broker.publish('reading', {'road_segment': self.other.id})        # filtrado
+            broker.publish('intensity', {'road_segment': self.segment.id, 'intensity': 'média', 'previous': 'baixa'})
+            chunk = (await anext(stream)).decode()
+            self.assertRegex(chunk, r'^id: \d+\nevent: intensity\ndata: \{"road_segment":\d+,"intensity":"média","previous":"baixa"\}\n\n$')
+            self.assertEqual(await anext(stream), b': keepalive\n\n')
+            await stream.aclose()
+
+    async def test_stream_filters(self):
+        """
+        Testa o filtro por área (bbox) e os parâmetros inválidos.
+        """
+        response = await self.async_client.get('/api/stream/?road_segment=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.async_client.get('/api/stream/?bbox=1,2,3')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        cache.clear()
+        response = await self.async_client.get('/api/stream/?bbox=-8.7,41.1,-8.5,41.2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        subscription, = broker._subscriptions
+        self.assertEqual(subscription.segment_ids, {self.segment.id})
+
+
+class AsyncReadViewsTest(TestCase):
+    """
+    Testes para os endpoints de leitura assíncronos (async_views.py).
+
+    Testa:
+    - Listagem e detalhe dos segmentos, e listagem das leituras: a mesma resposta dos ViewSets (filtros e paginação)
+    - O estado atual de um segmento (/state/) e o ETag (304) das respostas em cache
+    - Erros: segmento inexistente, parâmetros inválidos e métodos que não sejam GET
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.segments = [
+            RoadSegment.objects.create(longitude_start=-8.61 + i * 0.01, latitude_start=41.15, longitude_end=-8.60 + i * 0.01, latitude_end=41.15, length=800)
+            for i in range(5)
+        ]
+        base = datetime(2024, 12, 17, 14, 0, tzinfo=dt_timezone.utc)
+        for i, segment in enumerate(self.segments[:4]):
+            for minutes in range(3):
+                SpeedReading.objects.create(
+                    road_segment=segment, average_speed=10.0 + i * 20 + minutes, timestamp=base + timezone.timedelta(minutes=minutes)
+                )
+
+    async def assert_same_response(self, url):
+        """
+        Compara a resposta de /api/async/... com a do ViewSet (os links das páginas diferem só no caminho).
+        """
+        expected = await sync_to_async(self.client.get)(url)
+        response = await self.async_client.get(url.replace('/api/', '/api/async/'))
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content.decode().replace('/api/async/', '/api/'), expected.content.decode())
+        return response.json()
+
+    async def test_segment_list(self):
+        """
+        Testa a listagem dos segmentos (com filtros e paginação).
+        """
+        data = await self.assert_same_response('/api/segments/?page_size=2')
+        await self.assert_same_response(data['next'].replace('http://testserver', '').replace('/api/async/', '/api/'))
+        await self.assert_same_response('/api/segments/?intensity=baixa')
+        await self.assert_same_response('/api/segments/?bbox=-8.62,41.1,-8.585,41.2')
+
+    async def test_segment_detail_and_state(self):
+        """
+        Testa o detalhe e o estado atual de um segmento.
+        """
+        segment = self.segments[1]
+        data = await self.assert_same_response(f'/api/segments/{segment.id}/')
+        self.assertEqual(data['total_readings'], 3)
+
+        response = await self.async_client.get(f'/api/async/segments/{segment.id}/state/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'road_segment': segment.id, 'total_readings': 3, 'intensity': 'média', 'latest_reading': data['latest_reading'],
+        })
+
+        response = await self.async_client.get(f'/api/async/segments/{self.segments[4].id}/state/')
+        self.assertEqual(response.json()['latest_reading'], None)
+
+        # Mesma cache (e ETag) dos ViewSets
+        response = await self.async_client.get(f'/api/async/segments/{segment.id}/')
+        response = await self.async_client.get(f'/api/async/segments/{segment.id}/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_reading_list(self):
+        """
+        Testa a listagem das leituras (com filtros e paginação).
+        """
+        data = await self.assert_same_response('/api/readings/?page_size=5')
+        self.assertEqual(len(data['results']), 5)
+        await self.assert_same_response(f'/api/readings/?road_segment={self.segments[0].id}&intensity=elevada')
+        await self.assert_same_response('/api/readings/?from=2024-12-17T14:01:00Z&to=2024-12-17T14:02:00Z')
+
+    async def test_errors(self):
+        """
+        Testa os erros (iguais aos dos ViewSets) e que só GET é aceite.
+        """
+        await self.assert_same_response('/api/segments/999999/')
+        await self.assert_same_response('/api/segments/?bbox=1,2,3')
+        await self.assert_same_response('/api/readings/?from=ontem')
+        await self.assert_same_response('/api/readings/?cursor=invalido')
+
+        response = await self.async_client.post('/api/async/segments/', {})
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class WriteBehindTest(TestCase):
+    """
+    Testes para a escrita diferida das leituras (writebehind.py).
+
+    Testa:
+    - POST /api/readings/ responde 202 e a leitura só é gravada (com o estado do segmento) no flush
+    - Leituras inválidas continuam a receber 400 e a fila cheia responde 503 com Retry-After
+    - As leituras de um journal de um processo que terminou são recuperadas e gravadas (e as já gravadas não)
+    - Leituras de segmentos apagados entretanto são descartadas
+    - Um lote gravado duas vezes não duplica leituras
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'admin123')
+        self.client.force_authenticate(user=self.admin)
+        self.segment = RoadSegment.objects.create(longitude_start=0, latitude_start=0, longitude_end=1, latitude_end=1, length=100)
+        self.journal_dir = tempfile.mkdtemp()
+
+    def make_queue(self, **kwargs):
+        queue = writebehind.ReadingQueue(journal_dir=self.journal_dir, background=False, **kwargs)
+        patcher = mock.patch.object(writebehind, '_queue', queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return queue
+
+    def post_reading(self, speed, minutes=0):
+        timestamp = datetime(2024, 12, 17, 14, minutes, tzinfo=dt_timezone.utc).isoformat()
+        with self.settings(READINGS_WRITE_BEHIND=True):
+            return self.client.post(
+                '/api/readings/', {'road_segment': self.segment.id, 'average_speed': speed, 'timestamp': timestamp}, format='json'
+            )
+
+    def test_create_is_queued_and_flushed(self):
+        """
+        Testa se a leitura é aceite (202) e gravada apenas no flush, em lote.
+        """
+        queue = self.make_queue(batch_size=10)
+        response = self.post_reading(15.0)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data, {
+            'status': 'queued', 'road_segment': self.segment.id, 'average_speed': 15.0, 'timestamp': '2024-12-17T14:00:00Z',
+        })
+        self.post_reading(80.0, minutes=1)
+        self.assertEqual(SpeedReading.objects.count(), 0)
+        self.assertEqual(len(queue), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(queue.flush(), 2)
+        self.assertEqual(SpeedReading.objects.count(), 2)
+        self.assertEqual(len(queue), 0)
+        state = SegmentState.objects.get(road_segment=self.segment)
+        self.assertEqual((state.reading_count, state.intensity), (2, 'baixa'))
+
+        # Tudo gravado → o journal fica vazio
+        with open(queue.journal.path, encoding='utf-8') as journal:
+            self.assertEqual(journal.read(), '')
+
+    def test_validation_and_backpressure(self):
+        """
+        Testa as leituras inválidas (400) e a fila cheia (503).
+        """
+        self.make_queue(max_pending=1)
+        with self.settings(READINGS_WRITE_BEHIND=True):
+            response = self.client.post('/api/readings/', {'road_segment': 9999, 'average_speed': 30.0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(self.post_reading(30.0).status_code, status.HTTP_202_ACCEPTED)
+        response = self.post_reading(31.0)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_recover_journal_after_restart(self):
+        """
+        Testa se um novo processo recupera apenas as leituras por gravar do journal anterior.
+        """
+        previous = writebehind.ReadingQueue(journal_dir=self.journal_dir, batch_size=2, background=False)
+        previous.put([writebehind.reading_record(self.segment.id, speed, timezone.now()) for speed in (10.0, 20.0, 30.0)])
+        previous.flush()                  # Grava as 2 primeiras
+        previous.journal.close()          # Processo termina sem gravar a 3ª
+
+        queue = writebehind.ReadingQueue(journal_dir=self.journal_dir, background=False)
+        self.assertEqual([record['average_speed'] for record in queue.pending], [30.0])
+        self.assertFalse(os.path.exists(previous.journal.path))
+        queue.stop()
+        self.assertEqual(sorted(SpeedReading.objects.values_list('average_speed', flat=True)), [10.0, 20.0, 30.0])
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+        # O comando faz o mesmo sem esperar por um pedido
+        previous = writebehind.ReadingQueue(journal_dir=self.journal_dir, background=False)
+        previous.put([writebehind.reading_record(self.segment.id, 40.0, timezone.now())])
+        previous.journal.close()
+        out = StringIO()
+        call_command('flush_readings_queue', journal_dir=self.journal_dir, stdout=out)
+        self.assertIn('Gravadas 1 leituras', out.getvalue())
+        self.assertEqual(SpeedReading.objects.count(), 4)
+
+    def test_replayed_batch_is_idempotent(self):
+        """
+        Testa se uma leitura gravada duas vezes (ex.: lote repetido depois de um crash) não é duplicada.
+        """
+        queue = self.make_queue()
+        record = writebehind.reading_record(self.segment.id, 50.0, timezone.now())
+        queue.put([record])
+        queue.flush()
+        queue.put([record])
+        queue.flush()
+        self.assertEqual(SpeedReading.objects.count(), 1)
+        self.assertEqual(queue.written, 1)
+
+    def test_deleted_segment_is_dropped(self):
+        """
+        Testa se as leituras de um segmento apagado depois de aceites são descartadas.
+        """
+        queue = self.make_queue()
+        self.post_reading(50.0)
+        self.segment.delete()
+        self.assertEqual(queue.flush(), 1)
+        self.assertEqual(queue.written, 0)
+        self.assertEqual(SpeedReading.objects.count(), 0)
+
+
+class BenchmarkSuiteTest(TestCase):
+    """
+    Testes do dataset sintético e da suite de benchmarks.
+
+    Testa:
+    - Gerador determinístico (mesma semente → mesmos dados) com N × M linhas e segmentos distintos
+    - Comando generate_data com um ou vários ficheiros, importáveis pelo import_data
+    - Resultados da suite (importação e endpoints) com um dataset pequeno
+    - Comparação entre execuções e deteção de regressões
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_generator_is_deterministic(self):
+        """
+        Testa o número de linhas, as colunas e a repetição dos dados com a mesma semente.
+        """
+        rows = list(generate_rows(20, 3, seed=7))
+        self.assertEqual(len(rows), 60)
+        self.assertEqual(list(rows[0]), COLUMNS)
+        self.assertEqual(rows, list(generate_rows(20, 3, seed=7)))
+        self.assertNotEqual(rows, list(generate_rows(20, 3, seed=8)))
+
+        segments = generate_segments(500, seed=7)
+        self.assertEqual(len({segment[:4] for segment in segments}), 500)
+        self.assertTrue(all(speed >= 0 for speed in (row['Speed'] for row in rows)))
+        # Um instante por leitura, com uma leitura de cada segmento
+        self.assertEqual(len({row['Timestamp'] for row in rows}), 3)
+
+    def test_generate_data_command(self):
+        """
+        Testa a divisão das leituras por vários ficheiros e a importação do resultado.
+        """
+        path = os.path.join(self.directory, 'synthetic.csv')
+        out = StringIO()
+        call_command('generate_data', segments=5, readings=4, seed=1, output=path, stdout=out)
+        self.assertIn('Geradas 20 linhas', out.getvalue())
+
+        folder = os.path.join(self.directory, 'files')
+        call_command('generate_data', segments=5, readings=4, seed=1, files=3, output=folder, stdout=StringIO())
+        self.assertEqual(sorted(os.listdir(folder)), ['traffic-001.csv', 'traffic-002.csv', 'traffic-003.csv'])
+        with open(path, encoding='utf-8') as file:
+            single = file.read().splitlines()
+        parts = []
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), encoding='utf-8') as file:
+                parts.extend(file.read().splitlines()[1:])
+        self.assertEqual(parts, single[1:])
+
+        call_command('import_data', file=folder, workers=1, stdout=StringIO())
+        self.assertEqual(RoadSegment.objects.count(), 5)
+        self.assertEqual(SpeedReading.objects.count(), 20)
+
+        with self.assertRaises(CommandError):
+            call_command('generate_data', segments=0, output=path, stdout=StringIO())
+
+    def test_run_suite(self):
+        """
+        Testa os resultados de uma execução: importação, latências e queries de cada endpoint.
+        """
+        results = run_suite(segments=10, readings=2, seed=3, requests=3, batch_size=5)
+        self.assertEqual(results['meta']['segments'], 10)
+        self.assertEqual(results['meta']['database'], connection.vendor)
+        self.assertEqual(results['import']['insert']['rows'], 20)
+        self.assertEqual(SpeedReading.objects.count(), 20)      # o --upsert não duplica leituras
+
+        self.assertEqual(list(results['endpoints']), list(ENDPOINTS))
+        for name, values in results['endpoints'].items():
+            self.assertEqual(values['status'], [200], name)
+            self.assertLessEqual(values['p50_ms'], values['p99_ms'])
+        self.assertEqual(results['endpoints']['segments_list_cached']['queries'], 0)
+        self.assertGreater(results['endpoints']['segments_list']['queries'], 0)
+        # Os resultados são guardados em JSON
+        json.dumps(results)
+
+    def test_compare_results(self):
+        """
+        Testa a deteção de regressões (latência, débito e número de queries) entre duas execuções.
+        """
+        baseline = {
+            'import': {'insert': {'rows_per_second': 1000.0}},
+            'endpoints': {'segments_list': {'p50_ms': 10.0, 'p95_ms': 12.0, 'p99_ms': 20.0, 'queries': 2}},
+        }
+        current = {
+            'import': {'insert': {'rows_per_second': 800.0}},
+            'endpoints': {
+                'segments_list': {'p50_ms': 10.5, 'p95_ms': 11.0, 'p99_ms': 30.0, 'queries': 3},
+                'segments_detail': {'p50_ms': 1.0, 'p95_ms': 1.0, 'p99_ms': 1.0, 'queries': 1},
+            },
+        }
+        regressions = {path: regression for path, _previous, _value, _change, regression in compare_results(current, baseline)}
+        self.assertEqual(regressions, {
+            'import.insert.rows_per_second': True,       # -20%
+            'endpoints.segments_list.p50_ms': False,     # +5%
+            'endpoints.segments_list.p95_ms': False,     # melhorou
+            'endpoints.segments_list.p99_ms': True,      # +50%
+            'endpoints.segments_list.queries': True,     # mais uma query
+        })
+        # Com um limite maior, só o aumento do número de queries continua a ser uma regressão
+        regressions = [path for path, *_values, regression in compare_results(current, baseline, threshold=60) if regression]
+        self.assertEqual(regressions, ['endpoints.segments_list.queries'])
+
+
+class RequestMetricsTest(TestCase):
+    """
+    Testes das métricas dos pedidos (metrics.py) e do endpoint GET /metrics.
+
+    Testa:
+    - Pedidos, latência, queries, tempo na db, serialização e tamanho por vista
+    - Queries das vistas assíncronas
+    - Formato dos histogramas (limites cumulativos, soma e total)
+    - Log dos pedidos lentos com as queries
+    - METRICS_ENABLED = False
+    """
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.client = APIClient()
+        self.segment = RoadSegment.objects.create(
+            longitude_start=-8.61, latitude_start=41.15, longitude_end=-8.60, latitude_end=41.15, length=800
+        )
+        SpeedReading.objects.create(road_segment=self.segment, average_speed=30.0, timestamp=timezone.now())
+
+    def get_metrics(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_request_metrics(self):
+        """
+        Testa as métricas de um GET /api/segments/ (sem cache): as queries contadas são as do pedido.
+        """
+        with self.settings(SEGMENT_CACHE_TIMEOUT=0), CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/segments/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        queries = len(captured)           # Antes do próximo pedido (que limpa connection.queries)
+
+        samples = self.get_metrics()
+        view = '{view="segment-list"}'
+        self.assertEqual(samples['traffic_monitor_http_requests_total{view="segment-list",method="GET",status="200"}'], 1)
+        self.assertEqual(samples['traffic_monitor_http_request_duration_seconds_count{view="segment-list",method="GET"}'], 1)
+        self.assertEqual(samples[f'traffic_monitor_db_queries_per_request_sum{view}'], queries)
+        self.assertGreater(samples[f'traffic_monitor_db_duration_seconds_sum{view}'], 0)
+        self.assertEqual(samples[f'traffic_monitor_render_duration_seconds_count{view}'], 1)
+        self.assertEqual(samples[f'traffic_monitor_response_size_bytes_sum{view}'], len(response.content))
+
+        # Vistas sem nome e URLs inexistentes
+        self.client.get('/api/nao-existe/')
+        self.assertEqual(self.get_metrics()['traffic_monitor_http_requests_total{view="unmatched",method="GET",status="404"}'], 1)
+
+    async def test_async_view_queries(self):
+        """
+        Testa se as queries feitas pelo ORM assíncrono (noutra thread) são contadas no pedido.
+        """
+        response = await self.async_client.get(f'/api/async/segments/{self.segment.id}/state/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        samples = await sync_to_async(self.get_metrics)()
+        self.assertGreater(samples['traffic_monitor_db_queries_per_request_sum{view="async-segment-state"}'], 0)
+
+    def test_histogram_format(self):
+        """
+        Testa os limites cumulativos (le), a soma e o total de um histograma.
+        """
+        histogram = metrics.Histogram('test_seconds', 'Teste.', (0.1, 1.0), ('view',))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(('a',), value)
+        samples = {(name, labels): value for name, _names, labels, value in histogram.samples()}
+        self.assertEqual(samples[('test_seconds_bucket', ('a', '0.1'))], 2)     # le: menor ou igual
+        self.assertEqual(samples[('test_seconds_bucket', ('a', '1'))], 3)
+        self.assertEqual(samples[('test_seconds_bucket', ('a', '+Inf'))], 4)
+        self.assertEqual(samples[('test_seconds_count', ('a',))], 4)
+        self.assertAlmostEqual(samples[('test_seconds_sum', ('a',))], 3.65)
+        self.assertEqual(metrics.format_labels(('path',), ('a"b\\c',)), '{path="a\\"b\\\\c"}')
+
+    def test_slow_request_log(self):
+        """
+        Testa o log dos pedidos lentos, com o SQL das queries.
+        """
+        with self.settings(SLOW_REQUEST_THRESHOLD=0, SEGMENT_CACHE_TIMEOUT=0):
+            with self.assertLogs('traffic_monitor.slow_requests', 'WARNING') as logs:
+                self.client.get(f'/api/segments/{self.segment.id}/')
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(f'GET /api/segments/{self.segment.id}/ (segment-detail) → 200', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+        self.assertEqual(self.get_metrics()['traffic_monitor_slow_requests_total{view="segment-detail"}'], 1)
+
+        # Sem limite, nenhum pedido é registado
+        with self.assertNoLogs('traffic_monitor.slow_requests'):
+            self.client.get(f'/api/segments/{self.segment.id}/')
+
+    def test_disabled(self):
+        """
+        Testa se com METRICS_ENABLED = False nada é medido e o /metrics não existe.
+        """
+        with self.settings(METRICS_ENABLED=False):
+            self.client.get('/api/segments/')
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('traffic_monitor_http_requests_total{view="segment-list",method="GET",status="200"}', self.get_metrics())
+
+
+class IncidentDetectionTest(TestCase):
+    """
+    Testes da deteção de incidentes (incidents.py) e do endpoint GET /api/incidents/.
+
+    Testa:
+    - Uma quebra de velocidade abre um incidente, que é atualizado e termina quando as leituras voltam ao normal
+    - Segmentos sempre lentos e segmentos com poucas leituras não geram incidentes
+    - Leituras processadas sem queries (O(1) por leitura) depois de o segmento estar em memória
+    - Estatísticas e incidente ativo recuperados da db depois de reiniciar
+    - Falhas na deteção e incidentes desatualizados (outro processo) não fazem falhar a escrita das leituras
+    - Filtros do GET /api/incidents/
+    """
+
+    def setUp(self):
+        detector.reset()
+        self.addCleanup(detector.reset)
+        self.client = APIClient()
+        self.segment = RoadSegment.objects.create(
+            longitude_start=-8.61, latitude_start=41.15, longitude_end=-8.60, latitude_end=41.15, length=800
+        )
+        self.base = datetime(2024, 12, 17, 8, 0, tzinfo=dt_timezone.utc)
+        self.minute = 0
+
+    def add_readings(self, speeds, segment=None, detect=True):
+        """
+        Cria leituras de 5 em 5 minutos (em bloco, como o import_data) e corre a deteção depois do commit.
+        """
+        readings = []
+        for speed in speeds:
+            readings.append(SpeedReading(
+                road_segment=segment or self.segment, average_speed=speed,
+                timestamp=self.base + timezone.timedelta(minutes=self.minute),
+            ))
+            self.minute += 5
+        with self.captureOnCommitCallbacks(execute=detect):
+            insert_readings(readings)
+        return readings
+
+    def normal_speeds(self, count):
+        return [60.0 + (i % 3 - 1) * 2 for i in range(count)]       # 58, 60, 62, ...
+
+    def test_incident_lifecycle(self):
+        """
+        Testa a abertura, a atualização e o fim de um incidente.
+        """
+        self.add_readings(self.normal_speeds(20))
+        self.assertFalse(Incident.objects.exists())
+
+        slow = self.add_readings([15.0, 12.0, 20.0])
+        incident = Incident.objects.get()
+        self.assertTrue(incident.active)
+        self.assertEqual(incident.started_at, slow[0].timestamp)
+        self.assertEqual(incident.last_reading_at, slow[2].timestamp)
+        self.assertEqual((incident.reading_count, incident.min_speed), (3, 12.0))
+        self.assertAlmostEqual(incident.expected_speed, 60.0, delta=2)
+        self.assertGreater(incident.max_score, 3)
+
+        # As leituras anómalas não entram na média: o incidente continua até 3 leituras normais seguidas
+        recovered = self.add_readings(self.normal_speeds(2) + [14.0] + self.normal_speeds(3))
+        incident.refresh_from_db()
+        self.assertEqual(incident.reading_count, 4)
+        self.assertEqual(incident.ended_at, recovered[-1].timestamp)
+        self.assertFalse(incident.active)
+
+        # Uma nova quebra abre outro incidente
+        self.add_readings([10.0])
+        self.assertEqual(Incident.objects.filter(ended_at__isnull=True).count(), 1)
+        self.assertEqual(Incident.objects.count(), 2)
+
+    def test_no_false_positives(self):
+        """
+        Testa se um segmento sempre lento, ou com poucas leituras, não gera incidentes.
+        """
+        slow_street = RoadSegment.objects.create(
+            longitude_start=-8.62, latitude_start=41.15, longitude_end=-8.61, latitude_end=41.15, length=300
+        )
+        self.add_readings([15.0 + i % 2 for i in range(30)], segment=slow_street)
+        self.add_readings([60.0] * 5 + [10.0])          # Menos de INCIDENT_MIN_READINGS leituras
+        self.assertFalse(Incident.objects.exists())
+
+        with self.settings(INCIDENT_DETECTION=False):
+            self.add_readings(self.normal_speeds(10) + [10.0])
+        self.assertFalse(Incident.objects.exists())
+
+    def test_constant_cost_per_reading(self):
+        """
+        Testa se, com o segmento em memória, as leituras normais são avaliadas sem queries.
+        """
+        self.add_readings(self.normal_speeds(20))
+        readings = [
+            SpeedReading(road_segment_id=self.segment.id, average_speed=speed, timestamp=self.base + timezone.timedelta(hours=2, minutes=i))
+            for i, speed in enumerate(self.normal_speeds(1000))
+        ]
+        with self.assertNumQueries(0):
+            self.assertEqual(detector.process(readings), [])
+
+    def test_warm_up_after_restart(self):
+        """
+        Testa se depois de reiniciar a média é calculada com as leituras da db e o incidente ativo continua.
+        """
+        self.add_readings(self.normal_speeds(20), detect=False)
+        self.add_readings([10.0])
+        incident = Incident.objects.get()
+        self.assertAlmostEqual(incident.expected_speed, 60.0, delta=2)
+
+        detector.reset()
+        self.add_readings([11.0])
+        incident.refresh_from_db()
+        self.assertEqual(incident.reading_count, 2)
+        self.assertEqual(Incident.objects.count(), 1)
+
+        # Uma leitura criada individualmente (post_save) também é avaliada
+        detector.reset()
+        with self.captureOnCommitCallbacks(execute=True):
+            SpeedReading.objects.create(road_segment=self.segment, average_speed=9.0, timestamp=self.base + timezone.timedelta(days=1))
+        incident.refresh_from_db()
+        self.assertEqual((incident.reading_count, incident.min_speed), (3, 9.0))
+
+    def test_failures_do_not_break_writes(self):
+        """
+        Testa se uma falha na deteção é registada no log (sem exceção) e se o segmento volta a ser lido da db.
+        """
+        self.add_readings(self.normal_speeds(20))
+        with mock.patch.object(detector, 'save', side_effect=DatabaseError('falha')), \
+                self.assertLogs('traffic_monitor.incidents', 'ERROR'):
+            self.add_readings([10.0])
+        self.assertEqual(SpeedReading.objects.count(), 21)
+        self.assertNotIn(self.segment.id, detector.segments)
+
+        # A leitura seguinte volta a carregar o segmento da db e abre o incidente
+        self.add_readings([11.0])
+        self.assertEqual(Incident.objects.filter(ended_at__isnull=True).count(), 1)
+
+    def test_stale_incident_from_other_process(self):
+        """
+        Testa se um incidente em memória que outro processo terminou (abrindo outro) não faz falhar a gravação,
+        e se um incidente novo que colide com um ativo que entretanto terminou é gravado na mesma.
+        """
+        self.add_readings(self.normal_speeds(20))
+        self.add_readings([10.0])
+        stale = Incident.objects.get()
+
+        # Outro processo termina o incidente e abre outro no mesmo segmento
+        Incident.objects.filter(pk=stale.pk).update(ended_at=self.base + timezone.timedelta(hours=5))
+        other = Incident.objects.create(
+            road_segment=self.segment, started_at=self.base + timezone.timedelta(hours=6),
+            last_reading_at=self.base + timezone.timedelta(hours=6), expected_speed=60, min_speed=9, max_score=5,
+        )
+        self.add_readings([12.0])       # Reabriria o incidente desatualizado: o segmento é esquecido
+        self.assertNotIn(self.segment.id, detector.segments)
+        self.add_readings([11.0])       # Volta a ser lido da db e atualiza o incidente ativo
+        other.refresh_from_db()
+        self.assertEqual(other.reading_count, 2)
+        self.assertEqual(Incident.objects.filter(ended_at__isnull=True).count(), 1)
+
+        # O incidente ativo com que o novo colidiu já terminou: o novo é gravado na mesma
+        Incident.objects.filter(pk=other.pk).update(ended_at=self.base + timezone.timedelta(hours=7))
+        new = Incident(
+            road_segment=self.segment, started_at=self.base + timezone.timedelta(hours=8),
+            last_reading_at=self.base + timezone.timedelta(hours=8), expected_speed=60, min_speed=8, max_score=6,
+        )
+        detector.merge(new)
+        self.assertIsNotNone(new.pk)
+        self.assertEqual(Incident.objects.get(ended_at__isnull=True), new)
+
+    def test_api(self):
+        """
+        Testa a listagem, o detalhe e os filtros do GET /api/incidents/.
+        """
+        other = RoadSegment.objects.create(
+            longitude_start=-8.62, latitude_start=41.15, longitude_end=-8.61, latitude_end=41.15, length=300
+        )
+        ended = Incident.objects.create(
+            road_segment=self.segment, started_at=self.base, ended_at=self.base + timezone.timedelta(hours=1),
+            last_reading_at=self.base, expected_speed=60, min_speed=10, max_score=5,
+        )
+        active = Incident.objects.create(
+            road_segment=other, started_at=self.base + timezone.timedelta(hours=3),
+            last_reading_at=self.base + timezone.timedelta(hours=3), expected_speed=50, min_speed=12, max_score=4,
+        )
+
+        response = self.client.get('/api/incidents/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [active.id, ended.id])
+        self.assertEqual(response.data['results'][0]['active'], True)
+
+        def ids(query):
+            return [item['id'] for item in self.client.get(f'/api/incidents/?{query}').data['results']]
+        self.assertEqual(ids('active=true'), [active.id])
+        self.assertEqual(ids('active=false'), [ended.id])
+        self.assertEqual(ids(f'road_segment={self.segment.id}'), [ended.id])
+        self.assertEqual(ids('from=2024-12-17T09:30:00Z'), [active.id])                          # O primeiro já tinha terminado
+        self.assertEqual(ids('from=2024-12-17T08:30:00Z&to=2024-12-17T10:00:00Z'), [ended.id])
+
+        self.assertEqual(self.client.get(f'/api/incidents/{ended.id}/').data['ended_at'], '2024-12-17T09:00:00Z')
+        self.assertEqual(self.client.get('/api/incidents/?active=talvez').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post('/api/incidents/', {}).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ForecastTest(TestCase):
+    """
+    Testes da previsão da velocidade dos segmentos (forecasting.py).
+
+    Testa:
+    - O modelo aprende o padrão diário (hora de ponta) e prevê-o
+    - Ajustar todos os segmentos de uma vez dá o mesmo resultado que um a um
+    - O ajuste incremental dá o mesmo resultado que o ajuste completo
+    - Um ajuste antigo avança até ao intervalo atual (com um intervalo de confiança maior)
+    - GET /api/segments/{id}/forecast/ (só lê os modelos guardados) e comando fit_forecasts
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.segments = [
+            RoadSegment.objects.create(
+                longitude_start=-8.61 + i * 0.01, latitude_start=41.15, longitude_end=-8.60 + i * 0.01, latitude_end=41.15, length=800
+            )
+            for i in range(3)
+        ]
+        self.start = datetime(2024, 12, 1, tzinfo=dt_timezone.utc)
+
+    def add_readings(self, start, days, segments=None):
+        """
+        Uma leitura a cada 15 minutos: velocidade base de cada segmento, menos 30 km/h entre as 8h e as 10h.
+        """
+        readings = []
+        for step in range(days * 96):
+            timestamp = start + timezone.timedelta(minutes=15 * step)
+            for index, segment in enumerate(segments or self.segments):
+                speed = 50 + index * 10 - (30 if 8 <= timestamp.hour < 10 else 0) + (step % 3 - 1)
+                readings.append(SpeedReading(road_segment=segment, average_speed=speed, timestamp=timestamp))
+        insert_readings(readings)
+
+    def params(self):
+        return {
+            forecast.road_segment_id: (forecast.level, forecast.seasonal, forecast.residual_variance, forecast.observations)
+            for forecast in SegmentForecast.objects.all()
+        }
+
+    def assert_same_params(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for segment_id, (level, seasonal, variance, observations) in first.items():
+            other = second[segment_id]
+            self.assertAlmostEqual(level, other[0], places=6)
+            self.assertAlmostEqual(variance, other[2], places=6)
+            self.assertEqual(observations, other[3])
+            for value, expected in zip(seasonal, other[1]):
+                self.assertAlmostEqual(value, expected, places=6)
+
+    def test_daily_pattern(self):
+        """
+        Testa se a previsão antes da hora de ponta acompanha a descida da velocidade às 8h.
+        """
+        self.add_readings(self.start, 4)
+        until = self.start + timezone.timedelta(days=3, hours=7, minutes=30)
+        self.assertEqual(fit_forecasts(until=until), 3)
+
+        forecast = SegmentForecast.objects.get(road_segment=self.segments[1])
+        forecasts = predict(forecast, 60, self.segments[1], now=until)
+        self.assertEqual([item['timestamp'] for item in forecasts], [
+            until + timezone.timedelta(minutes=minutes) for minutes in (0, 15, 30, 45)
+        ])
+        self.assertEqual([item['minutes_ahead'] for item in forecasts], [15, 30, 45, 60])
+        self.assertAlmostEqual(forecasts[0]['speed'], 60, delta=3)          # Antes da hora de ponta
+        self.assertAlmostEqual(forecasts[2]['speed'], 30, delta=3)          # Às 8h
+        self.assertEqual(forecasts[2]['intensity'], 'média')
+        self.assertLessEqual(forecasts[2]['lower'], forecasts[2]['speed'])
+        self.assertGreaterEqual(forecasts[2]['upper'], forecasts[2]['speed'])
+
+    def test_stale_fit_rolls_forward(self):
+        """
+        Testa se, com um ajuste antigo, as previsões começam no intervalo atual (com a sazonalidade desse
+        intervalo do dia) e o intervalo de confiança alarga com o tempo decorrido desde o ajuste.
+        """
+        self.add_readings(self.start, 4)
+        # Um dia mais rápido do que o habitual: erros de previsão (variância) diferentes de 0
+        SpeedReading.objects.filter(timestamp__day=3).update(average_speed=F('average_speed') + 10)
+        until = self.start + timezone.timedelta(days=3, hours=7, minutes=30)
+        fit_forecasts(until=until)
+        forecast = SegmentForecast.objects.get(road_segment=self.segments[1])
+
+        fresh = predict(forecast, 60, now=until)
+        # Um dia depois (e a meio de um intervalo): os mesmos intervalos do dia, mais incerteza
+        stale = predict(forecast, 60, now=until + timezone.timedelta(days=1, minutes=7))
+        self.assertEqual([item['timestamp'] for item in stale], [item['timestamp'] + timezone.timedelta(days=1) for item in fresh])
+        self.assertEqual([item['speed'] for item in stale], [item['speed'] for item in fresh])
+        for old, new in zip(fresh, stale):
+            self.assertGreater(new['upper'] - new['lower'], old['upper'] - old['lower'])
+
+    def test_batched_fit_matches_single_segment(self):
+        """
+        Testa se ajustar os segmentos em bloco (uma matriz) dá o mesmo que ajustá-los um a um.
+        """
+        self.add_readings(self.start, 2)
+        SpeedReading.objects.filter(road_segment=self.segments[2], timestamp__hour=3).delete()   # Intervalos sem leituras
+        until = self.start + timezone.timedelta(days=2)
+        fit_forecasts(until=until)
+        batched = self.params()
+        fit_forecasts(until=until, full=True, batch_size=1)
+        self.assert_same_params(batched, self.params())
+
+    def test_incremental_fit_matches_full_fit(self):
+        """
+        Testa se continuar o ajuste a partir dos parâmetros guardados dá o mesmo que ajustar tudo de novo.
+        """
+        self.add_readings(self.start, 3)
+        fit_forecasts(until=self.start + timezone.timedelta(days=1, hours=5))
+        # Segmentos, parâmetros guardados, leituras novas e um INSERT ... ON CONFLICT (+ SAVEPOINT e RELEASE do atomic)
+        with self.assertNumQueries(6):
+            fit_forecasts(until=self.start + timezone.timedelta(days=2, hours=13))
+        incremental = self.params()
+        fit_forecasts(until=self.start + timezone.timedelta(days=2, hours=13), full=True)
+        self.assert_same_params(incremental, self.params())
+
+    def test_forecast_endpoint(self):
+        """
+        Testa se o pedido só lê os modelos guardados (404 sem ajuste, sem escrever na db), o horizonte e os erros.
+        """
+        recent = timezone.now() - timezone.timedelta(days=2)
+        self.add_readings(recent, 1, segments=self.segments[:1])
+        segment = self.segments[0]
+
+        # Sem ajuste: 404, sem ajustar o modelo no pedido
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/segments/{segment.id}/forecast/?horizon=30')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(SegmentForecast.objects.exists())
+
+        fit_forecasts()
+        response = self.client.get(f'/api/segments/{segment.id}/forecast/?horizon=30')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['forecasts']), 2)
+        self.assertEqual(response.data['observations'], 96)
+        # As previsões começam no intervalo atual, não no fim das leituras
+        first = datetime.fromisoformat(response.data['forecasts'][0]['timestamp'].replace('Z', '+00:00'))
+        self.assertLess(timezone.now() - first, timezone.timedelta(minutes=15))
+
+        self.assertEqual(self.client.get(f'/api/segments/{self.segments[1].id}/forecast/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f'/api/segments/{segment.id}/forecast/?horizon=500').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f'/api/segments/{segment.id}/forecast/?horizon=x').status_code, status.HTTP_400_BAD_REQUEST)
+
+        out = StringIO()
+        call_command('fit_forecasts', stdout=out)
+        self.assertIn('Segmentos com previsão: 1', out.getvalue())
+
+
+class RoutingTest(TestCase):
+    """
+    Testes dos percursos sobre o grafo dos segmentos (routing.py).
+
+    Testa:
+    - O caminho mais rápido segue as velocidades das últimas leituras (e não só a distância)
+    - As novas leituras atualizam o peso das arestas sem reconstruir o grafo (as mais antigas são ignoradas)
+    - Leituras apagadas, leituras de outros processos (SegmentState) e novos segmentos
+    - GET /api/segments/route/ e os erros (parâmetros inválidos, sem caminho)
+    """
+
+    def setUp(self):
+        cache.clear()   # Obriga o índice espacial e o grafo a serem reconstruídos
+        routing.invalidate_road_graph()
+        self.client = APIClient()
+        self.now = timezone.now()
+        # A → B → C (2 km) e A → D → C (3 km), todos a 60 km/h: o caminho mais rápido passa por B
+        self.points = {'A': (-8.62, 41.15), 'B': (-8.61, 41.15), 'C': (-8.60, 41.15), 'D': (-8.61, 41.16)}
+        self.segments = {
+            name: self.create_segment(name[0], name[1], length)
+            for name, length in (('AB', 1000), ('BC', 1000), ('AD', 1500), ('DC', 1500), ('CA', 2000))
+        }
+        for segment in self.segments.values():
+            self.add_reading(segment, 60, self.now - timezone.timedelta(minutes=5))
+
+    def create_segment(self, start, end, length):
+        (lon1, lat1), (lon2, lat2) = self.points[start], self.points[end]
+        return RoadSegment.objects.create(
+            longitude_start=lon1, latitude_start=lat1, longitude_end=lon2, latitude_end=lat2, length=length
+        )
+
+    def add_reading(self, segment, speed, timestamp):
+        with self.captureOnCommitCallbacks(execute=True):
+            return SpeedReading.objects.create(road_segment=segment, average_speed=speed, timestamp=timestamp)
+
+    def route(self, start='A', end='C'):
+        return routing.find_route(self.points[start], self.points[end])
+
+    def route_ids(self, start='A', end='C'):
+        return [segment['id'] for segment in self.route(start, end)['segments']]
+
+    def test_fastest_route(self):
+        """
+        Testa o caminho mais rápido, o tempo e a distância.
+        """
+        route = self.route()
+        self.assertEqual([segment['id'] for segment in route['segments']], [self.segments['AB'].id, self.segments['BC'].id])
+        self.assertEqual(route['travel_time'], 120.0)       # 2 km a 60 km/h
+        self.assertEqual(route['distance'], 2000.0)
+        self.assertEqual(route['coordinates'], [list(self.points[name]) for name in 'ABC'])
+        self.assertEqual(self.route('A', 'A')['segments'], [])
+
+    def test_new_readings_update_weights(self):
+        """
+        Testa se as novas leituras mudam o caminho sem reconstruir o grafo (sem queries no cálculo).
+        """
+        self.route()
+        graph = routing.get_road_graph()
+
+        self.add_reading(self.segments['BC'], 10, self.now)     # B → C passa a demorar 6 minutos
+        with self.assertNumQueries(0):
+            route = self.route()
+        self.assertEqual([segment['id'] for segment in route['segments']], [self.segments['AD'].id, self.segments['DC'].id])
+        self.assertIs(routing.get_road_graph(), graph)
+        self.assertEqual(graph.edges[self.segments['BC'].id].speed, 10)
+
+        # Uma leitura mais antiga do que a última não muda a velocidade
+        self.add_reading(self.segments['BC'], 90, self.now - timezone.timedelta(hours=1))
+        self.assertEqual(graph.edges[self.segments['BC'].id].speed, 10)
+
+        # Leituras em bloco (ex.: import_data)
+        with self.captureOnCommitCallbacks(execute=True):
+            insert_readings([
+                SpeedReading(road_segment=self.segments['BC'], average_speed=80, timestamp=self.now + timezone.timedelta(minutes=1)),
+            ])
+        self.assertEqual(self.route_ids(), [self.segments['AB'].id, self.segments['BC'].id])
+        self.assertIs(routing.get_road_graph(), graph)
+
+    def test_deleted_reading_and_other_processes(self):
+        """
+        Testa a velocidade depois de apagar a última leitura e as leituras escritas por outros processos.
+        """
+        slow = self.add_reading(self.segments['BC'], 10, self.now)
+        self.assertEqual(self.route_ids(), [self.segments['AD'].id, self.segments['DC'].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            slow.delete()
+        self.assertEqual(self.route_ids(), [self.segments['AB'].id, self.segments['BC'].id])
+
+        # Outro processo atualizou o estado do segmento (sem signals neste processo)
+        SegmentState.objects.filter(road_segment=self.segments['AB']).update(
+            latest_speed=5, latest_timestamp=self.now, updated_at=timezone.now()
+        )
+        self.assertEqual(self.route_ids(), [self.segments['AB'].id, self.segments['BC'].id])   # Ainda não sincronizou
+        with self.settings(ROUTING_SYNC_INTERVAL=0):
+            self.assertEqual(self.route_ids(), [self.segments['AD'].id, self.segments['DC'].id])
+
+    def test_new_segment_rebuilds_graph(self):
+        """
+        Testa se um novo segmento (sem leituras: ROUTING_DEFAULT_SPEED) entra no grafo.
+        """
+        self.route()
+        graph = routing.get_road_graph()
+        direct = self.create_segment('A', 'C', 500)         # 500 m a 30 km/h = 60 s
+        self.assertEqual(self.route_ids(), [direct.id])
+        self.assertIsNot(routing.get_road_graph(), graph)
+        self.assertEqual(self.route()['segments'][0]['speed'], None)
+        self.assertEqual(self.route()['travel_time'], 60.0)
+
+    def test_route_endpoint(self):
+        """
+        Testa GET /api/segments/route/ e os erros.
+        """
+        response = self.client.get('/api/segments/route/?from=-8.6201,41.1501&to=-8.5999,41.15')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['from'], [-8.62, 41.15])
+        self.assertEqual(response.data['to'], [-8.60, 41.15])
+        self.assertEqual(response.data['travel_time'], 120.0)
+        self.assertEqual([segment['speed'] for segment in response.data['segments']], [60, 60])
+
+        # Segmento isolado: não há caminho de A até ele
+        self.points.update({'E': (-8.50, 41.20), 'F': (-8.49, 41.20)})
+        self.create_segment('E', 'F', 800)
+        self.assertEqual(self.client.get('/api/segments/route/?from=-8.62,41.15&to=-8.49,41.20').status_code, status.HTTP_404_NOT_FOUND)
+
+        for query in ('from=-8.62,41.15', 'from=abc&to=-8.60,41.15', 'from=-8.62&to=-8.60,41.15', 'from=200,41.15&to=-8.60,41.15'):
+            self.assertEqual(self.client.get(f'/api/segments/route/?{query}').status_code, status.HTTP_400_BAD_REQUEST)
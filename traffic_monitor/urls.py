@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import RoadSegmentViewSet, SpeedReadingViewSet
+from .views import IncidentViewSet, RoadSegmentViewSet, SpeedReadingViewSet
+from .realtime import stream_events
+from . import async_views
 
 """
 Router do DRF: cria automaticamente os URLs para os ViewSets.
@@ -16,6 +18,9 @@ Gera:
 - GET    /api/segments/{id}/  → RoadSegmentViewSet.retrieve()
 - PUT    /api/segments/{id}/  → RoadSegmentViewSet.update()
 - DELETE /api/segments/{id}/  → RoadSegmentViewSet.destroy()
+
+O stream de eventos em tempo real (GET /api/stream/) e as versões assíncronas dos endpoints de leitura
+(GET /api/async/...) são vistas assíncronas normais do Django, fora do router.
 """
 
 #Começamos por criar o router que vai gerar automaticamente URLs para os ViewSets
@@ -26,9 +31,19 @@ router = DefaultRouter()
 # Ex.: 'segments' → /api/segments/
 router.register(r'segments', RoadSegmentViewSet, basename='segment')
 router.register(r'readings', SpeedReadingViewSet, basename='reading')
+router.register(r'incidents', IncidentViewSet, basename='incident')
 
 # URLs da aplicação
 urlpatterns = [
     # Inclui todos os URLs criados pelo router
     path('', include(router.urls)),
+
+    # Eventos em tempo real (Server-Sent Events)
+    path('stream/', stream_events, name='stream'),
+
+    # Endpoints de leitura assíncronos (ASGI)
+    path('async/segments/', async_views.segment_list, name='async-segment-list'),
+    path('async/segments/<int:pk>/', async_views.segment_detail, name='async-segment-detail'),
+    path('async/segments/<int:pk>/state/', async_views.segment_state_detail, name='async-segment-state'),
+    path('async/readings/', async_views.reading_list, name='async-reading-list'),
 ]
\ No newline at end of file
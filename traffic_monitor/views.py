@@ -1,13 +1,38 @@
-from rest_framework import viewsets
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
-from .models import RoadSegment, SpeedReading
+from .models import Incident, RoadSegment, SpeedReading, normalize_intensity
 from .serializers import (
     RoadSegmentSerializer, 
     RoadSegmentListSerializer,
-    SpeedReadingSerializer)
+    SpeedReadingSerializer,
+    SpeedReadingFastSerializer,
+    SpeedReadingBulkItemSerializer,
+    IncidentSerializer,
+    validate_bulk_readings)
+from .ingestion import insert_readings
+from . import writebehind
+from .aggregation import BUCKETS, aggregate_readings, filter_time_range, parse_percentiles, parse_segment_id, parse_time_range
+from .parsers import NDJSONParser
 from .permissions import IsAdminOrReadOnly
-from django.db.models import OuterRef, Subquery
+from .pagination import IncidentPagination, RoadSegmentPagination, SpeedReadingPagination
+from .caching import CachedResponseMixin
+from .geojson import format_timestamp, stream_feature_collection, tile_bbox
+from .export import EXPORT_FORMATS, export_readings
+from .forecasting import get_forecast, predict
+from .routing import find_route, parse_location
+from .spatial import NEAREST_MAX_LIMIT, nearest_segments, parse_bbox, parse_point, segments_in_bbox
+
+# Tentativas do POST /api/readings/bulk/ quando um pedido em simultâneo grava as mesmas leituras
+BULK_INSERT_ATTEMPTS = 3
 
 @extend_schema_view(
     list=extend_schema(
@@ -21,6 +46,13 @@ from django.db.models import OuterRef, Subquery
                 description='Filtrar por intensidade: elevada, média ou baixa',
                 required=False,
                 enum=['elevada', 'média', 'baixa']
+            ),
+            OpenApiParameter(
+                name='bbox',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Filtrar pelos segmentos numa área: minLon,minLat,maxLon,maxLat',
+                required=False
             )
         ],
         tags=["Segmentos de Estrada"]
@@ -51,7 +83,7 @@ from django.db.models import OuterRef, Subquery
         tags=["Segmentos de Estrada"]
     )
 )
-class RoadSegmentViewSet(viewsets.ModelViewSet):
+class RoadSegmentViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet responsável pela gestão de segmentos de Estrada.
     
@@ -61,10 +93,19 @@ class RoadSegmentViewSet(viewsets.ModelViewSet):
     - POST /api/segments/         → Criar novo segmento (apenas admin)
     - PUT /api/segments/{id}/     → Editar segmento (apenas admin)
     - DELETE /api/segments/{id}/  → Apagar segmento (apenas admin)
+    - GET /api/segments/nearest/  → Segmentos mais próximos de um ponto
+    - GET /api/segments/route/    → Caminho mais rápido entre dois pontos (velocidades atuais)
+    - GET /api/segments/geojson/  → Todos os segmentos em GeoJSON (streaming)
+    - GET /api/segments/tiles/{z}/{x}/{y}/ → Segmentos de um tile do mapa em GeoJSON
+    - GET /api/segments/{id}/forecast/ → Previsão da velocidade nos próximos minutos
     
     Permissões:
     - Administradores: Podem criar, editar e apagar
     - Utilizadores anónimos: Apenas leitura
+
+    A listagem é paginada por cursor: a resposta tem os campos next, previous e results.
+
+    As respostas de listagem e detalhe ficam em cache (com ETag) até o segmento ou as suas leituras mudarem.
     """
     
     # Todos os segmentos existentes na base de dados
@@ -75,6 +116,9 @@ class RoadSegmentViewSet(viewsets.ModelViewSet):
     
     # Permissões aplicadas a este ViewSet
     permission_classes = [IsAdminOrReadOnly]
+
+    # Paginação por cursor (pelo id)
+    pagination_class = RoadSegmentPagination
     
     def get_serializer_class(self):
         """
@@ -98,40 +142,207 @@ class RoadSegmentViewSet(viewsets.ModelViewSet):
 
         Como funciona:
             1. Captura o parâmetro intensity da URL
-            2. Converte a intensidade em intervalo de velocidade
-            3. Filtra os segmentos cuja última leitura está nesse intervalo
+            2. Filtra os segmentos pela intensidade guardada no SegmentState (estado atual do segmento)
+
+        Para evitar o problema N+1, o SegmentState (total de leituras e última leitura)
+        é obtido com select_related, sendo a resposta gerada num número constante de queries.
         """
     
         queryset = super().get_queryset() # Começamos com todos os segmentos
+
+        # O estado atual (total de leituras, última leitura e intensidade) vem no mesmo SELECT
+        queryset = queryset.select_related('state')
+
         intensity = self.request.query_params.get('intensity', None) # Tentar obter o parâmetro intensity da URL
         
         if intensity:
-            intensity = intensity.lower().replace('é','e')
-            # Subquery: Obter a velocidade da última leitura de cada segmento
-            latest_reading_subquery = SpeedReading.objects.filter(road_segment=OuterRef('pk')).order_by('-timestamp').values('average_speed')[:1]
-            
-            # Anotamos em cada segmento a velocidade da última leitura (é um campo temporário)
-            queryset = queryset.annotate(latest_speed=Subquery(latest_reading_subquery))
-            
-            # Filtrar os segmentos onde a última leitura tem a intensidade pretendida
-            if intensity == 'elevada':
-                queryset = queryset.filter(latest_speed__lte=20)
-
-            elif intensity == 'media':
-                queryset = queryset.filter(
-                    latest_speed__gt=20,
-                    latest_speed__lte=50)
-            elif intensity == 'baixa':
-                queryset = queryset.filter(latest_speed__gt=50)
-            else:
+            # Filtrar os segmentos cuja última leitura tem a intensidade pretendida (campo indexado do SegmentState)
+            intensity = normalize_intensity(intensity)
+            if intensity is None:
                 return queryset.none()
+            queryset = queryset.filter(state__intensity=intensity)
+
+        # Segmentos numa área (?bbox=minLon,minLat,maxLon,maxLat), resolvidos pelo índice espacial
+        bbox = self.request.query_params.get('bbox', None)
+        if bbox:
+            queryset = queryset.filter(pk__in=segments_in_bbox(*parse_bbox(bbox)))
         return queryset
 
+    @extend_schema(
+        summary="Segmentos mais próximos de um ponto",
+        description=(
+            "Retorna os segmentos mais próximos de um ponto (ex.: posição GPS), do mais próximo para o mais afastado, "
+            "com a distância em metros."
+        ),
+        parameters=[
+            OpenApiParameter(name='lon', type=OpenApiTypes.FLOAT, location=OpenApiParameter.QUERY,
+                             description='Longitude do ponto', required=True),
+            OpenApiParameter(name='lat', type=OpenApiTypes.FLOAT, location=OpenApiParameter.QUERY,
+                             description='Latitude do ponto', required=True),
+            OpenApiParameter(name='limit', type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                             description=f'Número de segmentos (por defeito: 10, máximo: {NEAREST_MAX_LIMIT})', required=False),
+        ],
+        responses={200: RoadSegmentListSerializer(many=True)},
+        tags=["Segmentos de Estrada"]
+    )
+    @action(detail=False, methods=['get'], url_path='nearest')
+    def nearest(self, request):
+        """
+        GET /api/segments/nearest/?lon=-8.61&lat=41.15&limit=5
+
+        Exemplo de resposta:
+            [{"id": 12, "longitude_start": -8.61, ..., "total_readings": 3, "distance": 35.2}, ...]
+        """
+        lon, lat = parse_point(request.query_params)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), NEAREST_MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({'limit': 'Deve ser um número inteiro.'})
+
+        distances = dict(nearest_segments(lon, lat, limit))
+        segments = RoadSegment.objects.select_related('state').in_bulk(distances)
+
+        results = []
+        for segment_id, distance in distances.items():
+            if segment_id in segments:
+                data = RoadSegmentListSerializer(segments[segment_id]).data
+                data['distance'] = round(distance, 1)
+                results.append(data)
+        return Response(results)
+
+    @extend_schema(
+        summary="Caminho mais rápido entre dois pontos",
+        description=(
+            "Calcula o caminho mais rápido entre os nós da rede mais próximos dos dois pontos, seguindo os segmentos "
+            "(do início para o fim) com o tempo de percurso dado pela velocidade da última leitura de cada segmento. "
+            "Retorna o tempo total (segundos), a distância (metros), os segmentos percorridos e as coordenadas do caminho."
+        ),
+        parameters=[
+            OpenApiParameter(name='from', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             description='Ponto de partida: lon,lat', required=True),
+            OpenApiParameter(name='to', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             description='Ponto de chegada: lon,lat', required=True),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+        tags=["Segmentos de Estrada"]
+    )
+    @action(detail=False, methods=['get'], url_path='route')
+    def route(self, request):
+        """
+        GET /api/segments/route/?from=-8.61,41.15&to=-8.59,41.16
+
+        Exemplo de resposta:
+            {"from": [-8.61, 41.15], "to": [-8.59, 41.16], "travel_time": 312.4, "distance": 2650.0,
+             "segments": [{"id": 12, "length": 800.0, "speed": 42.5, "travel_time": 67.8}, ...],
+             "coordinates": [[-8.61, 41.15], [-8.605, 41.152], ...]}
+        """
+        origin = parse_location(request.query_params, 'from')
+        destination = parse_location(request.query_params, 'to')
+        route = find_route(origin, destination)
+        if route is None:
+            raise NotFound('Não existe nenhum caminho entre os dois pontos.')
+        return Response(route)
+
+    def geojson_response(self, queryset):
+        return StreamingHttpResponse(stream_feature_collection(queryset), content_type='application/geo+json; charset=utf-8')
+
+    @extend_schema(
+        summary="Exportar segmentos em GeoJSON",
+        description=(
+            "Retorna todos os segmentos como uma FeatureCollection GeoJSON (LineString), com a intensidade atual, "
+            "a última velocidade e o total de leituras. A resposta é gerada em streaming. "
+            "Aceita os mesmos filtros da listagem (intensity e bbox)."
+        ),
+        parameters=[
+            OpenApiParameter(name='intensity', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             description='Filtrar por intensidade: elevada, média ou baixa', required=False),
+            OpenApiParameter(name='bbox', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             description='Filtrar pelos segmentos numa área: minLon,minLat,maxLon,maxLat', required=False),
+        ],
+        responses={(200, 'application/geo+json'): OpenApiTypes.OBJECT},
+        tags=["Segmentos de Estrada"]
+    )
+    @action(detail=False, methods=['get'], url_path='geojson')
+    def geojson(self, request):
+        """
+        GET /api/segments/geojson/?intensity=elevada
+        """
+        return self.geojson_response(self.get_queryset())
+
+    @extend_schema(
+        summary="Segmentos de um tile do mapa (GeoJSON)",
+        description=(
+            "Retorna, em GeoJSON, os segmentos de um tile z/x/y (esquema XYZ usado pelos mapas web), "
+            "para que o mapa só peça os segmentos da área visível. Aceita o filtro intensity."
+        ),
+        responses={(200, 'application/geo+json'): OpenApiTypes.OBJECT},
+        tags=["Segmentos de Estrada"]
+    )
+    @action(detail=False, methods=['get'], url_path=r'tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)')
+    def tiles(self, request, z, x, y):
+        """
+        GET /api/segments/tiles/14/7800/6100/
+        """
+        z, x, y = int(z), int(x), int(y)
+        if z > 22 or x >= 2 ** z or y >= 2 ** z:
+            raise NotFound('Tile inválido')
+        segment_ids = segments_in_bbox(*tile_bbox(z, x, y))
+        return self.geojson_response(self.get_queryset().filter(pk__in=segment_ids))
+
+    @extend_schema(
+        summary="Previsão da velocidade de um segmento",
+        description=(
+            "Retorna a velocidade média prevista para os próximos intervalos (por defeito 15 minutos) até ao horizonte pedido, "
+            "com o intervalo de 95% e a intensidade prevista. O modelo (suavização exponencial com sazonalidade diária) "
+            "é ajustado pelo comando fit_forecasts (este pedido só lê os parâmetros guardados); as previsões começam no "
+            "intervalo atual, com o intervalo de confiança alargado pelo tempo decorrido desde o ajuste (fitted_until)."
+        ),
+        parameters=[
+            OpenApiParameter(name='horizon', type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                             description='Minutos a prever (por defeito: 60)', required=False),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+        tags=["Segmentos de Estrada"]
+    )
+    @action(detail=True, methods=['get'], url_path='forecast')
+    def forecast(self, request, pk=None):
+        """
+        GET /api/segments/{id}/forecast/?horizon=60
+
+        Exemplo de resposta:
+            {"road_segment": 1, "step_minutes": 15, "fitted_until": "2024-12-17T14:00:00Z", "observations": 2688,
+             "forecasts": [{"timestamp": "2024-12-17T14:00:00Z", "minutes_ahead": 15, "speed": 42.1,
+                            "lower": 30.2, "upper": 54.0, "intensity": "média"}, ...]}
+
+        Cada previsão é a velocidade média do intervalo que começa em timestamp.
+        """
+        max_horizon = settings.FORECAST_MAX_HORIZON
+        try:
+            horizon = int(request.query_params.get('horizon', 60))
+        except ValueError:
+            raise ValidationError({'horizon': 'Deve ser um número inteiro (minutos).'})
+        if not 1 <= horizon <= max_horizon:
+            raise ValidationError({'horizon': f'Deve estar entre 1 e {max_horizon} minutos.'})
+
+        segment = self.get_object()
+        forecast = get_forecast(segment)
+        if forecast is None:
+            raise NotFound('Este segmento ainda não tem previsão (o modelo é ajustado pelo comando fit_forecasts).')
+
+        forecasts = predict(forecast, max(horizon, forecast.step_minutes), segment)
+        return Response({
+            'road_segment': segment.pk,
+            'step_minutes': forecast.step_minutes,
+            'fitted_until': format_timestamp(forecast.fitted_until),
+            'observations': forecast.observations,
+            'forecasts': [{**item, 'timestamp': format_timestamp(item['timestamp'])} for item in forecasts],
+        })
+
 
 @extend_schema_view(
     list=extend_schema(
         summary="Listar leituras de velocidade",
-        description="Retorna uma lista de todas as leituras de velocidade. Pode ser filtrada por segmento.",
+        description="Retorna uma lista de todas as leituras de velocidade. Pode ser filtrada por segmento, intensidade e intervalo de tempo.",
         parameters=[
             OpenApiParameter(
                 name='road_segment',
@@ -139,6 +350,28 @@ class RoadSegmentViewSet(viewsets.ModelViewSet):
                 location=OpenApiParameter.QUERY,
                 description='ID do segmento para filtrar as leituras',
                 required=False
+            ),
+            OpenApiParameter(
+                name='intensity',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Filtrar por intensidade: elevada, média ou baixa',
+                required=False,
+                enum=['elevada', 'média', 'baixa']
+            ),
+            OpenApiParameter(
+                name='from',
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description='Início (inclusive), ISO 8601',
+                required=False
+            ),
+            OpenApiParameter(
+                name='to',
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description='Fim (exclusive), ISO 8601',
+                required=False
             )
         ],
         tags=["Leituras de Velocidade"]
@@ -150,7 +383,11 @@ class RoadSegmentViewSet(viewsets.ModelViewSet):
     ),
     create=extend_schema(
         summary="Criar nova leitura (Admin)",
-        description="Cria uma nova leitura de velocidade associada a um segmento. Requer autenticação de administrador.",
+        description=(
+            "Cria uma nova leitura de velocidade associada a um segmento. Requer autenticação de administrador. "
+            "Com a escrita diferida ativa (READINGS_WRITE_BEHIND), a leitura é validada e colocada numa fila, "
+            "sendo gravada em lote pouco depois: a resposta é 202 Accepted (ou 503 se a fila estiver cheia)."
+        ),
         tags=["Leituras de Velocidade"]
     ),
     update=extend_schema(
@@ -179,27 +416,322 @@ class SpeedReadingViewSet(viewsets.ModelViewSet):
     - POST /api/readings/         → Criar nova leitura (apenas admin)
     - PUT /api/readings/{id}/     → Editar leitura (apenas admin)
     - DELETE /api/readings/{id}/  → Apagar leitura (apenas admin)
+    - POST /api/readings/bulk/    → Criar várias leituras de uma vez (apenas admin)
+    - GET /api/readings/aggregate/ → Estatísticas por intervalo de tempo (5m, 15m, 1h, 1d)
+    - GET /api/readings/export/   → Exportar leituras em CSV ou NDJSON (streaming)
     
     Permissões:
     - Administradores: Podem fazer tudo
     - utilizadores anónimos: Apenas leitura
+
+    A listagem é paginada por cursor (da leitura mais recente para a mais antiga).
     """
     
-    queryset = SpeedReading.objects.all()
+    # O segmento vem no mesmo SELECT (os limites de intensidade de cada leitura são os do seu segmento)
+    queryset = SpeedReading.objects.select_related('road_segment')
     serializer_class = SpeedReadingSerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = SpeedReadingPagination    # Paginação por cursor (timestamp, id)
+
+    # Serialização rápida da listagem (None → usa o serializer_class, como nos outros ViewSets)
+    fast_serializer_class = SpeedReadingFastSerializer
     
     def get_queryset(self):
         """
-        Esta função permite filtrar as leituras pelo segmento de estrada, usando parâmetros no URL.
+        Esta função permite filtrar as leituras pelo segmento de estrada e por intervalo de tempo, usando parâmetros no URL.
 
         Por exemplo: GET /api/readings/?road_segment=1 retorna apenas leituras do segmento 1.
+                     GET /api/readings/?from=2024-12-01T00:00:00Z&to=2025-01-01T00:00:00Z retorna as leituras de dezembro.
+                     GET /api/readings/?intensity=elevada retorna as leituras com intensidade elevada.
+
+        A intensidade é calculada na db (CASE WHEN com os limites de cada segmento, ver SpeedReadingQuerySet).
+
+        Com a tabela particionada por mês (comando partition_readings), o filtro por intervalo de tempo
+        faz com que o PostgreSQL só leia as partições desse intervalo.
         """
-        queryset = super().get_queryset() # SpeedReading.objects.all()
+        queryset = super().get_queryset() # SpeedReading.objects.select_related('road_segment')
         
-        # Obter o ID do segmento passado como parametro na URL
-        road_segment_id = self.request.query_params.get('road_segment', None)
+        # Obter o ID do segmento passado como parametro na URL (400 se não for um número)
+        road_segment_id = parse_segment_id(self.request.query_params)
         
         if road_segment_id is not None:
             queryset = queryset.filter(road_segment_id=road_segment_id)
+
+        # Intensidade (?intensity=elevada|média|baixa)
+        intensity = self.request.query_params.get('intensity', None)
+        if intensity:
+            intensity = normalize_intensity(intensity)
+            if intensity is None:
+                return queryset.none()
+            queryset = queryset.filter_intensity(intensity)
+
+        # Intervalo de tempo (?from= inclusive, ?to= exclusive)
+        start, end = parse_time_range(self.request.query_params)
+        return filter_time_range(queryset, start, end)
+
+    def create(self, request, *args, **kwargs):
+        """
+        POST /api/readings/
+
+        Com READINGS_WRITE_BEHIND, a leitura não é gravada neste pedido: depois de validada é colocada
+        na fila de escrita diferida (writebehind.py) e a resposta é 202 Accepted:
+            {"status": "queued", "road_segment": 1, "average_speed": 35.2, "timestamp": "2024-12-17T14:00:00Z"}
+        """
+        if not writebehind.is_enabled():
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        record = writebehind.reading_record(data['road_segment'].pk, data['average_speed'], data['timestamp'])
+        try:
+            writebehind.get_queue().put([record])
+        except writebehind.QueueFull as error:
+            return Response({'detail': error.detail}, status=error.status_code, headers={'Retry-After': '1'})
+        return Response({'status': 'queued', **record}, status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(
+        summary="Criar leituras em bloco (Admin)",
+        description=(
+            "Cria várias leituras de uma só vez. Aceita uma lista JSON ou NDJSON (application/x-ndjson, "
+            "uma leitura por linha). As leituras inválidas são devolvidas em errors (com a posição na lista) "
+            "sem impedir a criação das restantes. Requer autenticação de administrador."
+        ),
+        request=SpeedReadingBulkItemSerializer(many=True),
+        responses={201: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT},
+        tags=["Leituras de Velocidade"]
+    )
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        POST /api/readings/bulk/
+
+        1. Valida todas as leituras numa única passagem (sem uma query por leitura)
+        2. Verifica a existência de todos os segmentos com uma única query
+        3. Insere as leituras válidas com bulk_create numa única transação
+           (se outro pedido gravar entretanto a mesma leitura, a validação é repetida e essa leitura passa a erro)
+
+        Resposta: {"created": N, "ids": [...], "errors": [{"index": 3, "errors": {...}}]}
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Era esperada uma lista de leituras.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_items = getattr(settings, 'BULK_READINGS_MAX_ITEMS', 10000)
+        if len(items) > max_items:
+            return Response(
+                {'detail': f'Foram enviadas {len(items)} leituras, o máximo é {max_items}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        for attempt in range(BULK_INSERT_ATTEMPTS):
+            readings, errors = validate_bulk_readings(items)
+            if not readings:
+                break
+            try:
+                with transaction.atomic():
+                    readings = insert_readings(readings)
+                break
+            except IntegrityError:
+                # Um pedido em simultâneo gravou uma leitura igual (ou apagou um segmento) depois da validação:
+                # nada foi gravado, a próxima validação devolve essas leituras em errors
+                if attempt == BULK_INSERT_ATTEMPTS - 1:
+                    raise
+
+        return Response(
+            {
+                'created': len(readings),
+                'ids': [reading.pk for reading in readings if reading.pk is not None],
+                'errors': errors,
+            },
+            status=status.HTTP_201_CREATED if readings else status.HTTP_400_BAD_REQUEST
+        )
+
+    @extend_schema(
+        summary="Agregar leituras por intervalo de tempo",
+        description=(
+            "Devolve, para cada intervalo de tempo (bucket) e segmento, o número de leituras e a velocidade "
+            "média, mínima, máxima e o desvio padrão, calculados na base de dados. O resultado vem num formato "
+            "compacto: uma lista de colunas e uma lista de linhas. Nos buckets de 1h e 1d os valores são lidos "
+            "das estatísticas pré-calculadas (source=rollup) sempre que possível."
+        ),
+        parameters=[
+            OpenApiParameter(name='bucket', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             description='Tamanho do intervalo', required=False, enum=list(BUCKETS), default='1h'),
+            OpenApiParameter(name='road_segment', type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                             description='ID do segmento', required=False),
+            OpenApiParameter(name='from', type=OpenApiTypes.DATETIME, location=OpenApiParameter.QUERY,
+                             description='Início (inclusive), ISO 8601', required=False),
+            OpenApiParameter(name='to', type=OpenApiTypes.DATETIME, location=OpenApiParameter.QUERY,
+                             description='Fim (exclusive), ISO 8601', required=False),
+            OpenApiParameter(name='percentiles', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             description='Percentis da velocidade, ex.: 50,90 (apenas PostgreSQL)', required=False),
+            OpenApiParameter(name='histogram', type=OpenApiTypes.BOOL, location=OpenApiParameter.QUERY,
+                             description='Incluir o número de leituras por intensidade', required=False),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+        tags=["Leituras de Velocidade"]
+    )
+    @action(detail=False, methods=['get'], url_path='aggregate')
+    def aggregate(self, request):
+        """
+        GET /api/readings/aggregate/?bucket=1h&road_segment=1&from=...&to=...&histogram=true
+
+        Exemplo de resposta:
+            {"bucket": "1h", "source": "rollup", "columns": ["bucket", "road_segment", "count", "avg", "min", "max", "stddev"],
+             "rows": [["2024-12-17T14:00:00Z", 1, 12, 35.2, 10.0, 61.5, 12.1]]}
+        """
+        params = request.query_params
+        start, end = parse_time_range(params)
+
+        return Response(aggregate_readings(
+            self.get_queryset(),
+            bucket=params.get('bucket', '1h'),
+            percentiles=parse_percentiles(params.get('percentiles')),
+            histogram=params.get('histogram', '').lower() in ('1', 'true', 'yes'),
+            segment_id=parse_segment_id(params),
+            start=start,
+            end=end,
+            # O filtro por intensidade não existe nos rollups: agrega as leituras filtradas
+            use_rollups=not params.get('intensity'),
+        ))
+
+    @extend_schema(
+        summary="Exportar leituras (CSV ou NDJSON)",
+        description=(
+            "Exporta as leituras em CSV ou NDJSON, por ordem de data, em streaming (a resposta começa a ser enviada "
+            "de imediato e a memória usada não depende do número de leituras). Aceita os filtros da listagem."
+        ),
+        parameters=[
+            OpenApiParameter(name='output', type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             description='Formato: csv (por defeito) ou ndjson', required=False, enum=list(EXPORT_FORMATS)),
+            OpenApiParameter(name='road_segment', type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                             description='ID do segmento', required=False),
+            OpenApiParameter(name='from', type=OpenApiTypes.DATETIME, location=OpenApiParameter.QUERY,
+                             description='Início (inclusive), ISO 8601', required=False),
+            OpenApiParameter(name='to', type=OpenApiTypes.DATETIME, location=OpenApiParameter.QUERY,
+                             description='Fim (exclusive), ISO 8601', required=False),
+        ],
+        responses={(200, 'text/csv'): OpenApiTypes.STR, (200, 'application/x-ndjson'): OpenApiTypes.STR},
+        tags=["Leituras de Velocidade"]
+    )
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        GET /api/readings/export/?output=ndjson&road_segment=1&from=2024-12-01T00:00:00Z
+
+        O parâmetro chama-se output porque ?format= é usado pelo DRF para escolher o renderer.
+        """
+        output = request.query_params.get('output', 'csv').lower()
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': f'Formato inválido: {output}. Opções: {", ".join(EXPORT_FORMATS)}.'})
+
+        _encode, content_type, extension = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(export_readings(self.get_queryset(), output), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="readings.{extension}"'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        Listagem das leituras (definida no fim da classe para não esconder o list() do Python no corpo da classe).
+
+        Com fast_serializer_class, as leituras são lidas como dicionários (.values())
+        e convertidas diretamente, sem instâncias do modelo nem ModelSerializer; a resposta é igual.
+        """
+        if self.fast_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+
+        serializer = self.fast_serializer_class()
+        queryset = serializer.prepare(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(queryset))
+
+
+@extend_schema_view(
+    list=extend_schema(
+        summary="Listar incidentes",
+        description=(
+            "Retorna os incidentes (congestionamentos anómalos) detetados nas leituras, do mais recente para o mais antigo. "
+            "Pode filtrar por segmento, pelos ativos e pelo intervalo de tempo em que estiveram ativos."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='road_segment',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description='Filtrar por segmento',
+                required=False
+            ),
+            OpenApiParameter(
+                name='active',
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                description='true → apenas os incidentes a decorrer; false → apenas os terminados',
+                required=False
+            ),
+            OpenApiParameter(
+                name='from',
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description='Início (inclusive), ISO 8601',
+                required=False
+            ),
+            OpenApiParameter(
+                name='to',
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description='Fim (exclusive), ISO 8601',
+                required=False
+            )
+        ],
+        tags=["Incidentes"]
+    ),
+    retrieve=extend_schema(
+        summary="Obter detalhes de um incidente",
+        description="Retorna os detalhes de um incidente.",
+        tags=["Incidentes"]
+    )
+)
+class IncidentViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet (apenas leitura) dos incidentes detetados pelo incidents.py.
+
+    Endpoints:
+    - GET /api/incidents/       → Lista os incidentes (paginação por cursor)
+    - GET /api/incidents/{id}/  → Detalhes de um incidente
+    """
+
+    queryset = Incident.objects.all()
+    serializer_class = IncidentSerializer
+    permission_classes = [IsAdminOrReadOnly]
+    pagination_class = IncidentPagination       # Paginação por cursor (started_at, id)
+
+    def get_queryset(self):
+        """
+        Filtros:
+            GET /api/incidents/?road_segment=1
+            GET /api/incidents/?active=true
+            GET /api/incidents/?from=2024-12-01T00:00:00Z&to=2024-12-02T00:00:00Z → ativos em algum momento do dia 1
+        """
+        queryset = super().get_queryset()
+        params = self.request.query_params
+
+        road_segment_id = parse_segment_id(params)
+        if road_segment_id is not None:
+            queryset = queryset.filter(road_segment_id=road_segment_id)
+
+        active = params.get('active')
+        if active is not None:
+            if active.lower() not in ('true', 'false', '1', '0'):
+                raise ValidationError({'active': 'Use true ou false.'})
+            queryset = queryset.filter(ended_at__isnull=active.lower() in ('true', '1'))
+
+        # Incidentes que se sobrepõem ao intervalo: começaram antes do fim e terminaram depois do início
+        start, end = parse_time_range(params)
+        if end is not None:
+            queryset = queryset.filter(started_at__lt=end)
+        if start is not None:
+            queryset = queryset.filter(Q(ended_at__isnull=True) | Q(ended_at__gte=start))
         return queryset
@@ -0,0 +1,323 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import APIException
+
+from .models import RoadSegment, SpeedReading
+from .ingestion import upsert_readings
+from .geojson import format_timestamp
+
+try:
+    import fcntl
+except ImportError:     # Windows: sem locks, apenas um processo por pasta de journal
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+"""
+Fila de escrita diferida (write-behind) das leituras criadas com POST /api/readings/.
+
+Com READINGS_WRITE_BEHIND = True, cada leitura é validada, acrescentada a um journal em disco e
+respondida de imediato (202 Accepted). Uma thread em segundo plano grava as leituras em lotes
+(um bulk_create e um commit por lote, em vez de um commit por pedido):
+- quando há WRITE_BEHIND_BATCH_SIZE leituras em espera, ou
+- quando a leitura mais antiga espera há WRITE_BEHIND_MAX_DELAY segundos (latência limitada).
+
+Contrapressão: com WRITE_BEHIND_MAX_PENDING leituras em espera, os novos pedidos recebem 503 (Retry-After).
+
+Durabilidade (pelo menos uma vez): cada processo escreve no seu próprio journal (NDJSON, bloqueado com flock):
+
+    {"seq": 1, "road_segment": 1, "average_speed": 35.2, "timestamp": "2024-12-17T14:00:00Z"}   ← leitura aceite
+    {"done": 500}                                                                              ← gravadas até à seq 500
+
+Os journals de processos que terminaram sem gravar tudo (ex.: reinício, crash) são recuperados pelo
+próximo processo que usar a fila, ou pelo comando flush_readings_queue. Uma falha entre o commit e o
+registo "done" faz com que esse lote volte a ser gravado; como os lotes são gravados com upsert
+(segmento, timestamp), isso não cria leituras duplicadas.
+"""
+
+JOURNAL_PREFIX = 'readings-'
+JOURNAL_SUFFIX = '.ndjson'
+
+
+class QueueFull(APIException):
+    status_code = 503
+    default_detail = 'Demasiadas leituras em espera. Tente novamente dentro de alguns segundos.'
+    default_code = 'queue_full'
+
+
+def lock_file(file):
+    """
+    Bloqueia o ficheiro (exclusivo, sem esperar). Retorna False se outro processo já o tem.
+    """
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class Journal:
+    """
+    Journal (NDJSON) das leituras aceites por este processo.
+    """
+
+    def __init__(self, directory, fsync=False):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{JOURNAL_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}{JOURNAL_SUFFIX}')
+        self.fsync = fsync
+        self.file = open(self.path, 'a', encoding='utf-8')
+        lock_file(self.file)
+
+    def write(self, records):
+        self.file.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def rewrite(self, records):
+        """
+        Compacta o journal: passa a ter apenas as leituras ainda por gravar.
+        O novo ficheiro é escrito e bloqueado à parte e só depois substitui o antigo (os.replace).
+        """
+        tmp_path = f'{self.path}.tmp'
+        new_file = open(tmp_path, 'w', encoding='utf-8')
+        lock_file(new_file)
+        new_file.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+        new_file.flush()
+        os.fsync(new_file.fileno())
+        os.replace(tmp_path, self.path)
+        self.file.close()
+        self.file = new_file
+
+    def close(self, remove=False):
+        self.file.close()
+        if remove:
+            os.remove(self.path)
+
+
+def read_journal(path):
+    """
+    Leituras de um journal que ainda não foram gravadas (seq > último "done").
+    """
+    entries, done = [], 0
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue    # Linha incompleta (o processo terminou a meio de uma escrita)
+            if 'done' in record:
+                done = max(done, record['done'])
+            else:
+                entries.append(record)
+    return [entry for entry in entries if entry['seq'] > done]
+
+
+def reading_record(road_segment_id, average_speed, timestamp):
+    return {'road_segment': road_segment_id, 'average_speed': average_speed, 'timestamp': format_timestamp(timestamp)}
+
+
+class ReadingQueue:
+    """
+    Fila das leituras por gravar deste processo (ver o docstring do módulo).
+
+    Com background=False não é criada a thread: as leituras são gravadas chamando flush() (testes e comandos).
+    """
+
+    def __init__(self, journal_dir=None, batch_size=500, max_delay=1.0, max_pending=50000, fsync=False, background=True):
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.pending = []           # Registos (com seq) por gravar, por ordem
+        self.seq = 0
+        self.due_at = None          # Instante em que o lote atual tem de ser gravado
+        self.done_in_journal = 0    # Leituras já gravadas que ainda estão no journal (compactação)
+        self.written = 0
+        self.failures = 0
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        self.journal = Journal(journal_dir, fsync) if journal_dir else None
+        if self.journal:
+            self.recover(journal_dir)
+
+        self.worker = None
+        if background:
+            self.worker = threading.Thread(target=self.run, name='readings-write-behind', daemon=True)
+            self.worker.start()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def recover(self, directory):
+        """
+        Recupera as leituras dos journals de processos que já terminaram (os que não estão bloqueados).
+        """
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not name.startswith(JOURNAL_PREFIX) or not name.endswith(JOURNAL_SUFFIX) or path == self.journal.path:
+                continue
+            with open(path, 'a', encoding='utf-8') as orphan:
+                if not lock_file(orphan):
+                    continue    # Journal de um processo ativo
+                records = read_journal(path)
+                if records:
+                    with self.condition:
+                        self._append(records)
+                        self.due_at = time.monotonic()
+                os.remove(path)
+
+    def put(self, records):
+        """
+        Acrescenta leituras (reading_record) à fila. Lança QueueFull se a fila estiver cheia.
+        """
+        with self.condition:
+            if len(self.pending) + len(records) > self.max_pending:
+                raise QueueFull()
+            self._append(records)
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify()
+
+    def _append(self, records):
+        entries = []
+        for record in records:
+            self.seq += 1
+            entries.append({'seq': self.seq, **{key: record[key] for key in ('road_segment', 'average_speed', 'timestamp')}})
+        if self.journal:
+            self.journal.write(entries)
+        if not self.pending:
+            self.due_at = time.monotonic() + self.max_delay
+            self.condition.notify()
+        self.pending.extend(entries)
+
+    def flush(self):
+        """
+        Grava o próximo lote (até batch_size leituras) numa transação. Retorna o número de leituras do lote.
+        """
+        with self.flush_lock:
+            with self.condition:
+                batch = self.pending[:self.batch_size]
+            if not batch:
+                return 0
+
+            written = self.write_batch(batch)
+
+            with self.condition:
+                # Só o flush remove leituras da fila, e sempre do início
+                del self.pending[:len(batch)]
+                self.written += written
+                self.due_at = time.monotonic() if self.pending else None    # O resto já está atrasado
+                if self.journal:
+                    self.done_in_journal += len(batch)
+                    if not self.pending or self.done_in_journal >= 20 * self.batch_size:
+                        self.journal.rewrite(self.pending)
+                        self.done_in_journal = 0
+                    else:
+                        self.journal.write([{'done': batch[-1]['seq']}])
+            return len(batch)
+
+    def write_batch(self, batch):
+        """
+        Grava um lote com upsert_readings (os signals atualizam o estado, os rollups, a cache e o tempo real).
+        As leituras de segmentos que entretanto foram apagados são descartadas. Retorna o número de leituras gravadas.
+        """
+        existing = set(
+            RoadSegment.objects.filter(pk__in={record['road_segment'] for record in batch}).values_list('pk', flat=True)
+        )
+        readings = [
+            SpeedReading(
+                road_segment_id=record['road_segment'],
+                average_speed=record['average_speed'],
+                timestamp=parse_datetime(record['timestamp']),
+            )
+            for record in batch
+            if record['road_segment'] in existing
+        ]
+        if not readings:
+            return 0
+        with transaction.atomic():
+            created, updated = upsert_readings(readings)
+        return len(created) + len(updated)
+
+    def run(self):
+        """
+        Thread em segundo plano: espera por um lote completo ou pelo prazo da leitura mais antiga e grava.
+        Se a db falhar, as leituras ficam na fila e volta a tentar (com espera crescente, até 30 s).
+        """
+        backoff = 0
+        while not self.stopped.is_set():
+            with self.condition:
+                while not self.stopped.is_set() and len(self.pending) < self.batch_size:
+                    now = time.monotonic()
+                    if self.due_at is not None and now >= self.due_at:
+                        break
+                    self.condition.wait(None if self.due_at is None else self.due_at - now)
+            if self.stopped.is_set():
+                break
+
+            close_old_connections()
+            try:
+                self.flush()
+                backoff = 0
+            except Exception:
+                self.failures += 1
+                backoff = min(backoff * 2 or 0.5, 30)
+                logger.exception('Falha ao gravar as leituras em espera; nova tentativa dentro de %.1f s', backoff)
+                self.stopped.wait(backoff)
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        """
+        Pára a thread e grava as leituras em espera. O journal só é apagado se ficar tudo gravado.
+        """
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify()
+        if self.worker is not None and self.worker is not threading.current_thread():
+            self.worker.join()
+        try:
+            while self.flush():
+                pass
+        finally:
+            if self.journal:
+                self.journal.close(remove=not self.pending)
+
+
+_queue = None
+_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'READINGS_WRITE_BEHIND', False)
+
+
+def get_queue():
+    """
+    Fila deste processo (criada no primeiro uso, com as definições de config/settings.py).
+    """
+    global _queue
+    with _lock:
+        if _queue is None:
+            journal_dir = getattr(settings, 'WRITE_BEHIND_JOURNAL_DIR', None)
+            _queue = ReadingQueue(
+                journal_dir=str(journal_dir) if journal_dir else None,
+                batch_size=getattr(settings, 'WRITE_BEHIND_BATCH_SIZE', 500),
+                max_delay=getattr(settings, 'WRITE_BEHIND_MAX_DELAY', 1.0),
+                max_pending=getattr(settings, 'WRITE_BEHIND_MAX_PENDING', 50000),
+                fsync=getattr(settings, 'WRITE_BEHIND_FSYNC', False),
+            )
+            atexit.register(_queue.stop)
+        return _queue